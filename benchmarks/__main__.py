@@ -0,0 +1,52 @@
+import argparse
+import json
+import sys
+
+from .suite import SIZES, compare, run, write_csv
+
+"""
+Runs the micro-benchmark suite of benchmarks/suite.py, and compares it with a saved baseline.
+
+Usage:
+    python -m benchmarks --sizes 10k 1m --output results.json
+    python -m benchmarks --baseline results.json      # Exits with status 1 if a stage regressed
+    python -m benchmarks --write_csv synthetic.csv --sizes 1m
+"""
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=["10k"], help="Rows of the synthetic datasets")
+    parser.add_argument('--sample', type=int, default=20000, help="Rows validated and priced per dataset")
+    parser.add_argument('--write_sample', type=int, default=1000,
+                        help="Transactions written one at a time per dataset, after loading it")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic datasets")
+    parser.add_argument('--repeat', type=int, default=3, help="Passes of the stages that do not write. The fastest is kept")
+    parser.add_argument('--output', help="Save the results to this JSON file")
+    parser.add_argument('--baseline', help="Compare the results with those saved in this JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Slowdown of a stage's median latency or throughput reported as a regression")
+    parser.add_argument('--write_csv', help="Only write the dataset of the first size to this CSV file")
+    args = parser.parse_args()
+
+    if args.write_csv:
+        write_csv(args.write_csv, SIZES[args.sizes[0]], args.seed)
+        sys.exit(0)
+
+    results = run(args.sizes, args.sample, args.write_sample, args.seed, args.repeat)
+    for size, stages in results["sizes"].items():
+        for stage, result in stages.items():
+            print(f"{size} {stage}: {result['throughput_per_second']:.0f}/s, p50 {result['p50_us']:.1f} us, "
+                  f"p90 {result['p90_us']:.1f} us, p99 {result['p99_us']:.1f} us, max {result['max_us']:.0f} us "
+                  f"({result['ops']} ops of {result['items_per_op']})")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No stage slowed down by more than {args.tolerance:.0%} against {args.baseline}")
@@ -0,0 +1,119 @@
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Dict
+
+from database import ProcessedTransaction
+from database.columnar_repository import ColumnarRepository, TransactionRow
+from database.in_memory_repository import InMemoryRepository
+
+"""
+Snapshot size, load time, memory and stats time of the columnar repository against the pickled in-memory repository.
+
+Memory is what Python allocates while loading (tracemalloc): the columnar snapshot is memory-mapped, so its pages are
+read from disk by the OS on use and are not counted. The in-memory repository holds a ProcessedTransaction per row,
+so it is limited to --transactions; the columnar repository can also be measured alone on --columnar_transactions.
+
+Usage:
+    python -m benchmarks.columnar_repository --transactions 100000 --columnar_transactions 5000000
+"""
+
+TRANSACTIONS_PER_BLOCK = 150
+
+
+def make_rows(count: int):
+    start = datetime(2023, 8, 1)
+    for index in range(count):
+        yield TransactionRow(
+            hash=f"0x{index * 0x9e3779b97f4a7c15 % 2 ** 256:064x}", fromAddress=f"0x{index % 9973:040x}",
+            toAddress=f"0x{index % 8923:040x}", blockNumber=17818542 + index // TRANSACTIONS_PER_BLOCK,
+            executedAt=start + timedelta(seconds=index // 10), gasUsed=21000 + index % 100000,
+            gasCostInDollars=1.2345 * (index % 1000),
+        )
+
+
+def allocated(function) -> int:
+    # Bytes allocated by `function` and still held by its result. Timed separately, tracemalloc slows allocations down
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return held
+
+
+def best_time(function, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def lookup_time(repository, hashes) -> float:
+    return best_time(lambda: [repository.get_by_hash(hash) for hash in hashes], repeat=3) / len(hashes)
+
+
+def benchmark(name: str, repository, path: str, hashes) -> Dict[str, float]:
+    repository.save(path)
+    started = time.perf_counter()
+    loaded = _load(type(repository), path)
+    load_seconds = time.perf_counter() - started
+    return {
+        "name": name,
+        "snapshot_bytes": os.path.getsize(path),
+        "load_seconds": load_seconds,
+        "memory_bytes": allocated(lambda: _load(type(repository), path)),
+        "stats_seconds": best_time(loaded.get_stats),
+        "lookup_seconds": lookup_time(loaded, hashes),
+    }
+
+
+def _load(repository_class, path: str):
+    repository = repository_class()
+    repository.load(path)
+    return repository
+
+
+def run(transactions: int, columnar_transactions: int, directory: str):
+    results = []
+    hashes = [row.hash for row in make_rows(min(transactions, 1000))]
+
+    in_memory = InMemoryRepository()
+    in_memory.create_many([ProcessedTransaction(**row._asdict()) for row in make_rows(transactions)])
+    results.append((transactions, benchmark("in-memory (pickle)", in_memory, os.path.join(directory, "pickle"), hashes)))
+    del in_memory
+
+    columnar = ColumnarRepository()
+    columnar.create_many(list(make_rows(transactions)))
+    results.append((transactions, benchmark("columnar (memory-mapped)", columnar, os.path.join(directory, "columnar"),
+                                            hashes)))
+
+    if columnar_transactions > transactions:
+        columnar = ColumnarRepository(capacity=columnar_transactions)
+        rows = make_rows(columnar_transactions)
+        for _ in range(0, columnar_transactions, 100000):
+            columnar.create_many([row for _, row in zip(range(100000), rows)])
+        results.append((columnar_transactions, benchmark("columnar (memory-mapped)", columnar,
+                                                         os.path.join(directory, "columnar"), hashes)))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=100000, help="Transactions stored in both repositories")
+    parser.add_argument('--columnar_transactions', type=int, default=0,
+                        help="Transactions stored in the columnar repository alone")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for count, result in run(args.transactions, args.columnar_transactions, directory):
+            print(f"{result['name']}, {count} transactions: snapshot {result['snapshot_bytes'] / 2 ** 20:.1f} MiB, "
+                  f"load {result['load_seconds'] * 1e3:.1f} ms using {result['memory_bytes'] / 2 ** 20:.1f} MiB, "
+                  f"get_stats {result['stats_seconds'] * 1e3:.2f} ms, get_by_hash {result['lookup_seconds'] * 1e6:.1f} us")
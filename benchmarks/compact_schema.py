@@ -0,0 +1,143 @@
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from database import ProcessedTransaction, SqlRepository, maintenance
+from database.database import Base, SessionLocal, ReadSessionLocal, make_engine, READ_POOL_SIZE
+
+"""
+Database file size, ingest time and point lookup time with hashes and addresses stored as hex strings and as raw bytes
+(the compact schema, see database/hex_string.py), and the time `python -m database.maintenance compact` takes
+to convert the hex database.
+
+Hashes are random, as transaction hashes are, so the primary key index is written and read at random places.
+
+Usage:
+    python -m benchmarks.compact_schema --rows 200000 --lookups 20000
+"""
+
+SCHEMAS = {"hex strings": False, "compact": True}
+
+
+def make_transactions(generator: random.Random, start: int, count: int) -> List[ProcessedTransaction]:
+    return [
+        ProcessedTransaction(hash=f"0x{generator.getrandbits(256):064x}", fromAddress=f"0x{index % 5000 * 7919:040x}",
+                             toAddress=f"0x{index % 4999 * 104729:040x}" if index % 50 else "",
+                             blockNumber=17000000 + index // 150,
+                             executedAt=datetime(2023, 1, 1) + timedelta(seconds=index), gasUsed=21000 + index % 1000,
+                             gasCostInDollars=(index % 997) / 10)
+        for index in range(start, start + count)
+    ]
+
+
+def use_database(url: str, compact_schema=None):
+    engine = make_engine(url, compact_schema=compact_schema)
+    read_engine = make_engine(url, read_only=True, pool_size=READ_POOL_SIZE, compact_schema=compact_schema)
+    SessionLocal.configure(bind=engine)
+    ReadSessionLocal.configure(bind=read_engine)
+    return engine, read_engine
+
+
+def file_size(engine, path: str) -> int:
+    # Everything in the main file, and no free pages
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        connection.exec_driver_sql("VACUUM")
+    return os.path.getsize(path)
+
+
+def lookup_time(repository: SqlRepository, hashes: List[str]) -> float:
+    started = time.perf_counter()
+    for hash in hashes:
+        repository.get_by_hash(hash)
+    return (time.perf_counter() - started) / len(hashes)
+
+
+def index_lookup_time(path: str, keys: List) -> float:
+    # The primary key lookups alone, on a plain connection, without the session and ORM costs of get_by_hash
+    connection = sqlite3.connect(path)
+    try:
+        started = time.perf_counter()
+        for key in keys:
+            connection.execute("SELECT gasUsed FROM processed_transaction WHERE hash = ?", (key,)).fetchone()
+        return (time.perf_counter() - started) / len(keys)
+    finally:
+        connection.close()
+
+
+def batch_lookup_time(repository: SqlRepository, hashes: List[str], batch_size: int = 100) -> float:
+    started = time.perf_counter()
+    for start in range(0, len(hashes), batch_size):
+        repository.get_many_by_hash(hashes[start:start + batch_size])
+    return (time.perf_counter() - started) / len(hashes)
+
+
+def measure(directory: str, name: str, compact_schema: bool, rows: int, lookups: int) -> Dict[str, float]:
+    path = os.path.join(directory, f"{name.replace(' ', '_')}.db")
+    engine, read_engine = use_database(f"sqlite:///{path}", compact_schema)
+    try:
+        Base.metadata.create_all(bind=engine)
+        repository = SqlRepository()
+        generator = random.Random(0)
+        hashes = []
+        started = time.perf_counter()
+        for start in range(0, rows, repository.batch_size):
+            transactions = make_transactions(generator, start, min(repository.batch_size, rows - start))
+            hashes.extend(transaction.hash for transaction in transactions)
+            repository.create_many(transactions)
+        ingest_seconds = time.perf_counter() - started
+        size = file_size(engine, path)
+
+        generator = random.Random(1)
+        found = [generator.choice(hashes) for _ in range(lookups)]
+        missing = [f"0x{generator.getrandbits(256):064x}" for _ in range(lookups)]
+        # Warm the page cache, so both schemas are read from memory
+        lookup_time(repository, found)
+        keys = [bytes.fromhex(hash[2:]) if compact_schema else hash for hash in found]
+        return {
+            "path": path,
+            "file_bytes": size,
+            "ingest_seconds": ingest_seconds,
+            "found_seconds": lookup_time(repository, found),
+            "missing_seconds": lookup_time(repository, missing),
+            "batch_seconds": batch_lookup_time(repository, found),
+            "index_seconds": index_lookup_time(path, keys),
+        }
+    finally:
+        engine.dispose()
+        read_engine.dispose()
+
+
+def conversion_time(directory: str, path: str) -> float:
+    copy = os.path.join(directory, "converted.db")
+    shutil.copyfile(path, copy)
+    started = time.perf_counter()
+    assert maintenance.compact(f"sqlite:///{copy}")
+    return time.perf_counter() - started
+
+
+def run(rows: int, lookups: int):
+    with tempfile.TemporaryDirectory() as directory:
+        results = {name: measure(directory, name, compact, rows, lookups) for name, compact in SCHEMAS.items()}
+        return results, conversion_time(directory, results["hex strings"]["path"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200000, help="Transactions stored")
+    parser.add_argument('--lookups', type=int, default=20000, help="Lookups of stored and of unknown hashes")
+    args = parser.parse_args()
+
+    results, conversion_seconds = run(args.rows, args.lookups)
+    for name, result in results.items():
+        print(f"{name}: file {result['file_bytes'] / 2 ** 20:.1f} MiB ({result['file_bytes'] / args.rows:.0f} bytes/row), "
+              f"ingest {result['ingest_seconds']:.1f} s, get_by_hash {result['found_seconds'] * 1e6:.0f} us found, "
+              f"{result['missing_seconds'] * 1e6:.0f} us missing, get_many_by_hash {result['batch_seconds'] * 1e6:.1f} us/hash, "
+              f"primary key lookup {result['index_seconds'] * 1e6:.1f} us")
+    print(f"Converting the hex strings database: {conversion_seconds:.1f} s")
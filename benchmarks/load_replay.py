@@ -0,0 +1,359 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import requests
+from starlette.routing import Match
+
+from crypto_data.fake_coingecko import FakeCoinGeckoServer, hourly_prices
+from database import MAX_PAGE_SIZE
+from server.routes import get_api_router, get_ingest_router
+from .suite import dataset_time_range, environment, synthetic_rows, write_csv
+
+"""
+Load test of the API: replays a log of HTTP requests, or a synthetic mix of lookups, at a given concurrency and
+arrival rate, and reports the throughput and latency percentiles of every route.
+
+By default the API is started for the run, fully offline: a synthetic dataset (see benchmarks/suite.py) is written
+to ethereum_txs.csv in a temporary directory, and `server.main --process_csv` ingests it there, pricing it with a
+FakeCoinGeckoServer serving canned market_chart/range prices. The requests start once the ingest is done.
+With --url they are sent to a running server instead.
+
+The request log has one JSON object per line:
+    {"method": "GET", "path": "/transactions/0x5c50...", "at": 0.25}
+    {"method": "POST", "path": "/transactions/batch", "body": {"hashes": ["0x5c50..."]}}
+`method` defaults to GET, `body` is sent as JSON, and `at` is the second the request is sent at, from the start of
+the replay. --rate sends the requests at Poisson arrivals of that mean rate instead, and without `at` nor --rate
+every client sends its next request as soon as its last one is answered (a closed loop).
+
+The synthetic mix looks up stored transactions (uniformly drawn), unknown hashes (404s, answered by the Bloom filter)
+and /stats. --write_log saves it, so the same requests can be replayed against another build.
+
+The latency of a scheduled request is measured from the time it was due, not from when a client was free to send
+it, so a server falling behind the arrival rate shows up in the percentiles instead of slowing the arrivals down.
+If the clients themselves cannot keep up, `max_send_lag_ms` grows: raise --concurrency.
+
+Usage:
+    python -m benchmarks.load_replay --rows 100000 --requests 20000 --concurrency 32 --rate 500
+    python -m benchmarks.load_replay --log requests.log.jsonl --speed 2 --output results.json
+    python -m benchmarks.load_replay --url http://localhost:8000 --requests 5000
+    python -m benchmarks.load_replay --write_log mix.jsonl --requests 10000
+"""
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Share of the synthetic requests per kind
+DEFAULT_MIX = {"transaction": 0.6, "missing": 0.3, "stats": 0.1}
+# Seconds to wait for the server to start, and for its ingest to finish
+STARTUP_TIMEOUT = 60.
+INGEST_TIMEOUT = 3600.
+POLL_INTERVAL = 0.2
+
+# Only used to name the routes of the requests: nothing is served from them
+_ROUTES = get_api_router(None).routes + get_ingest_router(None, lambda: True).routes
+
+
+def route_of(method: str, path: str) -> str:
+    """
+    The route template serving a request, e.g. "GET /transactions/{hash}", or its path if no route matches it.
+    """
+    scope = {"type": "http", "method": method, "path": path.split("?", 1)[0]}
+    for route in _ROUTES:
+        if route.matches(scope)[0] == Match.FULL:
+            return f"{method} {route.path}"
+    return f"{method} {scope['path']}"
+
+
+def synthetic_requests(hashes: List[str], count: int, mix: Dict[str, float] = DEFAULT_MIX,
+                       seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Draw `count` requests of the kinds of `mix`: lookups of `hashes`, lookups of unknown hashes and /stats.
+    """
+    generator = random.Random(seed)
+    kinds = generator.choices(list(mix), weights=list(mix.values()), k=count)
+    paths = {
+        "transaction": lambda: f"/transactions/{generator.choice(hashes)}",
+        "missing": lambda: f"/transactions/0x{generator.getrandbits(256):064x}",
+        "stats": lambda: "/stats",
+    }
+    return [{"method": "GET", "path": paths[kind]()} for kind in kinds]
+
+
+def read_log(path: str) -> List[Dict[str, Any]]:
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def write_log(path: str, log: List[Dict[str, Any]]) -> None:
+    with open(path, "w") as file:
+        for request in log:
+            file.write(json.dumps(request) + "\n")
+
+
+def schedule(log: List[Dict[str, Any]], rate: Optional[float] = None, speed: float = 1.,
+             seed: int = 0) -> Optional[List[float]]:
+    """
+    The second each request is due at, from the start of the replay, or None to send them in a closed loop.
+
+    Args:
+        rate (float, optional): Mean requests per second of Poisson arrivals, overriding the times of the log.
+        speed (float): Factor the times of the log are sped up by.
+    """
+    if rate is not None:
+        generator = random.Random(seed)
+        offsets, offset = [], 0.
+        for _ in log:
+            offsets.append(offset)
+            offset += generator.expovariate(rate)
+        return offsets
+    if log and all("at" in request for request in log):
+        return [request["at"] / speed for request in log]
+    return None
+
+
+def replay(base_url: str, log: List[Dict[str, Any]], offsets: Optional[List[float]], concurrency: int,
+           timeout: float = 30.) -> Tuple[List[Tuple[str, Optional[int], float]], float, float]:
+    """
+    Send the requests of `log` from `concurrency` clients, each with its own keep-alive connection.
+
+    Returns:
+        Tuple: The (route, status, latency in seconds) of every request, its status None if it failed, the seconds
+        the replay took, and the largest delay between the time a request was due and the time it was sent.
+    """
+    if offsets is not None:
+        # Requests are sent in the order they are due
+        log = [request for _, request in sorted(zip(offsets, log), key=lambda pair: pair[0])]
+        offsets = sorted(offsets)
+    results = [None] * len(log)
+    send_lags = [0.] * len(log)
+    next_index = iter(range(len(log)))
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    def client():
+        with requests.Session() as session:
+            while True:
+                with lock:
+                    index = next(next_index, None)
+                if index is None:
+                    return
+                request = log[index]
+                method = request.get("method", "GET")
+                if offsets is not None:
+                    due = started + offsets[index]
+                    wait = due - time.perf_counter()
+                    if wait > 0:
+                        time.sleep(wait)
+                    else:
+                        send_lags[index] = -wait
+                else:
+                    due = time.perf_counter()
+                try:
+                    response = session.request(method, base_url + request["path"], json=request.get("body"),
+                                               timeout=timeout)
+                    status = response.status_code
+                except requests.RequestException:
+                    status = None
+                latency = time.perf_counter() - due
+                results[index] = (route_of(method, request["path"]), status, latency)
+
+    clients = [threading.Thread(target=client, name=f"client-{number}") for number in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return results, time.perf_counter() - started, max(send_lags, default=0.)
+
+
+def summarize(results: List[Tuple[str, Optional[int], float]], seconds: float) -> Dict[str, Dict[str, float]]:
+    """
+    Throughput and latency percentiles of the requests of every route and status, e.g. "GET /stats 200",
+    and of all of them under "total". Failed requests (no response) have the status "error".
+    """
+    groups = {}
+    for route, status, latency in results:
+        groups.setdefault(f"{route} {status if status is not None else 'error'}", []).append(latency)
+    groups["total"] = [latency for _, _, latency in results]
+
+    summary = {}
+    for name, latencies in sorted(groups.items()):
+        milliseconds = np.array(latencies) * 1e3
+        p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+        summary[name] = {
+            "requests": len(latencies),
+            "throughput_per_second": len(latencies) / seconds if seconds > 0 else 0.,
+            "mean_ms": float(milliseconds.mean()),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "max_ms": float(milliseconds.max()),
+        }
+    return summary
+
+
+def stored_hashes(base_url: str, count: int) -> List[str]:
+    """
+    Read up to `count` hashes stored by a running server, from the first pages of /transactions.
+    """
+    hashes, cursor = [], None
+    with requests.Session() as session:
+        while len(hashes) < count:
+            params = {"limit": min(MAX_PAGE_SIZE, count - len(hashes))}
+            if cursor is not None:
+                params["after"] = cursor
+            response = session.get(f"{base_url}/transactions", params=params, timeout=30)
+            response.raise_for_status()
+            page = response.json()
+            hashes.extend(transaction["hash"] for transaction in page["transactions"])
+            cursor = page["next"]
+            if cursor is None:
+                break
+    return hashes
+
+
+def _wait_for(check, process: subprocess.Popen, timeout: float, log_path: str, what: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            with open(log_path) as file:
+                output = file.read()[-2000:]
+            raise RuntimeError(f"The server exited with status {process.returncode} before {what}:\n{output}")
+        try:
+            result = check()
+            if result is not None:
+                return result
+        except requests.RequestException:
+            pass
+        time.sleep(POLL_INTERVAL)
+    raise RuntimeError(f"Timed out after {timeout:.0f} s waiting for {what}")
+
+
+@contextmanager
+def serve(rows: int, seed: int = 0, port: int = 8765, api_workers: int = 1,
+          server_options: Optional[List[str]] = None) -> Iterator[str]:
+    """
+    Run the API on a new database holding a synthetic dataset of `rows` transactions, ingested by the server
+    with prices of a FakeCoinGeckoServer, so nothing leaves the machine.
+
+    Args:
+        server_options (List[str], optional): More command line options of server.main, e.g. ["--workers", "2"].
+
+    Yields:
+        str: The base URL of the API, once the ingest is done.
+    """
+    start, end = dataset_time_range(rows)
+    # Covers the day before the first transaction, which the ingest fetches for its oldest prices
+    prices = hourly_prices(int((start - timedelta(days=2)).timestamp()), int((end + timedelta(days=1)).timestamp()))
+    with tempfile.TemporaryDirectory() as directory, FakeCoinGeckoServer(prices) as coingecko:
+        write_csv(os.path.join(directory, "ethereum_txs.csv"), rows, seed)
+        log_path = os.path.join(directory, "server.log")
+        environment_variables = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            filter(None, [REPOSITORY_ROOT, os.environ.get("PYTHONPATH")])))
+        command = [sys.executable, "-m", "server.main", "--process_csv", "--port", str(port),
+                   "--api_workers", str(api_workers), "--coingecko_url", coingecko.base_url] + (server_options or [])
+        with open(log_path, "w") as log_file:
+            # Run in the temporary directory, where it creates ratedapi.db and reads ethereum_txs.csv
+            process = subprocess.Popen(command, cwd=directory, env=environment_variables, stdout=log_file,
+                                       stderr=subprocess.STDOUT)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            _wait_for(lambda: requests.get(f"{base_url}/ready", timeout=5).ok or None, process, STARTUP_TIMEOUT,
+                      log_path, "it was ready")
+
+            def ingest_finished():
+                status = requests.get(f"{base_url}/ingest/status", timeout=5).json()
+                return status if status["status"] != "running" else None
+
+            status = _wait_for(ingest_finished, process, INGEST_TIMEOUT, log_path, "the ingest finished")
+            if status["status"] != "done":
+                raise RuntimeError(f"The ingest failed: {status['error']}")
+            print(f"[LoadReplay] Ingested {status['rowsWritten']} transactions at {status['rowsPerSecond']:.0f} rows/s "
+                  f"with {len(coingecko.requests)} CoinGecko calls")
+            yield base_url
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+def mix_weight(value: str) -> Tuple[str, float]:
+    kind, _, weight = value.partition("=")
+    if kind not in DEFAULT_MIX or not weight:
+        raise argparse.ArgumentTypeError(f"{value} is not one of {', '.join(DEFAULT_MIX)} with a weight, e.g. stats=0.1")
+    return kind, float(weight)
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    log = read_log(args.log) if args.log else None
+
+    def load(base_url: str, hashes: Optional[List[str]]) -> Dict[str, Any]:
+        requests_log = log
+        if requests_log is None:
+            if hashes is None:
+                hashes = stored_hashes(base_url, args.sample_hashes)
+            if not hashes:
+                raise RuntimeError("The server holds no transaction to look up")
+            requests_log = synthetic_requests(hashes, args.requests, dict(args.mix), args.seed)
+            if args.write_log:
+                write_log(args.write_log, requests_log)
+        offsets = schedule(requests_log, args.rate, args.speed, args.seed)
+        if args.warmup:
+            replay(base_url, requests_log[:args.warmup], None, args.concurrency)
+        results, seconds, send_lag = replay(base_url, requests_log, offsets, args.concurrency)
+        return {
+            "environment": environment(),
+            "parameters": {name: value for name, value in vars(args).items() if name not in ("output", "write_log")},
+            "seconds": seconds,
+            "max_send_lag_ms": send_lag * 1e3,
+            "routes": summarize(results, seconds),
+        }
+
+    if args.url:
+        return load(args.url.rstrip("/"), None)
+    with serve(args.rows, args.seed, args.port, args.api_workers) as base_url:
+        return load(base_url, [row["hash"] for row in synthetic_rows(args.rows, args.seed)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="Send the requests to this running server instead of starting one")
+    parser.add_argument('--log', help="Replay the requests of this JSONL file instead of a synthetic mix")
+    parser.add_argument('--requests', type=int, default=10000, help="Requests of the synthetic mix")
+    parser.add_argument('--mix', nargs='+', type=mix_weight, default=list(DEFAULT_MIX.items()),
+                        help="Weights of the kinds of synthetic requests: transaction, missing and stats")
+    parser.add_argument('--concurrency', type=int, default=16, help="Clients sending requests at the same time")
+    parser.add_argument('--rate', type=float, help="Mean requests per second, sent at Poisson arrivals")
+    parser.add_argument('--speed', type=float, default=1., help="Speed-up of the times of the replayed log")
+    parser.add_argument('--warmup', type=int, default=0, help="Requests of the log sent before the measured replay")
+    parser.add_argument('--rows', type=int, default=20000, help="Transactions of the dataset of the started server")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the dataset, the mix and the arrivals")
+    parser.add_argument('--port', type=int, default=8765, help="Port of the started server")
+    parser.add_argument('--api_workers', type=int, default=1, help="API processes of the started server")
+    parser.add_argument('--sample_hashes', type=int, default=10000,
+                        help="Stored hashes read from the server of --url to look up")
+    parser.add_argument('--write_log', help="Save the synthetic requests to this JSONL file")
+    parser.add_argument('--output', help="Save the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args)
+    print(f"{sum(route['requests'] for name, route in results['routes'].items() if name != 'total')} requests "
+          f"in {results['seconds']:.1f} s, max send lag {results['max_send_lag_ms']:.1f} ms")
+    for name, result in results["routes"].items():
+        print(f"{name}: {result['requests']} requests, {result['throughput_per_second']:.0f}/s, "
+              f"p50 {result['p50_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, "
+              f"max {result['max_ms']:.1f} ms")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,117 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from itertools import accumulate
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy.orm import sessionmaker
+
+from database import ProcessedTransaction, SqlRepository, PartitionedRepository, TransactionFilter
+from database.database import Base, make_engine, READ_POOL_SIZE
+
+"""
+Ingest and read times of a single SqlRepository database against a PartitionedRepository holding the same transactions
+in block range partitions.
+
+Point lookups read the index before the partition, the listings of recent blocks only open the last partitions,
+and the aggregate reads run on every partition (on FAN_OUT_WORKERS threads) and merge their results.
+
+Senders are drawn from a Zipf distribution, as a few exchanges and bots send most transactions. With --uniform_senders
+every partition has the same senders with the same totals, the worst case of the partitioned top addresses ranking.
+
+Usage:
+    python -m benchmarks.partitioned_repository --rows 300000 --partition_size 200
+"""
+
+TRANSACTIONS_PER_BLOCK = 150
+FIRST_BLOCK = 17000000
+SENDERS = 5000
+# The sender of rank r sends 1 / r as many transactions as the first one
+SENDER_WEIGHTS = list(accumulate(1 / rank for rank in range(1, SENDERS + 1)))
+
+
+def make_transactions(generator: random.Random, start: int, count: int,
+                      uniform_senders: bool = False) -> List[ProcessedTransaction]:
+    if uniform_senders:
+        senders = [index % SENDERS for index in range(start, start + count)]
+    else:
+        senders = generator.choices(range(SENDERS), cum_weights=SENDER_WEIGHTS, k=count)
+    return [
+        ProcessedTransaction(hash=f"0x{generator.getrandbits(256):064x}", fromAddress=f"0x{sender * 7919:040x}",
+                             toAddress=f"0x{index % 4999 * 104729:040x}",
+                             blockNumber=FIRST_BLOCK + index // TRANSACTIONS_PER_BLOCK,
+                             executedAt=datetime(2023, 1, 1) + timedelta(seconds=index), gasUsed=21000 + index % 1000,
+                             gasCostInDollars=(index % 997) / 10)
+        for index, sender in zip(range(start, start + count), senders)
+    ]
+
+
+def single_database(directory: str) -> SqlRepository:
+    url = f"sqlite:///{os.path.join(directory, 'single.db')}"
+    engine = make_engine(url)
+    Base.metadata.create_all(bind=engine)
+    read_engine = make_engine(url, read_only=True, pool_size=READ_POOL_SIZE)
+    return SqlRepository(session_factory=sessionmaker(bind=engine), read_session_factory=sessionmaker(bind=read_engine))
+
+
+def best_time(function, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def measure(repository, rows: int, lookups: int, uniform_senders: bool) -> Dict[str, float]:
+    generator = random.Random(0)
+    hashes = []
+    started = time.perf_counter()
+    for start in range(0, rows, repository.batch_size):
+        transactions = make_transactions(generator, start, min(repository.batch_size, rows - start), uniform_senders)
+        hashes.extend(transaction.hash for transaction in transactions)
+        repository.create_many(transactions)
+    ingest_seconds = time.perf_counter() - started
+
+    found = random.Random(1).sample(hashes, min(lookups, len(hashes)))
+    last_block = FIRST_BLOCK + (rows - 1) // TRANSACTIONS_PER_BLOCK
+    recent = TransactionFilter(from_block=last_block - 100)
+    return {
+        "ingest_seconds": ingest_seconds,
+        "lookup_seconds": best_time(lambda: [repository.get_by_hash(hash) for hash in found], repeat=3) / len(found),
+        "recent_page_seconds": best_time(lambda: repository.get_transactions(recent, limit=100)),
+        "stats_seconds": best_time(repository.get_stats),
+        "block_stats_seconds": best_time(lambda: repository.get_block_stats(FIRST_BLOCK, last_block, 1000)),
+        "top_addresses_seconds": best_time(lambda: repository.get_top_addresses("gasCost", 10)),
+    }
+
+
+def run(rows: int, lookups: int, partition_size: int, uniform_senders: bool = False) -> Dict[str, Dict[str, float]]:
+    with tempfile.TemporaryDirectory() as directory:
+        partitioned = PartitionedRepository(os.path.join(directory, "partitions"), partition_size=partition_size)
+        try:
+            return {
+                "single database": measure(single_database(directory), rows, lookups, uniform_senders),
+                f"{(rows - 1) // TRANSACTIONS_PER_BLOCK // partition_size + 1} partitions":
+                    measure(partitioned, rows, lookups, uniform_senders),
+            }
+        finally:
+            partitioned.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=300000, help="Transactions stored")
+    parser.add_argument('--lookups', type=int, default=5000, help="Lookups of stored hashes")
+    parser.add_argument('--partition_size', type=int, default=200, help="Blocks per partition")
+    parser.add_argument('--uniform_senders', action='store_true', help="Every sender sends as many transactions")
+    args = parser.parse_args()
+
+    for name, result in run(args.rows, args.lookups, args.partition_size, args.uniform_senders).items():
+        print(f"{name}: ingest {result['ingest_seconds']:.1f} s, get_by_hash {result['lookup_seconds'] * 1e6:.0f} us, "
+              f"recent page {result['recent_page_seconds'] * 1e3:.2f} ms, get_stats {result['stats_seconds'] * 1e3:.2f} ms, "
+              f"get_block_stats {result['block_stats_seconds'] * 1e3:.2f} ms, "
+              f"get_top_addresses {result['top_addresses_seconds'] * 1e3:.2f} ms")
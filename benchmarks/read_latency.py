@@ -0,0 +1,149 @@
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import create_engine
+
+from database import ProcessedTransaction, SqlRepository, database
+from database.database import Base, SessionLocal, ReadSessionLocal, make_engine, READ_POOL_SIZE
+
+"""
+Latency of the repository reads served by the API, idle and while another process ingests transactions in batches,
+with the default SQLite engine (rollback journal, reads and writes sharing one pool) and with the engines
+of database/database.py (write-ahead logging, separate read only pool).
+
+Usage:
+    python -m benchmarks.read_latency --rows 50000 --seconds 5
+"""
+
+ENGINES = {
+    "default engine": lambda url: (create_engine(url), None),
+    "wal, read pool": lambda url: (make_engine(url), make_engine(url, read_only=True, pool_size=READ_POOL_SIZE)),
+}
+
+
+def make_transactions(start: int, count: int) -> List[ProcessedTransaction]:
+    return [
+        ProcessedTransaction(hash=f"0x{index:064x}", fromAddress=f"0x{index % 5000:040x}",
+                             toAddress=f"0x{index % 4999:040x}", blockNumber=17000000 + index // 150,
+                             executedAt=datetime(2023, 1, 1) + timedelta(seconds=index), gasUsed=21000 + index % 1000,
+                             gasCostInDollars=(index % 997) / 10)
+        for index in range(start, start + count)
+    ]
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        "reads": len(latencies),
+        "p50_ms": latencies[len(latencies) // 2] * 1e3,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1e3,
+        "max_ms": latencies[-1] * 1e3,
+    }
+
+
+def use_engines(name: str, url: str):
+    engine, read_engine = ENGINES[name](url)
+    # The default engine serves the reads too
+    read_engine = read_engine or engine
+    SessionLocal.configure(bind=engine)
+    ReadSessionLocal.configure(bind=read_engine)
+    return engine, read_engine
+
+
+def ingest(name: str, url: str, start: int, stop, written) -> None:
+    # Runs in its own process, as the ingest would
+    use_engines(name, url)
+    repository = SqlRepository()
+    while not stop.is_set():
+        repository.create_many(make_transactions(start, repository.batch_size))
+        start += repository.batch_size
+        with written.get_lock():
+            written.value += repository.batch_size
+
+
+def measure(name: str, url: str, repository: SqlRepository, rows: int, seconds: float, readers: int,
+            write: bool) -> Dict[str, float]:
+    stop = threading.Event()
+    latencies = [[] for _ in range(readers)]
+    context = multiprocessing.get_context("spawn")
+    stop_writer = context.Event()
+    written = context.Value("q", 0)
+
+    def read(latencies: List[float]) -> None:
+        generator = random.Random(len(latencies))
+        while not stop.is_set():
+            started = time.perf_counter()
+            if generator.random() < 0.1:
+                repository.get_stats()
+            else:
+                repository.get_by_hash(f"0x{generator.randrange(rows):064x}")
+            latencies.append(time.perf_counter() - started)
+
+    writer = context.Process(target=ingest, args=(name, url, rows, stop_writer, written)) if write else None
+    if writer is not None:
+        writer.start()
+        # Measure once the writer is running
+        while written.value == 0:
+            time.sleep(0.01)
+    threads = [threading.Thread(target=read, args=(reader_latencies,)) for reader_latencies in latencies]
+    for thread in threads:
+        thread.start()
+    written_before = written.value
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    written_during = written.value - written_before
+    if writer is not None:
+        stop_writer.set()
+        writer.join()
+
+    result = percentiles([latency for reader_latencies in latencies for latency in reader_latencies])
+    result["rows_written_per_second"] = written_during / seconds
+    return result
+
+
+def run(rows: int = 50000, seconds: float = 5, readers: int = 4) -> Dict[str, Dict[str, Dict[str, float]]]:
+    default_engine, default_read_engine = database.engine, database.read_engine
+    results = {}
+    try:
+        for name in ENGINES:
+            with tempfile.TemporaryDirectory() as directory:
+                url = f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+                engine, read_engine = use_engines(name, url)
+                Base.metadata.create_all(bind=engine)
+
+                repository = SqlRepository()
+                repository.create_many(make_transactions(0, rows))
+                results[name] = {
+                    "idle": measure(name, url, repository, rows, seconds, readers, write=False),
+                    "during ingest": measure(name, url, repository, rows, seconds, readers, write=True),
+                }
+                engine.dispose()
+                read_engine.dispose()
+    finally:
+        SessionLocal.configure(bind=default_engine)
+        ReadSessionLocal.configure(bind=default_read_engine)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=50000, help="Transactions stored before measuring")
+    parser.add_argument('--seconds', type=float, default=5, help="Duration of each measurement")
+    parser.add_argument('--readers', type=int, default=4,
+        help=f"Threads reading concurrently, up to the {READ_POOL_SIZE} read connections. More threads mostly measure the GIL")
+    args = parser.parse_args()
+
+    for name, phases in run(args.rows, args.seconds, args.readers).items():
+        for phase, result in phases.items():
+            print(f"{name}, {phase}: {result['reads']} reads, p50 {result['p50_ms']:.2f} ms, "
+                  f"p99 {result['p99_ms']:.2f} ms, max {result['max_ms']:.1f} ms, "
+                  f"{result['rows_written_per_second']:.0f} rows written/s")
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict
+
+from fastapi import APIRouter, FastAPI, HTTPException
+
+from database import ProcessedTransaction
+from database.in_memory_repository import InMemoryRepository
+from server.response_models import ProcessedTransactionResponse, StatsResponse
+from server.routes import get_api_router
+
+"""
+Per-request CPU time of the JSON fast path of /transactions/{hash} and /stats against the pydantic response model path
+it replaced. Requests are sent to the ASGI apps in-process, over an in-memory repository, so the time measured
+is routing, the endpoint and serialization only.
+
+Usage:
+    python -m benchmarks.serialization --requests 20000
+"""
+
+
+def model_router(repository) -> APIRouter:
+    # The endpoints as they were before the fast path: copied into the response models, validated and encoded by FastAPI
+    router = APIRouter()
+
+    @router.get("/transactions/{hash}", response_model=ProcessedTransactionResponse)
+    def get_transaction(hash: str):
+        transaction = repository.get_by_hash(hash)
+        if transaction is None:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        return ProcessedTransactionResponse(
+            hash=transaction.hash,
+            fromAddress=transaction.fromAddress,
+            toAddress=transaction.toAddress,
+            blockNumber=transaction.blockNumber,
+            executedAt=transaction.executedAt,
+            gasUsed=transaction.gasUsed,
+            gasCostInDollars=transaction.gasCostInDollars,
+        )
+
+    @router.get("/stats", response_model=StatsResponse)
+    def get_stats():
+        return repository.get_stats()
+
+    return router
+
+
+def make_app(router: APIRouter) -> FastAPI:
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+async def _request(app: FastAPI, path: str) -> bytes:
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "", "headers": [],
+             "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80)}
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return b"".join(body)
+
+
+def cpu_per_request(app: FastAPI, paths, loop) -> float:
+    async def run():
+        for path in paths:
+            await _request(app, path)
+
+    started = time.process_time()
+    loop.run_until_complete(run())
+    return (time.process_time() - started) / len(paths)
+
+
+def run(requests: int = 20000, transactions: int = 1000) -> Dict[str, Dict[str, float]]:
+    repository = InMemoryRepository()
+    repository.create_many([
+        ProcessedTransaction(hash=f"0x{index:064x}", fromAddress=f"0x{index % 97:040x}", toAddress=f"0x{index % 89:040x}",
+                             blockNumber=17818542 + index // 150, executedAt=datetime(2023, 8, 1, 7, 4, 59),
+                             gasUsed=21000 + index, gasCostInDollars=1.2345 * index)
+        for index in range(transactions)
+    ])
+    apps = {"model": make_app(model_router(repository)), "fast path": make_app(get_api_router(repository))}
+    endpoints = {
+        "/transactions/{hash}": [f"/transactions/0x{index % transactions:064x}" for index in range(requests)],
+        # The stats are computed by the in-memory repository itself, so fewer requests are enough
+        "/stats": ["/stats"] * max(1, requests // 100),
+    }
+
+    loop = asyncio.new_event_loop()
+    try:
+        results = {}
+        for endpoint, paths in endpoints.items():
+            for app in apps.values():
+                # Same responses, and a warm up of both apps
+                assert loop.run_until_complete(_request(app, paths[0]))
+            results[endpoint] = {name: cpu_per_request(app, paths, loop) for name, app in apps.items()}
+        return results
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=20000, help="Requests sent to /transactions/{hash} per app")
+    args = parser.parse_args()
+
+    for endpoint, timings in run(args.requests).items():
+        model, fast = timings["model"], timings["fast path"]
+        print(f"{endpoint}: model {model * 1e6:.0f} us/request, fast path {fast * 1e6:.0f} us/request, "
+              f"{(model - fast) * 1e6:.0f} us ({1 - fast / model:.0%}) CPU saved per request")
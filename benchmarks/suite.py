@@ -0,0 +1,321 @@
+import csv
+import math
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import sessionmaker
+
+from crypto_data import CoinGeckoClientWithCache, CryptoToUsd
+from data_processor import CsvProcessor, RowDecoder
+from data_processor.raw_transaction import RawTransaction
+from database import ProcessedTransaction, SqlRepository
+from database.database import Base, make_engine, READ_POOL_SIZE
+
+"""
+Micro-benchmarks of the ingest, pricing and lookup hot paths, on synthetic datasets shaped like ethereum_txs.csv
+and a synthetic price source, so they run offline and give the same inputs on every run.
+
+Each stage times every operation and reports its throughput and latency percentiles:
+    validate_raw_transaction   RawTransaction validation of a CSV row
+    decode_rows                RowDecoder.decode of a batch of CSV rows, the fast_decode path of the ingest
+    compute_gas_cost_in_usd    CsvProcessor.compute_gas_cost_in_usd of a single transaction
+    compute_gas_costs_in_usd   The same for a block of transactions, as the ingest prices them
+    coingecko_get              CoinGeckoClientWithCache.get of a cached price (bisect lookups)
+    sql_create_many            SqlRepository.create_many of a batch, loading the whole dataset into a new database
+    sql_create                 SqlRepository.create of a single transaction, once the dataset is stored
+    sql_get_stats              SqlRepository.get_stats, once the dataset is stored
+
+The cost of validating and pricing a row does not depend on the size of the dataset, so those stages run on its
+first `sample` rows. The database stages run on the whole dataset. The stages that do not write report the fastest
+of `repeat` passes, the write stages a single one, so compare their results with a generous tolerance.
+"""
+
+# Dataset sizes runnable by name
+SIZES = {"10k": 10000, "1m": 1000000, "10m": 10000000}
+CSV_COLUMNS = [
+    "hash", "nonce", "block_hash", "block_number", "transaction_index", "from_address", "to_address", "value", "gas",
+    "gas_price", "block_timestamp", "max_fee_per_gas", "max_priority_fee_per_gas", "transaction_type",
+    "receipts_cumulative_gas_used", "receipts_gas_used", "receipts_contract_address", "receipts_root",
+    "receipts_status", "receipts_effective_gas_price",
+]
+FIRST_BLOCK = 17818542
+FIRST_BLOCK_TIME = datetime(2023, 8, 1, 7, 4, 59, tzinfo=timezone.utc)
+TRANSACTIONS_PER_BLOCK = 150
+SECONDS_PER_BLOCK = 12
+# Distinct senders and receivers, so the address aggregates are updated as often as with real data
+ADDRESSES = 50000
+# Share of the transactions creating a contract, which have no receiver
+CONTRACT_CREATIONS = 0.01
+PRICE_INTERVAL = timedelta(minutes=5)
+BATCH_SIZE = 1000
+# Operations of the stages that do not depend on the sample
+STATS_READS = 1000
+
+
+# Odd multipliers spreading small numbers over every byte of an address or a hash
+_ADDRESS_MULTIPLIER = 0x9e3779b97f4a7c15f39cc0605cedc8341082276b
+_HASH_MULTIPLIER = 0x9e3779b97f4a7c15f39cc0605cedc8341082276bf3a27251f86c6a11d0c18e95
+
+
+def _address(generator: random.Random) -> str:
+    return f"0x{generator.randrange(ADDRESSES) * _ADDRESS_MULTIPLIER % 2 ** 160:040x}"
+
+
+def synthetic_rows(count: int, seed: int = 0) -> Iterator[Dict[str, str]]:
+    """
+    Generate `count` rows as csv.DictReader reads them from ethereum_txs.csv: every value a string, optional ones empty.
+
+    Blocks hold TRANSACTIONS_PER_BLOCK transactions and are SECONDS_PER_BLOCK apart, from the first block of the file.
+    """
+    generator = random.Random(seed)
+    cumulative_gas_used = 0
+    for index in range(count):
+        block_offset, transaction_index = divmod(index, TRANSACTIONS_PER_BLOCK)
+        if transaction_index == 0:
+            cumulative_gas_used = 0
+        block_number = FIRST_BLOCK + block_offset
+        timestamp = FIRST_BLOCK_TIME + timedelta(seconds=SECONDS_PER_BLOCK * block_offset)
+        gas = generator.choice((21000, 60000, 100000, 250000, 1000000))
+        gas_used = gas if gas == 21000 else generator.randrange(21000, gas)
+        cumulative_gas_used += gas_used
+        gas_price = generator.randrange(15 * 10 ** 9, 60 * 10 ** 9)
+        dynamic_fee = generator.random() < 0.8
+        creates_contract = generator.random() < CONTRACT_CREATIONS
+        yield {
+            "hash": f"0x{generator.getrandbits(256):064x}",
+            "nonce": str(generator.randrange(200000)),
+            "block_hash": f"0x{block_number * _HASH_MULTIPLIER % 2 ** 256:064x}",
+            "block_number": str(block_number),
+            "transaction_index": str(transaction_index),
+            "from_address": _address(generator),
+            "to_address": "" if creates_contract else _address(generator),
+            "value": str(generator.randrange(10 ** 18) if generator.random() < 0.5 else 0),
+            "gas": str(gas),
+            "gas_price": str(gas_price),
+            "block_timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S.%f UTC"),
+            "max_fee_per_gas": str(gas_price + generator.randrange(10 ** 10)) if dynamic_fee else "",
+            "max_priority_fee_per_gas": str(generator.randrange(3 * 10 ** 9)) if dynamic_fee else "",
+            "transaction_type": "2" if dynamic_fee else "0",
+            "receipts_cumulative_gas_used": str(cumulative_gas_used),
+            "receipts_gas_used": str(gas_used),
+            "receipts_contract_address": _address(generator) if creates_contract else "",
+            "receipts_root": "",
+            "receipts_status": "1",
+            "receipts_effective_gas_price": str(gas_price),
+        }
+
+
+def write_csv(path: str, count: int, seed: int = 0) -> None:
+    """
+    Write a synthetic dataset of `count` rows to a CSV file with the header of ethereum_txs.csv.
+    """
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(synthetic_rows(count, seed))
+
+
+def dataset_time_range(count: int) -> Tuple[datetime, datetime]:
+    return FIRST_BLOCK_TIME, FIRST_BLOCK_TIME + timedelta(seconds=SECONDS_PER_BLOCK * (count // TRANSACTIONS_PER_BLOCK))
+
+
+class SyntheticPriceStore:
+    """
+    A price store for CoinGeckoClientWithCache holding a price every PRICE_INTERVAL over a time range, which it
+    reports as already fetched, so the client prices the timestamps of the range without calling CoinGecko.
+
+    Args:
+        start (datetime): The first timestamp priced.
+        end (datetime): The last timestamp priced.
+    """
+
+    def __init__(self, start: datetime, end: datetime):
+        self.start = start - PRICE_INTERVAL
+        self.end = end + PRICE_INTERVAL
+        points = int((self.end - self.start) / PRICE_INTERVAL) + 1
+        self.prices = {
+            self.start + PRICE_INTERVAL * index: 1850. + 50. * math.sin(index / 100) for index in range(points)
+        }
+
+    def load(self, crypto: str):
+        return dict(self.prices), [(self.start, self.end)]
+
+    def save(self, crypto: str, prices: Dict[datetime, float], start: datetime, end: datetime) -> None:
+        raise AssertionError(f"The synthetic prices cover the dataset, nothing should be fetched ({start} to {end})")
+
+
+def measure(operation: Callable[[Any], Any], arguments: Iterable, items_per_op: int = 1,
+            repeat: int = 1) -> Dict[str, float]:
+    """
+    Call `operation` once per argument, timing each call.
+
+    Args:
+        operation (Callable[[Any], Any]): The operation measured.
+        arguments (Iterable): The argument of each call. A sequence when `repeat` is above 1.
+        items_per_op (int): Items processed by a call, e.g. the rows of a batch.
+        repeat (int): Passes over the arguments. The fastest pass is reported, the others absorb the warm-up and
+            the noise of other processes. Only for operations whose cost does not change from one pass to the next.
+
+    Returns:
+        Dict[str, float]: The number of operations, the items processed per second over the time spent in the calls,
+        and the mean, median, 90th and 99th percentile and maximum latency of a call, in microseconds.
+    """
+    passes = []
+    for _ in range(repeat):
+        pass_latencies = []
+        for argument in arguments:
+            started = time.perf_counter()
+            operation(argument)
+            pass_latencies.append(time.perf_counter() - started)
+        passes.append(pass_latencies)
+    latencies = np.array(min(passes, key=sum)) * 1e6
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {
+        "ops": len(latencies),
+        "items_per_op": items_per_op,
+        "throughput_per_second": len(latencies) * items_per_op / latencies.sum() * 1e6,
+        "mean_us": float(latencies.mean()),
+        "p50_us": float(p50),
+        "p90_us": float(p90),
+        "p99_us": float(p99),
+        "max_us": float(latencies.max()),
+    }
+
+
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _processed(row: Dict[str, str]) -> ProcessedTransaction:
+    # Stored without the validation and pricing stages, which are measured on their own
+    gas_used = int(row["receipts_gas_used"])
+    return ProcessedTransaction(
+        hash=row["hash"], fromAddress=row["from_address"], toAddress=row["to_address"],
+        blockNumber=int(row["block_number"]),
+        executedAt=datetime.strptime(row["block_timestamp"], "%Y-%m-%d %H:%M:%S.%f UTC"), gasUsed=gas_used,
+        gasCostInDollars=gas_used * int(row["receipts_effective_gas_price"]) / 1e18 * 1850.,
+    )
+
+
+def run_size(count: int, sample: int, write_sample: int, seed: int = 0,
+             repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """
+    Run every stage on a synthetic dataset of `count` rows.
+
+    Args:
+        count (int): Rows of the dataset.
+        sample (int): Rows validated and priced.
+        write_sample (int): Transactions written one at a time by the sql_create stage.
+        seed (int): Seed of the dataset.
+        repeat (int): Passes of the stages that do not write, see `measure`.
+    """
+    results = {}
+    rows = list(synthetic_rows(min(count, sample), seed))
+    results["validate_raw_transaction"] = measure(lambda row: RawTransaction(**row), rows, repeat=repeat)
+    decoder = RowDecoder(CSV_COLUMNS)
+    results["decode_rows"] = measure(
+        decoder.decode, list(_batches(([row[column] for column in CSV_COLUMNS] for row in rows),
+                                      CsvProcessor.DECODE_BATCH_SIZE)),
+        items_per_op=CsvProcessor.DECODE_BATCH_SIZE, repeat=repeat,
+    )
+
+    client = CoinGeckoClientWithCache(price_store=SyntheticPriceStore(*dataset_time_range(count)))
+    processor = CsvProcessor(CryptoToUsd(client=client, eth_to_usd_cache={}), db_repository=None)
+    transactions = [RawTransaction(**row) for row in rows]
+    results["compute_gas_cost_in_usd"] = measure(processor.compute_gas_cost_in_usd, transactions, repeat=repeat)
+    results["compute_gas_costs_in_usd"] = measure(processor.compute_gas_costs_in_usd,
+                                                  list(_batches(transactions, BATCH_SIZE)), items_per_op=BATCH_SIZE,
+                                                  repeat=repeat)
+    results["coingecko_get"] = measure(lambda timestamp: client.get("ethereum", timestamp),
+                                       [transaction.block_timestamp for transaction in transactions], repeat=repeat)
+    del rows, transactions
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+        engine = make_engine(url)
+        read_engine = make_engine(url, read_only=True, pool_size=READ_POOL_SIZE)
+        try:
+            Base.metadata.create_all(bind=engine)
+            repository = SqlRepository(batch_size=BATCH_SIZE, session_factory=sessionmaker(bind=engine),
+                                       read_session_factory=sessionmaker(bind=read_engine))
+            results["sql_create_many"] = measure(
+                repository.create_many, _batches(map(_processed, synthetic_rows(count, seed)), BATCH_SIZE),
+                items_per_op=BATCH_SIZE,
+            )
+            # Hashes of another seed, so they are not stored yet
+            results["sql_create"] = measure(repository.create, map(_processed, synthetic_rows(write_sample, seed + 1)))
+            results["sql_get_stats"] = measure(lambda _: repository.get_stats(), range(STATS_READS), repeat=repeat)
+        finally:
+            engine.dispose()
+            read_engine.dispose()
+    return results
+
+
+def run(sizes: List[str], sample: int, write_sample: int, seed: int = 0, repeat: int = 3) -> Dict[str, Any]:
+    """
+    Run the stages on the datasets of the given SIZES.
+
+    Returns:
+        Dict[str, Any]: The results of each stage by size name, and the environment they were measured in.
+    """
+    return {
+        "environment": environment(),
+        "parameters": {"sample": sample, "write_sample": write_sample, "seed": seed, "repeat": repeat},
+        "sizes": {size: run_size(SIZES[size], sample, write_sample, seed, repeat) for size in sizes},
+    }
+
+
+def environment() -> Dict[str, Optional[str]]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "measured_at": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": str(os.cpu_count()),
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Compare the results of a run with a baseline run.
+
+    A stage regressed when its median latency grew, or its throughput dropped, by more than `tolerance`
+    (e.g. 0.2 for 20%). Stages and sizes missing from either run are not compared.
+
+    Returns:
+        List[str]: A description of each regression.
+    """
+    regressions = []
+    for size, stages in results["sizes"].items():
+        for stage, current in stages.items():
+            previous = baseline.get("sizes", {}).get(size, {}).get(stage)
+            if previous is None:
+                continue
+            slowdown = max(current["p50_us"] / previous["p50_us"],
+                           previous["throughput_per_second"] / current["throughput_per_second"]) - 1
+            if slowdown > tolerance:
+                regressions.append(
+                    f"{size} {stage}: p50 {previous['p50_us']:.1f} -> {current['p50_us']:.1f} us, throughput "
+                    f"{previous['throughput_per_second']:.0f} -> {current['throughput_per_second']:.0f}/s "
+                    f"({slowdown:+.0%})"
+                )
+    return regressions
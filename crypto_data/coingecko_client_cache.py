@@ -1,9 +1,51 @@
 import requests
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from typing import Tuple
+from email.utils import parsedate_to_datetime
+from functools import wraps
+from typing import List, Optional, Tuple, Sequence
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
-from time import sleep
 import bisect
+import threading
+
+from metrics import Counter
+from .interval_set import IntervalSet
+from .rate_limiter import TokenBucket
+
+# CoinGecko market_chart/range granularity tiers, newest first:
+# (maximum age of the prices, maximum range of a single call, granularity of the prices)
+GRANULARITY_TIERS = (
+    (timedelta(days=1), timedelta(days=1), timedelta(minutes=5)),
+    (timedelta(days=90), timedelta(days=90), timedelta(hours=1)),
+    (None, None, timedelta(days=1)),
+)
+
+COINGECKO_REQUESTS = Counter(
+    "ratedapi_coingecko_requests_total", "Calls to the CoinGecko API by HTTP status, 'error' when no response came",
+    ["status"],
+)
+COINGECKO_WAIT_SECONDS = Counter(
+    "ratedapi_coingecko_wait_seconds_total",
+    "Seconds the CoinGecko calls waited for the rate limiter, including the pauses after a 429 Too Many Requests",
+)
+PRICE_CACHE_REQUESTS = Counter(
+    "ratedapi_price_cache_requests_total",
+    "Timestamps priced by CoinGeckoClientWithCache, by result: a hit when a cached price covers them, "
+    "a miss when prices are fetched first",
+    ["result"],
+)
+_PRICE_CACHE_HITS = PRICE_CACHE_REQUESTS.labels("hit")
+_PRICE_CACHE_MISSES = PRICE_CACHE_REQUESTS.labels("miss")
+
+def _synchronized(method):
+    # Serialize the calls that read or update the cache, so prefetching in the background is safe
+    @wraps(method)
+    def synchronized(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return synchronized
 
 class CoinGeckoClientWithCache:
     """
@@ -13,17 +55,37 @@ class CoinGeckoClientWithCache:
     Ideally, in a prod environment it would retrieve this data from a prepopulated database using a SQL query, e.g.:
     'SELECT price from eth_to_usd WHERE {timestamp} <= timestamp ORDER BY timestamp DESC LIMIT 1'.
     
-    In lack of a database, a local in-memory cache is used that gets built on the fly,
-    as more (timestamp, price) pairs are retrieved from CoinGecko API calls.
+    A local in-memory cache is used that gets built on the fly, as more (timestamp, price) pairs
+    are retrieved from CoinGecko API calls. When a price store is given (e.g. database.SqlPriceStore),
+    the cache is loaded from it on first use and every fetched range is persisted to it, together with
+    the range itself, so ranges fetched before a restart are never fetched again.
 
     The approximate price returned for a transaction will be the last known price before the transaction timestamp.
     Which depending on the transaction age can be up to 5 minutes, 1 hour or 1 day before.
+    The fetched time ranges are tracked in an interval set: a cached price is only used for a timestamp when both
+    lie in the same fetched interval, so a price is never taken from before a range that was never fetched.
+
+    For bulk processing, `prefetch` fetches a whole time range upfront, with the fewest CoinGecko calls
+    that keep the granularity of each tier (see `plan_fetches`). The calls are made concurrently over a pooled
+    HTTP session, under a shared token-bucket rate limit. A 429 response pauses every call for the time given
+    by its Retry-After header. Lookups are serialized with the prefetch, so it can run in a background thread.
 
     The primary purpose of using a local cache is to minimize API calls to
     CoinGecko and improve the efficiency of data retrieval.
 
+    Args:
+        price_store (optional): A persistent store with `load(crypto)` and `save(crypto, prices, start, end)` methods.
+        base_url (str): The CoinGecko API base URL. Can point to a local stand-in such as FakeCoinGeckoServer.
+        max_concurrent_requests (int): Maximum number of CoinGecko calls in flight, and size of the connection pool.
+        requests_per_minute (float): Sustained CoinGecko call rate allowed by the rate limiter.
+        rate_limiter (TokenBucket, optional): A rate limiter to use instead of one built from requests_per_minute,
+            e.g. to share a limit between clients.
+        max_retries (int): Number of times a rate-limited call is retried before its HTTPError is raised.
+        timeout (float): Timeout in seconds of a single CoinGecko call.
+
     Attributes:
         cache (dict): A dictionary storing timestamp-price pairs, serving as a local cache.
+        coverage (IntervalSet): The time ranges already fetched.
 
     Usage:
         client = CoinGeckoClientWithCache()
@@ -31,41 +93,261 @@ class CoinGeckoClientWithCache:
     """
 
     BASE_URL = "https://api.coingecko.com/api/v3"
-    
-    def __init__(self):
+    DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+    DEFAULT_REQUESTS_PER_MINUTE = 30
+    DEFAULT_MAX_RETRIES = 3
+    DEFAULT_TIMEOUT = 30.
+    # Wait used when a 429 response has no usable Retry-After header
+    DEFAULT_RETRY_AFTER = 60.
+
+    def __init__(self, price_store=None, base_url: str = BASE_URL,
+                 max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+                 requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE, rate_limiter: Optional[TokenBucket] = None,
+                 max_retries: int = DEFAULT_MAX_RETRIES, timeout: float = DEFAULT_TIMEOUT):
+        if max_concurrent_requests < 1:
+            raise ValueError("max_concurrent_requests must be a positive integer")
+
+        self.price_store = price_store
+        self.base_url = base_url
+        self.max_concurrent_requests = max_concurrent_requests
+        self.rate_limiter = rate_limiter or TokenBucket(rate=requests_per_minute / 60, capacity=max_concurrent_requests)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent_requests)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.RLock()
         self.cache = {}
         self.sorted_timestamps = []
+        self.coverage = IntervalSet()
+        # (unix seconds, prices) arrays mirroring sorted_timestamps, rebuilt lazily after the cache changes
+        self._price_series = None
+        # (unix seconds starts, unix seconds ends) arrays mirroring coverage, rebuilt lazily after it changes
+        self._coverage_series = None
+        self._loaded_cryptos = set()
 
+    @_synchronized
     def get(self, crypto: str, timestamp: datetime) -> float:
+        self._load(crypto)
+        timestamp = self._as_utc(timestamp)
 
-        pos = bisect.bisect_left(self.sorted_timestamps, timestamp)
+        # If the timestamp was fetched along with a price before it
+        price = self._get_cached(timestamp)
+        if price is not None:
+            _PRICE_CACHE_HITS.inc()
+            return price
 
-        # If the exact timestamp is found in cache
-        if pos < len(self.sorted_timestamps) and self.sorted_timestamps[pos] == timestamp:
-            return self.cache[timestamp]
+        _PRICE_CACHE_MISSES.inc()
+        return self._fetch_around(crypto, timestamp)
 
-        # If a lower timestamp is found in cache
-        elif pos > 0:
-            return self.cache[self.sorted_timestamps[pos-1]]
-        
-        # If not found in cache, fetch data from CoinGecko
+    def _fetch_around(self, crypto: str, timestamp: datetime) -> Optional[float]:
+        # If not found in cache, fetch the parts of the range around the timestamp that were not fetched yet from CoinGecko.
+        # When the timestamp itself was fetched, only the prices before it are missing
         from_timestamp, to_timestamp = self._get_time_range(timestamp)
-        new_data = self._fetch_data_from_coingecko(crypto, from_timestamp, to_timestamp)
-        
-        # Update cache and sorted timestamps list
-        for key, value in new_data.items():
-            utc_timestamp = key.replace(tzinfo=timezone.utc)
-            bisect.insort_left(self.sorted_timestamps, utc_timestamp)
-            self.cache[utc_timestamp] = value
-            
+        if timestamp in self.coverage:
+            to_timestamp = timestamp
+        for gap_start, gap_end in self.coverage.gaps(from_timestamp, to_timestamp):
+            self._fetch_range(crypto, gap_start, gap_end)
+
         # Try retrieving the value again from cache after update
-        pos = bisect.bisect_left(self.sorted_timestamps, timestamp)
-        if pos < len(self.sorted_timestamps) and self.sorted_timestamps[pos] == timestamp:
-            return self.cache[timestamp]
-        elif pos > 0:
-            return self.cache[self.sorted_timestamps[pos-1]]        
-        
-        return None  # If value is still not found after the update 
+        return self._get_cached(timestamp)  # None if CoinGecko has no price before the timestamp
+
+    @_synchronized
+    def get_many(self, crypto: str, timestamps: Sequence[datetime]) -> np.ndarray:
+        """
+        Get the approximate prices for a whole block of timestamps at once.
+
+        Same semantics as `get`: each timestamp is priced with the last known price at or before it.
+        Instead of one bisect per timestamp, the cache is first filled for the timestamps that have no cached price,
+        then all the timestamps are mapped to prices and fetched ranges with searchsorted over the sorted series.
+
+        Args:
+            crypto (str): The cryptocurrency to query for, e.g., 'ethereum'.
+            timestamps (Sequence[datetime]): The timestamps to price. Naive timestamps are considered UTC.
+
+        Returns:
+            np.ndarray: The prices, in the order of the timestamps. NaN where no price is known.
+        """
+        self._load(crypto)
+        seconds = np.fromiter(
+            (self._as_utc(t).timestamp() for t in timestamps), dtype=np.float64, count=len(timestamps)
+        )
+        if not len(seconds):
+            return np.empty(0)
+
+        # Fetch from CoinGecko starting with the oldest timestamp without a cached price.
+        # A single fetch covers a wide range, so this usually takes a single iteration.
+        # Timestamps are only fetched once: after a fetch, a timestamp without a price has none on CoinGecko
+        fetched_up_to = -np.inf
+        positions, found = self._find_cached(seconds)
+        hits = int(found.sum())
+        _PRICE_CACHE_HITS.inc(hits)
+        _PRICE_CACHE_MISSES.inc(len(seconds) - hits)
+        while True:
+            missing = seconds[~found & (seconds > fetched_up_to)]
+            if not len(missing):
+                break
+
+            fetched_up_to = missing.min()
+            self._fetch_around(crypto, datetime.fromtimestamp(fetched_up_to, tz=timezone.utc))
+            positions, found = self._find_cached(seconds)
+
+        _, series_prices = self._get_price_series()
+        prices = np.full(len(seconds), np.nan)
+        prices[found] = series_prices[positions[found]]
+        return prices
+
+    @_synchronized
+    def plan_fetches(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """
+        Plan the fewest CoinGecko calls fetching every price needed between two timestamps.
+
+        The range is extended backwards by the granularity of its oldest tier, so that its first timestamp has
+        a price at or before it. The range is then split on the granularity tiers, the ranges already fetched
+        are left out and what remains is cut into calls no longer than the tier allows, so that every call gets
+        prices at the granularity of its tier.
+
+        Args:
+            start (datetime): The oldest timestamp to price, e.g. the oldest transaction of a file.
+            end (datetime): The newest timestamp to price.
+
+        Returns:
+            List[Tuple[datetime, datetime]]: The (from, to) ranges to fetch, oldest first.
+        """
+        current_time = datetime.utcnow().replace(tzinfo=timezone.utc)
+        start = self._as_utc(start)
+        end = min(self._as_utc(end), current_time)
+
+        for max_age, _, granularity in GRANULARITY_TIERS:
+            if max_age is None or current_time - start <= max_age:
+                start -= granularity
+                break
+
+        ranges = []
+        tier_end = end
+        for max_age, max_range, _ in GRANULARITY_TIERS:
+            tier_start = start if max_age is None else max(start, current_time - max_age)
+            if tier_start < tier_end:
+                for gap_start, gap_end in self.coverage.gaps(tier_start, tier_end):
+                    while max_range is not None and gap_end - gap_start > max_range:
+                        ranges.append((gap_start, gap_start + max_range))
+                        gap_start += max_range
+                    ranges.append((gap_start, gap_end))
+
+            tier_end = min(tier_end, tier_start)
+            if tier_end <= start:
+                break
+
+        return sorted(ranges)
+
+    @_synchronized
+    def prefetch(self, crypto: str, start: datetime, end: datetime) -> int:
+        """
+        Fetch every price needed between two timestamps upfront, as planned by `plan_fetches`.
+
+        The planned ranges are fetched concurrently, up to max_concurrent_requests at a time.
+
+        Returns:
+            int: The number of CoinGecko calls made.
+        """
+        self._load(crypto)
+        ranges = self.plan_fetches(start, end)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_requests, thread_name_prefix="coingecko") as executor:
+            fetches = [executor.submit(self._fetch_data_from_coingecko, crypto, *time_range) for time_range in ranges]
+            # Ranges are added in order as they complete, so a failure keeps what was fetched before it
+            for (from_timestamp, to_timestamp), fetch in zip(ranges, fetches):
+                self._add_range(crypto, from_timestamp, to_timestamp, fetch.result())
+
+        print(f"[CoinGeckoClientWithCache] Prefetched {crypto} prices between {start} and {end} with {len(ranges)} call(s)")
+        return len(ranges)
+
+    def _load(self, crypto: str) -> None:
+        # Load what the price store has for the cryptocurrency, once
+        if self.price_store is None or crypto in self._loaded_cryptos:
+            return
+        self._loaded_cryptos.add(crypto)
+
+        prices, coverage = self.price_store.load(crypto)
+        self._add_prices(prices)
+        for start, end in coverage:
+            self._add_coverage(start, end)
+
+    def _fetch_range(self, crypto: str, from_timestamp: datetime, to_timestamp: datetime) -> None:
+        self._add_range(crypto, from_timestamp, to_timestamp,
+                        self._fetch_data_from_coingecko(crypto, from_timestamp, to_timestamp))
+
+    def _add_range(self, crypto: str, from_timestamp: datetime, to_timestamp: datetime, new_data: dict) -> None:
+        new_data = {key.replace(tzinfo=timezone.utc): value for key, value in new_data.items()}
+
+        # Update cache, sorted timestamps list and fetched ranges
+        self._add_prices(new_data)
+        self._add_coverage(from_timestamp, to_timestamp)
+        if self.price_store is not None:
+            self.price_store.save(crypto, new_data, from_timestamp, to_timestamp)
+
+    def _add_prices(self, prices: dict) -> None:
+        if not prices:
+            return
+        new_timestamps = sorted(timestamp for timestamp in prices if timestamp not in self.cache)
+        self.cache.update(prices)
+        # Timsort merges the two sorted runs in linear time, which is faster than one insort per price
+        # when loading a large store
+        self.sorted_timestamps = sorted(self.sorted_timestamps + new_timestamps)
+        self._price_series = None
+
+    def _add_coverage(self, start: datetime, end: datetime) -> None:
+        self.coverage.add(start, end)
+        self._coverage_series = None
+
+    def _get_cached(self, timestamp: datetime) -> float:
+        # The last price at or before the timestamp, if it was fetched in the same range as the timestamp
+        interval = self.coverage.find(timestamp)
+        if interval is None:
+            return None
+
+        pos = bisect.bisect_right(self.sorted_timestamps, timestamp)
+        if pos > 0 and self.sorted_timestamps[pos - 1] >= interval[0]:
+            return self.cache[self.sorted_timestamps[pos - 1]]
+        return None
+
+    def _find_cached(self, seconds: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Vectorized _get_cached: the positions of the prices in the price series, and whether they are valid
+        series_timestamps, _ = self._get_price_series()
+        coverage_starts, coverage_ends = self._get_coverage_series()
+        positions = np.searchsorted(series_timestamps, seconds, side='right') - 1
+        if not len(series_timestamps) or not len(coverage_starts):
+            return positions, np.zeros(len(seconds), dtype=bool)
+
+        intervals = np.searchsorted(coverage_starts, seconds, side='right') - 1
+        found = (positions >= 0) & (intervals >= 0)
+        positions_or_first = np.maximum(positions, 0)
+        intervals_or_first = np.maximum(intervals, 0)
+        found &= seconds <= coverage_ends[intervals_or_first]
+        found &= series_timestamps[positions_or_first] >= coverage_starts[intervals_or_first]
+        return positions, found
+
+    def _get_price_series(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._price_series is None:
+            self._price_series = (
+                np.array([t.timestamp() for t in self.sorted_timestamps], dtype=np.float64),
+                np.array([self.cache[t] for t in self.sorted_timestamps], dtype=np.float64),
+            )
+        return self._price_series
+
+    def _get_coverage_series(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._coverage_series is None:
+            self._coverage_series = (
+                np.array([t.timestamp() for t in self.coverage.starts], dtype=np.float64),
+                np.array([t.timestamp() for t in self.coverage.ends], dtype=np.float64),
+            )
+        return self._coverage_series
+
+    @staticmethod
+    def _as_utc(timestamp: datetime) -> datetime:
+        # Naive timestamps are considered UTC
+        return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
 
     def _fetch_data_from_coingecko(self, crypto: str, from_timestamp: datetime, to_timestamp: datetime) -> dict:
         """
@@ -83,12 +365,18 @@ class CoinGeckoClientWithCache:
         from_unix_timestamp = int(from_timestamp.timestamp())
         to_unix_timestamp = int(to_timestamp.timestamp())
         
-        endpoint = f"{self.BASE_URL}/coins/{crypto}/market_chart/range?vs_currency=usd&from={from_unix_timestamp}&to={to_unix_timestamp}"
+        endpoint = f"{self.base_url}/coins/{crypto}/market_chart/range?vs_currency=usd&from={from_unix_timestamp}&to={to_unix_timestamp}"
 
-        retries = 3
-        while retries > 0:
+        retries = self.max_retries
+        while True:
+            COINGECKO_WAIT_SECONDS.inc(self.rate_limiter.acquire())
             try:
-                response = requests.get(endpoint)
+                try:
+                    response = self.session.get(endpoint, timeout=self.timeout)
+                except requests.RequestException:
+                    COINGECKO_REQUESTS.labels("error").inc()
+                    raise
+                COINGECKO_REQUESTS.labels(response.status_code).inc()
                 response.raise_for_status()
                 prices = response.json().get('prices', [])
                 
@@ -97,9 +385,11 @@ class CoinGeckoClientWithCache:
                 
             except HTTPError as e:
                 # Check if it's a rate limit error
-                if e.response.status_code == 429:
-                    print("[CoinGeckoClientWithCache] Rate limit hit. Waiting for 60 seconds before retrying...")
-                    sleep(60)
+                if e.response.status_code == 429 and retries > 0:
+                    retry_after = self._get_retry_after(e.response)
+                    print(f"[CoinGeckoClientWithCache] Rate limit hit. Waiting for {retry_after:.0f} seconds before retrying...")
+                    # Pauses the other calls too, they would be rate limited as well
+                    self.rate_limiter.pause(retry_after)
                     retries -= 1
                 else:
                     print(f"[CoinGeckoClientWithCache] An unexpected HTTP error occurred when calling {endpoint}:\n{e}")
@@ -108,8 +398,20 @@ class CoinGeckoClientWithCache:
             except Exception as e:
                 print(f"[CoinGeckoClientWithCache] An unexpected error occurred when calling {endpoint}:\n{e}")
                 raise e  
-        
-        return {}
+
+    def _get_retry_after(self, response: requests.Response) -> float:
+        # Retry-After is either a number of seconds or an HTTP date
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is None:
+            return self.DEFAULT_RETRY_AFTER
+        try:
+            return max(float(retry_after), 0.)
+        except ValueError:
+            pass
+        try:
+            return max((parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds(), 0.)
+        except (TypeError, ValueError):
+            return self.DEFAULT_RETRY_AFTER
 
     def _get_time_range(self, timestamp: datetime):
         # Data granularity for coingecko api is automatic (cannot be adjusted)
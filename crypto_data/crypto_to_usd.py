@@ -1,4 +1,16 @@
 from datetime import datetime
+from typing import Sequence
+import numpy as np
+
+from metrics import Counter
+
+ETH_TO_USD_CACHE_REQUESTS = Counter(
+    "ratedapi_eth_to_usd_cache_requests_total",
+    "Lookups of CryptoToUsd.eth_to_usd_cache by result, hit or miss. The blocks priced by get_many bypass it",
+    ["result"],
+)
+_HITS = ETH_TO_USD_CACHE_REQUESTS.labels("hit")
+_MISSES = ETH_TO_USD_CACHE_REQUESTS.labels("miss")
 
 class CryptoToUsd:
     """
@@ -11,6 +23,10 @@ class CryptoToUsd:
     Methods:
         get(crypto: str, timestamp: datetime) -> float:
             Get the value of a cryptocurrency in USD at a specific timestamp.
+        get_many(crypto: str, timestamps: Sequence[datetime]) -> np.ndarray:
+            Get the values of a cryptocurrency in USD for a block of timestamps.
+        prefetch(crypto: str, start: datetime, end: datetime) -> int:
+            Fetch the conversion rates needed between two timestamps upfront.
 
     Raises:
         ValueError: If the provided cryptocurrency is not supported.
@@ -41,7 +57,9 @@ class CryptoToUsd:
 
         # Check in the cache first
         if cache_key in self.eth_to_usd_cache:
+            _HITS.inc()
             return self.eth_to_usd_cache[cache_key]
+        _MISSES.inc()
 
         # If not in the cache, fetch using the injected client
         print(f"[CryptoToUsd] {cache_key} not in the eth_to_usd_cache. Will retrieve it using the http client.")
@@ -49,3 +67,44 @@ class CryptoToUsd:
         self.eth_to_usd_cache[cache_key] = usd_value
 
         return usd_value
+
+    def get_many(self, crypto: str, timestamps: Sequence[datetime]) -> np.ndarray:
+        """
+        Get the values of a cryptocurrency in USD for a block of timestamps.
+
+        The block is priced by the client in a single pass, bypassing the per-timestamp eth_to_usd_cache.
+
+        Args:
+            crypto (str): The cryptocurrency to convert (e.g., 'ethereum').
+            timestamps (Sequence[datetime]): The timestamps at which to fetch the conversion rates.
+
+        Returns:
+            np.ndarray: The values of the cryptocurrency in USD, in the order of the timestamps.
+
+        Raises:
+            ValueError: If the provided cryptocurrency is not supported.
+        """
+        if crypto != 'ethereum':
+            raise ValueError(f"Cryptocurrency {crypto} not supported")
+
+        return np.asarray(self.client.get_many(crypto, timestamps), dtype=np.float64)
+
+    def prefetch(self, crypto: str, start: datetime, end: datetime) -> int:
+        """
+        Fetch the conversion rates needed between two timestamps upfront, e.g. before processing a file.
+
+        Args:
+            crypto (str): The cryptocurrency to convert (e.g., 'ethereum').
+            start (datetime): The oldest timestamp that will be converted.
+            end (datetime): The newest timestamp that will be converted.
+
+        Returns:
+            int: The number of calls made by the client.
+
+        Raises:
+            ValueError: If the provided cryptocurrency is not supported.
+        """
+        if crypto != 'ethereum':
+            raise ValueError(f"Cryptocurrency {crypto} not supported")
+
+        return self.client.prefetch(crypto, start, end)
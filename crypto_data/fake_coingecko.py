@@ -0,0 +1,137 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+"""
+A local stand-in for the CoinGecko API, used to run the clients offline (tests, benchmarks, load tests).
+"""
+
+class FakeCoinGeckoServer:
+    """
+    Serves canned prices on `/api/v3/coins/{crypto}/market_chart/range`, the only CoinGecko endpoint used by the clients.
+
+    Every cryptocurrency gets the same price series. Runs in a background thread, on a random local port by default.
+
+    Args:
+        prices (List[Tuple[int, float]]): The (unix milliseconds, price) points served, sorted by timestamp.
+        host (str): The interface to listen on.
+        port (int): The port to listen on. 0 picks a free port.
+        latency (float): Seconds every response is delayed by, to simulate a remote server.
+
+    Attributes:
+        requests (List[str]): The paths of the requests received, in order.
+        max_in_flight (int): The largest number of requests handled at the same time.
+
+    Throttling is simulated with `throttle(count, retry_after)`: the next `count` requests are answered
+    with 429 Too Many Requests, with a Retry-After header when `retry_after` is given.
+
+    Usage:
+        with FakeCoinGeckoServer(prices) as server:
+            client = CoinGeckoClientWithCache(base_url=server.base_url)
+    """
+
+    def __init__(self, prices: List[Tuple[int, float]], host: str = "127.0.0.1", port: int = 0, latency: float = 0.):
+        self.prices = sorted(prices)
+        self.latency = latency
+        self.requests = []
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._throttled = 0
+        self._retry_after = None
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v3"
+
+    def start(self) -> 'FakeCoinGeckoServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> 'FakeCoinGeckoServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def throttle(self, count: int, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            self._throttled = count
+            self._retry_after = retry_after
+
+    def market_chart_range(self, from_seconds: float, to_seconds: float) -> dict:
+        from_ms, to_ms = from_seconds * 1000, to_seconds * 1000
+        return {"prices": [[timestamp, price] for timestamp, price in self.prices if from_ms <= timestamp <= to_ms]}
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests.append(self.path)
+                    fake._in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake._in_flight)
+                    throttled = fake._throttled > 0
+                    fake._throttled -= throttled
+                try:
+                    if fake.latency:
+                        time.sleep(fake.latency)
+                    self._respond(throttled)
+                finally:
+                    with fake._lock:
+                        fake._in_flight -= 1
+
+            def _respond(self, throttled: bool):
+                if throttled:
+                    headers = {} if fake._retry_after is None else {"Retry-After": str(fake._retry_after)}
+                    self._send(429, {"error": "Too Many Requests"}, headers)
+                    return
+
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if not url.path.endswith("/market_chart/range") or "from" not in query or "to" not in query:
+                    self._send(404, {"error": "Not found"})
+                    return
+
+                self._send(200, fake.market_chart_range(float(query["from"][0]), float(query["to"][0])))
+
+            def _send(self, status: int, body: dict, headers: Optional[dict] = None):
+                content = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                # Keep the test and benchmark output clean
+                pass
+
+        return Handler
+
+
+def hourly_prices(start_seconds: int, end_seconds: int, price: float = 1800.0, step: float = 1.0) -> List[Tuple[int, float]]:
+    """
+    Build a simple price series for the fake server: one point per hour, increasing by `step` each hour.
+    """
+    start_hour = start_seconds - start_seconds % 3600
+    return [
+        (timestamp * 1000, price + step * index)
+        for index, timestamp in enumerate(range(start_hour, end_seconds + 1, 3600))
+    ]
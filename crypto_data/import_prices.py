@@ -0,0 +1,60 @@
+import argparse
+import csv
+import json
+from datetime import datetime, timezone
+from typing import Dict
+
+"""
+Bulk importer seeding a price store from an offline price dump, so the ranges it covers are never fetched from CoinGecko.
+
+Supported dump formats:
+    - JSON, as returned by CoinGecko's market_chart/range endpoint: {"prices": [[unix_ms, price], ...], ...}
+    - CSV with a header and `timestamp,price` columns, timestamps in unix milliseconds.
+
+Usage:
+    python -m crypto_data.import_prices eth_usd_2023.json --crypto ethereum
+"""
+
+def read_price_dump(file_path: str) -> Dict[datetime, float]:
+    """
+    Read a price dump into UTC timestamp-price pairs.
+    """
+    if file_path.endswith('.json'):
+        with open(file_path, 'r') as dump:
+            points = json.load(dump)['prices']
+    else:
+        with open(file_path, 'r') as dump:
+            points = [(row['timestamp'], row['price']) for row in csv.DictReader(dump)]
+
+    return {
+        datetime.utcfromtimestamp(float(timestamp) / 1000).replace(tzinfo=timezone.utc): float(price)
+        for timestamp, price in points
+    }
+
+def import_price_dump(price_store, file_path: str, crypto: str = 'ethereum') -> int:
+    """
+    Import a price dump into the price store in a single transaction.
+
+    The whole range between the first and the last price of the dump is recorded as covered.
+
+    Returns:
+        int: The number of prices imported.
+    """
+    prices = read_price_dump(file_path)
+    if not prices:
+        return 0
+
+    price_store.save(crypto, prices, min(prices), max(prices))
+    return len(prices)
+
+if __name__ == "__main__":
+    from database import init_db, SqlPriceStore
+
+    parser = argparse.ArgumentParser(description="Seed the price store from an offline price dump")
+    parser.add_argument('file_path', help="The JSON or CSV price dump to import")
+    parser.add_argument('--crypto', dest='crypto', default='ethereum', help="The cryptocurrency the prices are for")
+    args = parser.parse_args()
+
+    init_db()
+    imported = import_price_dump(SqlPriceStore(), args.file_path, args.crypto)
+    print(f"[import_prices] Imported {imported} {args.crypto} prices from {args.file_path}")
@@ -0,0 +1,78 @@
+import bisect
+from typing import Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+class IntervalSet:
+    """
+    A set of closed intervals, kept sorted and merged so that no two intervals overlap or touch.
+
+    Lookups are O(log n) bisects over the interval starts and ends. Adding an interval is O(log n)
+    plus the cost of shifting the list, which is small since fetched ranges merge into few intervals.
+
+    Usage:
+        coverage = IntervalSet()
+        coverage.add(start, end)
+        coverage.find(timestamp)  # The (start, end) interval containing the timestamp, or None
+        coverage.gaps(start, end)  # The parts of [start, end] not covered yet
+    """
+
+    def __init__(self, intervals: Optional[List[Tuple[T, T]]] = None):
+        self._starts = []
+        self._ends = []
+        for start, end in intervals or []:
+            self.add(start, end)
+
+    @property
+    def starts(self) -> List[T]:
+        return list(self._starts)
+
+    @property
+    def ends(self) -> List[T]:
+        return list(self._ends)
+
+    def add(self, start: T, end: T) -> None:
+        if end < start:
+            raise ValueError(f"The interval end {end} is before its start {start}")
+
+        # Merge with every interval overlapping or touching [start, end]
+        first = bisect.bisect_left(self._ends, start)
+        last = bisect.bisect_right(self._starts, end)
+        if first < last:
+            start = min(start, self._starts[first])
+            end = max(end, self._ends[last - 1])
+
+        self._starts[first:last] = [start]
+        self._ends[first:last] = [end]
+
+    def find(self, value: T) -> Optional[Tuple[T, T]]:
+        position = bisect.bisect_right(self._starts, value) - 1
+        if position >= 0 and value <= self._ends[position]:
+            return self._starts[position], self._ends[position]
+        return None
+
+    def gaps(self, start: T, end: T) -> List[Tuple[T, T]]:
+        gaps = []
+        cursor = start
+        for position in range(bisect.bisect_left(self._ends, start), len(self._starts)):
+            if self._starts[position] > end:
+                break
+            if self._starts[position] > cursor:
+                gaps.append((cursor, self._starts[position]))
+            cursor = max(cursor, self._ends[position])
+
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def __contains__(self, value: T) -> bool:
+        return self.find(value) is not None
+
+    def __iter__(self) -> Iterator[Tuple[T, T]]:
+        return iter(zip(self._starts, self._ends))
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __repr__(self) -> str:
+        return f"IntervalSet({list(self)})"
@@ -0,0 +1,64 @@
+import threading
+import time
+from typing import Callable
+
+class TokenBucket:
+    """
+    A thread-safe token-bucket rate limiter.
+
+    Tokens are added at `rate` per second, up to `capacity`, and every call takes one. Calls beyond the
+    available tokens reserve future tokens and sleep until then, so concurrent callers are spread evenly
+    instead of all retrying at once. `pause` stops every caller for a while, e.g. when the server answers
+    429 Too Many Requests with a Retry-After header.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of tokens, i.e. the largest burst allowed.
+        clock (Callable[[], float]): Monotonic clock in seconds. Can be replaced in tests.
+        sleep (Callable[[float], None]): Sleep function. Can be replaced in tests.
+
+    Usage:
+        limiter = TokenBucket(rate=0.5, capacity=4)  # 30 calls per minute, bursts of 4
+        limiter.acquire()
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be a positive number of tokens per second")
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1 token")
+
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = capacity
+        self._updated_at = clock()
+        self._paused_until = self._updated_at
+
+    def acquire(self) -> float:
+        """
+        Take a token, sleeping until one is available.
+
+        Returns:
+            float: The number of seconds waited.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            wait = max(-self._tokens / self.rate, self._paused_until - now, 0.)
+
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """
+        Make every caller wait for at least `seconds` from now.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
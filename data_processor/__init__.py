@@ -1,2 +1,4 @@
 from .csv_processor import CsvProcessor
-from .raw_transaction import RawTransaction
\ No newline at end of file
+from .parallel_csv_processor import ParallelCsvProcessor
+from .raw_transaction import RawTransaction
+from .row_decoder import RowDecoder
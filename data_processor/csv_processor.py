@@ -1,10 +1,35 @@
 from pydantic import ValidationError
 from datetime import datetime
+from time import monotonic, perf_counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, List, Tuple
 import csv
+import numpy as np
 
 from .raw_transaction import RawTransaction
-from database import ProcessedTransaction, IRepository
+from .row_decoder import RowDecoder
+from database import ProcessedTransaction, IRepository, ON_CONFLICT_UPDATE
 from crypto_data.crypto_to_usd import CryptoToUsd
+from metrics import Counter
+
+INGEST_ROWS = Counter(
+    "ratedapi_ingest_rows_total",
+    "CSV rows by ingest stage: parsed (validated), rejected by the validation, skipped as already stored, "
+    "priced and inserted",
+    ["stage"],
+)
+INGEST_STAGE_SECONDS = Counter(
+    "ratedapi_ingest_stage_seconds_total",
+    "Seconds spent by the ingest per stage: parse (reading and validating rows, or waiting for the parsing workers), "
+    "prefetch (waiting for the ETH/USD prices), price and write",
+    ["stage"],
+)
+_PARSED, _REJECTED, _SKIPPED, _PRICED, _INSERTED = (
+    INGEST_ROWS.labels(stage) for stage in ("parsed", "rejected", "skipped", "priced", "inserted")
+)
+_PARSE_SECONDS, _PREFETCH_SECONDS, _PRICE_SECONDS, _WRITE_SECONDS = (
+    INGEST_STAGE_SECONDS.labels(stage) for stage in ("parse", "prefetch", "price", "write")
+)
 
 class CsvProcessor:
     """
@@ -13,40 +38,230 @@ class CsvProcessor:
     Args:
         crypto_to_usd_instance (CryptoToUsd): An instance of CryptoToUsd for currency conversion.
         db_repository (IRepository): A database repository for storing processed transactions.
+        batch_size (int): Maximum number of processed transactions buffered before they are written.
+        batch_timeout (float): Maximum number of seconds a buffered transaction waits before it is written.
+            The timeout is checked when a row arrives, so a stalled input does not flush a partial batch
+            until the next row or the end of the input.
+        on_conflict (str, optional): How the repository resolves hashes that are already stored ('ignore' or 'update').
+        skip_known_hashes (bool): Load the stored hashes once before processing and skip rows that are already
+            stored before they are validated and priced. Makes re-processing an unchanged file cheap.
+            Cannot be combined with on_conflict='update'.
+        prefetch_prices (bool): Scan the timestamps of the file and fetch all the ETH/USD prices they need upfront,
+            with as few calls as possible, instead of one call per cache miss during processing. The prefetch runs
+            in the background while the first rows are parsed, and pricing starts once it is done.
+        on_progress (Callable[[int, int], None], optional): Called after each batch is written, with the number of rows
+            written and skipped as already stored so far.
+        fast_decode (bool): Decode the rows in batches with a RowDecoder, into the fields processing needs only,
+            instead of validating each one as a RawTransaction. Rejects the same rows, several times faster.
 
     Methods:
-        process(file_path: str):
-            Process a CSV file containing cryptocurrency transaction data.
+        process(file_path: str) -> int:
+            Process a CSV file containing cryptocurrency transaction data. Returns the number of rows written.
         csv_stream(filename: str):
             Generate rows from a CSV file.
+        count_rows(file_path: str) -> int:
+            Count the data rows of a CSV file, without parsing them.
+        timestamp_range(file_path: str) -> Optional[Tuple[datetime, datetime]]:
+            Get the oldest and newest block timestamps of a CSV file.
+        process_raw_transactions(transactions: List[RawTransaction]) -> List[ProcessedTransaction]:
+            Process a block of raw cryptocurrency transactions, pricing them in a single vectorized pass.
+        compute_gas_costs_in_usd(transactions: List[RawTransaction]) -> np.ndarray:
+            Compute the gas costs of a block of transactions in USD.
         process_raw_transaction(transaction: RawTransaction) -> ProcessedTransaction:
-            Process a raw cryptocurrency transaction into a processed transaction.
+            Process a single raw transaction. Shortcut for a block of one transaction.
         compute_gas_cost_in_usd(transaction: RawTransaction) -> float:
-            Compute the gas cost of a transaction in USD.
+            Compute the gas cost of a single transaction in USD. Shortcut for a block of one transaction.
 
     """
     
-    def __init__(self, crypto_to_usd_instance: CryptoToUsd, db_repository: IRepository):
+    DEFAULT_BATCH_SIZE = 1000
+    DEFAULT_BATCH_TIMEOUT = 1.0
+    # Rows decoded per call to the RowDecoder with fast_decode
+    DECODE_BATCH_SIZE = 250
+
+    def __init__(self, crypto_to_usd_instance: CryptoToUsd, db_repository: IRepository,
+                 batch_size: int = DEFAULT_BATCH_SIZE, batch_timeout: float = DEFAULT_BATCH_TIMEOUT,
+                 on_conflict: Optional[str] = None, skip_known_hashes: bool = False, prefetch_prices: bool = False,
+                 on_progress: Optional[Callable[[int, int], None]] = None, fast_decode: bool = False):
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer")
+        if batch_timeout <= 0:
+            raise ValueError("batch_timeout must be a positive number of seconds")
+        if skip_known_hashes and on_conflict == ON_CONFLICT_UPDATE:
+            # The prefilter would drop every stored row before it reaches the repository, so nothing would be updated
+            raise ValueError("skip_known_hashes cannot be combined with on_conflict='update'")
+
         self.crypto_to_usd_instance = crypto_to_usd_instance
         self.db_repository = db_repository
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.on_conflict = on_conflict
+        self.skip_known_hashes = skip_known_hashes
+        self.prefetch_prices = prefetch_prices
+        self.on_progress = on_progress
+        self.fast_decode = fast_decode
+        self.rows_written = 0
+        self.rows_skipped = 0
 
-    def process(self, file_path: str):
+    def process(self, file_path: str) -> int:
         print(f"[CsvProcessor] Processing {file_path}")
-        for transaction_event in self.csv_stream(file_path):
+        started_at = monotonic()
+        self.rows_written = 0
+        self.rows_skipped = 0
+
+        prefetch = self._start_prefetch(file_path)
+        known_hashes = self.db_repository.get_all_hashes() if self.skip_known_hashes else None
+
+        if self.fast_decode:
+            transactions = self._decode_stream(file_path, known_hashes)
+        else:
+            transactions = self._validate_stream(self.csv_stream(file_path), known_hashes)
+        for raw_batch in self._timed_batches(transactions):
+            self._wait_for_prefetch(prefetch)
+            self._flush(self.process_raw_transactions(raw_batch))
+        self._wait_for_prefetch(prefetch)
+
+        self._report(self.rows_written, started_at)
+        return self.rows_written
+
+    def _validate_stream(self, transaction_events, known_hashes: Optional[set]):
+        for transaction_event in transaction_events:
+            if known_hashes is not None and transaction_event.get('hash') in known_hashes:
+                self.rows_skipped += 1
+                _SKIPPED.inc()
+                continue
+
             try:
                 raw_transaction = RawTransaction(**transaction_event)                
-                processed_transaction = self.process_raw_transaction(raw_transaction)
-                self.db_repository.create(processed_transaction)
-                
+
             except ValidationError as e:
                 # Handle the validation error, log it, emit a metric and alert etc.
                 print(f"Error processing transaction: {e}")
+                _REJECTED.inc()
+                continue
 
             except Exception as ex:
                 # TO DO: Emit a metric to alert on failed transactions
                 print(f"[CsvProcessor] An unexpected error occurred when processing {transaction_event}. Skipping it.\n{ex}")
                 raise ex
 
+            if known_hashes is not None:
+                # Also skips hashes repeated later in the same file
+                known_hashes.add(raw_transaction.hash)
+
+            yield raw_transaction
+
+    def _decode_stream(self, file_path: str, known_hashes: Optional[set]):
+        with open(file_path, 'r', newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, None)
+            if header is None:
+                return
+            decoder = RowDecoder(header)
+
+            rows = []
+            for row in reader:
+                if not row:
+                    continue
+                if known_hashes is not None and decoder.hash_of(row) in known_hashes:
+                    self.rows_skipped += 1
+                    _SKIPPED.inc()
+                    continue
+                rows.append(row)
+                if len(rows) >= self.DECODE_BATCH_SIZE:
+                    yield from self._decoded(decoder, rows, known_hashes)
+                    rows = []
+            if rows:
+                yield from self._decoded(decoder, rows, known_hashes)
+
+    def _decoded(self, decoder: RowDecoder, rows: list, known_hashes: Optional[set]):
+        transactions, rejected = decoder.decode(rows)
+        for row, reason in rejected:
+            print(f"Error processing transaction: {reason}\n{row}")
+            _REJECTED.inc()
+
+        for transaction in transactions:
+            if known_hashes is not None:
+                # Hashes repeated later in the same batch were not known when the rows were filtered
+                if transaction.hash in known_hashes:
+                    self.rows_skipped += 1
+                    _SKIPPED.inc()
+                    continue
+                known_hashes.add(transaction.hash)
+            yield transaction
+
+    def _batched(self, transactions):
+        # Buffer transactions and emit them in bulk, when the batch is full
+        # or when its oldest transaction has been waiting for longer than batch_timeout.
+        # The timeout is only checked when a transaction arrives
+        batch = []
+        batch_started_at = None
+
+        for transaction in transactions:
+            if not batch:
+                batch_started_at = monotonic()
+            batch.append(transaction)
+
+            if len(batch) >= self.batch_size or monotonic() - batch_started_at >= self.batch_timeout:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def _timed_batches(self, transactions):
+        # The batches of _batched, recording the time spent producing them and their rows.
+        # Timed per batch rather than per row, which would cost more than the counters are worth
+        started_at = perf_counter()
+        for batch in self._batched(transactions):
+            _PARSE_SECONDS.inc(perf_counter() - started_at)
+            _PARSED.inc(len(batch))
+            yield batch
+            started_at = perf_counter()
+
+    def _start_prefetch(self, file_path: str) -> Optional[Future]:
+        if not self.prefetch_prices:
+            return None
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        prefetch = executor.submit(self._prefetch, file_path)
+        executor.shutdown(wait=False)
+        return prefetch
+
+    def _prefetch(self, file_path: str):
+        try:
+            timestamp_range = self.timestamp_range(file_path)
+            if timestamp_range is not None:
+                self.crypto_to_usd_instance.prefetch('ethereum', *timestamp_range)
+        except Exception as e:
+            # Not fatal, the prices are then fetched on cache misses
+            print(f"[CsvProcessor] Could not prefetch the ETH/USD prices, they will be fetched as needed:\n{e}")
+
+    @staticmethod
+    def _wait_for_prefetch(prefetch: Optional[Future]):
+        if prefetch is not None:
+            started_at = perf_counter()
+            prefetch.result()
+            _PREFETCH_SECONDS.inc(perf_counter() - started_at)
+
+    def _flush(self, batch: list) -> int:
+        if not batch:
+            return 0
+        started_at = perf_counter()
+        self.db_repository.create_many(batch, on_conflict=self.on_conflict)
+        _WRITE_SECONDS.inc(perf_counter() - started_at)
+        _INSERTED.inc(len(batch))
+        self.rows_written += len(batch)
+        if self.on_progress is not None:
+            self.on_progress(self.rows_written, self.rows_skipped)
+        return len(batch)
+
+    def _report(self, rows_written: int, started_at: float):
+        elapsed = monotonic() - started_at
+        rows_per_second = rows_written / elapsed if elapsed > 0 else 0.
+        print(f"[CsvProcessor] Processed {rows_written} transactions in {elapsed:.2f}s ({rows_per_second:.0f} rows/sec)")
+        if self.rows_skipped:
+            print(f"[CsvProcessor] Skipped {self.rows_skipped} transactions that were already stored")
+
     def csv_stream(self, filename: str):
         # TO DO: We'd normally use Kafka or other message broker,
         # but we'll simulate an event stream using generators            
@@ -55,24 +270,83 @@ class CsvProcessor:
             for row in reader:
                 yield row
 
-    def process_raw_transaction(self, transaction: RawTransaction):
-        gas_cost_usd = self.compute_gas_cost_in_usd(transaction)
+    def count_rows(self, file_path: str) -> int:
+        # Counts line breaks, so it assumes rows without quoted line breaks, as ParallelCsvProcessor does
+        lines = 0
+        last_byte = b"\n"
+        with open(file_path, 'rb') as csvfile:
+            for block in iter(lambda: csvfile.read(1024 * 1024), b""):
+                lines += block.count(b"\n")
+                last_byte = block[-1:]
+        if last_byte != b"\n":
+            # Last line without a line break
+            lines += 1
+        # Without the header
+        return max(0, lines - 1)
 
-        return ProcessedTransaction(
-            hash=transaction.hash,
-            fromAddress=transaction.from_address,
-            toAddress=transaction.to_address,
-            blockNumber=transaction.block_number,
-            executedAt=transaction.block_timestamp,
-            gasUsed=transaction.receipts_gas_used,
-            gasCostInDollars=gas_cost_usd
-        )
+    def timestamp_range(self, file_path: str) -> Optional[Tuple[datetime, datetime]]:
+        # Only the block_timestamp column is parsed, in the format of the file (e.g. '2023-08-01 07:04:59.000000 UTC').
+        # Timestamps that do not parse are left to the validation of the rows
+        oldest = newest = None
+        with open(file_path, 'r', newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, [])
+            if 'block_timestamp' not in header:
+                return None
+            column = header.index('block_timestamp')
+
+            for row in reader:
+                try:
+                    timestamp = datetime.fromisoformat(row[column].replace(' UTC', '+00:00'))
+                except (IndexError, ValueError):
+                    continue
+                if oldest is None or timestamp < oldest:
+                    oldest = timestamp
+                if newest is None or timestamp > newest:
+                    newest = timestamp
+
+        return (oldest, newest) if oldest is not None else None
+
+    def process_raw_transaction(self, transaction: RawTransaction) -> ProcessedTransaction:
+        return self.process_raw_transactions([transaction])[0]
 
     def compute_gas_cost_in_usd(self, transaction: RawTransaction) -> float:
-        gas_cost_wei = transaction.receipts_gas_used * transaction.receipts_effective_gas_price
+        return float(self.compute_gas_costs_in_usd([transaction])[0])
+
+    def process_raw_transactions(self, transactions: List[RawTransaction]) -> List[ProcessedTransaction]:
+        started_at = perf_counter()
+        gas_costs_usd = self.compute_gas_costs_in_usd(transactions).tolist()
+
+        processed = [
+            ProcessedTransaction(
+                hash=transaction.hash,
+                fromAddress=transaction.from_address,
+                toAddress=transaction.to_address,
+                blockNumber=transaction.block_number,
+                executedAt=transaction.block_timestamp,
+                gasUsed=transaction.receipts_gas_used,
+                gasCostInDollars=gas_cost_usd
+            )
+            for transaction, gas_cost_usd in zip(transactions, gas_costs_usd)
+        ]
+        _PRICE_SECONDS.inc(perf_counter() - started_at)
+        _PRICED.inc(len(processed))
+        return processed
+
+    def compute_gas_costs_in_usd(self, transactions: List[RawTransaction]) -> np.ndarray:
+        # gas used * gas price is computed as floats since the amount in wei can overflow int64
+        count = len(transactions)
+        gas_used = np.fromiter((t.receipts_gas_used for t in transactions), dtype=np.float64, count=count)
+        gas_price = np.fromiter((t.receipts_effective_gas_price for t in transactions), dtype=np.float64, count=count)
+        timestamps = [t.block_timestamp for t in transactions]
+
+        gas_cost_wei = gas_used * gas_price
         gas_cost_gwei = gas_cost_wei / 1e9
         gas_cost_eth = gas_cost_gwei / 1e9
-        eth_to_usd = self.crypto_to_usd_instance.get('ethereum', transaction.block_timestamp)
-        gas_cost_usd = gas_cost_eth * eth_to_usd
+        eth_to_usd = np.asarray(self.crypto_to_usd_instance.get_many('ethereum', timestamps), dtype=np.float64)
+
+        if np.isnan(eth_to_usd).any():
+            missing = timestamps[int(np.argmax(np.isnan(eth_to_usd)))]
+            raise ValueError(f"[CsvProcessor] No ETH to USD price known at or before {missing}")
 
-        return gas_cost_usd
+        return gas_cost_eth * eth_to_usd
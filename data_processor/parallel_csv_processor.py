@@ -0,0 +1,320 @@
+import csv
+import io
+import multiprocessing
+import os
+import queue
+import threading
+from time import monotonic
+from typing import List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from .csv_processor import CsvProcessor, INGEST_ROWS
+from .raw_transaction import ParsedTransaction, RawTransaction
+from .row_decoder import RowDecoder
+
+# Sentinels exchanged between the pipeline stages
+_WORKER_ROWS = "rows"
+_WORKER_DONE = "done"
+_WORKER_FAILED = "failed"
+
+_REJECTED = INGEST_ROWS.labels("rejected")
+_SKIPPED = INGEST_ROWS.labels("skipped")
+
+
+class ParallelCsvProcessor(CsvProcessor):
+    """
+    A CsvProcessor that parses and validates the CSV file on multiple cores.
+
+    The pipeline has three stages connected by bounded queues, so a slow stage applies backpressure
+    to the ones before it instead of letting rows pile up in memory:
+        1. Worker processes: each takes byte-range chunks of the file (split on line boundaries),
+           parses the rows, validates them as RawTransaction objects (or decodes them with a RowDecoder
+           with fast_decode) and sends only the fields needed downstream, as ParsedTransaction tuples.
+        2. The main process: groups the validated transactions into batches bounded by size and time
+           and prices each batch in a single vectorized pass (the ETH/USD cache lives here, so it is shared by all the rows).
+        3. A single writer thread: commits the batches through the repository.
+
+    When prices are prefetched, the workers keep parsing into the bounded queue while the prefetch runs.
+
+    The rows of the file are not written in order. Rows must not contain quoted line breaks,
+    since chunks are split on raw newlines.
+
+    Args:
+        crypto_to_usd_instance (CryptoToUsd): An instance of CryptoToUsd for currency conversion.
+        db_repository (IRepository): A database repository for storing processed transactions.
+        workers (int): Number of parsing worker processes. Defaults to the number of CPUs.
+        queue_size (int): Capacity of the queues between the stages, in messages.
+        chunk_size (int): Target size in bytes of the file chunks handed to the workers.
+        rows_per_message (int): Number of validated transactions a worker sends per message.
+        **kwargs: The batching and conflict options accepted by CsvProcessor.
+    """
+
+    DEFAULT_QUEUE_SIZE = 16
+    DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+    DEFAULT_ROWS_PER_MESSAGE = 500
+    # How often the main process checks that the workers are still alive while it waits for rows
+    WORKER_POLL_INTERVAL = 1.0
+
+    def __init__(self, crypto_to_usd_instance, db_repository, workers: Optional[int] = None,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 rows_per_message: int = DEFAULT_ROWS_PER_MESSAGE, **kwargs):
+        super().__init__(crypto_to_usd_instance, db_repository, **kwargs)
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.chunk_size = chunk_size
+        self.rows_per_message = rows_per_message
+
+    def process(self, file_path: str) -> int:
+        print(f"[ParallelCsvProcessor] Processing {file_path} with {self.workers} workers")
+        started_at = monotonic()
+        self.rows_written = 0
+        self.rows_skipped = 0
+
+        prefetch = self._start_prefetch(file_path)
+        known_hashes = self.db_repository.get_all_hashes() if self.skip_known_hashes else None
+        fieldnames, chunks = split_file(file_path, self.chunk_size)
+
+        task_queue = multiprocessing.Queue()
+        for chunk in chunks:
+            task_queue.put(chunk)
+        for _ in range(self.workers):
+            task_queue.put(None)
+
+        result_queue = multiprocessing.Queue(maxsize=self.queue_size)
+        workers = [
+            multiprocessing.Process(
+                target=parse_chunks,
+                args=(file_path, fieldnames, task_queue, result_queue, known_hashes, self.rows_per_message,
+                      self.fast_decode),
+                daemon=True,
+            )
+            for _ in range(self.workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        writer = _BatchWriter(self, self.queue_size)
+        writer.start()
+
+        try:
+            for parsed_batch in self._timed_batches(self._collect_parsed(result_queue, workers, known_hashes)):
+                self._wait_for_prefetch(prefetch)
+                writer.put(self.process_raw_transactions(parsed_batch))
+            self._wait_for_prefetch(prefetch)
+        except BaseException:
+            for worker in workers:
+                worker.terminate()
+            try:
+                writer.close()
+            except Exception as writer_error:
+                # Surface the original error, the writer's one is usually a consequence of it
+                print(f"[ParallelCsvProcessor] The writer also failed while stopping the pipeline:\n{writer_error}")
+            raise
+        finally:
+            for worker in workers:
+                worker.join()
+
+        rows_written = writer.close()
+        self._report(rows_written, started_at)
+        return rows_written
+
+    def _collect_parsed(self, result_queue, workers: List[multiprocessing.Process], known_hashes: Optional[set]):
+        reported_workers = 0
+        while reported_workers < len(workers):
+            try:
+                message, payload = result_queue.get(timeout=self.WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                # A worker killed by the OS (e.g. out of memory) never reports back
+                self._check_workers(workers, reported_workers, result_queue)
+                continue
+
+            if message == _WORKER_DONE:
+                reported_workers += 1
+                rows_skipped, rows_rejected = payload
+                self.rows_skipped += rows_skipped
+                _SKIPPED.inc(rows_skipped)
+                _REJECTED.inc(rows_rejected)
+                continue
+
+            if message == _WORKER_FAILED:
+                raise RuntimeError(f"[ParallelCsvProcessor] A worker failed while parsing the file:\n{payload}")
+
+            for parsed_transaction in payload:
+                if known_hashes is not None:
+                    # Workers only know the stored hashes, not the ones parsed by the other workers
+                    if parsed_transaction.hash in known_hashes:
+                        self.rows_skipped += 1
+                        _SKIPPED.inc()
+                        continue
+                    known_hashes.add(parsed_transaction.hash)
+
+                yield parsed_transaction
+
+    @staticmethod
+    def _check_workers(workers: List[multiprocessing.Process], reported_workers: int, result_queue):
+        failed = [worker for worker in workers if worker.exitcode not in (None, 0)]
+        if failed:
+            exit_codes = ", ".join(str(worker.exitcode) for worker in failed)
+            raise RuntimeError(f"[ParallelCsvProcessor] {len(failed)} worker(s) exited unexpectedly with exit code(s) {exit_codes}")
+
+        # A worker only exits once its messages are flushed to the queue, so an exited worker
+        # that has not reported while the queue is empty will never report
+        exited = sum(1 for worker in workers if worker.exitcode is not None)
+        if exited > reported_workers and result_queue.empty():
+            raise RuntimeError("[ParallelCsvProcessor] A worker exited without reporting its results")
+
+
+class _BatchWriter(threading.Thread):
+    """
+    The single writer stage of ParallelCsvProcessor. Commits the batches it receives through the processor's repository.
+    """
+
+    def __init__(self, processor: CsvProcessor, queue_size: int):
+        super().__init__(daemon=True)
+        self.processor = processor
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.rows_written = 0
+        self.error = None
+
+    def run(self):
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                return
+            if self.error is not None:
+                # Keep draining the queue so the producer never blocks on a dead writer
+                continue
+            try:
+                self.rows_written += self.processor._flush(batch)
+            except Exception as e:
+                self.error = e
+
+    def put(self, batch: list):
+        if self.error is not None:
+            raise self.error
+        self.batches.put(batch)
+
+    def close(self) -> int:
+        self.batches.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.rows_written
+
+
+def split_file(file_path: str, chunk_size: int) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """
+    Split a CSV file into byte ranges of roughly chunk_size bytes that start and end on line boundaries.
+
+    Returns:
+        Tuple[List[str], List[Tuple[int, int]]]: The header fieldnames and the (start, end) offsets of the chunks.
+    """
+    file_size = os.path.getsize(file_path)
+
+    with open(file_path, 'rb') as csvfile:
+        header = csvfile.readline()
+        fieldnames = next(csv.reader([header.decode()]))
+
+        chunks = []
+        start = csvfile.tell()
+        while start < file_size:
+            csvfile.seek(min(start + chunk_size, file_size))
+            # Move the end of the chunk to the end of the line it falls in
+            csvfile.readline()
+            end = min(csvfile.tell(), file_size)
+            chunks.append((start, end))
+            start = end
+
+    return fieldnames, chunks
+
+
+def parse_chunks(file_path: str, fieldnames: List[str], task_queue, result_queue,
+                 known_hashes: Optional[set], rows_per_message: int, fast_decode: bool = False):
+    """
+    Worker process entry point. Parses and validates the chunks read from task_queue until it gets None.
+
+    Validated transactions are sent to result_queue as ParsedTransaction tuples, in lists of rows_per_message.
+    Invalid rows are reported and skipped, as in CsvProcessor. The worker ends by sending the number of rows
+    it skipped as already stored and the number of invalid rows, which the main process counts in its metrics.
+    With fast_decode, the rows are decoded by a RowDecoder, a message at a time.
+    """
+    rows_skipped = 0
+    rows_rejected = 0
+    try:
+        decoder = RowDecoder(fieldnames) if fast_decode else None
+        with open(file_path, 'rb') as csvfile:
+            for start, end in iter(task_queue.get, None):
+                csvfile.seek(start)
+                # newline='' leaves line endings to the csv module, which only splits rows on \r and \n,
+                # the same boundaries split_file uses
+                chunk = io.TextIOWrapper(io.BytesIO(csvfile.read(end - start)), newline='')
+
+                if decoder is not None:
+                    chunk_skipped, chunk_rejected = _decode_chunk(
+                        decoder, csv.reader(chunk), result_queue, known_hashes, rows_per_message
+                    )
+                    rows_skipped += chunk_skipped
+                    rows_rejected += chunk_rejected
+                    continue
+
+                parsed = []
+                for row in csv.reader(chunk):
+                    if not row:
+                        continue
+                    transaction_event = dict(zip(fieldnames, row))
+
+                    if known_hashes is not None and transaction_event.get('hash') in known_hashes:
+                        rows_skipped += 1
+                        continue
+
+                    try:
+                        raw_transaction = RawTransaction(**transaction_event)
+                    except ValidationError as e:
+                        print(f"Error processing transaction: {e}")
+                        rows_rejected += 1
+                        continue
+
+                    parsed.append(ParsedTransaction.from_raw_transaction(raw_transaction))
+                    if len(parsed) >= rows_per_message:
+                        result_queue.put((_WORKER_ROWS, parsed))
+                        parsed = []
+
+                if parsed:
+                    result_queue.put((_WORKER_ROWS, parsed))
+
+    except Exception as e:
+        result_queue.put((_WORKER_FAILED, repr(e)))
+        return
+
+    result_queue.put((_WORKER_DONE, (rows_skipped, rows_rejected)))
+
+
+def _decode_chunk(decoder: RowDecoder, rows, result_queue, known_hashes: Optional[set],
+                  rows_per_message: int) -> Tuple[int, int]:
+    # The fast_decode path of parse_chunks. Returns the number of rows skipped as already stored and rejected
+    rows_skipped = 0
+    rows_rejected = 0
+    pending = []
+    for row in rows:
+        if not row:
+            continue
+        if known_hashes is not None and decoder.hash_of(row) in known_hashes:
+            rows_skipped += 1
+            continue
+        pending.append(row)
+        if len(pending) >= rows_per_message:
+            rows_rejected += _send_decoded(decoder, pending, result_queue)
+            pending = []
+    if pending:
+        rows_rejected += _send_decoded(decoder, pending, result_queue)
+    return rows_skipped, rows_rejected
+
+
+def _send_decoded(decoder: RowDecoder, rows: list, result_queue) -> int:
+    parsed, rejected = decoder.decode(rows)
+    for row, reason in rejected:
+        print(f"Error processing transaction: {reason}\n{row}")
+    if parsed:
+        result_queue.put((_WORKER_ROWS, parsed))
+    return len(rejected)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import NamedTuple, Optional
 
 from pydantic import BaseModel, validator
 
@@ -36,3 +36,32 @@ class RawTransaction(BaseModel):
     @validator('max_fee_per_gas', 'max_priority_fee_per_gas', pre=True)
     def handle_empty_values(cls, v):
         return int(v) if v else None
+
+
+class ParsedTransaction(NamedTuple):
+    """
+    The fields of a validated RawTransaction that are needed to process it.
+
+    Built by RowDecoder, and sent by the workers of ParallelCsvProcessor, since unpickling full pydantic models
+    in the main process costs more than a large share of the validation done by the workers. Field names match
+    RawTransaction, so CsvProcessor processes both the same way.
+    """
+    hash: str
+    from_address: str
+    to_address: str
+    block_number: int
+    block_timestamp: datetime
+    receipts_gas_used: int
+    receipts_effective_gas_price: int
+
+    @classmethod
+    def from_raw_transaction(cls, transaction: RawTransaction) -> 'ParsedTransaction':
+        return cls(
+            transaction.hash,
+            transaction.from_address,
+            transaction.to_address,
+            transaction.block_number,
+            transaction.block_timestamp,
+            transaction.receipts_gas_used,
+            transaction.receipts_effective_gas_price,
+        )
@@ -1,12 +1,53 @@
 # database/__init__.py
 
 from .processed_transaction import ProcessedTransaction
-from .irepository import IRepository
+from .price_point import PricePoint, PriceCoverage
+from .transaction_stats import TransactionStats
+from .gas_rollup import TimeBucketRollup, BlockRollup
+from .address_stats import AddressStats
+from .ingest_run import IngestRun, INGEST_RUNNING, INGEST_DONE, INGEST_FAILED
+from .irepository import (
+    IRepository, ON_CONFLICT_IGNORE, ON_CONFLICT_UPDATE, ON_CONFLICT_MODES, TIME_BUCKETS, ADDRESS_RANKINGS,
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, TransactionFilter
+)
 from .sql_repository import SqlRepository
-from .database import Base, init_db, get_db_session
+from .caching_repository import CachingRepository
+from .negative_lookup_repository import NegativeLookupRepository
+from .instrumented_repository import InstrumentedRepository
+from .columnar_repository import ColumnarRepository, TransactionRow
+from .partitioned_repository import PartitionedRepository
+from .price_store import SqlPriceStore
+from .ingest_store import SqlIngestStore
+from .database import Base, init_db, get_db_session, get_read_session, READ_POOL_SIZE
 
 __all__ = [
     'ProcessedTransaction',
     'IRepository',
+    'ON_CONFLICT_IGNORE',
+    'ON_CONFLICT_UPDATE',
+    'ON_CONFLICT_MODES',
+    'TIME_BUCKETS',
+    'ADDRESS_RANKINGS',
+    'DEFAULT_PAGE_SIZE',
+    'MAX_PAGE_SIZE',
+    'TransactionFilter',
     'SqlRepository',
+    'CachingRepository',
+    'NegativeLookupRepository',
+    'InstrumentedRepository',
+    'ColumnarRepository',
+    'TransactionRow',
+    'PartitionedRepository',
+    'PricePoint',
+    'PriceCoverage',
+    'TransactionStats',
+    'TimeBucketRollup',
+    'BlockRollup',
+    'AddressStats',
+    'SqlPriceStore',
+    'IngestRun',
+    'INGEST_RUNNING',
+    'INGEST_DONE',
+    'INGEST_FAILED',
+    'SqlIngestStore',
 ]
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, BigInteger, Float, Index
+
+from .database import Base
+from .hex_codec import ADDRESS_BYTES
+from .hex_string import HexString
+
+class AddressStats(Base):
+    """
+    A SQLAlchemy model holding the per-address gas totals. Gas is paid by the sender of a transaction.
+
+    Kept up to date in the same database transaction as every write to processed_transaction, see database/aggregates.py.
+    Each ranking metric has an index with the address as a tie breaker, so the top addresses are read by walking
+    the index from its end instead of sorting the table.
+    """
+
+    __tablename__ = "address_stats"
+
+    address = Column(HexString(ADDRESS_BYTES), primary_key=True)
+    transactionsSent = Column(BigInteger, nullable=False, default=0)
+    transactionsReceived = Column(BigInteger, nullable=False, default=0)
+    gasUsed = Column(BigInteger, nullable=False, default=0)
+    gasCostInDollars = Column(Float, nullable=False, default=0.)
+
+    __table_args__ = (
+        Index("ix_address_stats_gas_cost", "gasCostInDollars", "address"),
+        Index("ix_address_stats_gas_used", "gasUsed", "address"),
+        Index("ix_address_stats_transactions_sent", "transactionsSent", "address"),
+    )
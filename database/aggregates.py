@@ -0,0 +1,275 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import text, select, update, delete
+from sqlalchemy.orm import Session
+
+from .irepository import BUCKET_HOUR, BUCKET_DAY, TIME_BUCKETS
+from .processed_transaction import ProcessedTransaction
+from .transaction_stats import TransactionStats
+from .gas_rollup import TimeBucketRollup, BlockRollup
+from .address_stats import AddressStats
+from .statements import accumulate_statement
+
+"""
+Maintenance of the aggregates derived from processed_transaction: the transaction_stats totals,
+the time_bucket_rollup / block_rollup gas rollups and the address_stats per-address totals.
+
+Writers describe the rows they insert, overwrite or replace as row changes, and apply them in the same
+database transaction as the rows themselves (see SqlRepository), so the aggregates are read without
+scanning processed_transaction.
+`check_aggregates` and `rebuild_aggregates` compare and reset the aggregates against a full scan, for when they drift
+(e.g. rows written by another tool). Both are exposed by `python -m database.maintenance`.
+"""
+
+STATS_ROW_ID = 1
+
+StatsDelta = Tuple[int, int, float]
+
+# The changes of a rollup table (every column but the primary key is a total, summed on conflict):
+# the deltas of its totals, in column order, by primary key tuple
+RollupDeltas = Dict[tuple, list]
+
+# The processed_transaction columns the aggregates depend on
+AGGREGATED_COLUMNS = ('gasUsed', 'gasCostInDollars', 'executedAt', 'blockNumber', 'fromAddress', 'toAddress')
+
+# A row added to (+1) or removed from (-1) the aggregates, as a column -> value mapping (see ProcessedTransaction.to_dict).
+# Plain mappings are much cheaper to read than ORM attributes in bulk
+RowChange = Tuple[int, Dict[str, Any]]
+
+
+def aggregated_columns():
+    return [getattr(ProcessedTransaction, column) for column in AGGREGATED_COLUMNS]
+
+def inserted_changes(rows: Iterable[Dict[str, Any]]) -> List[RowChange]:
+    # The changes made by inserting new rows
+    return [(1, row) for row in rows]
+
+def upserted_changes(rows: Iterable[Dict[str, Any]], stored: Dict[str, Dict[str, Any]],
+                     overwrite: bool) -> List[RowChange]:
+    """
+    The changes made by an INSERT ... ON CONFLICT of the rows.
+
+    Args:
+        rows: The rows written, in order.
+        stored: The aggregated columns already stored for the hashes of the rows, by hash.
+        overwrite (bool): Whether conflicting rows overwrite the stored row (DO UPDATE) or are dropped (DO NOTHING).
+    """
+    written = {}
+    for row in rows:
+        if overwrite or row['hash'] not in written:
+            written[row['hash']] = row
+
+    changes = []
+    for hash, row in written.items():
+        if hash in stored:
+            if not overwrite:
+                continue
+            changes.append((-1, stored[hash]))
+        changes.append((1, row))
+    return changes
+
+def bucket_start(executed_at: datetime, bucket: str) -> datetime:
+    # Naive UTC start of the time bucket of a timestamp
+    if executed_at.tzinfo is not None:
+        executed_at = executed_at.astimezone(timezone.utc).replace(tzinfo=None)
+    if bucket == BUCKET_HOUR:
+        return executed_at.replace(minute=0, second=0, microsecond=0)
+    if bucket == BUCKET_DAY:
+        return executed_at.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unsupported bucket {bucket}. Expected one of {TIME_BUCKETS}")
+
+def aggregate(changes: Iterable[RowChange]) -> Tuple[StatsDelta, Dict[type, RollupDeltas]]:
+    """
+    Sum row changes into the change of every aggregate.
+
+    Returns:
+        The (transactions, gas used, gas cost) change of the totals, and the changes of each rollup table.
+    """
+    # Rows of the same block share their timestamp and block number, so they are summed first
+    # and bucketed once per block
+    groups = defaultdict(lambda: [0, 0, 0.])
+    addresses = defaultdict(lambda: [0, 0, 0, 0.])
+    for sign, row in changes:
+        row_gas_used = sign * (row['gasUsed'] or 0)
+        row_gas_cost = sign * (row['gasCostInDollars'] or 0.)
+        group = groups[(row['executedAt'], row['blockNumber'])]
+        group[0] += sign
+        group[1] += row_gas_used
+        group[2] += row_gas_cost
+
+        # Senders pay the gas, receivers are only counted
+        if row['fromAddress']:
+            sender = addresses[(row['fromAddress'],)]
+            sender[0] += sign
+            sender[2] += row_gas_used
+            sender[3] += row_gas_cost
+        if row['toAddress']:
+            addresses[(row['toAddress'],)][1] += sign
+
+    count, gas_used, gas_cost_in_dollars = 0, 0, 0.
+    time_buckets = defaultdict(lambda: [0, 0, 0.])
+    blocks = defaultdict(lambda: [0, 0, 0.])
+    for (executed_at, block_number), (group_count, group_gas_used, group_gas_cost) in groups.items():
+        count += group_count
+        gas_used += group_gas_used
+        gas_cost_in_dollars += group_gas_cost
+
+        rollups = [blocks[(block_number,)]] if block_number is not None else []
+        if executed_at is not None:
+            rollups.extend(time_buckets[(bucket, bucket_start(executed_at, bucket))] for bucket in TIME_BUCKETS)
+        for rollup in rollups:
+            rollup[0] += group_count
+            rollup[1] += group_gas_used
+            rollup[2] += group_gas_cost
+
+    rollups = {TimeBucketRollup: time_buckets, BlockRollup: blocks, AddressStats: addresses}
+    return (count, gas_used, gas_cost_in_dollars), rollups
+
+def apply_changes(session: Session, changes: List[RowChange]) -> None:
+    """
+    Apply row changes to the aggregates, in the transaction of the session that made them.
+
+    On a database that has no aggregates yet, they are built from a full scan instead, which already includes the changes.
+    """
+    if not changes:
+        return
+
+    stats_delta, rollups = aggregate(changes)
+    if not _add_to_stats(session, stats_delta):
+        rebuild_aggregates(session)
+        return
+
+    dialect_name = session.get_bind().dialect.name
+    for model, deltas in rollups.items():
+        if deltas:
+            table = model.__table__
+            statement = accumulate_statement(table, dialect_name, index_elements=_key_columns(table))
+            session.execute(statement, _rollup_rows(table, deltas))
+
+def _add_to_stats(session: Session, delta: StatsDelta) -> bool:
+    # Returns False when the database has no aggregates yet
+    transactions, gas_used, gas_cost_in_dollars = delta
+    result = session.execute(
+        update(TransactionStats)
+        .where(TransactionStats.id == STATS_ROW_ID)
+        .values(
+            totalTransactionsInDB=TransactionStats.totalTransactionsInDB + transactions,
+            totalGasUsed=TransactionStats.totalGasUsed + gas_used,
+            totalGasCostInDollars=TransactionStats.totalGasCostInDollars + gas_cost_in_dollars,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+def _key_columns(table) -> List[str]:
+    return [column.key for column in table.primary_key.columns]
+
+def _total_columns(table) -> List[str]:
+    return [column.key for column in table.columns if not column.primary_key]
+
+def _rollup_rows(table, deltas: RollupDeltas) -> List[Dict[str, Any]]:
+    keys, totals = _key_columns(table), _total_columns(table)
+    return [dict(zip(keys, key), **dict(zip(totals, values))) for key, values in deltas.items()]
+
+def compute_stats(session: Session) -> Dict[str, Any]:
+    # Full scan of processed_transaction
+    sql = text("""
+    SELECT
+        COUNT(*) as totalTransactionsInDB,
+        SUM(gasUsed) as totalGasUsed,
+        SUM(gasCostInDollars) as totalGasCostInDollars
+    FROM
+        processed_transaction
+    """)
+    result = session.execute(sql).fetchone()
+
+    return {
+        "totalTransactionsInDB": result[0] if result and result[0] is not None else 0,
+        "totalGasUsed": result[1] if result and result[1] is not None else 0,
+        "totalGasCostInDollars": result[2] if result and result[2] is not None else 0.
+    }
+
+def compute_rollups(session: Session) -> Dict[type, RollupDeltas]:
+    # Full scan of processed_transaction, aggregated as the row changes are
+    rows = session.execute(select(*aggregated_columns()).execution_options(yield_per=10000))
+    _, rollups = aggregate((1, row._mapping) for row in rows)
+    return rollups
+
+def read_rollups(session: Session, model: type) -> RollupDeltas:
+    table = model.__table__
+    keys, totals = _key_columns(table), _total_columns(table)
+    return {
+        tuple(row[:len(keys)]): list(row[len(keys):])
+        for row in session.execute(select(*[table.c[column] for column in keys + totals]))
+    }
+
+def read_stats(session: Session) -> Optional[Dict[str, Any]]:
+    stats = session.get(TransactionStats, STATS_ROW_ID)
+    if stats is None:
+        return None
+    return {
+        "totalTransactionsInDB": stats.totalTransactionsInDB,
+        "totalGasUsed": stats.totalGasUsed,
+        "totalGasCostInDollars": stats.totalGasCostInDollars
+    }
+
+def rebuild_aggregates(session: Session) -> Dict[str, Any]:
+    """
+    Reset every aggregate to a full scan of processed_transaction.
+
+    Returns:
+        Dict[str, Any]: The rebuilt stats.
+    """
+    stats = compute_stats(session)
+    session.merge(TransactionStats(id=STATS_ROW_ID, **stats))
+
+    for model, deltas in compute_rollups(session).items():
+        session.execute(delete(model))
+        if deltas:
+            session.execute(model.__table__.insert(), _rollup_rows(model.__table__, deltas))
+    session.flush()
+    return stats
+
+def check_aggregates(session: Session) -> Tuple[bool, Optional[Dict[str, Any]], Dict[str, Any], int]:
+    """
+    Compare the aggregates with a full scan of processed_transaction.
+
+    The dollar totals are compared with a relative tolerance, since summing in a different order rounds differently.
+
+    Returns:
+        Tuple[bool, Optional[Dict[str, Any]], Dict[str, Any], int]: Whether they match, the stored and the scanned stats,
+        and the number of rollup rows that differ from the scan.
+    """
+    stored = read_stats(session)
+    actual = compute_stats(session)
+    stats_consistent = stored is not None and _same_totals(
+        (stored["totalTransactionsInDB"], stored["totalGasUsed"], stored["totalGasCostInDollars"]),
+        (actual["totalTransactionsInDB"], actual["totalGasUsed"], actual["totalGasCostInDollars"]),
+    )
+
+    mismatches = sum(
+        _count_mismatches(read_rollups(session, model), deltas) for model, deltas in compute_rollups(session).items()
+    )
+
+    return stats_consistent and mismatches == 0, stored, actual, mismatches
+
+def _count_mismatches(stored: RollupDeltas, actual: RollupDeltas) -> int:
+    # Rows emptied by overwrites stay stored with zero totals, they match a missing row
+    mismatches = 0
+    for key in set(stored) | set(actual):
+        stored_totals, actual_totals = stored.get(key), actual.get(key)
+        empty = [0] * len(stored_totals or actual_totals)
+        mismatches += not _same_totals(stored_totals or empty, actual_totals or empty)
+    return mismatches
+
+def _same_totals(stored, actual) -> bool:
+    # Counts match exactly, dollar amounts up to rounding
+    for stored_total, actual_total in zip(stored, actual):
+        if isinstance(stored_total, float) or isinstance(actual_total, float):
+            if not math.isclose(stored_total, actual_total, rel_tol=1e-9, abs_tol=1e-6):
+                return False
+        elif stored_total != actual_total:
+            return False
+    return True
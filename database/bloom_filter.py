@@ -0,0 +1,98 @@
+import math
+import threading
+from hashlib import blake2b
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+_MASK_64 = (1 << 64) - 1
+
+class BloomFilter:
+    """
+    A Bloom filter over strings: a compact set that can answer "definitely not added" or "maybe added".
+
+    The bit array and the number of hash functions are sized for `capacity` keys at `false_positive_rate`.
+    Adding more keys than the capacity keeps the filter correct (no false negatives) but raises the rate
+    of false positives, see `estimated_false_positive_rate`.
+
+    Positions are derived from a 128 bit BLAKE2b digest of the key by double hashing, so they are spread evenly
+    even for keys chosen by clients. Lookups of single keys stay in pure Python, bulk adds are vectorized with numpy.
+
+    Args:
+        capacity (int): The number of keys the filter is sized for.
+        false_positive_rate (float): The target rate of false positives at capacity, between 0 and 1.
+
+    Usage:
+        hashes = BloomFilter(capacity=1000000, false_positive_rate=0.01)
+        hashes.add_many(stored_hashes)
+        hash in hashes  # False means it was never added
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float = 0.01):
+        if capacity < 1:
+            raise ValueError("capacity must be a positive number of keys")
+        if not 0 < false_positive_rate < 1:
+            raise ValueError("false_positive_rate must be between 0 and 1")
+
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        # Optimal sizes for n keys at rate p: m = -n ln(p) / ln(2)^2 bits and k = m / n ln(2) hash functions
+        self.size = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._bits)
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            for position in self._positions(key):
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def add_many(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        if not keys:
+            return
+
+        digests = np.frombuffer(b"".join(_digest(key) for key in keys), dtype="<u8").reshape(-1, 2)
+        first, step = digests[:, :1], digests[:, 1:] | np.uint64(1)
+        # uint64 arithmetic wraps like the masked arithmetic of _positions
+        positions = ((first + np.arange(self.hash_count, dtype=np.uint64) * step) % np.uint64(self.size)).ravel()
+        masks = np.left_shift(np.uint8(1), (positions & np.uint64(7)).astype(np.uint8))
+        bits = np.frombuffer(self._bits, dtype=np.uint8)
+        with self._lock:
+            np.bitwise_or.at(bits, positions >> np.uint64(3), masks)
+            self.count += len(keys)
+
+    def __contains__(self, key: str) -> bool:
+        # Bits are only ever set, so reading without the lock can only miss a key added concurrently
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def estimated_false_positive_rate(self) -> float:
+        # (1 - e^(-kn/m))^k for the number of keys added so far
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "capacity": self.capacity,
+            "count": self.count,
+            "hash_count": self.hash_count,
+            "memory_bytes": self.memory_bytes,
+            "target_false_positive_rate": self.false_positive_rate,
+            "estimated_false_positive_rate": self.estimated_false_positive_rate(),
+        }
+
+    def _positions(self, key: str) -> List[int]:
+        digest = _digest(key)
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return [((first + index * step) & _MASK_64) % self.size for index in range(self.hash_count)]
+
+
+def _digest(key: str) -> bytes:
+    return blake2b(key.encode(), digest_size=16).digest()
@@ -0,0 +1,92 @@
+import sys
+from typing import Optional, Dict, Any, List
+
+from .irepository import IRepository
+from .lru_cache import LruCache
+from .processed_transaction import ProcessedTransaction
+from .repository_decorator import RepositoryDecorator
+
+# Rough size of a cached transaction besides its column values: the object, its instance state and the cache entry
+TRANSACTION_OVERHEAD_BYTES = 600
+
+class CachingRepository(RepositoryDecorator):
+    """
+    A read-through cache in front of another repository, for the lookups by hash.
+
+    Transactions found by get_by_hash and get_many_by_hash are kept in an LruCache bounded by entries
+    and/or bytes, with an optional TTL. Hashes that are not stored are not cached.
+    Writes made through this repository invalidate the hashes they write. Writes made by other processes
+    are only picked up once the entries expire, so set a TTL when the database is written elsewhere.
+
+    Cached transactions are shared between callers and must not be modified.
+    Every other method is passed through to the wrapped repository.
+
+    Args:
+        repository (IRepository): The repository the transactions are read from and written to.
+        max_entries (int, optional): Maximum number of cached transactions.
+        max_bytes (int, optional): Maximum approximate size of the cached transactions, in bytes.
+        ttl (float, optional): Seconds a transaction stays cached.
+
+    Usage:
+        repository = CachingRepository(SqlRepository(), max_entries=100000, ttl=300)
+        repository.cache_stats()  # hits, misses, evictions, expirations, entries, bytes
+    """
+
+    DEFAULT_MAX_ENTRIES = 100000
+
+    def __init__(self, repository: IRepository, max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+                 max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        super().__init__(repository)
+        self.cache = LruCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl, sizeof=transaction_size)
+
+    def create(self, transaction: ProcessedTransaction) -> None:
+        # Read before the write, which can expire the attributes of the transaction
+        hash = transaction.hash
+        try:
+            self.repository.create(transaction)
+        finally:
+            self.cache.invalidate(hash)
+
+    def create_many(self, transactions: List[ProcessedTransaction], on_conflict: Optional[str] = None) -> None:
+        hashes = [transaction.hash for transaction in transactions]
+        try:
+            self.repository.create_many(transactions, on_conflict)
+        finally:
+            self.cache.invalidate_many(hashes)
+
+    def get_by_hash(self, hash: str) -> Optional[ProcessedTransaction]:
+        transaction = self.cache.get(hash)
+        if transaction is None:
+            # Taken before the read, so a write that lands during the read keeps the stale row out of the cache
+            generation = self.cache.generation
+            transaction = self.repository.get_by_hash(hash)
+            if transaction is not None:
+                self.cache.put(hash, transaction, generation)
+        return transaction
+
+    def get_many_by_hash(self, hashes: List[str]) -> Dict[str, Any]:
+        found = {}
+        missing = []
+        for hash in dict.fromkeys(hashes):
+            transaction = self.cache.get(hash)
+            if transaction is None:
+                missing.append(hash)
+            else:
+                found[hash] = transaction
+
+        if missing:
+            generation = self.cache.generation
+            for hash, transaction in self.repository.get_many_by_hash(missing).items():
+                self.cache.put(hash, transaction, generation)
+                found[hash] = transaction
+        return found
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self.cache.stats()
+
+
+def transaction_size(hash: str, transaction: Any) -> int:
+    # Approximate memory held by a cached transaction
+    return TRANSACTION_OVERHEAD_BYTES + sys.getsizeof(hash) + sum(
+        sys.getsizeof(getattr(transaction, column.key)) for column in ProcessedTransaction.__table__.columns
+    )
@@ -0,0 +1,566 @@
+import json
+import os
+import struct
+import threading
+from datetime import datetime
+from typing import Optional, Iterator, List, Set, Dict, Any, NamedTuple, Tuple
+
+import numpy as np
+
+from .aggregates import bucket_start
+from .hex_codec import HASH_BYTES, ADDRESS_BYTES, hex_to_bytes, bytes_to_hex, hex_array, hex_list
+from .instrumented_repository import DUPLICATE_TRANSACTIONS
+from .irepository import (
+    IRepository, ON_CONFLICT_MODES, ON_CONFLICT_UPDATE, ADDRESS_RANKINGS, RANK_BY_GAS_COST, RANK_BY_GAS_USED,
+    BUCKET_HOUR, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, TransactionFilter, Cursor
+)
+from .processed_transaction import ProcessedTransaction
+
+_MASK_64 = (1 << 64) - 1
+_EMPTY_SLOT = -1
+# Stored for the empty address (the receiver of contract creations). No account is expected to ever hold it
+NO_ADDRESS = b"\xff" * ADDRESS_BYTES
+
+class TransactionRow(NamedTuple):
+    """
+    A transaction read from a ColumnarRepository, with the ProcessedTransaction columns as attributes.
+    """
+    hash: str
+    fromAddress: str
+    toAddress: str
+    blockNumber: int
+    executedAt: datetime
+    gasUsed: int
+    gasCostInDollars: float
+
+class ColumnarRepository(IRepository):
+    """
+    An in-memory repository storing the transactions column by column in numpy arrays.
+
+    Hashes and addresses are stored as their raw 32 and 20 bytes, and the other columns as int64, datetime64 and float64
+    arrays, about 120 bytes per transaction including the index, instead of a SQLAlchemy object per transaction.
+    Hashes are found through an open-addressing hash table (linear probing, at most half full) of row numbers,
+    and the stats are vectorized sums over the columns. The listing order and the per-address totals are computed
+    on the first read after a write, so the repository suits bulk loads followed by reads.
+
+    Hashes and addresses must be 0x-prefixed lowercase hex strings of 32 and 20 bytes, as exported by the node,
+    and addresses can be empty. As in SqlRepository, empty addresses have no address stats.
+    Reads return TransactionRow tuples rather than ProcessedTransaction objects, which cost more to build than the lookup.
+
+    `save` writes a binary snapshot of the columns and of the index. `load` maps it into memory instead of reading it,
+    so a snapshot of millions of transactions opens almost instantly and its pages are read from disk on first use.
+    Writes after a load stay in memory (copy on write), the snapshot file is never modified.
+
+    Args:
+        capacity (int): Number of transactions the arrays are allocated for. They grow as needed.
+
+    Usage:
+        repository = ColumnarRepository()
+        repository.create_many(transactions)
+        repository.save("transactions.snapshot")
+
+        repository = ColumnarRepository()
+        repository.load("transactions.snapshot")
+    """
+
+    DEFAULT_CAPACITY = 1024
+    # Rows of the listing scanned at once when looking for the rows matching the filters
+    SCAN_SIZE = 65536
+    SNAPSHOT_MAGIC = b"RATEDTX1"
+    SNAPSHOT_VERSION = 1
+    # Alignment of the arrays in the snapshot file
+    SNAPSHOT_ALIGNMENT = 64
+
+    # name: (dtype, bytes per value for the byte columns)
+    COLUMNS = {
+        "hash": (np.uint8, HASH_BYTES),
+        "fromAddress": (np.uint8, ADDRESS_BYTES),
+        "toAddress": (np.uint8, ADDRESS_BYTES),
+        "blockNumber": (np.int64, None),
+        "executedAt": (np.dtype("datetime64[us]"), None),
+        "gasUsed": (np.int64, None),
+        "gasCostInDollars": (np.float64, None),
+    }
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self._lock = threading.RLock()
+        self._count = 0
+        self._capacity = 0
+        self._columns = {}
+        self._reserve(max(1, capacity))
+        self._slots = np.full(_table_size(self._capacity), _EMPTY_SLOT, dtype=np.int64)
+        # Incremented by every write, invalidates the derived arrays below
+        self._version = 0
+        self._listing = None
+        self._address_totals = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def create(self, transaction: ProcessedTransaction) -> None:
+        self.create_many([transaction])
+
+    def create_many(self, transactions: List[Any], on_conflict: Optional[str] = None) -> None:
+        """
+        Store transactions, or any objects with the ProcessedTransaction columns as attributes.
+
+        Conflicts are resolved as in SqlRepository.create_many: without `on_conflict` the duplicates are reported
+        and skipped, 'ignore' skips them silently and 'update' overwrites the stored transactions.
+
+        Raises:
+            ValueError: If a hash or an address is not a 0x-prefixed lowercase hex string of the right size.
+        """
+        if on_conflict is not None and on_conflict not in ON_CONFLICT_MODES:
+            raise ValueError(f"Unsupported on_conflict mode {on_conflict}. Expected one of {ON_CONFLICT_MODES}")
+
+        # Index of the transaction kept for each hash of the batch: the first one, or the last one when updating
+        kept = {}
+        for index, transaction in enumerate(transactions):
+            if transaction.hash in kept and on_conflict != ON_CONFLICT_UPDATE:
+                if on_conflict is None:
+                    print(f"[ColumnarRepository] Duplicate transaction detected with hash {transaction.hash}")
+                    DUPLICATE_TRANSACTIONS.inc()
+                continue
+            kept[transaction.hash] = index
+        if not kept:
+            return
+        batch = [transactions[index] for index in kept.values()]
+        values = self._encode(batch)
+
+        with self._lock:
+            stored = self._find_many(values["hash"])
+            new = stored == _EMPTY_SLOT
+            if on_conflict == ON_CONFLICT_UPDATE:
+                for name, column in self._columns.items():
+                    column[stored[~new]] = values[name][~new]
+            elif on_conflict is None:
+                for index in np.flatnonzero(~new):
+                    print(f"[ColumnarRepository] Duplicate transaction detected with hash {batch[index].hash}")
+                    DUPLICATE_TRANSACTIONS.inc()
+
+            added = int(new.sum())
+            if added:
+                start = self._count
+                self._reserve(start + added)
+                for name, column in self._columns.items():
+                    column[start:start + added] = values[name][new]
+                self._count += added
+                if self._count > len(self._slots) // 2:
+                    self._rebuild_index()
+                else:
+                    self._index(np.arange(start, start + added, dtype=np.int64))
+            self._version += 1
+
+    def get_by_hash(self, hash: str) -> Optional[TransactionRow]:
+        try:
+            needle = hex_to_bytes(hash, HASH_BYTES)
+        except ValueError:
+            return None
+        with self._lock:
+            row = self._find(needle)
+            return self._row(row) if row != _EMPTY_SLOT else None
+
+    def get_many_by_hash(self, hashes: List[str]) -> Dict[str, TransactionRow]:
+        valid = []
+        for hash in dict.fromkeys(hashes):
+            try:
+                hex_to_bytes(hash, HASH_BYTES)
+            except ValueError:
+                continue
+            valid.append(hash)
+        if not valid:
+            return {}
+        with self._lock:
+            rows = self._find_many(hex_array(valid, HASH_BYTES))
+            return {row.hash: row for row in self._rows(rows[rows != _EMPTY_SLOT])}
+
+    def get_all_hashes(self) -> Set[str]:
+        with self._lock:
+            return set(hex_list(self._columns["hash"][:self._count]))
+
+    def stream_hashes(self, chunk_size: int = MAX_PAGE_SIZE) -> Iterator[str]:
+        for start in range(0, self._count, chunk_size):
+            with self._lock:
+                chunk = self._columns["hash"][start:min(start + chunk_size, self._count)]
+                yield from hex_list(chunk)
+
+    def get_transactions(self, filters: TransactionFilter, after: Optional[Cursor] = None,
+                         limit: int = DEFAULT_PAGE_SIZE) -> List[TransactionRow]:
+        page = []
+        with self._lock:
+            for rows in self._matching_rows(filters, after):
+                page.extend(self._rows(rows[:limit - len(page)]))
+                if len(page) >= limit:
+                    break
+        return page
+
+    def stream_transactions(self, filters: TransactionFilter, after: Optional[Cursor] = None,
+                            chunk_size: int = MAX_PAGE_SIZE) -> Iterator[TransactionRow]:
+        """
+        Iterate over the transactions matching `filters` after the cursor, ordered by (blockNumber, hash).
+        The listing reflects the transactions stored when the iteration started.
+        """
+        with self._lock:
+            matching = self._matching_rows(filters, after)
+        for rows in matching:
+            for start in range(0, len(rows), chunk_size):
+                with self._lock:
+                    chunk = self._rows(rows[start:start + chunk_size])
+                yield from chunk
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count = self._count
+            return {
+                "totalTransactionsInDB": count,
+                "totalGasUsed": int(self._columns["gasUsed"][:count].sum()),
+                "totalGasCostInDollars": float(self._columns["gasCostInDollars"][:count].sum()),
+            }
+
+    def get_timeseries(self, start: datetime, end: datetime, bucket: str) -> List[Dict[str, Any]]:
+        unit = "h" if bucket == BUCKET_HOUR else "D"
+        with self._lock:
+            buckets = self._columns["executedAt"][:self._count].astype(f"datetime64[{unit}]")
+            selected = ((buckets >= np.datetime64(bucket_start(start, bucket), unit))
+                        & (buckets <= np.datetime64(bucket_start(end, bucket), unit)))
+            keys, count, gas_used, gas_cost = self._grouped_sums(buckets[selected], selected)
+        return [
+            {"bucketStart": key, "transactionCount": count, "gasUsed": gas_used, "gasCostInDollars": gas_cost}
+            for key, count, gas_used, gas_cost
+            in zip(keys.astype("datetime64[us]").tolist(), count, gas_used, gas_cost)
+        ]
+
+    def get_block_stats(self, from_block: int, to_block: int, size: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            blocks = self._columns["blockNumber"][:self._count]
+            selected = (blocks >= from_block) & (blocks <= to_block)
+            keys, count, gas_used, gas_cost = self._grouped_sums(blocks[selected] // size * size, selected)
+        return [
+            {"fromBlock": max(block, from_block), "toBlock": min(block + size - 1, to_block),
+             "transactionCount": count, "gasUsed": gas_used, "gasCostInDollars": gas_cost}
+            for block, count, gas_used, gas_cost in zip(keys.tolist(), count, gas_used, gas_cost)
+        ]
+
+    def get_address_stats(self, address: str) -> Optional[Dict[str, Any]]:
+        try:
+            needle = _address_key(address)
+        except ValueError:
+            return None
+        with self._lock:
+            senders, sent, gas_used, gas_cost, receivers, received = self._get_address_totals()
+            sender = _position(senders, needle)
+            receiver = _position(receivers, needle)
+            if sender is None and receiver is None:
+                return None
+            return {
+                "address": address,
+                "transactionsSent": int(sent[sender]) if sender is not None else 0,
+                "transactionsReceived": int(received[receiver]) if receiver is not None else 0,
+                "gasUsed": int(gas_used[sender]) if sender is not None else 0,
+                "gasCostInDollars": float(gas_cost[sender]) if sender is not None else 0.,
+            }
+
+    def get_top_addresses(self, by: str, limit: int) -> List[Dict[str, Any]]:
+        if by not in ADDRESS_RANKINGS:
+            raise ValueError(f"Unsupported ranking {by}. Expected one of {ADDRESS_RANKINGS}")
+
+        with self._lock:
+            senders, sent, gas_used, gas_cost, receivers, received = self._get_address_totals()
+            metric = {RANK_BY_GAS_COST: gas_cost, RANK_BY_GAS_USED: gas_used}.get(by, sent)
+            # Same order as SqlRepository: highest metric first, ties by highest address
+            top = np.lexsort((senders, metric))[::-1][:limit]
+            received_by_top = np.zeros(len(top), dtype=np.int64)
+            positions = np.searchsorted(receivers, senders[top])
+            found = positions < len(receivers)
+            found[found] = receivers[positions[found]] == senders[top][found]
+            received_by_top[found] = received[positions[found]]
+        addresses = hex_list(senders[top].view(np.uint8).reshape(len(top), ADDRESS_BYTES), empty=NO_ADDRESS)
+        return [
+            {"address": address, "transactionsSent": transactions_sent, "transactionsReceived": transactions_received,
+             "gasUsed": gas, "gasCostInDollars": cost}
+            for address, transactions_sent, transactions_received, gas, cost in zip(
+                addresses, sent[top].tolist(), received_by_top.tolist(), gas_used[top].tolist(), gas_cost[top].tolist()
+            )
+        ]
+
+    def save(self, filepath: str) -> None:
+        """
+        Write a snapshot of the transactions and of the index to `filepath`, replacing it atomically.
+
+        The file holds a JSON header describing the arrays, followed by the raw arrays aligned on
+        SNAPSHOT_ALIGNMENT bytes, so `load` can map them without parsing.
+        """
+        with self._lock:
+            arrays = {name: column[:self._count] for name, column in self._columns.items()}
+            arrays["slots"] = self._slots
+            layout = {}
+            offset = 0
+            for name, array in arrays.items():
+                layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+                offset = _aligned(offset + array.nbytes, self.SNAPSHOT_ALIGNMENT)
+            header = json.dumps({"version": self.SNAPSHOT_VERSION, "count": self._count, "arrays": layout}).encode()
+            data_start = _aligned(len(self.SNAPSHOT_MAGIC) + 8 + len(header), self.SNAPSHOT_ALIGNMENT)
+
+            temporary_path = f"{filepath}.tmp"
+            with open(temporary_path, "wb") as file:
+                file.write(self.SNAPSHOT_MAGIC + struct.pack("<Q", len(header)) + header)
+                for name, array in arrays.items():
+                    file.seek(data_start + layout[name]["offset"])
+                    file.write(np.ascontiguousarray(array).tobytes())
+                file.truncate(data_start + offset)
+            os.replace(temporary_path, filepath)
+
+    def load(self, filepath: str) -> None:
+        """
+        Map a snapshot written by `save`, replacing the transactions of this repository.
+
+        Raises:
+            ValueError: If the file is not a snapshot of a supported version.
+        """
+        with open(filepath, "rb") as file:
+            if file.read(len(self.SNAPSHOT_MAGIC)) != self.SNAPSHOT_MAGIC:
+                raise ValueError(f"{filepath} is not a transaction snapshot")
+            header_length, = struct.unpack("<Q", file.read(8))
+            header = json.loads(file.read(header_length))
+        if header["version"] != self.SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {header['version']}")
+        data_start = _aligned(len(self.SNAPSHOT_MAGIC) + 8 + header_length, self.SNAPSHOT_ALIGNMENT)
+
+        arrays = {}
+        for name, layout in header["arrays"].items():
+            dtype, shape = np.dtype(layout["dtype"]), tuple(layout["shape"])
+            if 0 in shape:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                # Copy on write: writes stay in memory and never reach the file
+                arrays[name] = np.memmap(filepath, dtype=dtype, mode="c", offset=data_start + layout["offset"],
+                                         shape=shape)
+
+        with self._lock:
+            self._slots = arrays.pop("slots")
+            self._columns = arrays
+            self._count = self._capacity = header["count"]
+            self._version += 1
+
+    def _encode(self, transactions: List[Any]) -> Dict[str, np.ndarray]:
+        return {
+            "hash": hex_array([transaction.hash for transaction in transactions], HASH_BYTES),
+            "fromAddress": hex_array([transaction.fromAddress for transaction in transactions], ADDRESS_BYTES,
+                                     empty=NO_ADDRESS),
+            "toAddress": hex_array([transaction.toAddress for transaction in transactions], ADDRESS_BYTES,
+                                   empty=NO_ADDRESS),
+            "blockNumber": np.array([transaction.blockNumber for transaction in transactions], dtype=np.int64),
+            "executedAt": np.array([transaction.executedAt for transaction in transactions], dtype="datetime64[us]"),
+            "gasUsed": np.array([transaction.gasUsed for transaction in transactions], dtype=np.int64),
+            "gasCostInDollars": np.array([transaction.gasCostInDollars for transaction in transactions],
+                                         dtype=np.float64),
+        }
+
+    def _row(self, row: int) -> TransactionRow:
+        columns = self._columns
+        return TransactionRow(
+            bytes_to_hex(columns["hash"][row].tobytes()),
+            _address(columns["fromAddress"][row].tobytes()),
+            _address(columns["toAddress"][row].tobytes()),
+            int(columns["blockNumber"][row]),
+            columns["executedAt"][row].item(),
+            int(columns["gasUsed"][row]),
+            float(columns["gasCostInDollars"][row]),
+        )
+
+    def _rows(self, rows: np.ndarray) -> List[TransactionRow]:
+        columns = self._columns
+        return [
+            TransactionRow(*values)
+            for values in zip(
+                hex_list(columns["hash"][rows]),
+                hex_list(columns["fromAddress"][rows], empty=NO_ADDRESS),
+                hex_list(columns["toAddress"][rows], empty=NO_ADDRESS),
+                columns["blockNumber"][rows].tolist(),
+                columns["executedAt"][rows].tolist(),
+                columns["gasUsed"][rows].tolist(),
+                columns["gasCostInDollars"][rows].tolist(),
+            )
+        ]
+
+    def _reserve(self, count: int) -> None:
+        # Grow the arrays to hold `count` transactions, at least doubling them to amortize the copies
+        if count <= self._capacity:
+            return
+        capacity = max(count, 2 * self._capacity)
+        for name, (dtype, width) in self.COLUMNS.items():
+            column = np.empty((capacity, width) if width else capacity, dtype=dtype)
+            if name in self._columns:
+                column[:self._count] = self._columns[name][:self._count]
+            self._columns[name] = column
+        self._capacity = capacity
+
+    def _hash_keys(self, hashes: np.ndarray) -> np.ndarray:
+        # Mix the 4 words of each hash, so hashes sharing their first bytes still spread over the table
+        words = hashes.view("<u8")
+        return _mix(words[:, 0] ^ words[:, 1] ^ words[:, 2] ^ words[:, 3])
+
+    def _rebuild_index(self) -> None:
+        self._slots = np.full(_table_size(self._count), _EMPTY_SLOT, dtype=np.int64)
+        self._index(np.arange(self._count, dtype=np.int64))
+
+    def _index(self, rows: np.ndarray) -> None:
+        # Vectorized linear probing: every pending row claims its slot, one row wins each empty slot,
+        # and the others move to the next slot
+        mask = np.uint64(len(self._slots) - 1)
+        slots = (self._hash_keys(self._columns["hash"][rows]) & mask).astype(np.int64)
+        while len(rows):
+            empty = self._slots[slots] == _EMPTY_SLOT
+            claimed, first = np.unique(slots[empty], return_index=True)
+            self._slots[claimed] = rows[empty][first]
+            placed = np.zeros(len(rows), dtype=bool)
+            placed[np.flatnonzero(empty)[first]] = True
+            rows, slots = rows[~placed], (slots[~placed] + 1) & int(mask)
+
+    def _find_many(self, hashes: np.ndarray) -> np.ndarray:
+        # Row of each hash, or _EMPTY_SLOT. Probes the table for all the hashes at once
+        found = np.full(len(hashes), _EMPTY_SLOT, dtype=np.int64)
+        mask = len(self._slots) - 1
+        needles = np.ascontiguousarray(hashes).view(f"S{HASH_BYTES}").ravel()
+        stored = self._columns["hash"].view(f"S{HASH_BYTES}").ravel()
+        pending = np.arange(len(hashes))
+        slots = (self._hash_keys(np.ascontiguousarray(hashes)) & np.uint64(mask)).astype(np.int64)
+        while len(pending):
+            rows = self._slots[slots]
+            occupied = rows != _EMPTY_SLOT
+            matched = occupied.copy()
+            matched[occupied] = stored[rows[occupied]] == needles[pending[occupied]]
+            found[pending[matched]] = rows[matched]
+            probing = occupied & ~matched
+            pending, slots = pending[probing], (slots[probing] + 1) & mask
+        return found
+
+    def _find(self, needle: bytes) -> int:
+        words = struct.unpack("<4Q", needle)
+        mask = len(self._slots) - 1
+        slot = _mix_int(words[0] ^ words[1] ^ words[2] ^ words[3]) & mask
+        hashes = self._columns["hash"]
+        while True:
+            row = int(self._slots[slot])
+            if row == _EMPTY_SLOT or hashes[row].tobytes() == needle:
+                return row
+            slot = (slot + 1) & mask
+
+    def _get_listing(self) -> Tuple[np.ndarray, np.ndarray]:
+        # The rows ordered by (blockNumber, hash), and their block numbers in that order
+        if self._listing is None or self._listing[0] != self._version:
+            count = self._count
+            hashes = self._columns["hash"][:count].view(f"S{HASH_BYTES}").ravel()
+            blocks = self._columns["blockNumber"][:count]
+            order = np.lexsort((hashes, blocks))
+            self._listing = (self._version, order, blocks[order])
+        return self._listing[1], self._listing[2]
+
+    def _matching_rows(self, filters: TransactionFilter, after: Optional[Cursor]) -> Iterator[np.ndarray]:
+        # The rows of the listing, in order, as arrays of row numbers
+        order, blocks = self._get_listing()
+        start, end = 0, len(order)
+        if filters.from_block is not None:
+            start = int(np.searchsorted(blocks, filters.from_block, "left"))
+        if filters.to_block is not None:
+            end = int(np.searchsorted(blocks, filters.to_block, "right"))
+        if after is not None:
+            after_block, after_hash = after
+            block_start = int(np.searchsorted(blocks, after_block, "left"))
+            block_end = int(np.searchsorted(blocks, after_block, "right"))
+            # A block holds few transactions, and comparing them as strings accepts any cursor
+            in_block = hex_list(self._columns["hash"][order[block_start:block_end]])
+            start = max(start, block_start + sum(1 for hash in in_block if hash <= after_hash))
+
+        criteria = []
+        for name, address in (("fromAddress", filters.from_address), ("toAddress", filters.to_address)):
+            if address is not None:
+                try:
+                    needle = _address_key(address)
+                except ValueError:
+                    return iter(())
+                criteria.append((self._columns[name].view(f"S{ADDRESS_BYTES}").ravel(), needle))
+
+        return self._scan(order, start, end, criteria)
+
+    def _scan(self, order: np.ndarray, start: int, end: int, criteria) -> Iterator[np.ndarray]:
+        for scan_start in range(start, end, self.SCAN_SIZE):
+            rows = order[scan_start:min(scan_start + self.SCAN_SIZE, end)]
+            for column, needle in criteria:
+                rows = rows[column[rows] == needle]
+            if len(rows):
+                yield rows
+
+    def _get_address_totals(self):
+        # Per sender (sorted): transactions sent, gas used and gas cost paid; per receiver (sorted): transactions received
+        if self._address_totals is None or self._address_totals[0] != self._version:
+            count = self._count
+            senders, sent, gas_used, gas_cost = self._grouped_sums(
+                self._columns["fromAddress"][:count].view(f"S{ADDRESS_BYTES}").ravel(), np.ones(count, dtype=bool)
+            )
+            receivers, received = np.unique(
+                self._columns["toAddress"][:count].view(f"S{ADDRESS_BYTES}").ravel(), return_counts=True
+            )
+            # Empty addresses have no totals
+            is_sender, is_receiver = senders != NO_ADDRESS, receivers != NO_ADDRESS
+            self._address_totals = (self._version, senders[is_sender], np.asarray(sent)[is_sender],
+                                    np.asarray(gas_used)[is_sender], np.asarray(gas_cost)[is_sender],
+                                    receivers[is_receiver], received[is_receiver])
+        return self._address_totals[1:]
+
+    def _grouped_sums(self, keys: np.ndarray, selected: np.ndarray):
+        """
+        Sum the transaction count, gas used and gas cost of the selected rows by key.
+
+        Returns:
+            The sorted distinct keys, and the count, gas used and gas cost of each, as lists.
+        """
+        count = self._count
+        gas_used = self._columns["gasUsed"][:count][selected]
+        gas_cost = self._columns["gasCostInDollars"][:count][selected]
+        if not len(keys):
+            return keys, [], [], []
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        counts = np.diff(np.append(starts, len(keys)))
+        return (keys[starts], counts.tolist(), np.add.reduceat(gas_used[order], starts).tolist(),
+                np.add.reduceat(gas_cost[order], starts).tolist())
+
+
+def _table_size(count: int) -> int:
+    # Smallest power of two that keeps the table at most half full
+    return 1 << max(4, (2 * count - 1).bit_length())
+
+def _aligned(offset: int, alignment: int) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+def _mix(keys: np.ndarray) -> np.ndarray:
+    # The 64 bit finalizer of MurmurHash3. uint64 arithmetic wraps like the masked arithmetic of _mix_int
+    keys = keys ^ (keys >> np.uint64(33))
+    keys = keys * np.uint64(0xff51afd7ed558ccd)
+    keys = keys ^ (keys >> np.uint64(33))
+    keys = keys * np.uint64(0xc4ceb9fe1a85ec53)
+    return keys ^ (keys >> np.uint64(33))
+
+def _mix_int(key: int) -> int:
+    key ^= key >> 33
+    key = (key * 0xff51afd7ed558ccd) & _MASK_64
+    key ^= key >> 33
+    key = (key * 0xc4ceb9fe1a85ec53) & _MASK_64
+    return key ^ (key >> 33)
+
+def _address_key(address: str):
+    # The stored bytes of an address, as a value of the 'S20' view of the address columns
+    key = NO_ADDRESS if address == "" else hex_to_bytes(address, ADDRESS_BYTES)
+    return np.frombuffer(key, dtype=f"S{ADDRESS_BYTES}")[0]
+
+def _address(key: bytes) -> str:
+    return "" if key == NO_ADDRESS else bytes_to_hex(key)
+
+def _position(keys: np.ndarray, key) -> Optional[int]:
+    # Position of `key` in sorted `keys`, or None
+    position = int(np.searchsorted(keys, key))
+    if position < len(keys) and keys[position] == key:
+        return position
+    return None
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, String, Integer, BigInteger, Float, DateTime
+
+from .database import Base
+
+class TimeBucketRollup(Base):
+    """
+    A SQLAlchemy model holding the gas totals of the transactions executed in a time bucket (an hour or a day).
+
+    Kept up to date in the same database transaction as every write to processed_transaction, see database/aggregates.py.
+    Bucket starts are naive UTC datetimes, like ProcessedTransaction.executedAt.
+    """
+
+    __tablename__ = "time_bucket_rollup"
+
+    bucket = Column(String, primary_key=True)
+    bucketStart = Column(DateTime, primary_key=True)
+    transactionCount = Column(BigInteger, nullable=False, default=0)
+    gasUsed = Column(BigInteger, nullable=False, default=0)
+    gasCostInDollars = Column(Float, nullable=False, default=0.)
+
+class BlockRollup(Base):
+    """
+    A SQLAlchemy model holding the gas totals of the transactions of a block.
+
+    Kept up to date in the same database transaction as every write to processed_transaction, see database/aggregates.py.
+    """
+
+    __tablename__ = "block_rollup"
+
+    blockNumber = Column(Integer, primary_key=True)
+    transactionCount = Column(BigInteger, nullable=False, default=0)
+    gasUsed = Column(BigInteger, nullable=False, default=0)
+    gasCostInDollars = Column(Float, nullable=False, default=0.)
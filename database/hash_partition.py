@@ -0,0 +1,24 @@
+from sqlalchemy import Column, BigInteger, Index
+from sqlalchemy.orm import declarative_base
+
+from .hex_codec import HASH_BYTES
+from .hex_string import HexString
+
+# The index lives in a database of its own, next to the partitions (see PartitionedRepository), so its table is kept
+# out of Base and init_db does not create it in ratedapi.db
+PartitionIndexBase = declarative_base()
+
+class HashPartition(PartitionIndexBase):
+    """
+    A SQLAlchemy model routing a transaction hash to the partition storing it, identified by its first block number.
+    """
+
+    __tablename__ = "hash_partition"
+
+    hash = Column(HexString(HASH_BYTES), primary_key=True)
+    partitionStart = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        # Drops the entries of an archived partition
+        Index("ix_hash_partition_start", "partitionStart"),
+    )
@@ -0,0 +1,53 @@
+import binascii
+from typing import List, Optional
+
+import numpy as np
+
+"""
+Conversions between the 0x-prefixed hex strings of hashes and addresses, as exported by the node, and their raw bytes.
+
+Only lowercase hex strings of the exact size are accepted, so decoding and encoding back always gives
+the same string.
+"""
+
+HASH_BYTES = 32
+ADDRESS_BYTES = 20
+
+def hex_to_bytes(value: str, size: int) -> bytes:
+    """
+    Decode a 0x-prefixed lowercase hex string of `size` bytes.
+
+    Raises:
+        ValueError: If the string is not the 0x-prefixed lowercase hex encoding of `size` bytes.
+    """
+    if len(value) != 2 + 2 * size or not value.startswith("0x") or value.lower() != value:
+        raise ValueError(f"{value!r} is not a 0x-prefixed lowercase hex string of {size} bytes")
+    return bytes.fromhex(value[2:])
+
+def bytes_to_hex(value: bytes) -> str:
+    return "0x" + value.hex()
+
+def hex_array(values: List[str], size: int, empty: Optional[bytes] = None) -> np.ndarray:
+    """
+    Decode hex strings into a (len(values), size) array of bytes. See `hex_to_bytes`.
+
+    Args:
+        empty (bytes, optional): The bytes stored for the empty strings. Empty strings are rejected by default.
+    """
+    data = b"".join(empty if value == "" and empty is not None else hex_to_bytes(value, size) for value in values)
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(values), size)
+
+def hex_list(values: np.ndarray, empty: Optional[bytes] = None) -> List[str]:
+    """
+    Encode the rows of a 2D array of bytes as 0x-prefixed hex strings.
+
+    Args:
+        empty (bytes, optional): The bytes decoded as the empty string, see `hex_array`.
+    """
+    width = 2 * values.shape[1]
+    encoded = binascii.hexlify(np.ascontiguousarray(values).tobytes()).decode()
+    strings = ["0x" + encoded[start:start + width] for start in range(0, len(encoded), width)]
+    if empty is None:
+        return strings
+    empty_string = bytes_to_hex(empty)
+    return ["" if string == empty_string else string for string in strings]
@@ -0,0 +1,90 @@
+from typing import Optional
+
+from sqlalchemy import String, LargeBinary
+from sqlalchemy.engine import Dialect
+from sqlalchemy.types import TypeDecorator
+
+from .hex_codec import hex_to_bytes
+
+"""
+Column type of the hashes and addresses, stored as hex strings or, in the compact schema, as their raw bytes.
+
+The schema of a database is chosen when it is created (see `make_engine`), and existing databases are converted with
+`python -m database.maintenance compact`. Values are converted by the column type, so the repositories read and write
+hex strings with both schemas.
+"""
+
+def is_compact(dialect: Dialect) -> bool:
+    # Set on the dialect of each engine by make_engine
+    return getattr(dialect, "compact_schema", False)
+
+
+class HexString(TypeDecorator):
+    """
+    A 0x-prefixed hex string of `size` bytes, stored as a string, or as `size` raw bytes in the compact schema.
+
+    The compact schema only stores lowercase hex strings of the exact size, as exported by the node, and the empty string
+    (the receiver of contract creations): writing any other value raises a ValueError. Comparisons with such values
+    match no stored value instead, so looking up a malformed hash finds nothing with both schemas.
+
+    Binary values sort as the lowercase hex strings they encode, so the listings keep their order.
+
+    Args:
+        size (int): Number of bytes of the values.
+        strict (bool): Whether unsupported values raise a ValueError (writes) or match nothing (comparisons).
+    """
+
+    impl = String
+    cache_ok = True
+
+    def __init__(self, size: int, strict: bool = True):
+        super().__init__()
+        self.size = size
+        self.strict = strict
+        # One instance per column, so its processors are built once per engine
+        self._compared_type = HexString(size, strict=False) if strict else self
+
+    def load_dialect_impl(self, dialect: Dialect):
+        if is_compact(dialect):
+            return dialect.type_descriptor(LargeBinary(self.size))
+        return dialect.type_descriptor(String())
+
+    def bind_processor(self, dialect: Dialect):
+        # Processors of their own rather than process_bind_param, which adds a call per value
+        if not is_compact(dialect):
+            return super().bind_processor(dialect)
+        return self.to_bytes
+
+    def result_processor(self, dialect: Dialect, coltype):
+        if not is_compact(dialect):
+            return super().result_processor(dialect, coltype)
+        return _to_hex
+
+    def to_bytes(self, value: Optional[str]) -> Optional[bytes]:
+        """
+        The bytes stored for a value in the compact schema.
+
+        Raises:
+            ValueError: If the type is strict and the value is not a lowercase hex string of `size` bytes, or empty.
+        """
+        if value is None:
+            return None
+        if value == "":
+            return b""
+        try:
+            return hex_to_bytes(value, self.size)
+        except ValueError:
+            if self.strict:
+                raise
+            # Longer than any stored value, so it equals none of them
+            return bytes(self.size + 1) + value.encode()
+
+    def coerce_compared_value(self, op, value):
+        return self._compared_type
+
+
+def _to_hex(value) -> Optional[str]:
+    # bytes, or memoryview on some drivers
+    if value is None:
+        return None
+    return "0x" + value.hex() if len(value) else ""
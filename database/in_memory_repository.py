@@ -1,8 +1,16 @@
 import pickle
 
-from typing import Optional
-from database.irepository import IRepository
+from datetime import datetime
+from typing import Optional, Iterator, List, Set, Dict, Any
+from database.irepository import (
+    IRepository, ON_CONFLICT_UPDATE, ADDRESS_RANKINGS, RANK_BY_GAS_COST, RANK_BY_GAS_USED, DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE, TransactionFilter, Cursor
+)
 from .processed_transaction import ProcessedTransaction
+from .instrumented_repository import DUPLICATE_TRANSACTIONS
+from .address_stats import AddressStats
+from .aggregates import aggregate, inserted_changes, bucket_start
+from .gas_rollup import TimeBucketRollup, BlockRollup
 
 """
 NOT USED.
@@ -17,9 +25,43 @@ class InMemoryRepository(IRepository):
     def create(self, transaction: ProcessedTransaction) -> None:
         self._data_source[transaction.hash] = transaction
 
+    def create_many(self, transactions: List[ProcessedTransaction], on_conflict: Optional[str] = None) -> None:
+        # Same semantics as SqlRepository.create_many: unless on_conflict is 'update', the stored row is kept
+        for transaction in transactions:
+            if transaction.hash in self._data_source and on_conflict != ON_CONFLICT_UPDATE:
+                if on_conflict is None:
+                    print(f"[InMemoryRepository] Duplicate transaction detected with hash {transaction.hash}")
+                    DUPLICATE_TRANSACTIONS.inc()
+                continue
+            self.create(transaction)
+
     def get_by_hash(self, hash: str) -> Optional[ProcessedTransaction]:
         return self._data_source.get(hash)
 
+    def get_many_by_hash(self, hashes: List[str]) -> Dict[str, ProcessedTransaction]:
+        return {hash: self._data_source[hash] for hash in hashes if hash in self._data_source}
+
+    def get_all_hashes(self) -> Set[str]:
+        return set(self._data_source)
+
+    def stream_hashes(self, chunk_size: int = MAX_PAGE_SIZE) -> Iterator[str]:
+        return iter(list(self._data_source))
+
+    def get_transactions(self, filters: TransactionFilter, after: Optional[Cursor] = None,
+                         limit: int = DEFAULT_PAGE_SIZE) -> List[ProcessedTransaction]:
+        return list(self.stream_transactions(filters, after))[:limit]
+
+    def stream_transactions(self, filters: TransactionFilter, after: Optional[Cursor] = None,
+                            chunk_size: int = MAX_PAGE_SIZE) -> Iterator[ProcessedTransaction]:
+        transactions = sorted(self._data_source.values(), key=lambda t: (t.blockNumber, t.hash))
+        for transaction in transactions:
+            if ((filters.from_address is None or transaction.fromAddress == filters.from_address)
+                    and (filters.to_address is None or transaction.toAddress == filters.to_address)
+                    and (filters.from_block is None or transaction.blockNumber >= filters.from_block)
+                    and (filters.to_block is None or transaction.blockNumber <= filters.to_block)
+                    and (after is None or (transaction.blockNumber, transaction.hash) > after)):
+                yield transaction
+
     def get_stats(self):
         totalTransactionsInDB = len(self._data_source)
         totalGasUsed = sum(transaction.gasUsed for transaction in self._data_source.values())
@@ -31,6 +73,51 @@ class InMemoryRepository(IRepository):
             "totalGasCostInDollars": totalGasCostInDollars
         }
 
+    def get_timeseries(self, start: datetime, end: datetime, bucket: str) -> List[Dict[str, Any]]:
+        time_buckets = self._rollups()[TimeBucketRollup]
+        first, last = bucket_start(start, bucket), bucket_start(end, bucket)
+        return [
+            {"bucketStart": key[1], "transactionCount": count, "gasUsed": gasUsed, "gasCostInDollars": gasCostInDollars}
+            for key, (count, gasUsed, gasCostInDollars) in sorted(time_buckets.items())
+            if key[0] == bucket and first <= key[1] <= last
+        ]
+
+    def get_block_stats(self, from_block: int, to_block: int, size: int) -> List[Dict[str, Any]]:
+        ranges = {}
+        for (block_number,), rollup in self._rollups()[BlockRollup].items():
+            if from_block <= block_number <= to_block:
+                totals = ranges.setdefault(block_number // size * size, [0, 0, 0.])
+                for index, value in enumerate(rollup):
+                    totals[index] += value
+        return [
+            {"fromBlock": max(block, from_block), "toBlock": min(block + size - 1, to_block),
+             "transactionCount": count, "gasUsed": gasUsed, "gasCostInDollars": gasCostInDollars}
+            for block, (count, gasUsed, gasCostInDollars) in sorted(ranges.items())
+        ]
+
+    def get_address_stats(self, address: str) -> Optional[Dict[str, Any]]:
+        totals = self._rollups()[AddressStats].get((address,))
+        return None if totals is None else self._address_stats(address, totals)
+
+    def get_top_addresses(self, by: str, limit: int) -> List[Dict[str, Any]]:
+        if by not in ADDRESS_RANKINGS:
+            raise ValueError(f"Unsupported ranking {by}. Expected one of {ADDRESS_RANKINGS}")
+        metric = {RANK_BY_GAS_COST: 3, RANK_BY_GAS_USED: 2}.get(by, 0)
+        # Same order as SqlRepository: highest metric first, ties by highest address
+        senders = [item for item in self._rollups()[AddressStats].items() if item[1][0] > 0]
+        ranked = sorted(senders, key=lambda item: (item[1][metric], item[0]), reverse=True)
+        return [self._address_stats(address, totals) for (address,), totals in ranked[:limit]]
+
+    def _rollups(self):
+        _, rollups = aggregate(inserted_changes(t.to_dict() for t in self._data_source.values()))
+        return rollups
+
+    @staticmethod
+    def _address_stats(address: str, totals: list) -> Dict[str, Any]:
+        sent, received, gasUsed, gasCostInDollars = totals
+        return {"address": address, "transactionsSent": sent, "transactionsReceived": received,
+                "gasUsed": gasUsed, "gasCostInDollars": gasCostInDollars}
+
     def save(self, filepath: str) -> None:
         with open(filepath, 'wb') as file:
             pickle.dump(self._data_source, file)
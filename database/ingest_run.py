@@ -0,0 +1,31 @@
+from sqlalchemy import Column, String, Integer, DateTime
+
+from .database import Base
+
+INGEST_RUNNING = "running"
+INGEST_DONE = "done"
+INGEST_FAILED = "failed"
+
+class IngestRun(Base):
+    """
+    A SQLAlchemy model representing a run of the CSV ingest and its progress.
+
+    The ingest runs in its own process and updates its row as it writes, so every API process
+    can report the progress and tell when the stored transactions changed.
+    Timestamps are naive UTC, as the transactions'.
+    """
+
+    __tablename__ = "ingest_run"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    filePath = Column(String)
+    status = Column(String, index=True)
+    # Data rows of the file, counted when processing starts. Invalid rows are never written nor skipped
+    rowsTotal = Column(Integer, nullable=True)
+    rowsWritten = Column(Integer, default=0)
+    # Rows skipped as already stored
+    rowsSkipped = Column(Integer, default=0)
+    startedAt = Column(DateTime)
+    updatedAt = Column(DateTime)
+    finishedAt = Column(DateTime, nullable=True)
+    error = Column(String, nullable=True)
@@ -0,0 +1,107 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+from sqlalchemy import select, update
+
+from .database import get_db_session, get_read_session
+from .ingest_run import IngestRun, INGEST_RUNNING, INGEST_DONE, INGEST_FAILED
+
+class SqlIngestStore:
+    """
+    Persistent progress of the CSV ingest runs, written by the ingest process and read by the API processes.
+
+    Usage:
+        store = SqlIngestStore()
+        run_id = store.start("ethereum_txs.csv", rows_total=100000)
+        store.update(run_id, rows_written=5000, rows_skipped=0)
+        store.finish(run_id, rows_written=100000, rows_skipped=0)
+        store.latest()  # status, progress, rows/sec and ETA of the last run
+    """
+
+    def start(self, file_path: str, rows_total: Optional[int] = None) -> int:
+        """
+        Record a new running run.
+
+        Args:
+            file_path (str): The file it processes.
+            rows_total (int, optional): The rows of the file, if already counted. See `update`.
+
+        Returns:
+            int: The id of the run.
+        """
+        now = datetime.utcnow()
+        with get_db_session() as session:
+            run = IngestRun(filePath=file_path, status=INGEST_RUNNING, rowsTotal=rows_total, rowsWritten=0,
+                            rowsSkipped=0, startedAt=now, updatedAt=now)
+            session.add(run)
+            session.flush()
+            return run.id
+
+    def update(self, run_id: int, rows_written: int, rows_skipped: int, rows_total: Optional[int] = None) -> None:
+        values = dict(rowsWritten=rows_written, rowsSkipped=rows_skipped, updatedAt=datetime.utcnow())
+        if rows_total is not None:
+            values.update(rowsTotal=rows_total)
+        with get_db_session() as session:
+            session.execute(update(IngestRun).where(IngestRun.id == run_id).values(**values))
+
+    def finish(self, run_id: int, rows_written: int, rows_skipped: int, error: Optional[str] = None) -> None:
+        """
+        Mark a run as done, or as failed with `error`.
+        """
+        now = datetime.utcnow()
+        with get_db_session() as session:
+            session.execute(
+                update(IngestRun).where(IngestRun.id == run_id)
+                .values(status=INGEST_FAILED if error is not None else INGEST_DONE, rowsWritten=rows_written,
+                        rowsSkipped=rows_skipped, updatedAt=now, finishedAt=now, error=error)
+            )
+
+    def fail_unfinished(self, error: str) -> int:
+        """
+        Mark the runs still running as failed, e.g. at startup, since their process is gone.
+
+        Returns:
+            int: The number of runs marked as failed.
+        """
+        now = datetime.utcnow()
+        with get_db_session() as session:
+            result = session.execute(
+                update(IngestRun).where(IngestRun.status == INGEST_RUNNING)
+                .values(status=INGEST_FAILED, updatedAt=now, finishedAt=now, error=error)
+            )
+            return result.rowcount
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """
+        Get the progress of the last run.
+
+        Returns:
+            Optional[Dict[str, Any]]: The run, with its rows done (written or skipped), rows per second and estimated
+            seconds left (None once finished, or before the rows are counted and the first batch is written),
+            or None if no run was started.
+        """
+        with get_read_session() as session:
+            run = session.execute(select(IngestRun).order_by(IngestRun.id.desc()).limit(1)).scalar()
+            if run is None:
+                return None
+
+            rows_done = run.rowsWritten + run.rowsSkipped
+            elapsed = ((run.finishedAt or run.updatedAt) - run.startedAt).total_seconds()
+            rows_per_second = rows_done / elapsed if elapsed > 0 else 0.
+            eta_seconds = None
+            if run.status == INGEST_RUNNING and run.rowsTotal is not None and rows_per_second > 0:
+                eta_seconds = max(0, run.rowsTotal - rows_done) / rows_per_second
+            return {
+                "id": run.id,
+                "filePath": run.filePath,
+                "status": run.status,
+                "rowsTotal": run.rowsTotal,
+                "rowsWritten": run.rowsWritten,
+                "rowsSkipped": run.rowsSkipped,
+                "rowsDone": rows_done,
+                "rowsPerSecond": rows_per_second,
+                "etaSeconds": eta_seconds,
+                "startedAt": run.startedAt,
+                "updatedAt": run.updatedAt,
+                "finishedAt": run.finishedAt,
+                "error": run.error,
+            }
@@ -0,0 +1,78 @@
+from datetime import datetime
+from time import perf_counter
+from typing import Optional, Dict, Any, List, Set
+
+from metrics import Counter, Histogram
+from .irepository import IRepository, DEFAULT_PAGE_SIZE, TransactionFilter, Cursor
+from .processed_transaction import ProcessedTransaction
+from .repository_decorator import RepositoryDecorator
+
+REPOSITORY_LATENCY = Histogram(
+    "ratedapi_repository_call_duration_seconds", "Latency of the repository calls, by repository and method",
+    ["repository", "method"],
+)
+DUPLICATE_TRANSACTIONS = Counter(
+    "ratedapi_duplicate_transactions_total",
+    "Transactions written without on_conflict whose hash was already stored, or repeated in their batch",
+)
+
+# The methods timed by InstrumentedRepository. The streams return before they are read, so they are not timed
+TIMED_METHODS = (
+    "create", "create_many", "get_by_hash", "get_many_by_hash", "get_all_hashes", "get_transactions", "get_stats",
+    "get_timeseries", "get_block_stats", "get_address_stats", "get_top_addresses",
+)
+
+class InstrumentedRepository(RepositoryDecorator):
+    """
+    Records the latency of every call to another repository in REPOSITORY_LATENCY, including the failed ones.
+
+    Args:
+        repository (IRepository): The timed repository.
+        name (str): The `repository` label of its calls, e.g. 'api' in front of the caches and 'storage' behind them.
+    """
+
+    def __init__(self, repository: IRepository, name: str):
+        super().__init__(repository)
+        self.name = name
+        self._latencies = {method: REPOSITORY_LATENCY.labels(name, method) for method in TIMED_METHODS}
+
+    def _timed(self, method: str, *args):
+        started = perf_counter()
+        try:
+            return getattr(self.repository, method)(*args)
+        finally:
+            self._latencies[method].observe(perf_counter() - started)
+
+    def create(self, transaction: ProcessedTransaction) -> None:
+        self._timed("create", transaction)
+
+    def create_many(self, transactions: List[ProcessedTransaction], on_conflict: Optional[str] = None) -> None:
+        self._timed("create_many", transactions, on_conflict)
+
+    def get_by_hash(self, hash: str) -> Optional[ProcessedTransaction]:
+        return self._timed("get_by_hash", hash)
+
+    def get_many_by_hash(self, hashes: List[str]) -> Dict[str, Any]:
+        return self._timed("get_many_by_hash", hashes)
+
+    def get_all_hashes(self) -> Set[str]:
+        return self._timed("get_all_hashes")
+
+    def get_transactions(self, filters: TransactionFilter, after: Optional[Cursor] = None,
+                         limit: int = DEFAULT_PAGE_SIZE) -> List[Any]:
+        return self._timed("get_transactions", filters, after, limit)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self._timed("get_stats")
+
+    def get_timeseries(self, start: datetime, end: datetime, bucket: str) -> List[Dict[str, Any]]:
+        return self._timed("get_timeseries", start, end, bucket)
+
+    def get_block_stats(self, from_block: int, to_block: int, size: int) -> List[Dict[str, Any]]:
+        return self._timed("get_block_stats", from_block, to_block, size)
+
+    def get_address_stats(self, address: str) -> Optional[Dict[str, Any]]:
+        return self._timed("get_address_stats", address)
+
+    def get_top_addresses(self, by: str, limit: int) -> List[Dict[str, Any]]:
+        return self._timed("get_top_addresses", by, limit)
@@ -1,8 +1,42 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterator, List, NamedTuple, Set, Tuple
 
 from .processed_transaction import ProcessedTransaction
 
+# Conflict resolution modes for create_many when a transaction hash is already stored:
+# skip the incoming row, or overwrite the stored one with it
+ON_CONFLICT_IGNORE = "ignore"
+ON_CONFLICT_UPDATE = "update"
+ON_CONFLICT_MODES = (ON_CONFLICT_IGNORE, ON_CONFLICT_UPDATE)
+
+# Time buckets of the gas rollups
+BUCKET_HOUR = "hour"
+BUCKET_DAY = "day"
+TIME_BUCKETS = (BUCKET_HOUR, BUCKET_DAY)
+
+# Metrics the addresses can be ranked by: gas cost and gas used paid as sender, transactions sent
+RANK_BY_GAS_COST = "gasCost"
+RANK_BY_GAS_USED = "gasUsed"
+RANK_BY_TRANSACTIONS = "transactions"
+ADDRESS_RANKINGS = (RANK_BY_GAS_COST, RANK_BY_GAS_USED, RANK_BY_TRANSACTIONS)
+
+# Default and largest number of transactions per listing page
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+class TransactionFilter(NamedTuple):
+    """
+    The criteria of a transaction listing. Unset criteria match every transaction, block bounds are included.
+    """
+    from_address: Optional[str] = None
+    to_address: Optional[str] = None
+    from_block: Optional[int] = None
+    to_block: Optional[int] = None
+
+# A listing cursor: the (blockNumber, hash) of the last transaction read. Listings resume strictly after it
+Cursor = Tuple[int, str]
+
 class IRepository(ABC):
     """
     An abstract base class representing a repository interface for processed transactions.
@@ -12,10 +46,52 @@ class IRepository(ABC):
     def create(self, transaction: ProcessedTransaction) -> None:
         pass
 
+    @abstractmethod
+    def create_many(self, transactions: List[ProcessedTransaction], on_conflict: Optional[str] = None) -> None:
+        pass
+
     @abstractmethod
     def get_by_hash(self, hash: str) -> Optional[ProcessedTransaction]:
         pass
 
+    @abstractmethod
+    def get_many_by_hash(self, hashes: List[str]) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    def get_all_hashes(self) -> Set[str]:
+        pass
+
+    @abstractmethod
+    def stream_hashes(self, chunk_size: int = MAX_PAGE_SIZE) -> Iterator[str]:
+        pass
+
+    @abstractmethod
+    def get_transactions(self, filters: TransactionFilter, after: Optional[Cursor] = None,
+                         limit: int = DEFAULT_PAGE_SIZE) -> List[Any]:
+        pass
+
+    @abstractmethod
+    def stream_transactions(self, filters: TransactionFilter, after: Optional[Cursor] = None,
+                            chunk_size: int = MAX_PAGE_SIZE) -> Iterator[Any]:
+        pass
+
     @abstractmethod
     def get_stats(self) -> Dict[str, Any]:
-        pass
\ No newline at end of file
+        pass
+
+    @abstractmethod
+    def get_timeseries(self, start: datetime, end: datetime, bucket: str) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def get_block_stats(self, from_block: int, to_block: int, size: int) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def get_address_stats(self, address: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def get_top_addresses(self, by: str, limit: int) -> List[Dict[str, Any]]:
+        pass
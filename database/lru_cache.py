@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+class LruCache:
+    """
+    A thread-safe cache bounded by number of entries and/or bytes, evicting the least recently used entries first.
+
+    Entries can also expire `ttl` seconds after they are stored. Expired entries are dropped when they are read,
+    or evicted as any other entry.
+
+    Writers that cannot lock out readers use `generation` to avoid caching stale values: a reader takes
+    the generation before reading from the source, and `put` drops the value if an entry was invalidated since.
+
+    Args:
+        max_entries (int, optional): Maximum number of entries.
+        max_bytes (int, optional): Maximum total size of the entries, as measured by `sizeof`.
+        ttl (float, optional): Seconds an entry stays valid. Entries never expire by default.
+        sizeof (Callable[[Any, Any], int]): The size in bytes of a (key, value) entry. Only needed with max_bytes.
+        clock (Callable[[], float]): Monotonic clock in seconds. Can be replaced in tests.
+
+    Usage:
+        cache = LruCache(max_entries=10000, ttl=60)
+        value = cache.get(key)  # None on a miss
+        cache.put(key, value)
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None, ttl: Optional[float] = None,
+                 sizeof: Callable[[Any, Any], int] = lambda key, value: 0,
+                 clock: Callable[[], float] = time.monotonic):
+        if max_entries is None and max_bytes is None:
+            raise ValueError("The cache needs a bound: max_entries, max_bytes or both")
+        if (max_entries is not None and max_entries < 1) or (max_bytes is not None and max_bytes < 1):
+            raise ValueError("max_entries and max_bytes must be positive")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be a positive number of seconds")
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (value, expires at, size), least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None) -> bool:
+        """
+        Store an entry, evicting the least recently used ones to stay within the bounds.
+
+        Args:
+            generation (int, optional): The generation taken before `value` was read. The value is dropped
+                if an entry was invalidated since.
+
+        Returns:
+            bool: Whether the entry was stored.
+        """
+        size = self._sizeof(key, value) if self.max_bytes is not None else 0
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            if self.max_bytes is not None and size > self.max_bytes:
+                return False
+
+            if key in self._entries:
+                self._remove(key)
+            expires_at = self._clock() + self.ttl if self.ttl is not None else None
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+
+            while ((self.max_entries is not None and len(self._entries) > self.max_entries)
+                   or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def invalidate(self, key: Hashable) -> None:
+        self.invalidate_many([key])
+
+    def invalidate_many(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
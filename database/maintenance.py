@@ -0,0 +1,132 @@
+import argparse
+import sys
+
+from sqlalchemy.exc import StatementError
+from sqlalchemy.schema import CreateTable
+
+from .database import Base, DATABASE_URL, init_db, get_db_session, make_engine, stored_compact_schema
+from .aggregates import check_aggregates, rebuild_aggregates
+from .processed_transaction import ProcessedTransaction
+from .address_stats import AddressStats
+from .hex_string import HexString
+
+"""
+Maintenance commands for the aggregates maintained alongside processed_transaction (stats totals and gas rollups),
+and the conversion of a database to the compact schema.
+
+Usage:
+    python -m database.maintenance check    # Exits with status 1 if the aggregates drifted
+    python -m database.maintenance rebuild  # Recomputes the aggregates from processed_transaction
+    python -m database.maintenance compact  # Stores the hashes and addresses as raw bytes, see database/hex_string.py
+    python -m database.maintenance compact --url sqlite:///partitions/partition_000017800000.db  # Another database
+"""
+
+# The tables with HexString columns, converted by `compact`
+HEX_TABLES = (ProcessedTransaction.__table__, AddressStats.__table__)
+# SQL function converting the hex strings while `compact` copies the tables
+HEX_TO_BYTES = "hex_to_bytes"
+
+def check() -> bool:
+    with get_db_session() as session:
+        consistent, stored, actual, mismatches = check_aggregates(session)
+
+    if consistent:
+        print(f"[maintenance] Aggregates are consistent: {stored}")
+    else:
+        print(f"[maintenance] Aggregates drifted.\n  Stored stats:  {stored}\n  Scanned stats: {actual}\n"
+              f"  Rollup rows that differ: {mismatches}\n"
+              f"Run `python -m database.maintenance rebuild` to fix them.")
+    return consistent
+
+def rebuild() -> None:
+    with get_db_session() as session:
+        stats = rebuild_aggregates(session)
+    print(f"[maintenance] Aggregates rebuilt: {stats}")
+
+def compact(url: str = DATABASE_URL) -> bool:
+    """
+    Convert a SQLite database to the compact schema, storing the hashes and addresses as raw bytes instead of hex strings.
+
+    The tables are renamed, recreated with the compact schema and copied in SQL in a single transaction, so the database is left
+    unchanged if a value cannot be converted. The file is then vacuumed to give the space back to the file system.
+    Stop the server and the ingest first: they keep using the schema they opened the database with.
+
+    Returns:
+        bool: False if a value is not a lowercase hex string of the expected size, or empty.
+    """
+    compact_engine = make_engine(url, compact_schema=True, pool_size=1)
+    try:
+        with compact_engine.connect() as connection:
+            stored = stored_compact_schema(connection.connection)
+            # Creates the database or its missing tables with the compact schema
+            Base.metadata.create_all(bind=connection)
+            connection.commit()
+            if stored is not False:
+                print("[maintenance] The database uses the compact schema")
+                return True
+
+            # Converts the values of the HexString columns in SQL, see _convert_table
+            malformed = []
+            def to_bytes(value, size):
+                try:
+                    return HexString(size).to_bytes(value)
+                except ValueError as e:
+                    malformed.append(str(e))
+                    raise
+            connection.connection.dbapi_connection.create_function(HEX_TO_BYTES, 2, to_bytes, deterministic=True)
+
+            # pysqlite only opens transactions before DML statements, while the tables are renamed and created first
+            connection.exec_driver_sql("BEGIN")
+            try:
+                copied = {table.name: _convert_table(connection, table) for table in HEX_TABLES}
+            except StatementError as e:
+                connection.rollback()
+                print(f"[maintenance] Could not convert the database, it was left unchanged: "
+                      f"{malformed[0] if malformed else e.orig}")
+                return False
+            connection.commit()
+
+        with compact_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql("VACUUM")
+    finally:
+        compact_engine.dispose()
+
+    print(f"[maintenance] Converted to the compact schema: {copied} rows copied")
+    return True
+
+def _convert_table(connection, table) -> int:
+    # Recreate `table` with the compact schema and copy its rows, converting the hex strings with HEX_TO_BYTES
+    connection.exec_driver_sql(f'ALTER TABLE "{table.name}" RENAME TO "{table.name}_hex"')
+    for index in table.indexes:
+        connection.exec_driver_sql(f'DROP INDEX IF EXISTS "{index.name}"')
+    connection.execute(CreateTable(table))
+
+    columns = ", ".join(f'"{column.key}"' for column in table.columns)
+    values = ", ".join(
+        f'{HEX_TO_BYTES}("{column.key}", {column.type.size})' if isinstance(column.type, HexString) else f'"{column.key}"'
+        for column in table.columns
+    )
+    copied = connection.exec_driver_sql(
+        f'INSERT INTO "{table.name}" ({columns}) SELECT {values} FROM "{table.name}_hex"'
+    ).rowcount
+
+    connection.exec_driver_sql(f'DROP TABLE "{table.name}_hex"')
+    # After the copy, building an index at once is faster than inserting into it row by row
+    for index in table.indexes:
+        index.create(connection)
+    return copied
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check or rebuild the aggregates served by /stats and /stats/timeseries, "
+                                                 "or convert the database to the compact schema")
+    parser.add_argument('command', choices=['check', 'rebuild', 'compact'])
+    parser.add_argument('--url', dest='url', default=DATABASE_URL,
+                        help="The database converted by compact, e.g. a partition of a PartitionedRepository")
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        sys.exit(0 if compact(args.url) else 1)
+    init_db()
+    if args.command == 'check':
+        sys.exit(0 if check() else 1)
+    rebuild()
@@ -0,0 +1,175 @@
+import threading
+from typing import Optional, Dict, Any, List
+
+from .bloom_filter import BloomFilter
+from .irepository import IRepository
+from .processed_transaction import ProcessedTransaction
+from .repository_decorator import RepositoryDecorator
+
+class NegativeLookupRepository(RepositoryDecorator):
+    """
+    Answers lookups of hashes that are not stored without querying the wrapped repository.
+
+    A BloomFilter over the stored hashes is built from the wrapped repository on the first lookup
+    (or by calling `load`). Writes made through this repository add their hashes to it before writing,
+    so a hash is never reported missing once its row can be read. A lookup the filter rules out
+    returns None straight away; the others, including the false positives, go to the wrapped repository.
+
+    Only writes made through this repository are seen: when another process writes to the database, call `suspend`
+    while it writes and `load` once it is done, or its new rows would be reported missing.
+
+    The filter is sized for twice the stored transactions (at least `min_capacity`), and rebuilt at twice
+    its size once more transactions than its capacity were written.
+
+    Args:
+        repository (IRepository): The repository the transactions are read from and written to.
+        false_positive_rate (float): The target rate of unknown hashes that still reach the wrapped repository.
+        min_capacity (int): The smallest number of hashes the filter is sized for.
+
+    Usage:
+        repository = NegativeLookupRepository(SqlRepository(), false_positive_rate=0.001)
+        repository.load()
+        repository.filter_stats()  # memory, false positive rates, lookups answered without the database
+    """
+
+    DEFAULT_FALSE_POSITIVE_RATE = 0.01
+    DEFAULT_MIN_CAPACITY = 1000000
+    # Capacity of the filter relative to the number of stored hashes
+    GROWTH_FACTOR = 2
+    # Hashes read from the wrapped repository per bulk add while loading
+    LOAD_CHUNK_SIZE = 100000
+
+    def __init__(self, repository: IRepository, false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE,
+                 min_capacity: int = DEFAULT_MIN_CAPACITY):
+        super().__init__(repository)
+        self.false_positive_rate = false_positive_rate
+        self.min_capacity = min_capacity
+        self.filter = None
+        # Hashes written before the filter is built, or while it is rebuilt, added to it once the build is done.
+        # Until the first load they are all kept, so call load before writing large amounts of transactions
+        self._written_during_load = []
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._suspended = False
+
+        self.lookups = 0
+        self.filtered_lookups = 0
+        self.false_positives = 0
+
+    def load(self) -> None:
+        """
+        Build the filter from the hashes stored in the wrapped repository. Lookups keep using the previous filter,
+        if any, until the new one is ready.
+        """
+        with self._load_lock:
+            self._load()
+
+    def suspend(self) -> None:
+        """
+        Send every lookup to the wrapped repository until the next `load` completes, e.g. while another process
+        writes transactions the filter cannot see.
+        """
+        self._suspended = True
+
+    @property
+    def suspended(self) -> bool:
+        return self._suspended
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._written_during_load is None:
+                self._written_during_load = []
+
+        stored = self.repository.get_stats()["totalTransactionsInDB"]
+        new_filter = BloomFilter(max(self.min_capacity, stored * self.GROWTH_FACTOR), self.false_positive_rate)
+        chunk = []
+        for hash in self.repository.stream_hashes():
+            chunk.append(hash)
+            if len(chunk) >= self.LOAD_CHUNK_SIZE:
+                new_filter.add_many(chunk)
+                chunk = []
+        new_filter.add_many(chunk)
+
+        with self._lock:
+            new_filter.add_many(self._written_during_load)
+            self._written_during_load = None
+            self.filter = new_filter
+            self._suspended = False
+
+        stats = new_filter.stats()
+        print(f"[NegativeLookupRepository] Loaded {stats['count']} hashes into a {stats['memory_bytes'] / 2 ** 20:.1f} MiB "
+              f"Bloom filter with {stats['hash_count']} hash functions, sized for {stats['capacity']} hashes "
+              f"at a {stats['target_false_positive_rate']:.2%} false positive rate")
+
+    def create(self, transaction: ProcessedTransaction) -> None:
+        self._add([transaction.hash])
+        self.repository.create(transaction)
+        self._grow_if_full()
+
+    def create_many(self, transactions: List[ProcessedTransaction], on_conflict: Optional[str] = None) -> None:
+        self._add([transaction.hash for transaction in transactions])
+        self.repository.create_many(transactions, on_conflict)
+        self._grow_if_full()
+
+    def get_by_hash(self, hash: str) -> Optional[ProcessedTransaction]:
+        self.lookups += 1
+        if self._suspended:
+            return self.repository.get_by_hash(hash)
+        if hash not in self._get_filter():
+            self.filtered_lookups += 1
+            return None
+
+        transaction = self.repository.get_by_hash(hash)
+        if transaction is None:
+            self.false_positives += 1
+        return transaction
+
+    def get_many_by_hash(self, hashes: List[str]) -> Dict[str, Any]:
+        hashes = list(dict.fromkeys(hashes))
+        if self._suspended:
+            self.lookups += len(hashes)
+            return self.repository.get_many_by_hash(hashes)
+        stored_filter = self._get_filter()
+        candidates = [hash for hash in hashes if hash in stored_filter]
+        self.lookups += len(hashes)
+        self.filtered_lookups += len(hashes) - len(candidates)
+
+        found = self.repository.get_many_by_hash(candidates) if candidates else {}
+        self.false_positives += len(candidates) - len(found)
+        return found
+
+    def filter_stats(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: The size and false positive rates of the filter, and the number of lookups,
+            lookups answered by the filter alone and false positives seen since startup.
+        """
+        stats = self.filter.stats() if self.filter is not None else {}
+        stats.update(lookups=self.lookups, filtered_lookups=self.filtered_lookups, false_positives=self.false_positives,
+                     suspended=self._suspended)
+        return stats
+
+    def _get_filter(self) -> BloomFilter:
+        if self.filter is None:
+            with self._load_lock:
+                if self.filter is None:
+                    self._load()
+        return self.filter
+
+    def _add(self, hashes: List[str]) -> None:
+        # Before the write, so no reader can see the row while the filter rules it out
+        with self._lock:
+            if self.filter is not None:
+                self.filter.add_many(hashes)
+            if self._written_during_load is not None:
+                self._written_during_load.extend(hashes)
+
+    def _is_full(self) -> bool:
+        return self.filter is not None and self.filter.count > self.filter.capacity
+
+    def _grow_if_full(self) -> None:
+        if self._is_full():
+            with self._load_lock:
+                # Another writer may have rebuilt it meanwhile
+                if self._is_full():
+                    self._load()
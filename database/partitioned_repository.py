@@ -0,0 +1,467 @@
+import os
+import re
+import shutil
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, Executor
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterator, List, Set, Tuple, Callable
+
+from sqlalchemy import select, delete, bindparam
+from sqlalchemy.orm import sessionmaker
+
+from .aggregates import rebuild_aggregates
+from .database import Base, READ_POOL_SIZE, get_db_session, get_read_session, make_engine
+from .hash_partition import HashPartition, PartitionIndexBase
+from .hex_codec import HASH_BYTES
+from .hex_string import HexString
+from .instrumented_repository import DUPLICATE_TRANSACTIONS
+from .irepository import (
+    IRepository, ON_CONFLICT_MODES, ON_CONFLICT_IGNORE, ON_CONFLICT_UPDATE, ADDRESS_RANKINGS, RANK_BY_GAS_COST,
+    RANK_BY_GAS_USED, RANK_BY_TRANSACTIONS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, TransactionFilter, Cursor
+)
+from .processed_transaction import ProcessedTransaction
+from .transaction_stats import TransactionStats
+from .gas_rollup import TimeBucketRollup, BlockRollup
+from .address_stats import AddressStats
+from .sql_repository import SqlRepository
+from .statements import insert_statement
+
+# Database of the hash -> partition index, and of each partition, named after its first block number
+INDEX_FILE = "index.db"
+PARTITION_FILE = re.compile(r"partition_(\d+)\.db")
+# The tables of a partition: its transactions and their aggregates
+PARTITION_TABLES = [model.__table__ for model in
+                    (ProcessedTransaction, TransactionStats, TimeBucketRollup, BlockRollup, AddressStats)]
+
+# Built once, the lookups only bind the hash. Compared as in a query, so a malformed hash is not found
+PARTITION_OF_HASH = select(HashPartition.partitionStart).where(
+    HashPartition.hash == bindparam("hash", type_=HexString(HASH_BYTES, strict=False))
+)
+
+def partition_file(start: int) -> str:
+    return f"partition_{start:012d}.db"
+
+class PartitionedRepository(IRepository):
+    """
+    A repository sharding the transactions by block number range into SQLite databases, one file per range of
+    `partition_size` blocks, stored in `directory` next to a hash -> partition index.
+
+    Each partition is a SqlRepository with its own aggregates. Lookups by hash read the partition of the hash from the index,
+    listings read the partitions in block order and skip those outside the block bounds and before the cursor,
+    and the aggregate reads (stats, timeseries, block stats, address stats and rankings) run on every partition
+    on a thread pool and merge their results.
+
+    Old partitions are not written once the ingest has moved past their blocks, so they can be converted to the compact schema
+    (`python -m database.maintenance compact --url sqlite:///<partition file>`) or moved out of the repository with
+    `archive` while the newest one keeps taking writes.
+
+    A partition is created under a temporary name and renamed once its tables exist, so other processes reading the
+    directory never open a partition without its tables. Writes are expected from a single process at a time (the
+    ingest), and a transaction moved to another partition by an update is deleted from its old partition before
+    it is written to the new one: a failure in between loses it until it is written again, rather than counting it twice.
+
+    Args:
+        directory (str): The directory of the partitions. Created if needed.
+        partition_size (int): Number of blocks per partition. Keep it the same for a directory.
+        batch_size (int): Maximum number of rows written per transaction by create_many.
+        executor (Executor, optional): Runs the reads of the partitions. A pool of FAN_OUT_WORKERS threads by default.
+
+    Usage:
+        repository = PartitionedRepository("partitions", partition_size=100000)
+        repository.create_many(transactions)
+        repository.get_stats()
+        repository.archive(17800000, "archive")
+    """
+
+    DEFAULT_PARTITION_SIZE = 100000
+    FAN_OUT_WORKERS = 4
+    # Factor the number of senders read from each partition grows by, until the ranking is exact
+    RANKING_DEPTH_GROWTH = 4
+    # The address_stats key each ranking orders by, as in SqlRepository.RANKING_COLUMNS
+    RANKING_KEYS = {
+        RANK_BY_GAS_COST: "gasCostInDollars",
+        RANK_BY_GAS_USED: "gasUsed",
+        RANK_BY_TRANSACTIONS: "transactionsSent",
+    }
+
+    def __init__(self, directory: str, partition_size: int = DEFAULT_PARTITION_SIZE,
+                 batch_size: int = SqlRepository.DEFAULT_BATCH_SIZE, executor: Optional[Executor] = None):
+        if partition_size < 1:
+            raise ValueError("partition_size must be a positive integer")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.partition_size = partition_size
+        for start in self._stored_starts():
+            if start % partition_size:
+                raise ValueError(f"{partition_file(start)} does not start a partition of {partition_size} blocks")
+
+        # The repository and the engines of each open partition, by first block number
+        self._partitions_by_start: Dict[int, Tuple[SqlRepository, List]] = {}
+        self._lock = threading.Lock()
+        self.batch_size = batch_size
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=self.FAN_OUT_WORKERS,
+                                                        thread_name_prefix="partition")
+
+        url = f"sqlite:///{os.path.join(directory, INDEX_FILE)}"
+        self._index_engines = [make_engine(url), make_engine(url, read_only=True, pool_size=READ_POOL_SIZE)]
+        PartitionIndexBase.metadata.create_all(bind=self._index_engines[0])
+        self._index_sessions = sessionmaker(bind=self._index_engines[0])
+        self._index_read_sessions = sessionmaker(bind=self._index_engines[1])
+
+    @property
+    def batch_size(self) -> int:
+        return self._batch_size
+
+    @batch_size.setter
+    def batch_size(self, batch_size: int) -> None:
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer")
+        self._batch_size = batch_size
+        for repository, _ in self._partitions_by_start.values():
+            repository.batch_size = batch_size
+
+    def partition_start(self, block_number: int) -> int:
+        return block_number // self.partition_size * self.partition_size
+
+    def partitions(self) -> List[int]:
+        """
+        Get the first block number of each partition, lowest first.
+        """
+        return self._stored_starts()
+
+    def create(self, transaction: ProcessedTransaction) -> None:
+        self.create_many([transaction])
+
+    def create_many(self, transactions: List[ProcessedTransaction], on_conflict: Optional[str] = None) -> None:
+        """
+        Write transactions to the partitions of their blocks, `batch_size` rows at a time, and route their hashes to them.
+
+        Duplicates are found in the index, so a hash stored in another partition is a duplicate too. Without `on_conflict`
+        they are reported as in SqlRepository.create and skipped, with 'ignore' they are skipped, and with 'update' they
+        overwrite the stored row, moving it to another partition if its block number changed.
+        """
+        if on_conflict is not None and on_conflict not in ON_CONFLICT_MODES:
+            raise ValueError(f"Unsupported on_conflict mode {on_conflict}. Expected one of {ON_CONFLICT_MODES}")
+
+        for start in range(0, len(transactions), self.batch_size):
+            self._write_batch(transactions[start:start + self.batch_size], on_conflict)
+
+    def _write_batch(self, batch: List[ProcessedTransaction], on_conflict: Optional[str]) -> None:
+        written = {}
+        for transaction in batch:
+            if transaction.hash in written and on_conflict != ON_CONFLICT_UPDATE:
+                if on_conflict is None:
+                    print(f"[PartitionedRepository] Duplicate transaction detected with hash {transaction.hash}")
+                    DUPLICATE_TRANSACTIONS.inc()
+                continue
+            written[transaction.hash] = transaction
+
+        # Through the write connections, which see the last commits
+        with get_read_session(self._index_sessions) as session:
+            stored = self._locate(session, list(written))
+
+        moved = defaultdict(list)
+        by_partition = defaultdict(list)
+        for hash, transaction in written.items():
+            start = self.partition_start(transaction.blockNumber)
+            if hash in stored:
+                if on_conflict is None:
+                    print(f"[PartitionedRepository] Duplicate transaction detected with hash {hash}")
+                    DUPLICATE_TRANSACTIONS.inc()
+                if on_conflict != ON_CONFLICT_UPDATE:
+                    continue
+                if stored[hash] != start:
+                    moved[stored[hash]].append(hash)
+            by_partition[start].append(transaction)
+
+        for start, hashes in moved.items():
+            partition = self._partition(start)
+            if partition is not None:
+                partition.delete_many(hashes)
+        for start, transactions in sorted(by_partition.items()):
+            # Rows stored in a partition but missing from the index, after a failure between the two writes, are kept
+            self._partition(start, create=True).create_many(transactions, on_conflict=on_conflict or ON_CONFLICT_IGNORE)
+        if by_partition:
+            with get_db_session(self._index_sessions) as session:
+                statement = insert_statement(HashPartition.__table__, session.get_bind().dialect.name,
+                                             ON_CONFLICT_UPDATE, index_elements=['hash'])
+                session.execute(statement, [
+                    {"hash": transaction.hash, "partitionStart": start}
+                    for start, transactions in by_partition.items() for transaction in transactions
+                ])
+
+    def _locate(self, session, hashes: List[str]) -> Dict[str, int]:
+        # The partition of each stored hash among `hashes`, in chunked IN queries
+        located = {}
+        for start in range(0, len(hashes), SqlRepository.IN_CLAUSE_SIZE):
+            chunk = hashes[start:start + SqlRepository.IN_CLAUSE_SIZE]
+            located.update(session.execute(
+                select(HashPartition.hash, HashPartition.partitionStart).where(HashPartition.hash.in_(chunk))
+            ).all())
+        return located
+
+    def get_by_hash(self, hash: str) -> Optional[ProcessedTransaction]:
+        # On a connection rather than a session, which costs as much as the query
+        with self._index_engines[1].connect() as connection:
+            start = connection.execute(PARTITION_OF_HASH, {"hash": hash}).scalar()
+        partition = None if start is None else self._partition(start)
+        return None if partition is None else partition.get_by_hash(hash)
+
+    def get_many_by_hash(self, hashes: List[str]) -> Dict[str, Any]:
+        """
+        Get the stored transactions among `hashes`, with one query per partition holding some of them.
+
+        Returns:
+            Dict[str, Any]: Rows with the ProcessedTransaction columns as attributes, by hash. Hashes that are
+            not stored are left out.
+        """
+        with get_read_session(self._index_read_sessions) as session:
+            located = self._locate(session, list(dict.fromkeys(hashes)))
+        by_partition = defaultdict(list)
+        for hash, start in located.items():
+            by_partition[start].append(hash)
+
+        found = {}
+        for start, partition_hashes in by_partition.items():
+            partition = self._partition(start)
+            if partition is not None:
+                found.update(partition.get_many_by_hash(partition_hashes))
+        return found
+
+    def get_all_hashes(self) -> Set[str]:
+        with get_read_session(self._index_read_sessions) as session:
+            return set(session.scalars(select(HashPartition.hash)))
+
+    def stream_hashes(self, chunk_size: int = MAX_PAGE_SIZE) -> Iterator[str]:
+        """
+        Iterate over the stored hashes from the index, fetched `chunk_size` at a time.
+        """
+        with get_read_session(self._index_read_sessions) as session:
+            yield from session.scalars(select(HashPartition.hash).execution_options(yield_per=chunk_size))
+
+    def get_transactions(self, filters: TransactionFilter, after: Optional[Cursor] = None,
+                         limit: int = DEFAULT_PAGE_SIZE) -> List[Any]:
+        """
+        Get a page of the transactions matching `filters`, ordered by (blockNumber, hash), from the partitions
+        in block order until the page is full.
+
+        Returns:
+            List[Any]: Rows with the ProcessedTransaction columns as attributes.
+        """
+        rows = []
+        for partition in self._listed_partitions(filters, after):
+            if len(rows) >= limit:
+                break
+            rows.extend(partition.get_transactions(filters, after, limit - len(rows)))
+        return rows
+
+    def stream_transactions(self, filters: TransactionFilter, after: Optional[Cursor] = None,
+                            chunk_size: int = MAX_PAGE_SIZE) -> Iterator[Any]:
+        """
+        Iterate over every transaction matching `filters` after the cursor, ordered by (blockNumber, hash),
+        one partition after the other.
+
+        Returns:
+            Iterator[Any]: Rows with the ProcessedTransaction columns as attributes.
+        """
+        for partition in self._listed_partitions(filters, after):
+            yield from partition.stream_transactions(filters, after, chunk_size)
+
+    def _listed_partitions(self, filters: TransactionFilter, after: Optional[Cursor]) -> Iterator[SqlRepository]:
+        # The partitions that can hold transactions of the listing, lowest blocks first
+        for start, partition in self._open_partitions():
+            end = start + self.partition_size - 1
+            if filters.to_block is not None and start > filters.to_block:
+                return
+            if filters.from_block is not None and end < filters.from_block:
+                continue
+            if after is not None and end < after[0]:
+                continue
+            yield partition
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {"totalTransactionsInDB": 0, "totalGasUsed": 0, "totalGasCostInDollars": 0.}
+        for partition_stats in self._fan_out(lambda partition: partition.get_stats()):
+            for key in stats:
+                stats[key] += partition_stats[key]
+        return stats
+
+    def get_timeseries(self, start: datetime, end: datetime, bucket: str) -> List[Dict[str, Any]]:
+        # A bucket can hold the transactions of two partitions
+        merged = {}
+        for buckets in self._fan_out(lambda partition: partition.get_timeseries(start, end, bucket)):
+            for row in buckets:
+                self._add_totals(merged, row["bucketStart"], row)
+        return [merged[bucket_start] for bucket_start in sorted(merged)]
+
+    def get_block_stats(self, from_block: int, to_block: int, size: int) -> List[Dict[str, Any]]:
+        # Ranges of `size` blocks are aligned on multiples of `size` in every partition, so they can span several of them
+        partitions = [
+            (start, partition) for start, partition in self._open_partitions()
+            if start <= to_block and start + self.partition_size - 1 >= from_block
+        ]
+        merged = {}
+        for ranges in self._fan_out(lambda partition: partition.get_block_stats(from_block, to_block, size), partitions):
+            for row in ranges:
+                self._add_totals(merged, row["fromBlock"], row)
+        return [merged[block] for block in sorted(merged)]
+
+    @staticmethod
+    def _add_totals(merged: Dict[Any, Dict[str, Any]], key, row: Dict[str, Any]) -> None:
+        if key not in merged:
+            merged[key] = dict(row)
+            return
+        totals = merged[key]
+        for column in ("transactionCount", "gasUsed", "gasCostInDollars"):
+            totals[column] += row[column]
+
+    def get_address_stats(self, address: str) -> Optional[Dict[str, Any]]:
+        return self._merge_address_stats(
+            self._fan_out(lambda partition: partition.get_many_address_stats([address]))
+        ).get(address)
+
+    def get_top_addresses(self, by: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get the senders with the highest totals over every partition.
+
+        The top `depth` senders of each partition are read, starting at `limit`, and their totals summed over every partition.
+        A sender missing from all these lists has at most the sum of the last value of each list, so once the
+        `limit`-th total is above it the ranking is exact. Otherwise more senders are read. Few are needed when the
+        partitions have the same top senders, as with exchanges and bots; senders spread evenly over the partitions can
+        require reading all of them.
+
+        Returns:
+            List[Dict[str, Any]]: The addresses, highest first. Ties are ordered by address, highest first.
+        """
+        if by not in ADDRESS_RANKINGS:
+            raise ValueError(f"Unsupported ranking {by}. Expected one of {ADDRESS_RANKINGS}")
+        partitions = self._open_partitions()
+        if limit < 1 or not partitions:
+            return []
+
+        key = self.RANKING_KEYS[by]
+        depth = limit
+        # The totals of the senders read so far, which do not change from one depth to the next
+        totals = {}
+        while True:
+            tops = self._fan_out(lambda partition: partition.get_top_addresses(by, depth), partitions)
+            candidates = list({stats["address"] for top in tops for stats in top} - totals.keys())
+            totals.update(self._merge_address_stats(
+                self._fan_out(lambda partition: partition.get_many_address_stats(candidates), partitions)
+            ))
+            ranked = sorted(totals.values(), key=lambda stats: (stats[key], stats["address"]), reverse=True)[:limit]
+            bound = sum(top[-1][key] for top in tops if len(top) == depth)
+            if all(len(top) < depth for top in tops) or (len(ranked) == limit and ranked[-1][key] > bound):
+                return ranked
+            depth *= self.RANKING_DEPTH_GROWTH
+
+    @staticmethod
+    def _merge_address_stats(results: List[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+        merged = {}
+        for found in results:
+            for address, stats in found.items():
+                if address not in merged:
+                    merged[address] = dict(stats)
+                    continue
+                totals = merged[address]
+                for column in ("transactionsSent", "transactionsReceived", "gasUsed", "gasCostInDollars"):
+                    totals[column] += stats[column]
+        return merged
+
+    def archive(self, start: int, destination: str) -> str:
+        """
+        Move a partition out of the repository, e.g. to cheaper storage. Its transactions are no longer found,
+        listed or counted, and can be written again.
+
+        Args:
+            start (int): The first block number of the partition.
+            destination (str): The directory the partition file is moved to. Created if needed.
+
+        Returns:
+            str: The path of the moved file.
+        """
+        path = os.path.join(self.directory, partition_file(start))
+        if not os.path.exists(path):
+            raise ValueError(f"No partition starts at block {start}")
+        with self._lock:
+            self._close_partition(start)
+            os.makedirs(destination, exist_ok=True)
+            moved = shutil.move(path, os.path.join(destination, partition_file(start)))
+        with get_db_session(self._index_sessions) as session:
+            session.execute(delete(HashPartition).where(HashPartition.partitionStart == start))
+        print(f"[PartitionedRepository] Archived the partition of blocks {start} to "
+              f"{start + self.partition_size - 1} to {moved}")
+        return moved
+
+    def close(self) -> None:
+        """
+        Close the connections to every database, and stop the thread pool if it was created by the repository.
+        """
+        with self._lock:
+            for start in list(self._partitions_by_start):
+                self._close_partition(start)
+        for engine in self._index_engines:
+            engine.dispose()
+        if self._owns_executor:
+            self._executor.shutdown()
+
+    def _fan_out(self, read: Callable[[SqlRepository], Any],
+                 partitions: Optional[List[Tuple[int, SqlRepository]]] = None) -> List[Any]:
+        # Runs `read` on the partitions on the thread pool, and returns their results in block order
+        if partitions is None:
+            partitions = self._open_partitions()
+        return list(self._executor.map(read, [partition for _, partition in partitions]))
+
+    def _stored_starts(self) -> List[int]:
+        return sorted(
+            int(match.group(1)) for match in map(PARTITION_FILE.fullmatch, os.listdir(self.directory)) if match
+        )
+
+    def _open_partitions(self) -> List[Tuple[int, SqlRepository]]:
+        # Listed on every read, so the partitions created, archived or removed by other processes are seen
+        starts = self._stored_starts()
+        with self._lock:
+            for start in set(self._partitions_by_start) - set(starts):
+                self._close_partition(start)
+        partitions = [(start, self._partition(start)) for start in starts]
+        return [(start, partition) for start, partition in partitions if partition is not None]
+
+    def _partition(self, start: int, create: bool = False) -> Optional[SqlRepository]:
+        # The repository of a partition, or None if its file does not exist and `create` is False
+        with self._lock:
+            if start in self._partitions_by_start:
+                return self._partitions_by_start[start][0]
+            path = os.path.join(self.directory, partition_file(start))
+            if not os.path.exists(path):
+                # Connecting would create an empty file, without the tables
+                if not create:
+                    return None
+                self._create_partition(path)
+
+            url = f"sqlite:///{path}"
+            engines = [make_engine(url), make_engine(url, read_only=True, pool_size=READ_POOL_SIZE)]
+            repository = SqlRepository(batch_size=self.batch_size, session_factory=sessionmaker(bind=engines[0]),
+                                       read_session_factory=sessionmaker(bind=engines[1]))
+            self._partitions_by_start[start] = (repository, engines)
+            return repository
+
+    @staticmethod
+    def _create_partition(path: str) -> None:
+        building = f"{path}.new"
+        engine = make_engine(f"sqlite:///{building}", pool_size=1)
+        try:
+            Base.metadata.create_all(bind=engine, tables=PARTITION_TABLES)
+            # Empty aggregates, so the first reads do not build them
+            with get_db_session(sessionmaker(bind=engine)) as session:
+                rebuild_aggregates(session)
+        finally:
+            # The last connection checkpoints the write-ahead log into the file
+            engine.dispose()
+        os.replace(building, path)
+
+    def _close_partition(self, start: int) -> None:
+        _, engines = self._partitions_by_start.pop(start, (None, []))
+        for engine in engines:
+            engine.dispose()
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, String, Float, BigInteger, Integer
+
+from .database import Base
+
+class PricePoint(Base):
+    """
+    A SQLAlchemy model representing a USD price of a cryptocurrency, as returned by CoinGecko.
+
+    Timestamps are stored as unix milliseconds, the unit CoinGecko returns them in.
+    """
+
+    __tablename__ = "price_point"
+
+    crypto = Column(String, primary_key=True)
+    timestamp = Column(BigInteger, primary_key=True)
+    price = Column(Float)
+
+class PriceCoverage(Base):
+    """
+    A SQLAlchemy model representing a time range whose prices were already fetched (or imported).
+
+    Every price CoinGecko has for the range is stored as a PricePoint, so the range never needs to be fetched again,
+    even if it has no price points.
+    """
+
+    __tablename__ = "price_coverage"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    crypto = Column(String, index=True)
+    start = Column(BigInteger)
+    end = Column(BigInteger)
@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+from sqlalchemy import select
+
+from .database import get_db_session
+from .irepository import ON_CONFLICT_UPDATE
+from .price_point import PricePoint, PriceCoverage
+from .statements import insert_statement
+
+class SqlPriceStore:
+    """
+    Persistent store for the cryptocurrency prices fetched from CoinGecko.
+
+    Keeps both the price points and the time ranges already fetched, so a CoinGeckoClientWithCache
+    backed by it does not fetch them again after a restart.
+
+    Usage:
+        store = SqlPriceStore()
+        client = CoinGeckoClientWithCache(price_store=store)
+    """
+
+    def load(self, crypto: str) -> Tuple[Dict[datetime, float], List[Tuple[datetime, datetime]]]:
+        """
+        Load everything stored for a cryptocurrency.
+
+        Returns:
+            Tuple[Dict[datetime, float], List[Tuple[datetime, datetime]]]: The timestamp-price pairs
+            and the (start, end) ranges already fetched, with UTC timestamps.
+        """
+        with get_db_session() as session:
+            prices = {
+                _to_datetime(timestamp): price
+                for timestamp, price in session.execute(
+                    select(PricePoint.timestamp, PricePoint.price).where(PricePoint.crypto == crypto)
+                )
+            }
+            coverage = [
+                (_to_datetime(start), _to_datetime(end))
+                for start, end in session.execute(
+                    select(PriceCoverage.start, PriceCoverage.end).where(PriceCoverage.crypto == crypto)
+                )
+            ]
+        return prices, coverage
+
+    def save(self, crypto: str, prices: Dict[datetime, float], start: datetime, end: datetime) -> None:
+        """
+        Store the prices fetched for the range [start, end] in a single transaction.
+
+        Prices already stored for the same timestamps are overwritten.
+        """
+        self.save_many(crypto, prices, [(start, end)])
+
+    def save_many(self, crypto: str, prices: Dict[datetime, float], coverage: List[Tuple[datetime, datetime]]) -> None:
+        """
+        Store prices and the ranges they cover in a single transaction. Used to bulk import price dumps.
+        """
+        with get_db_session() as session:
+            if prices:
+                statement = insert_statement(PricePoint.__table__, session.get_bind().dialect.name,
+                                             ON_CONFLICT_UPDATE, index_elements=['crypto', 'timestamp'])
+                session.execute(statement, [
+                    {'crypto': crypto, 'timestamp': _to_milliseconds(timestamp), 'price': price}
+                    for timestamp, price in prices.items()
+                ])
+            if coverage:
+                session.execute(PriceCoverage.__table__.insert(), [
+                    {'crypto': crypto, 'start': _to_milliseconds(start), 'end': _to_milliseconds(end)}
+                    for start, end in coverage
+                ])
+
+def _to_milliseconds(timestamp: datetime) -> int:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return round(timestamp.timestamp() * 1000)
+
+def _to_datetime(milliseconds: int) -> datetime:
+    # Same conversion as the one applied to the CoinGecko responses, so the cache keys match
+    return datetime.utcfromtimestamp(milliseconds / 1000).replace(tzinfo=timezone.utc)
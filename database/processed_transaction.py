@@ -1,19 +1,37 @@
-from sqlalchemy import Column, String, Float, Integer, DateTime
+from sqlalchemy import Column, Float, Integer, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 from .database import Base
+from .hex_codec import HASH_BYTES, ADDRESS_BYTES
+from .hex_string import HexString
 
 class ProcessedTransaction(Base):
     """
     A SQLAlchemy model representing a processed transaction.
+
+    Listings are ordered by (blockNumber, hash) and paginated on it, so every listing filter has a composite
+    index ending with those columns: a page is a range scan starting at the cursor, however deep it is.
+    The address indexes also serve the lookups by address alone.
+
+    Hashes and addresses are hex strings, stored as raw bytes in the compact schema, see HexString.
     """
 
     __tablename__ = "processed_transaction"
 
-    hash = Column(String, primary_key=True, unique=True, index=True)
-    fromAddress = Column(String)
-    toAddress = Column(String)
+    hash = Column(HexString(HASH_BYTES), primary_key=True, unique=True, index=True)
+    fromAddress = Column(HexString(ADDRESS_BYTES))
+    toAddress = Column(HexString(ADDRESS_BYTES))
     blockNumber = Column(Integer)
     executedAt = Column(DateTime)
     gasUsed = Column(Integer)
     gasCostInDollars = Column(Float)
+
+    __table_args__ = (
+        Index("ix_processed_transaction_block_hash", "blockNumber", "hash"),
+        Index("ix_processed_transaction_from_block_hash", "fromAddress", "blockNumber", "hash"),
+        Index("ix_processed_transaction_to_block_hash", "toAddress", "blockNumber", "hash"),
+    )
+
+    def to_dict(self) -> dict:
+        # Plain column -> value mapping, used for Core bulk inserts
+        return {column.key: getattr(self, column.key) for column in self.__table__.columns}
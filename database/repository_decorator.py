@@ -0,0 +1,60 @@
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterator, List, Set
+
+from .irepository import IRepository, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, TransactionFilter, Cursor
+from .processed_transaction import ProcessedTransaction
+
+class RepositoryDecorator(IRepository):
+    """
+    A repository that passes every call through to another repository.
+
+    Base class of the repositories that add behaviour (caching, filtering...) in front of another one:
+    they override the methods they change and inherit the rest.
+
+    Args:
+        repository (IRepository): The wrapped repository.
+    """
+
+    def __init__(self, repository: IRepository):
+        self.repository = repository
+
+    def create(self, transaction: ProcessedTransaction) -> None:
+        self.repository.create(transaction)
+
+    def create_many(self, transactions: List[ProcessedTransaction], on_conflict: Optional[str] = None) -> None:
+        self.repository.create_many(transactions, on_conflict)
+
+    def get_by_hash(self, hash: str) -> Optional[ProcessedTransaction]:
+        return self.repository.get_by_hash(hash)
+
+    def get_many_by_hash(self, hashes: List[str]) -> Dict[str, Any]:
+        return self.repository.get_many_by_hash(hashes)
+
+    def get_all_hashes(self) -> Set[str]:
+        return self.repository.get_all_hashes()
+
+    def stream_hashes(self, chunk_size: int = MAX_PAGE_SIZE) -> Iterator[str]:
+        return self.repository.stream_hashes(chunk_size)
+
+    def get_transactions(self, filters: TransactionFilter, after: Optional[Cursor] = None,
+                         limit: int = DEFAULT_PAGE_SIZE) -> List[Any]:
+        return self.repository.get_transactions(filters, after, limit)
+
+    def stream_transactions(self, filters: TransactionFilter, after: Optional[Cursor] = None,
+                            chunk_size: int = MAX_PAGE_SIZE) -> Iterator[Any]:
+        return self.repository.stream_transactions(filters, after, chunk_size)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self.repository.get_stats()
+
+    def get_timeseries(self, start: datetime, end: datetime, bucket: str) -> List[Dict[str, Any]]:
+        return self.repository.get_timeseries(start, end, bucket)
+
+    def get_block_stats(self, from_block: int, to_block: int, size: int) -> List[Dict[str, Any]]:
+        return self.repository.get_block_stats(from_block, to_block, size)
+
+    def get_address_stats(self, address: str) -> Optional[Dict[str, Any]]:
+        return self.repository.get_address_stats(address)
+
+    def get_top_addresses(self, by: str, limit: int) -> List[Dict[str, Any]]:
+        return self.repository.get_top_addresses(by, limit)
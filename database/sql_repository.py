@@ -1,54 +1,412 @@
-from typing import Optional, Dict, Any
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterator, List, Set
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import text
+from sqlalchemy import select, delete, func, tuple_
+from sqlalchemy.orm import sessionmaker
 
-from .irepository import IRepository
-from .database import get_db_session
+from .irepository import (
+    IRepository, ON_CONFLICT_MODES, ON_CONFLICT_UPDATE, ADDRESS_RANKINGS, RANK_BY_GAS_COST, RANK_BY_GAS_USED,
+    RANK_BY_TRANSACTIONS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, TransactionFilter, Cursor
+)
+from .database import get_db_session, get_read_session
+from .instrumented_repository import DUPLICATE_TRANSACTIONS
+from .statements import insert_statement
 from .processed_transaction import ProcessedTransaction
+from .gas_rollup import TimeBucketRollup, BlockRollup
+from .address_stats import AddressStats
+from .aggregates import (
+    aggregated_columns, apply_changes, inserted_changes, upserted_changes, bucket_start, read_stats, rebuild_aggregates
+)
 
 class SqlRepository(IRepository):
     """
     A repository class for handling database operations related to ProcessedTransaction objects.
 
     This class provides methods for creating and retrieving ProcessedTransaction objects in a SQL database.
+    Every write also updates the aggregates (transaction_stats totals, hourly / daily / block gas rollups,
+    per-address totals) in the same database transaction, so the stats reads never scan processed_transaction.
+    Reads go through the read only connections of `get_read_session`, writes through `get_db_session`.
+
+    Args:
+        batch_size (int): Maximum number of rows written per transaction by create_many.
+        session_factory (sessionmaker, optional): Sessions of the writes, SessionLocal by default.
+        read_session_factory (sessionmaker, optional): Sessions of the reads, ReadSessionLocal by default.
     """
 
+    DEFAULT_BATCH_SIZE = 1000
+    # Keep IN (...) lists below SQLite's default limit of bound parameters per statement
+    IN_CLAUSE_SIZE = 500
+    # The address_stats column each ranking orders by. Each one is indexed with the address, see AddressStats
+    RANKING_COLUMNS = {
+        RANK_BY_GAS_COST: AddressStats.gasCostInDollars,
+        RANK_BY_GAS_USED: AddressStats.gasUsed,
+        RANK_BY_TRANSACTIONS: AddressStats.transactionsSent,
+    }
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, session_factory: Optional[sessionmaker] = None,
+                 read_session_factory: Optional[sessionmaker] = None):
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+
+    @property
+    def batch_size(self) -> int:
+        return self._batch_size
+
+    @batch_size.setter
+    def batch_size(self, batch_size: int) -> None:
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer")
+        self._batch_size = batch_size
+
     def create(self, transaction: ProcessedTransaction) -> None:
-        with get_db_session() as session:
+        with get_db_session(self.session_factory) as session:
             try:
                 session.add(transaction)
+                apply_changes(session, inserted_changes([transaction.to_dict()]))
                 session.commit()
             except IntegrityError:
                 # Handle the error (e.g., log it, update the record, etc.)
                 print(f"[SqlRepository] Duplicate transaction detected with hash {transaction.hash}")
+                DUPLICATE_TRANSACTIONS.inc()
                 session.rollback()
 
+    def create_many(self, transactions: List[ProcessedTransaction], on_conflict: Optional[str] = None) -> None:
+        """
+        Bulk insert transactions, committing once per batch of at most `batch_size` rows.
+
+        Rows are written with a single Core executemany per batch instead of one ORM session per row.
+
+        Without `on_conflict`, a batch containing a duplicate hash is rolled back and retried without the duplicates,
+        so the valid rows are still stored and the duplicates are reported as in `create`.
+        With `on_conflict` set to 'ignore' or 'update', duplicates are resolved by the database in the same
+        statement (INSERT ... ON CONFLICT DO NOTHING / DO UPDATE), which makes re-ingesting a file idempotent.
+        """
+        if on_conflict is not None and on_conflict not in ON_CONFLICT_MODES:
+            raise ValueError(f"Unsupported on_conflict mode {on_conflict}. Expected one of {ON_CONFLICT_MODES}")
+
+        for start in range(0, len(transactions), self.batch_size):
+            batch = transactions[start:start + self.batch_size]
+            try:
+                with get_db_session(self.session_factory) as session:
+                    rows = [transaction.to_dict() for transaction in batch]
+                    if on_conflict is None:
+                        changes = inserted_changes(rows)
+                    else:
+                        # Only the rows the statement actually inserts or overwrites change the aggregates
+                        stored = self._get_stored(session, [row['hash'] for row in rows])
+                        changes = upserted_changes(rows, stored, overwrite=on_conflict == ON_CONFLICT_UPDATE)
+
+                    statement = insert_statement(ProcessedTransaction.__table__, session.get_bind().dialect.name,
+                                                 on_conflict, index_elements=['hash'])
+                    session.execute(statement, rows)
+                    apply_changes(session, changes)
+            except IntegrityError:
+                self._create_new(batch)
+
+    def _create_new(self, batch: List[ProcessedTransaction]) -> None:
+        # Look up which hashes of the batch are already stored in one query, instead of retrying row by row
+        hashes = [transaction.hash for transaction in batch]
+        new_transactions = []
+        try:
+            with get_db_session(self.session_factory) as session:
+                stored = set(self._get_stored(session, hashes))
+                for transaction in batch:
+                    if transaction.hash in stored:
+                        print(f"[SqlRepository] Duplicate transaction detected with hash {transaction.hash}")
+                        DUPLICATE_TRANSACTIONS.inc()
+                        continue
+                    stored.add(transaction.hash)
+                    new_transactions.append(transaction)
+
+                if new_transactions:
+                    rows = [transaction.to_dict() for transaction in new_transactions]
+                    session.execute(ProcessedTransaction.__table__.insert(), rows)
+                    apply_changes(session, inserted_changes(rows))
+        except IntegrityError:
+            # Another writer stored some of the rows between the lookup and the insert
+            for transaction in new_transactions:
+                self.create(transaction)
+
+    def delete_many(self, hashes: List[str]) -> int:
+        """
+        Delete the transactions with the given hashes, and remove them from the aggregates in the same transaction.
+
+        Returns:
+            int: Number of transactions deleted. Hashes that are not stored are ignored.
+        """
+        unique_hashes = list(dict.fromkeys(hashes))
+        with get_db_session(self.session_factory) as session:
+            stored = self._get_stored(session, unique_hashes)
+            for start in range(0, len(unique_hashes), self.IN_CLAUSE_SIZE):
+                chunk = unique_hashes[start:start + self.IN_CLAUSE_SIZE]
+                session.execute(delete(ProcessedTransaction).where(ProcessedTransaction.hash.in_(chunk)))
+            apply_changes(session, [(-1, row) for row in stored.values()])
+        return len(stored)
+
+    def _get_stored(self, session, hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        # The aggregated columns stored for the given hashes, in chunked IN queries
+        stored = {}
+        for start in range(0, len(hashes), self.IN_CLAUSE_SIZE):
+            chunk = hashes[start:start + self.IN_CLAUSE_SIZE]
+            rows = session.execute(
+                select(ProcessedTransaction.hash, *aggregated_columns()).where(ProcessedTransaction.hash.in_(chunk))
+            )
+            stored.update((row.hash, row._mapping) for row in rows)
+        return stored
+
     def get_by_hash(self, hash: str) -> Optional[ProcessedTransaction]:
-        with get_db_session() as session:
+        with get_read_session(self.read_session_factory) as session:
             transaction = session.query(ProcessedTransaction).filter_by(hash=hash).first()
             if transaction:
                 # detach the object from the session
                 session.expunge(transaction)
             return transaction
 
+    def get_many_by_hash(self, hashes: List[str]) -> Dict[str, Any]:
+        """
+        Get the stored transactions among `hashes`, in a single session with chunked IN (...) queries.
+
+        Returns:
+            Dict[str, Any]: Rows with the ProcessedTransaction columns as attributes, by hash. Hashes that are
+            not stored are left out.
+        """
+        unique_hashes = list(dict.fromkeys(hashes))
+        found = {}
+        with get_read_session(self.read_session_factory) as session:
+            for start in range(0, len(unique_hashes), self.IN_CLAUSE_SIZE):
+                chunk = unique_hashes[start:start + self.IN_CLAUSE_SIZE]
+                rows = session.execute(
+                    select(*ProcessedTransaction.__table__.columns).where(ProcessedTransaction.hash.in_(chunk))
+                )
+                found.update((row.hash, row) for row in rows)
+        return found
+
+    def get_all_hashes(self) -> Set[str]:
+        with get_read_session(self.read_session_factory) as session:
+            return set(session.scalars(select(ProcessedTransaction.hash)))
+
+    def stream_hashes(self, chunk_size: int = MAX_PAGE_SIZE) -> Iterator[str]:
+        """
+        Iterate over the stored hashes, fetched `chunk_size` at a time, without holding them all in memory.
+        """
+        with get_read_session(self.read_session_factory) as session:
+            yield from session.scalars(select(ProcessedTransaction.hash).execution_options(yield_per=chunk_size))
+
+    def get_transactions(self, filters: TransactionFilter, after: Optional[Cursor] = None,
+                         limit: int = DEFAULT_PAGE_SIZE) -> List[Any]:
+        """
+        Get a page of the transactions matching `filters`, ordered by (blockNumber, hash).
+
+        Pages are read with keyset pagination: the query seeks past the `after` cursor in the composite
+        index of the filter instead of skipping rows with an OFFSET, so every page costs the same.
+
+        Args:
+            filters (TransactionFilter): The listing criteria.
+            after (Cursor, optional): The (blockNumber, hash) of the last transaction of the previous page.
+            limit (int): Maximum number of transactions returned.
+
+        Returns:
+            List[Any]: Rows with the ProcessedTransaction columns as attributes.
+        """
+        with get_read_session(self.read_session_factory) as session:
+            return session.execute(self._transactions_query(filters, after).limit(limit)).all()
+
+    def stream_transactions(self, filters: TransactionFilter, after: Optional[Cursor] = None,
+                            chunk_size: int = MAX_PAGE_SIZE) -> Iterator[Any]:
+        """
+        Iterate over every transaction matching `filters` after the cursor, ordered by (blockNumber, hash).
+
+        Rows are fetched `chunk_size` at a time from a single query (a server-side cursor where the driver supports one),
+        so memory does not grow with the size of the listing. The session stays open until the iteration ends
+        or the generator is closed.
+
+        Returns:
+            Iterator[Any]: Rows with the ProcessedTransaction columns as attributes.
+        """
+        with get_read_session(self.read_session_factory) as session:
+            query = self._transactions_query(filters, after).execution_options(yield_per=chunk_size)
+            yield from session.execute(query)
+
+    @staticmethod
+    def _transactions_query(filters: TransactionFilter, after: Optional[Cursor]):
+        # Every combination of criteria is served by a range scan of one of the ProcessedTransaction indexes
+        query = select(*ProcessedTransaction.__table__.columns)
+        if filters.from_address is not None:
+            query = query.where(ProcessedTransaction.fromAddress == filters.from_address)
+        if filters.to_address is not None:
+            query = query.where(ProcessedTransaction.toAddress == filters.to_address)
+        if filters.from_block is not None:
+            query = query.where(ProcessedTransaction.blockNumber >= filters.from_block)
+        if filters.to_block is not None:
+            query = query.where(ProcessedTransaction.blockNumber <= filters.to_block)
+        if after is not None:
+            # A plain tuple, so the hash is bound as a hash column value
+            query = query.where(tuple_(ProcessedTransaction.blockNumber, ProcessedTransaction.hash) > tuple(after))
+        return query.order_by(ProcessedTransaction.blockNumber, ProcessedTransaction.hash)
+
     def get_stats(self) -> Dict[str, Any]:
-        with get_db_session() as session:
-            sql = text("""
-            SELECT
-                COUNT(*) as totalTransactionsInDB,
-                SUM(gasUsed) as totalGasUsed,
-                SUM(gasCostInDollars) as totalGasCostInDollars
-            FROM
-                processed_transaction
-            """)
-            result = session.execute(sql).fetchone()
-
-            total_transactions_in_db = result[0] if result and result[0] is not None else 0
-            total_gas_used = result[1] if result and result[1] is not None else 0
-            total_gas_cost_in_dollars = result[2] if result and result[2] is not None else 0.
-
-            return {
-                "totalTransactionsInDB": total_transactions_in_db,
-                "totalGasUsed": total_gas_used,
-                "totalGasCostInDollars": total_gas_cost_in_dollars
-            }
+        with get_read_session(self.read_session_factory) as session:
+            return self._read_stats(session)
+
+    def get_timeseries(self, start: datetime, end: datetime, bucket: str) -> List[Dict[str, Any]]:
+        """
+        Get the gas totals per time bucket between two timestamps, from the rollups.
+
+        Args:
+            start (datetime): Start of the range. The bucket it falls in is included.
+            end (datetime): End of the range, included.
+            bucket (str): 'hour' or 'day'.
+
+        Returns:
+            List[Dict[str, Any]]: The buckets that have transactions, oldest first.
+        """
+        with get_read_session(self.read_session_factory) as session:
+            self._read_stats(session)
+            rows = session.execute(
+                select(TimeBucketRollup)
+                .where(TimeBucketRollup.bucket == bucket)
+                .where(TimeBucketRollup.bucketStart >= bucket_start(start, bucket))
+                .where(TimeBucketRollup.bucketStart <= bucket_start(end, bucket))
+                .where(TimeBucketRollup.transactionCount > 0)
+                .order_by(TimeBucketRollup.bucketStart)
+            ).scalars()
+            return [
+                {
+                    "bucketStart": row.bucketStart,
+                    "transactionCount": row.transactionCount,
+                    "gasUsed": row.gasUsed,
+                    "gasCostInDollars": row.gasCostInDollars
+                }
+                for row in rows
+            ]
+
+    def get_block_stats(self, from_block: int, to_block: int, size: int) -> List[Dict[str, Any]]:
+        """
+        Get the gas totals per range of `size` blocks between two block numbers, from the rollups.
+
+        Ranges are aligned on multiples of `size`, and only the blocks between from_block and to_block are counted.
+
+        Returns:
+            List[Dict[str, Any]]: The ranges that have transactions, lowest blocks first.
+        """
+        with get_read_session(self.read_session_factory) as session:
+            self._read_stats(session)
+            range_start = (BlockRollup.blockNumber // size) * size
+            rows = session.execute(
+                select(
+                    range_start,
+                    func.sum(BlockRollup.transactionCount),
+                    func.sum(BlockRollup.gasUsed),
+                    func.sum(BlockRollup.gasCostInDollars),
+                )
+                .where(BlockRollup.blockNumber >= from_block)
+                .where(BlockRollup.blockNumber <= to_block)
+                .where(BlockRollup.transactionCount > 0)
+                .group_by(range_start)
+                .order_by(range_start)
+            )
+            return [
+                {
+                    "fromBlock": max(block, from_block),
+                    "toBlock": min(block + size - 1, to_block),
+                    "transactionCount": count,
+                    "gasUsed": gas_used,
+                    "gasCostInDollars": gas_cost
+                }
+                for block, count, gas_used, gas_cost in rows
+            ]
+
+    def get_address_stats(self, address: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the totals of an address, as sender and receiver, from the address_stats aggregates.
+
+        Returns:
+            Optional[Dict[str, Any]]: The totals, or None if the address has no stored transaction.
+        """
+        with get_read_session(self.read_session_factory) as session:
+            self._read_stats(session)
+            # Compared rather than looked up by primary key, so a malformed address is not found in the compact schema
+            stats = session.execute(select(AddressStats).where(AddressStats.address == address)).scalar()
+            if stats is None or (stats.transactionsSent == 0 and stats.transactionsReceived == 0):
+                # Rows emptied by overwrites are kept with zero totals
+                return None
+            return self._address_stats(stats)
+
+    def get_many_address_stats(self, addresses: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the totals of several addresses in a single session, with chunked IN (...) queries.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: The totals by address, as returned by get_address_stats. Addresses without
+            stored transactions are left out.
+        """
+        unique_addresses = list(dict.fromkeys(addresses))
+        found = {}
+        with get_read_session(self.read_session_factory) as session:
+            self._read_stats(session)
+            for start in range(0, len(unique_addresses), self.IN_CLAUSE_SIZE):
+                chunk = unique_addresses[start:start + self.IN_CLAUSE_SIZE]
+                rows = session.execute(
+                    select(*AddressStats.__table__.columns)
+                    .where(AddressStats.address.in_(chunk))
+                    .where((AddressStats.transactionsSent > 0) | (AddressStats.transactionsReceived > 0))
+                )
+                found.update((stats.address, self._address_stats(stats)) for stats in rows)
+        return found
+
+    def get_top_addresses(self, by: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get the senders with the highest totals, from the address_stats aggregates.
+
+        The ranking column is indexed together with the address, so this reads `limit` index entries
+        from the end of the index instead of sorting every address.
+
+        Args:
+            by (str): 'gasCost', 'gasUsed' or 'transactions' (sent).
+            limit (int): Maximum number of addresses returned.
+
+        Returns:
+            List[Dict[str, Any]]: The addresses, highest first. Ties are ordered by address, highest first.
+        """
+        if by not in ADDRESS_RANKINGS:
+            raise ValueError(f"Unsupported ranking {by}. Expected one of {ADDRESS_RANKINGS}")
+
+        with get_read_session(self.read_session_factory) as session:
+            self._read_stats(session)
+            # Rows of the columns rather than AddressStats objects, which cost more to build than the query
+            rows = session.execute(
+                select(*AddressStats.__table__.columns)
+                .where(AddressStats.transactionsSent > 0)
+                .order_by(self.RANKING_COLUMNS[by].desc(), AddressStats.address.desc())
+                .limit(limit)
+            )
+            return [self._address_stats(stats) for stats in rows]
+
+    @staticmethod
+    def _address_stats(stats: Any) -> Dict[str, Any]:
+        # An AddressStats, or a row of its columns
+        return {
+            "address": stats.address,
+            "transactionsSent": stats.transactionsSent,
+            "transactionsReceived": stats.transactionsReceived,
+            "gasUsed": stats.gasUsed,
+            "gasCostInDollars": stats.gasCostInDollars
+        }
+
+    def _read_stats(self, session) -> Dict[str, Any]:
+        stats = read_stats(session)
+        if stats is None:
+            # First read on a database written before the aggregates existed. Read sessions cannot write
+            print("[SqlRepository] No aggregates found. Building them from the stored transactions")
+            try:
+                with get_db_session(self.session_factory) as write_session:
+                    stats = rebuild_aggregates(write_session)
+            except IntegrityError:
+                # Another process built them first
+                stats = None
+            # End the read transaction, so the next reads see the rebuilt aggregates
+            session.rollback()
+            if stats is None:
+                stats = read_stats(session)
+        return stats
@@ -0,0 +1,61 @@
+from typing import List, Optional
+from sqlalchemy import Table
+from sqlalchemy.dialects import sqlite, postgresql
+
+from .irepository import ON_CONFLICT_IGNORE
+
+"""
+Dialect specific statements shared by the SQL stores.
+"""
+
+# ON CONFLICT is dialect specific. Both SQLite and PostgreSQL support the same syntax
+_ON_CONFLICT_DIALECTS = {'sqlite': sqlite, 'postgresql': postgresql}
+
+
+def insert_statement(table: Table, dialect_name: str, on_conflict: Optional[str], index_elements: List[str]):
+    """
+    Build an INSERT for `table`, resolving conflicts on `index_elements` as requested by `on_conflict`.
+
+    Args:
+        table (Table): The table to insert into.
+        dialect_name (str): The name of the dialect of the database the statement runs on.
+        on_conflict (str, optional): None for a plain INSERT, 'ignore' for ON CONFLICT DO NOTHING
+            or 'update' for ON CONFLICT DO UPDATE of all the non key columns.
+        index_elements (List[str]): The columns of the unique constraint the conflicts are resolved on.
+    """
+    if on_conflict is None:
+        return table.insert()
+
+    if dialect_name not in _ON_CONFLICT_DIALECTS:
+        raise NotImplementedError(f"on_conflict is not supported for the {dialect_name} dialect")
+
+    statement = _ON_CONFLICT_DIALECTS[dialect_name].insert(table)
+    if on_conflict == ON_CONFLICT_IGNORE:
+        return statement.on_conflict_do_nothing(index_elements=index_elements)
+
+    return statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column.key: statement.excluded[column.key] for column in table.columns if column.key not in index_elements}
+    )
+
+
+def accumulate_statement(table: Table, dialect_name: str, index_elements: List[str]):
+    """
+    Build an INSERT for `table` that adds the inserted values to the stored ones on conflict, for rollup tables.
+
+    Args:
+        table (Table): The table to insert into.
+        dialect_name (str): The name of the dialect of the database the statement runs on.
+        index_elements (List[str]): The key columns. Every other column is summed.
+    """
+    if dialect_name not in _ON_CONFLICT_DIALECTS:
+        raise NotImplementedError(f"Accumulating inserts are not supported for the {dialect_name} dialect")
+
+    statement = _ON_CONFLICT_DIALECTS[dialect_name].insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={
+            column.key: column + statement.excluded[column.key]
+            for column in table.columns if column.key not in index_elements
+        }
+    )
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, BigInteger, Float
+
+from .database import Base
+
+class TransactionStats(Base):
+    """
+    A SQLAlchemy model holding the aggregates served by /stats, in a single row.
+
+    The row is updated in the same database transaction as every write to processed_transaction,
+    so reading the stats does not scan the transactions. See database/aggregates.py.
+    """
+
+    __tablename__ = "transaction_stats"
+
+    id = Column(Integer, primary_key=True)
+    totalTransactionsInDB = Column(BigInteger, nullable=False, default=0)
+    totalGasUsed = Column(BigInteger, nullable=False, default=0)
+    totalGasCostInDollars = Column(Float, nullable=False, default=0.)
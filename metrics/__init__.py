@@ -0,0 +1,21 @@
+# metrics/__init__.py
+
+from .registry import (
+    Counter, Histogram, CallbackMetric, Registry, REGISTRY, CONTENT_TYPE, DEFAULT_BUCKETS, DIRECTORY_ENV, COUNTER, GAUGE,
+    HISTOGRAM, shared_directory
+)
+
+__all__ = [
+    'Counter',
+    'Histogram',
+    'CallbackMetric',
+    'Registry',
+    'REGISTRY',
+    'CONTENT_TYPE',
+    'DEFAULT_BUCKETS',
+    'DIRECTORY_ENV',
+    'COUNTER',
+    'GAUGE',
+    'HISTOGRAM',
+    'shared_directory',
+]
@@ -0,0 +1,347 @@
+import atexit
+import bisect
+import json
+import math
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+"""
+Counters and histograms exposed in the Prometheus text exposition format, without a client library.
+
+Updating a metric takes a lock and a few additions, so the hot paths can stay instrumented in production: bind the
+labels once (`metric.labels(...)` returns the same child every time) and update the child on every call.
+
+Every process has its own registry. A process shares it with the others by writing snapshots of it to a common
+directory (see `Registry.share`), and the process serving /metrics adds up its own metrics and the snapshots of the
+others, so the ingest process and every API process are counted whichever process answers the scrape.
+"""
+
+# Upper bounds, in seconds, of the latency histogram buckets: from a cached lookup to a slow aggregate
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds between two snapshots written by a shared registry
+SHARE_INTERVAL = 1.0
+# The directory the processes of a server share their metrics in. server.main sets it for the processes it starts
+DIRECTORY_ENV = "RATEDAPI_METRICS_DIRECTORY"
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.
+
+    def inc(self, amount: float = 1.) -> None:
+        with self._lock:
+            self.value += amount
+
+    def sample(self) -> float:
+        return self.value
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self._upper_bounds = upper_bounds
+        # One count per bucket, not cumulative, and a last one for the values above every bound
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def sample(self) -> List[float]:
+        with self._lock:
+            return self.counts + [self.sum]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional['Registry'] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values: Any):
+        """
+        The child of the metric with these label values, in the order of `labelnames`. Children are created on
+        first use and never removed, so keep the label values to a small set.
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "help": self.documentation,
+            "labels": list(self.labelnames),
+            "samples": [[list(key), child.sample()] for key, child in list(self._children.items())],
+        }
+
+
+class Counter(_Metric):
+    """
+    A count that only goes up, e.g. of requests or of seconds spent waiting. Name it with a `_total` suffix.
+
+    Usage:
+        REQUESTS = Counter("ratedapi_coingecko_requests_total", "Calls to CoinGecko by status", ["status"])
+        REQUESTS.labels(200).inc()
+    """
+    kind = COUNTER
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.) -> None:
+        # For the counters without labels
+        self.labels().inc(amount)
+
+
+class Histogram(_Metric):
+    """
+    The distribution of observed values, e.g. latencies in seconds, over fixed buckets.
+
+    Args:
+        buckets (Sequence[float]): The upper bounds of the buckets, in increasing order. Values above the last one
+            are only counted in the +Inf bucket.
+
+    Usage:
+        LATENCY = Histogram("ratedapi_repository_call_duration_seconds", "Repository calls", ["method"])
+        LATENCY.labels("get_by_hash").observe(seconds)
+    """
+    kind = HISTOGRAM
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional['Registry'] = None):
+        if list(buckets) != sorted(buckets) or not buckets:
+            raise ValueError("buckets must be a non-empty increasing sequence")
+        self.buckets = tuple(float(bound) for bound in buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        # For the histograms without labels
+        self.labels().observe(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(super().snapshot(), buckets=list(self.buckets))
+
+
+class CallbackMetric(_Metric):
+    """
+    A metric read from another object when the metrics are collected, e.g. the statistics an LruCache keeps anyway,
+    so it costs nothing between two scrapes.
+
+    Args:
+        callback (Callable[[], Dict[Tuple, float]]): Returns the value of every combination of label values.
+        kind (str): COUNTER for values that only go up, GAUGE otherwise.
+    """
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Dict[Tuple, float]],
+                 labelnames: Sequence[str] = (), kind: str = GAUGE, registry: Optional['Registry'] = None):
+        self.kind = kind
+        self.callback = callback
+        super().__init__(name, documentation, labelnames, registry)
+
+    def labels(self, *values: Any):
+        raise TypeError(f"{self.name} is read from its callback")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(super().snapshot(), samples=[
+            [[str(value) for value in key], float(value)] for key, value in self.callback().items()
+        ])
+
+
+class Registry:
+    """
+    The metrics of a process, by name.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._directory = None
+        self._stopped = threading.Event()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"A metric named {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        The current value of every metric, as JSON-serializable data.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def collect(self, directory: Optional[str] = None) -> str:
+        """
+        The metrics of this process, added to the last snapshots shared in `directory` by the other processes,
+        in the text exposition format.
+        """
+        snapshots = [self.snapshot()]
+        if directory is not None:
+            snapshots += read_snapshots(directory, exclude=os.getpid())
+        return render(merge(snapshots))
+
+    def share(self, directory: str, interval: float = SHARE_INTERVAL) -> None:
+        """
+        Write a snapshot of this registry to `directory` every `interval` seconds, in a background thread,
+        and once more when the process exits. Does nothing if this registry is already shared.
+        """
+        if self._directory is not None:
+            return
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        def write_snapshots():
+            while not self._stopped.wait(interval):
+                self.write_snapshot()
+
+        threading.Thread(target=write_snapshots, name="metrics", daemon=True).start()
+        atexit.register(self.write_snapshot)
+
+    def write_snapshot(self) -> None:
+        if self._directory is None:
+            return
+        path = os.path.join(self._directory, f"{os.getpid()}.json")
+        try:
+            # Written aside and renamed, so the readers never see a partial snapshot
+            with open(path + ".tmp", "w") as file:
+                json.dump(self.snapshot(), file)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            # The directory is removed when the server stops, possibly before its processes exit
+            pass
+
+
+def shared_directory() -> Optional[str]:
+    """
+    The directory of DIRECTORY_ENV, or None when the process does not share its metrics.
+    """
+    return os.environ.get(DIRECTORY_ENV) or None
+
+
+def read_snapshots(directory: str, exclude: Optional[int] = None) -> List[Dict[str, Dict[str, Any]]]:
+    """
+    The snapshots written to `directory` by the shared registries, except the one of the process `exclude`.
+    """
+    snapshots = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return snapshots
+    for name in names:
+        if not name.endswith(".json") or name == f"{exclude}.json":
+            continue
+        try:
+            with open(os.path.join(directory, name)) as file:
+                snapshots.append(json.load(file))
+        except (OSError, ValueError):
+            # Removed since it was listed
+            continue
+    return snapshots
+
+
+def merge(snapshots: Iterable[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Add up the samples of the metrics of several snapshots: counters, histogram buckets and gauges alike.
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for key, value in metric["samples"]:
+                key = tuple(key)
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    target["samples"][key] = [total + added for total, added in zip(current, value)]
+                else:
+                    target["samples"][key] = current + value
+    return merged
+
+
+def render(metrics: Dict[str, Dict[str, Any]]) -> str:
+    """
+    The text exposition format of merged snapshots.
+    """
+    lines = []
+    for name, metric in sorted(metrics.items()):
+        lines.append(f"# HELP {name} {_escape_help(metric['help'])}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        samples = metric["samples"]
+        items = samples.items() if isinstance(samples, dict) else ((tuple(key), value) for key, value in samples)
+        for key, value in sorted(items):
+            labels = list(zip(metric["labels"], key))
+            if metric["kind"] != HISTOGRAM:
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + [math.inf], value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(value[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labels: List[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels) + "}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# The registry of the process, used by the metrics created without one
+REGISTRY = Registry()
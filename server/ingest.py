@@ -0,0 +1,218 @@
+import multiprocessing
+import threading
+import time
+from contextlib import nullcontext
+from time import monotonic
+from typing import Optional
+
+from crypto_data import CoinGeckoClientWithCache, CryptoToUsd
+from data_processor import CsvProcessor, ParallelCsvProcessor
+from database import (
+    IRepository, SqlRepository, PartitionedRepository, SqlPriceStore, SqlIngestStore, CachingRepository,
+    InstrumentedRepository, NegativeLookupRepository, INGEST_RUNNING
+)
+from metrics import REGISTRY, shared_directory
+from server.profiling import DEFAULT_SAMPLE_INTERVAL, SamplingProfiler
+
+"""
+CSV ingest running in its own process, next to the API processes.
+
+The ingest records its progress in the ingest_run table. The API processes serve it on /ingest/status, and watch it
+to keep their in-memory lookup structures consistent with the rows the ingest writes.
+"""
+
+# Minimum seconds between two progress updates written by the ingest
+PROGRESS_INTERVAL = 1.0
+
+def transaction_repository(batch_size: int = SqlRepository.DEFAULT_BATCH_SIZE, partition_directory: Optional[str] = None,
+                           partition_size: int = PartitionedRepository.DEFAULT_PARTITION_SIZE) -> IRepository:
+    """
+    The repository of the transactions: ratedapi.db, or the partitions in `partition_directory` when it is set.
+    """
+    if partition_directory is None:
+        return SqlRepository(batch_size=batch_size)
+    return PartitionedRepository(partition_directory, partition_size=partition_size, batch_size=batch_size)
+
+def start_ingest(file_path: str, batch_size: int = CsvProcessor.DEFAULT_BATCH_SIZE, on_conflict: Optional[str] = None,
+                 skip_known: bool = False, workers: int = 1, partition_directory: Optional[str] = None,
+                 partition_size: int = PartitionedRepository.DEFAULT_PARTITION_SIZE,
+                 coingecko_url: str = CoinGeckoClientWithCache.BASE_URL, profile_directory: Optional[str] = None,
+                 profile_interval: float = DEFAULT_SAMPLE_INTERVAL, fast_decode: bool = False) -> multiprocessing.Process:
+    """
+    Start processing a CSV file into the database in a new process. See `run_ingest`.
+
+    The run is recorded before the process starts, so the API processes started after this call
+    never use a lookup filter that misses its rows.
+
+    Returns:
+        multiprocessing.Process: The ingest process. It is not a daemon, since the parallel processor starts
+        worker processes of its own.
+    """
+    run_id = SqlIngestStore().start(file_path)
+    # Spawned, so it opens its own database connections instead of sharing the parent's
+    process = multiprocessing.get_context("spawn").Process(
+        target=run_ingest, name="ingest", args=(file_path,),
+        kwargs=dict(batch_size=batch_size, on_conflict=on_conflict, skip_known=skip_known, workers=workers, run_id=run_id,
+                    partition_directory=partition_directory, partition_size=partition_size, coingecko_url=coingecko_url,
+                    profile_directory=profile_directory, profile_interval=profile_interval, fast_decode=fast_decode),
+    )
+    process.start()
+    return process
+
+def run_ingest(file_path: str, batch_size: int = CsvProcessor.DEFAULT_BATCH_SIZE, on_conflict: Optional[str] = None,
+               skip_known: bool = False, workers: int = 1, run_id: Optional[int] = None,
+               partition_directory: Optional[str] = None,
+               partition_size: int = PartitionedRepository.DEFAULT_PARTITION_SIZE,
+               coingecko_url: str = CoinGeckoClientWithCache.BASE_URL, profile_directory: Optional[str] = None,
+               profile_interval: float = DEFAULT_SAMPLE_INTERVAL, fast_decode: bool = False) -> int:
+    """
+    Process a CSV file into the database, pricing the transactions with CoinGecko, and record the progress.
+
+    Args:
+        file_path (str): The CSV file.
+        batch_size (int): Number of transactions written per batch.
+        on_conflict (str, optional): How already stored hashes are resolved ('ignore' or 'update').
+        skip_known (bool): Skip the rows already stored before validating and pricing them.
+        workers (int): Number of processes parsing the file. 1 processes it on a single core.
+        run_id (int, optional): The run already recorded for this ingest. A new one is recorded by default.
+        partition_directory (str, optional): Store the transactions in block range partitions in this directory,
+            see PartitionedRepository, instead of ratedapi.db.
+        partition_size (int): Number of blocks per partition.
+        coingecko_url (str): The CoinGecko API base URL, e.g. of a FakeCoinGeckoServer to run offline.
+        profile_directory (str, optional): Profile the ingest with a SamplingProfiler and write its report and
+            collapsed stacks to this directory. The worker processes of the parallel processor are not sampled,
+            their time shows as the main process waiting for their batches.
+        profile_interval (float): Seconds between two samples of the profile.
+        fast_decode (bool): Decode the rows in batches with a RowDecoder instead of one RawTransaction per row.
+
+    Returns:
+        int: The number of rows written.
+    """
+    metrics_directory = shared_directory()
+    if metrics_directory is not None:
+        # Served on /metrics by the API processes of the server that started this ingest
+        REGISTRY.share(metrics_directory)
+    coin_gecko_client = CoinGeckoClientWithCache(price_store=SqlPriceStore(), base_url=coingecko_url)
+    crypto_to_usd = CryptoToUsd(client=coin_gecko_client, eth_to_usd_cache={})
+    repository = InstrumentedRepository(transaction_repository(batch_size, partition_directory, partition_size), "ingest")
+    processor_options = dict(batch_size=batch_size, on_conflict=on_conflict, skip_known_hashes=skip_known,
+                             prefetch_prices=True, fast_decode=fast_decode)
+    if workers > 1:
+        csv_processor = ParallelCsvProcessor(crypto_to_usd_instance=crypto_to_usd, db_repository=repository,
+                                             workers=workers, **processor_options)
+    else:
+        csv_processor = CsvProcessor(crypto_to_usd_instance=crypto_to_usd, db_repository=repository, **processor_options)
+    profiler = SamplingProfiler(profile_interval) if profile_directory is not None else nullcontext()
+    try:
+        with profiler:
+            return ingest_file(csv_processor, file_path, SqlIngestStore(), run_id)
+    finally:
+        # The process exits without running its exit handlers
+        REGISTRY.write_snapshot()
+        if profile_directory is not None:
+            report_path, collapsed_path = profiler.write(profile_directory, f"ingest-{time.strftime('%Y%m%d-%H%M%S')}")
+            print(f"[SamplingProfiler] Wrote the ingest profile to {report_path} and {collapsed_path}")
+
+def ingest_file(csv_processor: CsvProcessor, file_path: str, ingest_store: SqlIngestStore,
+                run_id: Optional[int] = None) -> int:
+    """
+    Process a CSV file with `csv_processor`, recording the run and its progress in `ingest_store`.
+
+    Args:
+        run_id (int, optional): The run already recorded for this ingest. A new one is recorded by default.
+
+    Returns:
+        int: The number of rows written.
+    """
+    if run_id is None:
+        run_id = ingest_store.start(file_path)
+    try:
+        ingest_store.update(run_id, 0, 0, rows_total=csv_processor.count_rows(file_path))
+    except BaseException as e:
+        ingest_store.finish(run_id, 0, 0, error=repr(e))
+        raise
+    last_update = monotonic()
+
+    def report_progress(rows_written: int, rows_skipped: int) -> None:
+        nonlocal last_update
+        if monotonic() - last_update >= PROGRESS_INTERVAL:
+            ingest_store.update(run_id, rows_written, rows_skipped)
+            last_update = monotonic()
+
+    csv_processor.on_progress = report_progress
+    try:
+        rows_written = csv_processor.process(file_path)
+    except BaseException as e:
+        ingest_store.finish(run_id, csv_processor.rows_written, csv_processor.rows_skipped, error=repr(e))
+        raise
+    ingest_store.finish(run_id, rows_written, csv_processor.rows_skipped)
+    return rows_written
+
+
+class IngestWatcher(threading.Thread):
+    """
+    Keeps the lookup structures of an API process consistent with the ingest runs of another process.
+
+    The Bloom filter of `negative_lookups` cannot see the rows written by another process, so its lookups are
+    suspended (sent to the database) while an ingest runs. Once no ingest runs, and after every run that ends,
+    the filter is rebuilt from the database and the transaction cache is cleared, as the run may have overwritten
+    cached transactions. The runs of `start_ingest` are recorded before the API processes start, so they are seen
+    on the first poll; the rows of a run started later can be reported missing until the next poll sees it.
+
+    The process is ready once the watcher has read the ingest progress once. Until the filter is first loaded,
+    lookups go to the database, so requests never wait for the load.
+
+    Args:
+        ingest_store (SqlIngestStore): The progress of the ingest runs.
+        negative_lookups (NegativeLookupRepository): The Bloom filter of the process.
+        caching_repository (CachingRepository): The transaction cache of the process.
+        poll_interval (float): Seconds between two reads of the ingest progress.
+
+    Usage:
+        watcher = IngestWatcher(SqlIngestStore(), negative_lookups, repository)
+        watcher.start()
+        watcher.ready  # True once the progress was read
+    """
+
+    DEFAULT_POLL_INTERVAL = 1.0
+
+    def __init__(self, ingest_store: SqlIngestStore, negative_lookups: NegativeLookupRepository,
+                 caching_repository: CachingRepository, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        super().__init__(name="ingest-watcher", daemon=True)
+        self.ingest_store = ingest_store
+        self.negative_lookups = negative_lookups
+        self.caching_repository = caching_repository
+        self.poll_interval = poll_interval
+        self.ready = False
+        self._stopped = threading.Event()
+        # (id, status) of the last run when the filter was loaded, None if there was no run
+        self._loaded_after = None
+        self._loaded = False
+
+    def start(self) -> None:
+        self.negative_lookups.suspend()
+        super().start()
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                # e.g. the database is briefly locked. The next poll retries
+                print(f"[IngestWatcher] Could not read the ingest progress: {e}")
+            self._stopped.wait(self.poll_interval)
+
+    def poll(self) -> None:
+        run = self.ingest_store.latest()
+        state = (run["id"], run["status"]) if run is not None else None
+        if run is not None and run["status"] == INGEST_RUNNING:
+            self.negative_lookups.suspend()
+        elif not self._loaded or state != self._loaded_after:
+            self.negative_lookups.load()
+            self.caching_repository.cache.clear()
+            self._loaded_after = state
+            self._loaded = True
+        self.ready = True
+
+    def stop(self) -> None:
+        self._stopped.set()
@@ -1,29 +1,187 @@
 import argparse
+import os
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
-from database import init_db, SqlRepository
-from server.routes import get_api_router
-from crypto_data import CoinGeckoClientWithCache, CryptoToUsd
+from crypto_data import CoinGeckoClientWithCache
+from database import (
+    init_db, CachingRepository, InstrumentedRepository, NegativeLookupRepository, PartitionedRepository,
+    SqlIngestStore, ON_CONFLICT_MODES, ON_CONFLICT_UPDATE
+)
+from metrics import CallbackMetric, COUNTER, DIRECTORY_ENV, REGISTRY, shared_directory
+from server.ingest import IngestWatcher, start_ingest, transaction_repository
+from server.middleware import MetricsMiddleware, ProfilingMiddleware
+from server.profiling import DEFAULT_SAMPLE_INTERVAL
+from server.routes import get_api_router, get_ingest_router, get_metrics_router
 from data_processor import CsvProcessor
 
-app = FastAPI()
+# The API processes import this module, so the command line options reach them through the environment
+LOOKUP_FILTER_ERROR_RATE_ENV = "RATEDAPI_LOOKUP_FILTER_ERROR_RATE"
+LOOKUP_FILTER_CAPACITY_ENV = "RATEDAPI_LOOKUP_FILTER_CAPACITY"
+PARTITION_DIRECTORY_ENV = "RATEDAPI_PARTITION_DIRECTORY"
+PARTITION_SIZE_ENV = "RATEDAPI_PARTITION_SIZE"
+PROFILE_DIRECTORY_ENV = "RATEDAPI_PROFILE_DIRECTORY"
+PROFILE_TOKEN_ENV = "RATEDAPI_PROFILE_TOKEN"
+PROFILE_SAMPLE_RATE_ENV = "RATEDAPI_PROFILE_SAMPLE_RATE"
+DEFAULT_PROFILE_DIRECTORY = "profiles"
 
-repository = SqlRepository()
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
 
-app.include_router(get_api_router(repository))
+def probability(value: str) -> float:
+    number = float(value)
+    if not 0 < number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not between 0 and 1")
+    return number
+
+def share(value: str) -> float:
+    number = float(value)
+    if not 0 <= number <= 1:
+        raise argparse.ArgumentTypeError(f"{value} is not between 0 and 1")
+    return number
+
+def positive_float(value: str) -> float:
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive number")
+    return number
+
+sql_repository = transaction_repository(
+    partition_directory=os.environ.get(PARTITION_DIRECTORY_ENV) or None,
+    partition_size=int(os.environ.get(PARTITION_SIZE_ENV, PartitionedRepository.DEFAULT_PARTITION_SIZE)),
+)
+# Lookups of unknown hashes are answered by a Bloom filter, hot ones from memory.
+# The ingest process writes to the database directly, so the watcher keeps both consistent with it
+negative_lookups = NegativeLookupRepository(
+    # Timed behind the filter and the cache, so its latencies are those of the database alone
+    InstrumentedRepository(sql_repository, "storage"),
+    false_positive_rate=float(os.environ.get(LOOKUP_FILTER_ERROR_RATE_ENV, NegativeLookupRepository.DEFAULT_FALSE_POSITIVE_RATE)),
+    min_capacity=int(os.environ.get(LOOKUP_FILTER_CAPACITY_ENV, NegativeLookupRepository.DEFAULT_MIN_CAPACITY)),
+)
+repository = CachingRepository(negative_lookups)
+ingest_store = SqlIngestStore()
+ingest_watcher = IngestWatcher(ingest_store, negative_lookups, repository)
+
+def transaction_cache_requests():
+    stats = repository.cache_stats()
+    return {("hit",): stats["hits"], ("miss",): stats["misses"]}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ingest_watcher.start()
+    # Registered by the served app only: this module is imported twice by the processes that run it as __main__
+    cache_requests = CallbackMetric(
+        "ratedapi_transaction_cache_requests_total", "Lookups of the transaction cache of the API processes, by result",
+        transaction_cache_requests, labelnames=["result"], kind=COUNTER,
+    )
+    yield
+    REGISTRY.unregister(cache_requests.name)
+    ingest_watcher.stop()
+
+# The processes started by the server add up their metrics in this directory, see metrics/registry.py
+metrics_directory = shared_directory()
+if metrics_directory is not None:
+    REGISTRY.share(metrics_directory)
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+# Requests are profiled on demand with the token, and at random at the sample rate
+profile_token = os.environ.get(PROFILE_TOKEN_ENV) or None
+profile_sample_rate = float(os.environ.get(PROFILE_SAMPLE_RATE_ENV) or 0)
+if profile_token is not None or profile_sample_rate > 0:
+    app.add_middleware(ProfilingMiddleware,
+                       directory=os.environ.get(PROFILE_DIRECTORY_ENV) or DEFAULT_PROFILE_DIRECTORY,
+                       token=profile_token, sample_rate=profile_sample_rate)
+app.include_router(get_api_router(InstrumentedRepository(repository, "api")))
+app.include_router(get_ingest_router(ingest_store, lambda: ingest_watcher.ready))
+app.include_router(get_metrics_router(REGISTRY, metrics_directory))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--process_csv', dest='process_csv', action='store_true', 
-        help="Process the CSV file and populate the database before starting the server")
+        help="Process the CSV file into the database in a background process while the server runs")
+    parser.add_argument('--batch_size', dest='batch_size', type=positive_int, default=CsvProcessor.DEFAULT_BATCH_SIZE,
+        help="Number of transactions written to the database per batch when processing the CSV file")
+    parser.add_argument('--on_conflict', dest='on_conflict', choices=ON_CONFLICT_MODES, default=None,
+        help="Resolve transactions that are already stored in bulk instead of failing on them: 'ignore' keeps the stored row, 'update' overwrites it")
+    parser.add_argument('--skip_known', dest='skip_known', action='store_true',
+        help="Load the stored transaction hashes once and skip CSV rows that are already stored before validating and pricing them")
+    parser.add_argument('--workers', dest='workers', type=positive_int, default=1,
+        help="Number of processes parsing and validating the CSV file in parallel. 1 processes it on a single core")
+    parser.add_argument('--fast_decode', dest='fast_decode', action='store_true',
+        help="Validate the CSV rows in batches, column by column, into the fields the ingest needs instead of one "
+             "model per row. Rejects the same rows")
+    parser.add_argument('--lookup_filter_error_rate', dest='lookup_filter_error_rate', type=probability,
+        default=NegativeLookupRepository.DEFAULT_FALSE_POSITIVE_RATE,
+        help="False positive rate of the Bloom filter answering lookups of unknown hashes. Lower rates take more memory")
+    parser.add_argument('--lookup_filter_capacity', dest='lookup_filter_capacity', type=positive_int,
+        default=NegativeLookupRepository.DEFAULT_MIN_CAPACITY,
+        help="Minimum number of hashes the Bloom filter is sized for. It grows with the stored transactions")
+    parser.add_argument('--api_workers', dest='api_workers', type=positive_int, default=1,
+        help="Number of API server processes. They share the database, each keeps its own cache and Bloom filter")
+    parser.add_argument('--partition_directory', dest='partition_directory', default=None,
+        help="Store the transactions in this directory, in one database per range of --partition_size blocks, "
+             "instead of ratedapi.db")
+    parser.add_argument('--partition_size', dest='partition_size', type=positive_int,
+        default=PartitionedRepository.DEFAULT_PARTITION_SIZE,
+        help="Number of blocks per partition with --partition_directory")
+    parser.add_argument('--coingecko_url', dest='coingecko_url', default=CoinGeckoClientWithCache.BASE_URL,
+        help="Base URL of the CoinGecko API used to price the CSV file, e.g. a local stand-in to run offline")
+    parser.add_argument('--port', dest='port', type=positive_int, default=8000, help="Port the API listens on")
+    parser.add_argument('--profile', dest='profile', action='store_true',
+        help="Profile the CSV processing by sampling and write its report, sorted by cumulative time, and its "
+             "collapsed stacks for flame graphs to --profile_directory")
+    parser.add_argument('--profile_interval', dest='profile_interval', type=positive_float,
+        default=DEFAULT_SAMPLE_INTERVAL, help="Seconds between two stack samples of the CSV processing profile")
+    parser.add_argument('--profile_directory', dest='profile_directory', default=DEFAULT_PROFILE_DIRECTORY,
+        help="Directory the profiles of the CSV processing and of the API requests are written to")
+    parser.add_argument('--profile_token', dest='profile_token', default=None,
+        help=f"Profile the API requests sending this secret in an X-Profile header or a profile query parameter. "
+             f"Can be set in {PROFILE_TOKEN_ENV} instead, to keep it out of the process list")
+    parser.add_argument('--profile_sample_rate', dest='profile_sample_rate', type=share, default=0.,
+        help="Share of the API requests profiled without asking, e.g. 0.001 on live traffic")
     args = parser.parse_args()
+    if args.skip_known and args.on_conflict == ON_CONFLICT_UPDATE:
+        parser.error("--skip_known skips the stored rows, so it cannot be combined with --on_conflict update")
+
+    os.environ[LOOKUP_FILTER_ERROR_RATE_ENV] = str(args.lookup_filter_error_rate)
+    os.environ[LOOKUP_FILTER_CAPACITY_ENV] = str(args.lookup_filter_capacity)
+    os.environ[PARTITION_DIRECTORY_ENV] = args.partition_directory or ""
+    os.environ[PARTITION_SIZE_ENV] = str(args.partition_size)
+    os.environ[PROFILE_DIRECTORY_ENV] = args.profile_directory
+    os.environ[PROFILE_SAMPLE_RATE_ENV] = str(args.profile_sample_rate)
+    if args.profile_token:
+        os.environ[PROFILE_TOKEN_ENV] = args.profile_token
+    # A new directory on every start, so the metrics of the processes of a previous run are not added to the new ones
+    metrics_directory = tempfile.mkdtemp(prefix="ratedapi-metrics-")
+    os.environ[DIRECTORY_ENV] = metrics_directory
 
     init_db()
+    # Built once here, before the API processes race to build them on their first read.
+    # The repository of this module was created before the options were read
+    transaction_repository(partition_directory=args.partition_directory, partition_size=args.partition_size).get_stats()
+    # Their process is gone, and the API processes would never use their Bloom filter again
+    ingest_store.fail_unfinished("Interrupted: the server stopped before the ingest finished")
 
+    ingest = None
     if args.process_csv:
-        coin_gecko_client = CoinGeckoClientWithCache()
-        crypto_to_usd = CryptoToUsd(client=coin_gecko_client, eth_to_usd_cache={})
-        csv_processor = CsvProcessor(crypto_to_usd_instance=crypto_to_usd, db_repository=repository)        
-        csv_processor.process(file_path="ethereum_txs.csv")
+        ingest = start_ingest("ethereum_txs.csv", batch_size=args.batch_size, on_conflict=args.on_conflict,
+                              skip_known=args.skip_known, workers=args.workers,
+                              partition_directory=args.partition_directory, partition_size=args.partition_size,
+                              coingecko_url=args.coingecko_url,
+                              profile_directory=args.profile_directory if args.profile else None,
+                              profile_interval=args.profile_interval, fast_decode=args.fast_decode)
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    try:
+        # Imported by each API process, instead of sharing the app of this one
+        uvicorn.run("server.main:app", host="0.0.0.0", port=args.port, workers=args.api_workers)
+    finally:
+        if ingest is not None and ingest.is_alive():
+            ingest.terminate()
+            ingest.join()
+        shutil.rmtree(metrics_directory, ignore_errors=True)
@@ -0,0 +1,151 @@
+import cProfile
+import hmac
+import itertools
+import os
+import random
+import time
+from time import perf_counter
+from typing import Callable, Optional
+from urllib.parse import parse_qs, parse_qsl, urlencode
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics import Histogram
+from server.profiling import current_profile, trace_report
+
+"""
+ASGI middleware of the API.
+"""
+
+HTTP_LATENCY = Histogram(
+    "ratedapi_http_request_duration_seconds",
+    "Latency of the HTTP requests until their response starts, by method, route template and status",
+    ["method", "route", "status"],
+)
+# The route label of the requests that match no route, so unknown paths cannot add labels without bounds
+UNMATCHED_ROUTE = "unmatched"
+# A request is profiled when it carries the profiling token in this header or query parameter.
+# The response names the stored profile in the same header
+PROFILE_HEADER = "x-profile"
+PROFILE_QUERY_PARAMETER = "profile"
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of every HTTP request in HTTP_LATENCY, labelled with the template of the route that served it
+    (e.g. /transactions/{hash}) rather than its path. A plain ASGI middleware, which costs a few microseconds per
+    request where Starlette's BaseHTTPMiddleware would add a task and a stream per request.
+
+    The latency is measured until the response starts, so streamed responses are not timed while they stream.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+        responded = False
+
+        def observe(status: int) -> None:
+            # The router has set the route of the request by now
+            route = scope.get("route")
+            HTTP_LATENCY.labels(scope["method"], route.path if route is not None else UNMATCHED_ROUTE,
+                                status).observe(perf_counter() - started)
+
+        async def send_timed(message: Message) -> None:
+            nonlocal responded
+            if message["type"] == "http.response.start":
+                responded = True
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        except Exception:
+            # Answered with a 500 by Starlette's ServerErrorMiddleware, which runs outside of this one
+            if not responded:
+                observe(500)
+            raise
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the requests that ask for it with the token, and a random share of the others, with cProfile
+    (see server/profiling.py). Their profiles are stored in `directory` as a report sorted by cumulative time
+    (.txt) and as pstats data (.pstats, e.g. for snakeviz), and their responses name them in an X-Profile header.
+
+    Only the calls the routes run on their executor are traced: the repository calls and the encoding of the
+    responses. Requests for routes that do not use it, or streamed responses, get a profile of the calls traced
+    before the response started.
+
+    Args:
+        app (ASGIApp): The application.
+        directory (str): Where the profiles are stored.
+        token (str, optional): The secret of the X-Profile header and `profile` query parameter. Without it,
+            requests cannot ask to be profiled.
+        sample_rate (float): Share of the requests profiled without asking, e.g. 0.001 on live traffic.
+    """
+
+    def __init__(self, app: ASGIApp, directory: str, token: Optional[str] = None, sample_rate: float = 0.,
+                 random: Callable[[], float] = random.random):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1")
+        self.app = app
+        self.directory = directory
+        self.token = token.encode() if token else None
+        self.sample_rate = sample_rate
+        self.random = random
+        self._sequence = itertools.count()
+
+    def _asks_for_profile(self, scope: Scope) -> bool:
+        if self.token is None:
+            return False
+        for name, value in scope.get("headers", []):
+            if name == PROFILE_HEADER.encode() and hmac.compare_digest(value, self.token):
+                return True
+        values = parse_qs(scope.get("query_string", b"")).get(PROFILE_QUERY_PARAMETER.encode(), [])
+        return any(hmac.compare_digest(value, self.token) for value in values)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not (
+                self._asks_for_profile(scope) or (self.sample_rate and self.random() < self.sample_rate)):
+            await self.app(scope, receive, send)
+            return
+
+        profile = cProfile.Profile()
+        name = f"request-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._sequence)}"
+        status = None
+
+        async def send_profiled(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message, headers=list(message.get("headers", [])) + [
+                    (PROFILE_HEADER.encode(), name.encode())
+                ])
+            await send(message)
+
+        reset_token = current_profile.set(profile)
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            current_profile.reset(reset_token)
+            self._store(name, scope, status, perf_counter() - started, profile)
+
+    def _store(self, name: str, scope: Scope, status: Optional[int], seconds: float, profile: cProfile.Profile):
+        os.makedirs(self.directory, exist_ok=True)
+        # Without the token
+        query = urlencode([
+            (key, value) for key, value in parse_qsl(scope.get("query_string", b"").decode(errors="replace"))
+            if key != PROFILE_QUERY_PARAMETER
+        ])
+        path = scope["path"] + (f"?{query}" if query else "")
+        with open(os.path.join(self.directory, f"{name}.txt"), "w") as file:
+            file.write(f"{scope['method']} {path} answered {status} in {seconds * 1e3:.2f} ms\n\n")
+            file.write(trace_report(profile))
+        profile.dump_stats(os.path.join(self.directory, f"{name}.pstats"))
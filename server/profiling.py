@@ -0,0 +1,151 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+"""
+Opt-in profiling of the API requests and of the CSV ingest.
+
+A request is profiled with cProfile: its repository calls and response encoding, which run on the executor of the
+routes, are traced while the request runs. `current_profile` holds the profile of the request being served, so
+the routes trace the calls of the profiled requests only, whatever else the process serves meanwhile.
+
+The ingest is profiled by sampling: the stacks of every thread are read every `interval` seconds, which costs little
+enough to profile an ingest running next to live traffic. The samples are reported sorted by cumulative time, and
+exported as collapsed stacks ("thread;outer;...;inner count" lines) for flamegraph.pl, speedscope or inferno.
+"""
+
+# The profile of the request being served, if it is profiled
+current_profile: ContextVar[Optional[cProfile.Profile]] = ContextVar("current_profile", default=None)
+
+# Seconds between two stack samples of the ingest
+DEFAULT_SAMPLE_INTERVAL = 0.005
+# Functions listed by the reports
+REPORT_LIMIT = 40
+
+
+def trace_report(profile: cProfile.Profile, limit: int = REPORT_LIMIT) -> str:
+    """
+    The functions of a cProfile profile sorted by cumulative time, as printed by pstats.
+    """
+    if not profile.getstats():
+        return "No calls were traced\n"
+    output = io.StringIO()
+    pstats.Stats(profile, stream=output).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return output.getvalue()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    A statistical profiler of every thread of the process, sampling their stacks from a background thread.
+
+    Threads waiting (for a lock, a queue or a socket) are sampled as well, so the profile shows where the wall time
+    goes rather than the CPU time. The stacks are rooted at the name of their thread.
+
+    Args:
+        interval (float): Seconds between two samples. Shorter intervals are more precise and cost more.
+
+    Usage:
+        with SamplingProfiler(interval=0.005) as profiler:
+            process()
+        print(profiler.report())
+        profiler.write("profiles", "ingest")  # ingest.txt and ingest.collapsed
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        if interval <= 0:
+            raise ValueError("interval must be a positive number of seconds")
+        self.interval = interval
+        self.stacks: Dict[Tuple[str, ...], int] = Counter()
+        self.samples = 0
+        self.seconds = 0.
+        self._started_at = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> 'SamplingProfiler':
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self.seconds = time.perf_counter() - self._started_at
+
+    def __enter__(self) -> 'SamplingProfiler':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """
+        The sampled stacks in the collapsed format of flamegraph.pl: one "root;...;leaf count" line per stack.
+        """
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def report(self, limit: int = REPORT_LIMIT) -> str:
+        """
+        The functions sampled the most often, sorted by cumulative time: the samples in which they were running or
+        calling other functions. The seconds are estimated from the share of the samples.
+        """
+        cumulative, own = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            # Counted once per stack, however many times it recurses
+            for label in set(stack[1:]):
+                cumulative[label] += count
+            own[stack[-1]] += count
+        seconds_per_sample = self.seconds / self.samples if self.samples else 0.
+        lines = [
+            f"{self.samples} samples of every thread over {self.seconds:.2f} s, "
+            f"one every {seconds_per_sample * 1e3:.1f} ms",
+            "",
+            f"{'cumulative s':>12} {'own s':>8}  function",
+        ]
+        for label, count in cumulative.most_common(limit):
+            lines.append(f"{count * seconds_per_sample:12.3f} {own[label] * seconds_per_sample:8.3f}  {label}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: str, name: str) -> Tuple[str, str]:
+        """
+        Write the report and the collapsed stacks to `name`.txt and `name`.collapsed in `directory`.
+
+        Returns:
+            Tuple[str, str]: The paths of the two files.
+        """
+        os.makedirs(directory, exist_ok=True)
+        report_path = os.path.join(directory, f"{name}.txt")
+        collapsed_path = os.path.join(directory, f"{name}.collapsed")
+        with open(report_path, "w") as file:
+            file.write(self.report())
+        with open(collapsed_path, "w") as file:
+            file.write(self.collapsed())
+        return report_path, collapsed_path
@@ -0,0 +1,12 @@
+from typing import List
+from pydantic import BaseModel, Field
+
+"""
+Pydantic models representing the request bodies accepted by the API.
+"""
+
+# Largest number of hashes resolved by a single batch lookup
+MAX_BATCH_HASHES = 10000
+
+class TransactionBatchRequest(BaseModel):
+    hashes: List[str] = Field(max_length=MAX_BATCH_HASHES)
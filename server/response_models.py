@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import List, Optional
 from pydantic import BaseModel, validator
 
 """
@@ -17,6 +18,14 @@ class ProcessedTransactionResponse(BaseModel):
     def round_gas_cost(cls, value):
         return round(value, 2)
 
+class TransactionPageResponse(BaseModel):
+    transactions: List[ProcessedTransactionResponse]
+    next: Optional[str]
+
+class TransactionBatchResponse(BaseModel):
+    transactions: List[ProcessedTransactionResponse]
+    missing: List[str]
+
 class StatsResponse(BaseModel):
     totalTransactionsInDB: int
     totalGasUsed: int
@@ -25,3 +34,69 @@ class StatsResponse(BaseModel):
     @validator('totalGasCostInDollars', pre=True)
     def round_totalGasCostInDollars(cls, value):
         return round(value, 2)
+
+class TimeseriesPoint(BaseModel):
+    bucketStart: datetime
+    transactionCount: int
+    gasUsed: int
+    gasCostInDollars: float
+
+    @validator('gasCostInDollars', pre=True)
+    def round_gas_cost(cls, value):
+        return round(value, 2)
+
+class TimeseriesResponse(BaseModel):
+    bucket: str
+    points: List[TimeseriesPoint]
+
+class BlockRangeStats(BaseModel):
+    fromBlock: int
+    toBlock: int
+    transactionCount: int
+    gasUsed: int
+    gasCostInDollars: float
+
+    @validator('gasCostInDollars', pre=True)
+    def round_gas_cost(cls, value):
+        return round(value, 2)
+
+class BlockStatsResponse(BaseModel):
+    size: int
+    points: List[BlockRangeStats]
+
+class AddressStatsResponse(BaseModel):
+    address: str
+    transactionsSent: int
+    transactionsReceived: int
+    gasUsed: int
+    gasCostInDollars: float
+
+    @validator('gasCostInDollars', pre=True)
+    def round_gas_cost(cls, value):
+        return round(value, 2)
+
+class TopAddressesResponse(BaseModel):
+    by: str
+    addresses: List[AddressStatsResponse]
+
+class IngestStatusResponse(BaseModel):
+    id: int
+    filePath: str
+    status: str
+    rowsTotal: Optional[int]
+    rowsWritten: int
+    rowsSkipped: int
+    rowsDone: int
+    rowsPerSecond: float
+    etaSeconds: Optional[float]
+    startedAt: datetime
+    updatedAt: datetime
+    finishedAt: Optional[datetime]
+    error: Optional[str]
+
+    @validator('rowsPerSecond', 'etaSeconds', pre=True)
+    def round_rates(cls, value):
+        return round(value, 1) if value is not None else None
+
+class ReadinessResponse(BaseModel):
+    ready: bool
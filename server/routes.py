@@ -1,12 +1,44 @@
-from fastapi import APIRouter, HTTPException
-from server.response_models import ProcessedTransactionResponse, StatsResponse
+import asyncio
+import base64
+import binascii
+from concurrent.futures import Executor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Iterator, Optional
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from metrics import CONTENT_TYPE
+from database import READ_POOL_SIZE, TIME_BUCKETS, ADDRESS_RANKINGS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, TransactionFilter
+from server.request_models import TransactionBatchRequest
+from server.response_models import (
+    ProcessedTransactionResponse, TransactionPageResponse, TransactionBatchResponse, StatsResponse, TimeseriesResponse,
+    BlockStatsResponse, AddressStatsResponse, TopAddressesResponse, IngestStatusResponse, ReadinessResponse
+)
+from server.profiling import current_profile
+from server.serialization import TransactionEncoder, transaction_page_json, transaction_batch_json, stats_json
 
-def get_api_router(repository):
+# Largest number of buckets or block ranges a single stats query can span
+MAX_POINTS = 10000
+
+BUCKET_DURATIONS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+# Largest leaderboard returned by /addresses/top
+MAX_TOP_ADDRESSES = 1000
+
+def get_api_router(repository, executor: Optional[Executor] = None):
     """
     Create an API router for handling transaction-related endpoints.
 
+    The transaction and /stats endpoints encode their responses straight to JSON bytes (see server/serialization.py)
+    and return them as raw responses, so FastAPI does not validate and encode them again. Their response_model
+    still documents them.
+
+    The endpoints are async: requests are parsed and validated on the event loop, and the blocking repository calls
+    run on `executor`. By default it has one thread per read connection of the database pool, so a burst of requests
+    queues for a thread instead of holding Starlette's threadpool threads while they wait for a connection.
+
     Args:
         repository: An instance of a repository for database operations.
+        executor (Executor, optional): Runs the repository calls. Defaults to READ_POOL_SIZE threads.
 
     Returns:
         APIRouter: An API router for transaction-related endpoints.
@@ -14,9 +46,98 @@ def get_api_router(repository):
     """
 
     router = APIRouter()
+    encoder = TransactionEncoder()
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=READ_POOL_SIZE, thread_name_prefix="db")
+
+    async def run(function, *args):
+        profile = current_profile.get()
+        if profile is not None:
+            # Traced on the executor thread, where the work of the request runs
+            return await asyncio.get_running_loop().run_in_executor(executor, profile.runcall, function, *args)
+        return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+
+    @router.get("/transactions", response_model=TransactionPageResponse)
+    async def list_transactions(from_address: Optional[str] = Query(None, alias="fromAddress"),
+                                to_address: Optional[str] = Query(None, alias="toAddress"),
+                                from_block: Optional[int] = Query(None, alias="fromBlock"),
+                                to_block: Optional[int] = Query(None, alias="toBlock"),
+                                after: Optional[str] = None,
+                                limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                                stream: bool = False):
+        """
+        List transactions ordered by block number and hash, with keyset (cursor) pagination.
+
+        Args:
+            from_address (str, optional): Only the transactions sent by this address (`fromAddress` query parameter).
+            to_address (str, optional): Only the transactions received by this address (`toAddress` query parameter).
+            from_block (int, optional): Lowest block number, included (`fromBlock` query parameter).
+            to_block (int, optional): Highest block number, included (`toBlock` query parameter).
+            after (str, optional): The `next` cursor of the previous page.
+            limit (int): Page size, up to MAX_PAGE_SIZE.
+            stream (bool): Stream every matching transaction after the cursor as NDJSON (one JSON object per line)
+                instead of returning a page. `limit` does not apply.
+
+        Returns:
+            TransactionPageResponse: The page, and the cursor of the next page (null on the last page).
+
+        Raises:
+            HTTPException: If the cursor is invalid or the block range is reversed, returns a 400 status code.
+
+        """
+        if from_block is not None and to_block is not None and from_block > to_block:
+            raise HTTPException(status_code=400, detail="fromBlock must not be after toBlock")
+        filters = TransactionFilter(
+            from_address=from_address.lower() if from_address is not None else None,
+            to_address=to_address.lower() if to_address is not None else None,
+            from_block=from_block,
+            to_block=to_block,
+        )
+        cursor = _decode_cursor(after) if after is not None else None
+
+        if stream:
+            # Iterated by Starlette in its threadpool, on a connection of the pool overflow
+            transactions = repository.stream_transactions(filters, cursor, chunk_size=MAX_PAGE_SIZE)
+            return StreamingResponse(_ndjson_chunks(encoder, transactions), media_type="application/x-ndjson")
+
+        def read_page() -> bytes:
+            # One extra row tells whether there is a next page
+            transactions = repository.get_transactions(filters, cursor, limit + 1)
+            page = transactions[:limit]
+            last = page[-1] if len(transactions) > limit else None
+            next_cursor = _encode_cursor(last.blockNumber, last.hash) if last is not None else None
+            return transaction_page_json(encoder, page, next_cursor)
+
+        return Response(await run(read_page), media_type="application/json")
+
+    @router.post("/transactions/batch", response_model=TransactionBatchResponse)
+    async def get_transactions_batch(request: TransactionBatchRequest):
+        """
+        Get the details of many transactions by hash, in one request and one database session.
+
+        Args:
+            request (TransactionBatchRequest): The hashes to look up, up to MAX_BATCH_HASHES.
+
+        Returns:
+            TransactionBatchResponse: The stored transactions and the hashes that are not stored, both in request order
+                and without duplicates.
+
+        """
+        hashes = list(dict.fromkeys(request.hashes))
+
+        def read_batch() -> bytes:
+            # Encoded on the executor too, as large batches would hold the event loop
+            found = repository.get_many_by_hash(hashes)
+            return transaction_batch_json(
+                encoder,
+                [found[hash] for hash in hashes if hash in found],
+                [hash for hash in hashes if hash not in found],
+            )
+
+        return Response(await run(read_batch), media_type="application/json")
 
     @router.get("/transactions/{hash}", response_model=ProcessedTransactionResponse)
-    def get_transaction(hash: str):
+    async def get_transaction(hash: str):
         """
         Get transaction details by hash.
 
@@ -30,21 +151,13 @@ def get_api_router(repository):
             HTTPException: If the transaction is not found, returns a 404 status code.
 
         """        
-        transaction = repository.get_by_hash(hash)
+        transaction = await run(repository.get_by_hash, hash)
         if transaction is None:
             raise HTTPException(status_code=404, detail="Transaction not found")
-        return ProcessedTransactionResponse(
-            hash=transaction.hash,
-            fromAddress=transaction.fromAddress,
-            toAddress=transaction.toAddress,
-            blockNumber=transaction.blockNumber,
-            executedAt=transaction.executedAt,
-            gasUsed=transaction.gasUsed,
-            gasCostInDollars=transaction.gasCostInDollars,
-        )
+        return Response(encoder.encode(transaction), media_type="application/json")
 
     @router.get("/stats", response_model=StatsResponse)
-    def get_stats():
+    async def get_stats():
         """
         Get statistics for transactions.
 
@@ -52,7 +165,206 @@ def get_api_router(repository):
             StatsResponse: The response containing transaction statistics.
 
         """        
-        stats = repository.get_stats()
+        stats = await run(repository.get_stats)
+        return Response(stats_json(stats), media_type="application/json")
+
+    @router.get("/stats/timeseries", response_model=TimeseriesResponse)
+    async def get_stats_timeseries(from_timestamp: datetime = Query(alias="from"),
+                                   to_timestamp: datetime = Query(alias="to"), bucket: str = "hour"):
+        """
+        Get gas used and gas cost per time bucket, from the pre-aggregated rollups.
+
+        Args:
+            from_timestamp (datetime): Start of the range (`from` query parameter). Its bucket is included.
+            to_timestamp (datetime): End of the range (`to` query parameter), included.
+            bucket (str): 'hour' or 'day'.
+
+        Returns:
+            TimeseriesResponse: The buckets of the range that have transactions, oldest first.
+
+        Raises:
+            HTTPException: If the bucket is unknown, the range is reversed or spans more than MAX_POINTS buckets,
+                returns a 400 status code.
+
+        """
+        from_timestamp, to_timestamp = _as_naive_utc(from_timestamp), _as_naive_utc(to_timestamp)
+        if bucket not in TIME_BUCKETS:
+            raise HTTPException(status_code=400, detail=f"Unsupported bucket {bucket}. Expected one of {TIME_BUCKETS}")
+        if from_timestamp > to_timestamp:
+            raise HTTPException(status_code=400, detail="from must not be after to")
+        if (to_timestamp - from_timestamp) / BUCKET_DURATIONS[bucket] > MAX_POINTS:
+            raise HTTPException(status_code=400, detail=f"The range spans more than {MAX_POINTS} {bucket} buckets")
+
+        points = await run(repository.get_timeseries, from_timestamp, to_timestamp, bucket)
+        return {"bucket": bucket, "points": points}
+
+    @router.get("/stats/blocks", response_model=BlockStatsResponse)
+    async def get_block_stats(from_block: int, to_block: int, size: int = Query(1, ge=1)):
+        """
+        Get gas used and gas cost per range of `size` blocks, from the pre-aggregated rollups.
+
+        Returns:
+            BlockStatsResponse: The block ranges that have transactions, lowest blocks first.
+
+        Raises:
+            HTTPException: If the range is reversed or spans more than MAX_POINTS block ranges, returns a 400 status code.
+
+        """
+        if from_block > to_block:
+            raise HTTPException(status_code=400, detail="from_block must not be after to_block")
+        if (to_block // size) - (from_block // size) + 1 > MAX_POINTS:
+            raise HTTPException(status_code=400, detail=f"The range spans more than {MAX_POINTS} block ranges")
+
+        return {"size": size, "points": await run(repository.get_block_stats, from_block, to_block, size)}
+
+    @router.get("/addresses/top", response_model=TopAddressesResponse)
+    async def get_top_addresses(by: str = "gasCost", limit: int = Query(10, ge=1, le=MAX_TOP_ADDRESSES)):
+        """
+        Get the senders that paid the most, from the maintained per-address aggregates.
+
+        Args:
+            by (str): 'gasCost', 'gasUsed' or 'transactions' (sent).
+            limit (int): Number of addresses returned, up to MAX_TOP_ADDRESSES.
+
+        Returns:
+            TopAddressesResponse: The addresses, highest first.
+
+        Raises:
+            HTTPException: If the ranking is unknown, returns a 400 status code.
+
+        """
+        if by not in ADDRESS_RANKINGS:
+            raise HTTPException(status_code=400, detail=f"Unsupported ranking {by}. Expected one of {ADDRESS_RANKINGS}")
+
+        return {"by": by, "addresses": await run(repository.get_top_addresses, by, limit)}
+
+    @router.get("/addresses/{address}/stats", response_model=AddressStatsResponse)
+    async def get_address_stats(address: str):
+        """
+        Get the transactions sent and received by an address and the gas it paid.
+
+        Args:
+            address (str): The address, in any letter case.
+
+        Returns:
+            AddressStatsResponse: The totals of the address.
+
+        Raises:
+            HTTPException: If the address has no stored transaction, returns a 404 status code.
+
+        """
+        # Addresses are stored lowercase, as exported by the node, while checksummed addresses are mixed case
+        stats = await run(repository.get_address_stats, address.lower())
+        if stats is None:
+            raise HTTPException(status_code=404, detail="Address not found")
         return stats
     
     return router
+
+
+def get_ingest_router(ingest_store, is_ready: Callable[[], bool]):
+    """
+    Create an API router for the progress of the CSV ingest and the readiness of the process.
+
+    Args:
+        ingest_store: The store of the ingest runs, e.g. SqlIngestStore.
+        is_ready (Callable[[], bool]): Whether the process can serve requests.
+
+    Returns:
+        APIRouter: An API router for the operational endpoints.
+
+    """
+
+    router = APIRouter()
+
+    @router.get("/ingest/status", response_model=IngestStatusResponse)
+    def get_ingest_status():
+        """
+        Get the progress of the last CSV ingest run.
+
+        Returns:
+            IngestStatusResponse: The status ('running', 'done' or 'failed') of the run, the rows written and skipped
+                so far out of the rows of the file, the rows per second and the estimated seconds left.
+
+        Raises:
+            HTTPException: If no ingest has run, returns a 404 status code.
+
+        """
+        status = ingest_store.latest()
+        if status is None:
+            raise HTTPException(status_code=404, detail="No ingest has run")
+        return status
+
+    @router.get("/ready", response_model=ReadinessResponse)
+    def get_readiness():
+        """
+        Tell whether the process can serve requests, e.g. for a load balancer.
+
+        Returns:
+            ReadinessResponse: Whether the process is ready. Returns a 503 status code until it is.
+
+        """
+        if not is_ready():
+            return JSONResponse(status_code=503, content={"ready": False})
+        return {"ready": True}
+
+    return router
+
+
+def get_metrics_router(registry, directory: Optional[str] = None):
+    """
+    Create an API router serving the metrics in the Prometheus text exposition format.
+
+    Args:
+        registry (Registry): The metrics of this process.
+        directory (str, optional): The directory the other processes of the server share their metrics in.
+            Their last snapshots are added to the metrics of this process.
+
+    Returns:
+        APIRouter: An API router for the /metrics endpoint.
+
+    """
+
+    router = APIRouter()
+
+    @router.get("/metrics", response_class=Response)
+    def get_metrics():
+        """
+        Get the metrics of the API and ingest processes: request and repository latency histograms, ingest row
+        and stage time counters, CoinGecko calls and waits, and cache hits and misses.
+        """
+        return Response(registry.collect(directory), media_type=CONTENT_TYPE)
+
+    return router
+
+def _as_naive_utc(timestamp: datetime) -> datetime:
+    # Transactions are stored with naive UTC timestamps
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _ndjson_chunks(encoder: TransactionEncoder, transactions: Iterable,
+                   lines_per_chunk: int = MAX_PAGE_SIZE) -> Iterator[bytes]:
+    # Sync iterators are consumed in a threadpool, one hop per item, so lines are sent in chunks
+    lines = []
+    for transaction in transactions:
+        lines.append(encoder.encode(transaction))
+        if len(lines) >= lines_per_chunk:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+def _encode_cursor(block_number: int, hash: str) -> str:
+    # Opaque to clients, so the pagination key can change without breaking them
+    return base64.urlsafe_b64encode(f"{block_number}:{hash}".encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        block_number, hash = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+        return int(block_number), hash
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,96 @@
+import json
+import threading
+import weakref
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+"""
+JSON encoding fast path for the hottest endpoints.
+
+Rows are encoded straight to JSON bytes, instead of being copied into the pydantic response models, validated
+against the route's response_model and encoded by FastAPI's generic encoder. The bytes are the same as the
+response models produce (same fields, same order, gasCostInDollars rounded to 2 decimals), so the response models
+still document these endpoints. Uses orjson when it is installed, the standard library encoder otherwise.
+"""
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+
+def _default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def transaction_dict(transaction) -> Dict[str, Any]:
+    # The fields of ProcessedTransactionResponse, in order
+    return {
+        "hash": transaction.hash,
+        "fromAddress": transaction.fromAddress,
+        "toAddress": transaction.toAddress,
+        "blockNumber": transaction.blockNumber,
+        "executedAt": transaction.executedAt,
+        "gasUsed": transaction.gasUsed,
+        "gasCostInDollars": round(transaction.gasCostInDollars, 2),
+    }
+
+
+class TransactionEncoder:
+    """
+    Encodes transactions to JSON bytes, remembering the bytes of each transaction object it encoded.
+
+    The bytes are kept for as long as the transaction object itself is alive, e.g. while the repository cache
+    holds it: the repository returns the same object for a hash until it is evicted or invalidated by a write,
+    so the cached bytes of a hash are never stale and are released together with the cached transaction.
+    Objects that cannot be weakly referenced (e.g. SQLAlchemy rows) are encoded every time.
+    """
+
+    def __init__(self):
+        self._encoded = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, transaction) -> bytes:
+        try:
+            with self._lock:
+                encoded = self._encoded.get(transaction)
+        except TypeError:
+            return dumps(transaction_dict(transaction))
+
+        if encoded is not None:
+            self.hits += 1
+            return encoded
+
+        self.misses += 1
+        encoded = dumps(transaction_dict(transaction))
+        with self._lock:
+            self._encoded[transaction] = encoded
+        return encoded
+
+    def encode_list(self, transactions: Iterable) -> bytes:
+        return b"[" + b",".join(self.encode(transaction) for transaction in transactions) + b"]"
+
+
+def transaction_page_json(encoder: TransactionEncoder, transactions: List, next_cursor: Optional[str]) -> bytes:
+    return b'{"transactions":' + encoder.encode_list(transactions) + b',"next":' + dumps(next_cursor) + b"}"
+
+
+def transaction_batch_json(encoder: TransactionEncoder, transactions: List, missing: List[str]) -> bytes:
+    return b'{"transactions":' + encoder.encode_list(transactions) + b',"missing":' + dumps(missing) + b"}"
+
+
+def stats_json(stats: Dict[str, Any]) -> bytes:
+    return dumps({
+        "totalTransactionsInDB": stats["totalTransactionsInDB"],
+        "totalGasUsed": stats["totalGasUsed"],
+        "totalGasCostInDollars": round(stats["totalGasCostInDollars"], 2),
+    })
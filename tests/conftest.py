@@ -0,0 +1,41 @@
+import pytest
+
+from database import database
+from database.database import Base, SessionLocal, ReadSessionLocal, make_engine
+
+
+def bind_database(url, monkeypatch, compact_schema=None):
+    # Point the session factories to the database at `url`. Returns a function restoring the default ones
+    default_engine, default_read_engine = database.engine, database.read_engine
+    engine = make_engine(url, compact_schema=compact_schema)
+    read_engine = make_engine(url, read_only=True, compact_schema=compact_schema)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "read_engine", read_engine)
+    SessionLocal.configure(bind=engine)
+    ReadSessionLocal.configure(bind=read_engine)
+
+    def restore():
+        SessionLocal.configure(bind=default_engine)
+        ReadSessionLocal.configure(bind=default_read_engine)
+        engine.dispose()
+        read_engine.dispose()
+
+    return engine, restore
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path, monkeypatch):
+    # A throwaway database file instead of ratedapi.db
+    engine, restore = bind_database(f"sqlite:///{tmp_path / 'test.db'}", monkeypatch)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    restore()
+
+
+@pytest.fixture
+def compact_sqlite_engine(tmp_path, monkeypatch):
+    # A throwaway database file with the compact schema: hashes and addresses stored as raw bytes
+    engine, restore = bind_database(f"sqlite:///{tmp_path / 'compact.db'}", monkeypatch, compact_schema=True)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    restore()
@@ -1,7 +1,12 @@
+import math
+import time
 import pytest
+import requests
 from datetime import datetime, timezone, timedelta
+from requests.exceptions import HTTPError
 
 from crypto_data import CoinGeckoClientWithCache
+from crypto_data.rate_limiter import TokenBucket
 
 # Mocking the response from CoinGecko to avoid real API calls
 @pytest.fixture
@@ -29,3 +34,173 @@ def test_get_future_timestamp(mock_coingecko_response):
     future_timestamp = datetime.utcnow().replace(tzinfo=timezone.utc) + timedelta(days=1)
     with pytest.raises(ValueError, match="The given timestamp is in the future!"):
         client.get('ethereum', future_timestamp)
+
+def test_get_many_matches_get(mock_coingecko_response):
+    client = CoinGeckoClientWithCache()
+    timestamps = [
+        datetime.utcfromtimestamp(1641081600).replace(tzinfo=timezone.utc),
+        datetime.utcfromtimestamp(1640995200).replace(tzinfo=timezone.utc),
+        datetime.utcfromtimestamp(1641000000).replace(tzinfo=timezone.utc),
+        datetime.utcfromtimestamp(1641100000).replace(tzinfo=timezone.utc),
+    ]
+
+    prices = client.get_many('ethereum', timestamps)
+
+    assert prices.tolist() == [200.0, 100.0, 100.0, 200.0]
+    assert prices.tolist() == [client.get('ethereum', timestamp) for timestamp in timestamps]
+
+def test_get_many_without_lower_price(mock_coingecko_response):
+    client = CoinGeckoClientWithCache()
+    timestamp = datetime.utcfromtimestamp(1640995100).replace(tzinfo=timezone.utc)
+
+    assert math.isnan(client.get_many('ethereum', [timestamp])[0])
+
+def test_fetching_the_same_range_twice_does_not_duplicate_timestamps(mock_coingecko_response):
+    client = CoinGeckoClientWithCache()
+    # No price is known before this timestamp, so every call fetches the same mocked range
+    timestamp = datetime.utcfromtimestamp(1640995100).replace(tzinfo=timezone.utc)
+
+    client.get('ethereum', timestamp)
+    client.get('ethereum', timestamp)
+
+    assert len(client.sorted_timestamps) == len(client.cache) == 2
+
+def utc(seconds: int) -> datetime:
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+def test_price_from_before_a_fetched_range_is_not_used(monkeypatch):
+    client = CoinGeckoClientWithCache()
+    fetched = []
+
+    def fetch(crypto, from_timestamp, to_timestamp):
+        fetched.append((from_timestamp, to_timestamp))
+        return {}
+
+    monkeypatch.setattr(client, "_fetch_data_from_coingecko", fetch)
+    client._add_prices({utc(1640995200): 100.0})
+    client._add_coverage(utc(1640995200), utc(1640995200 + 3600))
+
+    # A price months before the timestamp is only used if the whole range between them was fetched
+    timestamp = utc(1640995200 + 500 * 24 * 3600)
+    assert client.get('ethereum', timestamp) is None
+    assert len(fetched) == 1
+    assert fetched[0][0] <= timestamp <= fetched[0][1]
+
+def test_plan_fetches_follows_granularity_tiers():
+    client = CoinGeckoClientWithCache()
+    now = datetime.now(timezone.utc)
+
+    plan = client.plan_fetches(now - timedelta(days=400), now)
+
+    # One daily call for everything older than 90 days, one hourly call up to 1 day old, one 5 minute call
+    assert len(plan) == 3
+    assert plan[0][0] == now - timedelta(days=401)
+    assert plan[0][1] - plan[0][0] > timedelta(days=90)
+    assert plan[1][1] - plan[1][0] <= timedelta(days=90)
+    assert plan[2][1] - plan[2][0] <= timedelta(days=1)
+    assert all(previous[1] == following[0] for previous, following in zip(plan, plan[1:]))
+
+def test_plan_fetches_leaves_out_fetched_ranges():
+    client = CoinGeckoClientWithCache()
+    start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    client._add_coverage(start, start + timedelta(days=10))
+
+    assert client.plan_fetches(start + timedelta(days=1), start + timedelta(days=5)) == []
+    assert client.plan_fetches(start + timedelta(days=5), start + timedelta(days=20)) == [
+        (start + timedelta(days=10), start + timedelta(days=20))
+    ]
+
+def test_prefetch_answers_every_lookup_of_the_range(fake_coingecko_prices):
+    server, prices = fake_coingecko_prices()
+    client = CoinGeckoClientWithCache(base_url=server.base_url)
+    start, end = prices[0][0] // 1000 + 10, prices[-1][0] // 1000
+
+    assert client.prefetch('ethereum', utc(start), utc(end)) == 1
+    assert client.get_many('ethereum', [utc(start), utc(end - 10), utc(end)]).tolist() == [
+        prices[0][1], prices[-2][1], prices[-1][1]
+    ]
+    assert len(server.requests) == 1
+
+def test_prefetch_fetches_ranges_concurrently(fake_coingecko_prices):
+    server, prices = fake_coingecko_prices(latency=0.3)
+    client = CoinGeckoClientWithCache(base_url=server.base_url, max_concurrent_requests=3)
+    now = datetime.now(timezone.utc)
+
+    started_at = time.monotonic()
+    # Spans the three granularity tiers, so three calls
+    assert client.prefetch('ethereum', now - timedelta(days=400), now) == 3
+
+    assert server.max_in_flight == 3
+    assert time.monotonic() - started_at < 0.9
+
+def test_rate_limited_call_honours_retry_after(fake_coingecko_prices):
+    server, prices = fake_coingecko_prices()
+    rate_limiter = TokenBucket(rate=100, capacity=1)
+    client = CoinGeckoClientWithCache(base_url=server.base_url, rate_limiter=rate_limiter)
+    server.throttle(2, retry_after=0.2)
+
+    started_at = time.monotonic()
+    assert client.get('ethereum', utc(prices[0][0] // 1000)) == prices[0][1]
+
+    assert len(server.requests) == 3
+    assert time.monotonic() - started_at >= 0.4
+
+def test_calls_waits_and_cache_lookups_are_counted(fake_coingecko_prices):
+    from crypto_data.coingecko_client_cache import COINGECKO_REQUESTS, COINGECKO_WAIT_SECONDS, PRICE_CACHE_REQUESTS
+
+    counters = [COINGECKO_REQUESTS.labels(200), COINGECKO_REQUESTS.labels(429), COINGECKO_WAIT_SECONDS.labels(),
+                PRICE_CACHE_REQUESTS.labels("hit"), PRICE_CACHE_REQUESTS.labels("miss")]
+    before = [counter.value for counter in counters]
+    server, prices = fake_coingecko_prices()
+    client = CoinGeckoClientWithCache(base_url=server.base_url, rate_limiter=TokenBucket(rate=100, capacity=1))
+    server.throttle(1, retry_after=0.2)
+    timestamp = utc(prices[0][0] // 1000)
+
+    client.get('ethereum', timestamp)
+    client.get_many('ethereum', [timestamp, timestamp])
+
+    requests_200, requests_429, wait_seconds, hits, misses = [
+        counter.value - value for counter, value in zip(counters, before)
+    ]
+    assert (requests_200, requests_429, hits, misses) == (1, 1, 2, 1)
+    assert wait_seconds >= 0.19
+
+def test_rate_limited_call_fails_after_max_retries(fake_coingecko_prices):
+    server, prices = fake_coingecko_prices()
+    client = CoinGeckoClientWithCache(base_url=server.base_url, rate_limiter=TokenBucket(rate=100, capacity=1), max_retries=1)
+    server.throttle(2, retry_after=0)
+
+    with pytest.raises(HTTPError):
+        client.get('ethereum', utc(prices[0][0] // 1000))
+    # Nothing is recorded as fetched
+    assert len(client.coverage) == 0
+
+@pytest.mark.parametrize('retry_after, expected', [
+    (None, CoinGeckoClientWithCache.DEFAULT_RETRY_AFTER),
+    ('12', 12.),
+    ('Wed, 21 Oct 2015 07:28:00 GMT', 0.),
+    ('soon', CoinGeckoClientWithCache.DEFAULT_RETRY_AFTER),
+])
+def test_get_retry_after(retry_after, expected):
+    response = requests.Response()
+    if retry_after is not None:
+        response.headers['Retry-After'] = retry_after
+
+    assert CoinGeckoClientWithCache()._get_retry_after(response) == expected
+
+@pytest.fixture
+def fake_coingecko_prices():
+    from crypto_data.fake_coingecko import FakeCoinGeckoServer, hourly_prices
+
+    end = int((datetime.now(timezone.utc) - timedelta(days=200)).timestamp())
+    prices = hourly_prices(end - 10 * 24 * 3600, end)
+    servers = []
+
+    def start(latency: float = 0.):
+        server = FakeCoinGeckoServer(prices, latency=latency).start()
+        servers.append(server)
+        return server, prices
+
+    yield start
+    for server in servers:
+        server.stop()
@@ -65,3 +65,18 @@ def test_cache_does_not_have_partial_dates():
     # Assert cache doesn't store partial date keys
     partial_date = timestamp.strftime('%Y-%m-%d')
     assert partial_date not in crypto_converter.eth_to_usd_cache
+
+def test_get_many_delegates_to_client():
+    timestamps = [datetime.now(), datetime.now()]
+    client = Mock()
+    client.get_many.return_value = [3000.0, 3001.0]
+    crypto_converter = CryptoToUsd(client, {})
+
+    assert crypto_converter.get_many('ethereum', timestamps).tolist() == [3000.0, 3001.0]
+    client.get_many.assert_called_once_with('ethereum', timestamps)
+
+def test_get_many_invalid_crypto():
+    crypto_converter = CryptoToUsd(Mock(), {})
+
+    with pytest.raises(ValueError, match="Cryptocurrency bitcoin not supported"):
+        crypto_converter.get_many('bitcoin', [datetime.now()])
@@ -0,0 +1,32 @@
+import pytest
+
+from crypto_data.interval_set import IntervalSet
+
+def test_add_merges_overlapping_and_touching_intervals():
+    intervals = IntervalSet([(10, 20), (30, 40)])
+    intervals.add(20, 25)
+    intervals.add(50, 60)
+    assert list(intervals) == [(10, 25), (30, 40), (50, 60)]
+
+    intervals.add(15, 55)
+    assert list(intervals) == [(10, 60)]
+
+def test_add_rejects_reversed_interval():
+    with pytest.raises(ValueError):
+        IntervalSet().add(2, 1)
+
+def test_find():
+    intervals = IntervalSet([(10, 20), (30, 40)])
+    assert intervals.find(10) == (10, 20)
+    assert intervals.find(35) == (30, 40)
+    assert intervals.find(25) is None
+    assert 40 in intervals
+    assert 41 not in intervals
+    assert 5 not in intervals
+
+def test_gaps():
+    intervals = IntervalSet([(10, 20), (30, 40)])
+    assert intervals.gaps(0, 50) == [(0, 10), (20, 30), (40, 50)]
+    assert intervals.gaps(12, 35) == [(20, 30)]
+    assert intervals.gaps(12, 18) == []
+    assert IntervalSet().gaps(0, 5) == [(0, 5)]
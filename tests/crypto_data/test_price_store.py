@@ -0,0 +1,69 @@
+import json
+import pytest
+from datetime import datetime, timezone, timedelta
+
+from crypto_data import CoinGeckoClientWithCache
+from crypto_data.fake_coingecko import FakeCoinGeckoServer, hourly_prices
+from crypto_data.import_prices import import_price_dump
+from database import SqlPriceStore
+
+# Ten days of hourly prices, ending a hundred days ago
+END = int((datetime.now(timezone.utc) - timedelta(days=100)).timestamp())
+START = END - 10 * 24 * 3600
+PRICES = hourly_prices(START, END)
+
+
+def utc(seconds: int) -> datetime:
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+@pytest.fixture
+def fake_coingecko():
+    with FakeCoinGeckoServer(PRICES) as server:
+        yield server
+
+def test_store_round_trip(sqlite_engine):
+    store = SqlPriceStore()
+    store.save('ethereum', {utc(START): 1800.0, utc(START + 3600): 1801.5}, utc(START - 60), utc(START + 3600))
+
+    prices, coverage = store.load('ethereum')
+
+    assert prices == {utc(START): 1800.0, utc(START + 3600): 1801.5}
+    assert coverage == [(utc(START - 60), utc(START + 3600))]
+    assert store.load('bitcoin') == ({}, [])
+
+def test_client_fetches_from_fake_coingecko_and_persists(sqlite_engine, fake_coingecko):
+    client = CoinGeckoClientWithCache(price_store=SqlPriceStore(), base_url=fake_coingecko.base_url)
+
+    assert client.get('ethereum', utc(START + 2 * 3600 + 10)) == PRICES[2][1]
+    assert len(fake_coingecko.requests) == 1
+
+    prices, coverage = SqlPriceStore().load('ethereum')
+    assert len(prices) == len(PRICES)
+    assert len(coverage) == 1
+
+def test_restart_issues_no_calls_for_stored_ranges(sqlite_engine, fake_coingecko):
+    CoinGeckoClientWithCache(price_store=SqlPriceStore(), base_url=fake_coingecko.base_url).get('ethereum', utc(START + 10))
+
+    restarted_client = CoinGeckoClientWithCache(price_store=SqlPriceStore(), base_url=fake_coingecko.base_url)
+    assert restarted_client.get('ethereum', utc(PRICES[-1][0] // 1000 - 10)) == PRICES[-2][1]
+    assert restarted_client.get_many('ethereum', [utc(START + 10), utc(PRICES[-1][0] // 1000)]).tolist() == [PRICES[0][1], PRICES[-1][1]]
+    assert len(fake_coingecko.requests) == 1
+
+def test_imported_dump_seeds_the_store(sqlite_engine, fake_coingecko, tmp_path):
+    dump = tmp_path / 'prices.json'
+    dump.write_text(json.dumps({'prices': [[timestamp, price] for timestamp, price in PRICES]}))
+
+    assert import_price_dump(SqlPriceStore(), str(dump)) == len(PRICES)
+
+    client = CoinGeckoClientWithCache(price_store=SqlPriceStore(), base_url=fake_coingecko.base_url)
+    prices = client.get_many('ethereum', [utc(START + 10), utc(PRICES[-1][0] // 1000)])
+    assert prices.tolist() == [PRICES[0][1], PRICES[-1][1]]
+    assert fake_coingecko.requests == []
+
+def test_imported_csv_dump(sqlite_engine, tmp_path):
+    dump = tmp_path / 'prices.csv'
+    dump.write_text("timestamp,price\n" + "\n".join(f"{timestamp},{price}" for timestamp, price in PRICES[:3]))
+
+    assert import_price_dump(SqlPriceStore(), str(dump)) == 3
+    prices, coverage = SqlPriceStore().load('ethereum')
+    assert coverage == [(utc(PRICES[0][0] // 1000), utc(PRICES[2][0] // 1000))]
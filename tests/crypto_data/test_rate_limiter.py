@@ -0,0 +1,45 @@
+import pytest
+
+from crypto_data.rate_limiter import TokenBucket
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+def test_burst_up_to_capacity_then_rate(clock):
+    limiter = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+
+    assert [limiter.acquire() for _ in range(5)] == [0, 0, 0, 0.5, 0.5]
+
+def test_tokens_refill_over_time(clock):
+    limiter = TokenBucket(rate=1, capacity=2, clock=clock, sleep=clock.sleep)
+    limiter.acquire()
+    limiter.acquire()
+
+    clock.now += 10
+    # Refilled up to the capacity only
+    assert [limiter.acquire() for _ in range(3)] == [0, 0, 1]
+
+def test_pause_delays_every_caller(clock):
+    limiter = TokenBucket(rate=10, capacity=5, clock=clock, sleep=clock.sleep)
+    limiter.pause(30)
+
+    assert limiter.acquire() == 30
+    assert limiter.acquire() == 0
+
+@pytest.mark.parametrize('options', [{'rate': 0, 'capacity': 1}, {'rate': 1, 'capacity': 0}])
+def test_rejects_invalid_limits(options):
+    with pytest.raises(ValueError):
+        TokenBucket(**options)
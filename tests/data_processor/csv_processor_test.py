@@ -1,3 +1,4 @@
+import itertools
 import pytest
 from datetime import datetime, timezone
 from unittest.mock import Mock, patch, call
@@ -39,6 +40,7 @@ def mock_csv_stream(*rows):
 def mock_crypto_to_usd_instance():
     instance = Mock()
     instance.get.return_value = 3000  # mock value for ETH to USD
+    instance.get_many.side_effect = lambda crypto, timestamps: [3000] * len(timestamps)
     return instance
 
 @pytest.fixture
@@ -51,8 +53,9 @@ def csv_processor(mock_crypto_to_usd_instance, mock_db_repository):
 
 def test_csv_processor_process_valid_transaction(csv_processor):
     with patch.object(csv_processor, 'csv_stream', return_value=mock_csv_stream(SAMPLE_ROW)):
-        csv_processor.process('sample.csv')
-        csv_processor.db_repository.create.assert_called_once()
+        assert csv_processor.process('sample.csv') == 1
+        csv_processor.db_repository.create_many.assert_called_once()
+        assert len(csv_processor.db_repository.create_many.call_args.args[0]) == 1
 
 def test_csv_processor_process_validation_error(csv_processor):
     invalid_transaction = dict(SAMPLE_ROW)
@@ -60,7 +63,100 @@ def test_csv_processor_process_validation_error(csv_processor):
 
     with patch.object(csv_processor, 'csv_stream', return_value=mock_csv_stream(invalid_transaction)):
         csv_processor.process('sample.csv')
-        csv_processor.db_repository.create.assert_not_called()
+        csv_processor.db_repository.create_many.assert_not_called()
+
+def test_csv_processor_process_flushes_full_batches(mock_crypto_to_usd_instance, mock_db_repository):
+    csv_processor = CsvProcessor(mock_crypto_to_usd_instance, mock_db_repository, batch_size=2)
+    rows = [dict(SAMPLE_ROW, hash=f'hash_{i}') for i in range(5)]
+
+    with patch.object(csv_processor, 'csv_stream', return_value=mock_csv_stream(*rows)):
+        assert csv_processor.process('sample.csv') == 5
+
+    batch_sizes = [len(c.args[0]) for c in mock_db_repository.create_many.call_args_list]
+    assert batch_sizes == [2, 2, 1]
+
+def test_csv_processor_process_flushes_on_timeout(mock_crypto_to_usd_instance, mock_db_repository):
+    csv_processor = CsvProcessor(mock_crypto_to_usd_instance, mock_db_repository, batch_size=100, batch_timeout=0.5)
+    rows = [dict(SAMPLE_ROW, hash=f'hash_{i}') for i in range(3)]
+
+    # Every clock reading is one second after the previous one, so each row exceeds the timeout
+    with patch.object(csv_processor, 'csv_stream', return_value=mock_csv_stream(*rows)), \
+            patch('data_processor.csv_processor.monotonic', side_effect=itertools.count()):
+        csv_processor.process('sample.csv')
+
+    assert mock_db_repository.create_many.call_count == 3
+
+def test_csv_processor_skips_known_hashes(mock_crypto_to_usd_instance, mock_db_repository):
+    mock_db_repository.get_all_hashes.return_value = {'hash_0'}
+    csv_processor = CsvProcessor(mock_crypto_to_usd_instance, mock_db_repository, on_conflict='ignore', skip_known_hashes=True)
+    rows = [dict(SAMPLE_ROW, hash=f'hash_{i}') for i in (0, 1, 1)]
+
+    with patch.object(csv_processor, 'csv_stream', return_value=mock_csv_stream(*rows)):
+        assert csv_processor.process('sample.csv') == 1
+
+    written = mock_db_repository.create_many.call_args.args[0]
+    assert [transaction.hash for transaction in written] == ['hash_1']
+    assert mock_db_repository.create_many.call_args.kwargs == {'on_conflict': 'ignore'}
+    # Skipped rows are never priced
+    assert len(mock_crypto_to_usd_instance.get_many.call_args.args[1]) == 1
+
+def test_csv_processor_prefetches_prices_over_the_file_timestamps(mock_crypto_to_usd_instance, mock_db_repository, tmp_path):
+    csv_file = tmp_path / 'transactions.csv'
+    rows = [dict(SAMPLE_ROW, hash=f'hash_{i}', block_timestamp=f'2023-08-01 07:0{i}:00.000000 UTC') for i in (3, 1, 2)]
+    csv_file.write_text(','.join(SAMPLE_ROW) + '\n' + '\n'.join(
+        ','.join('' if value is None else str(value) for value in row.values()) for row in rows
+    ) + '\n')
+    csv_processor = CsvProcessor(mock_crypto_to_usd_instance, mock_db_repository, prefetch_prices=True)
+
+    assert csv_processor.process(str(csv_file)) == 3
+
+    mock_crypto_to_usd_instance.prefetch.assert_called_once_with(
+        'ethereum', datetime(2023, 8, 1, 7, 1, tzinfo=timezone.utc), datetime(2023, 8, 1, 7, 3, tzinfo=timezone.utc)
+    )
+
+@pytest.mark.parametrize('skip_known_hashes', [False, True])
+def test_csv_processor_fast_decode_writes_the_same_transactions(mock_crypto_to_usd_instance, tmp_path, skip_known_hashes):
+    csv_file = tmp_path / 'transactions.csv'
+    rows = [dict(SAMPLE_ROW, hash=f'hash_{i % 4}', block_number=i) for i in range(6)]
+    rows.insert(2, dict(SAMPLE_ROW, hash='invalid', gas='not a number'))
+    csv_file.write_text(','.join(SAMPLE_ROW) + '\n' + '\n'.join(
+        ','.join('' if value is None else str(value) for value in row.values()) for row in rows
+    ) + '\n\n')
+    written = []
+    for fast_decode in (False, True):
+        repository = Mock()
+        repository.get_all_hashes.return_value = {'hash_3'}
+        csv_processor = CsvProcessor(mock_crypto_to_usd_instance, repository, batch_size=2,
+                                     skip_known_hashes=skip_known_hashes, fast_decode=fast_decode)
+        csv_processor.DECODE_BATCH_SIZE = 3
+
+        csv_processor.process(str(csv_file))
+
+        written.append([(t.hash, t.blockNumber, t.executedAt, t.gasUsed, t.gasCostInDollars)
+                        for c in repository.create_many.call_args_list for t in c.args[0]])
+        assert csv_processor.rows_skipped == (3 if skip_known_hashes else 0)
+
+    assert written[0] == written[1]
+    assert len(written[1]) == (3 if skip_known_hashes else 6)
+
+def test_csv_processor_prefetch_failure_is_not_fatal(mock_crypto_to_usd_instance, mock_db_repository):
+    mock_crypto_to_usd_instance.prefetch.side_effect = ConnectionError("CoinGecko is down")
+    csv_processor = CsvProcessor(mock_crypto_to_usd_instance, mock_db_repository, prefetch_prices=True)
+
+    with patch.object(csv_processor, 'timestamp_range', return_value=(datetime(2022, 1, 1), datetime(2022, 1, 2))), \
+            patch.object(csv_processor, 'csv_stream', return_value=mock_csv_stream(SAMPLE_ROW)):
+        assert csv_processor.process('sample.csv') == 1
+
+    mock_crypto_to_usd_instance.prefetch.assert_called_once()
+
+@pytest.mark.parametrize('options', [{'batch_size': 0}, {'batch_timeout': 0}])
+def test_csv_processor_rejects_invalid_batching(mock_crypto_to_usd_instance, mock_db_repository, options):
+    with pytest.raises(ValueError, match="must be a positive"):
+        CsvProcessor(mock_crypto_to_usd_instance, mock_db_repository, **options)
+
+def test_csv_processor_rejects_skip_known_hashes_with_update(mock_crypto_to_usd_instance, mock_db_repository):
+    with pytest.raises(ValueError, match="cannot be combined with on_conflict='update'"):
+        CsvProcessor(mock_crypto_to_usd_instance, mock_db_repository, on_conflict='update', skip_known_hashes=True)
 
 def test_csv_processor_process_generic_error(csv_processor):
     with patch.object(csv_processor, 'csv_stream', side_effect=Exception("Generic error")):
@@ -71,3 +167,32 @@ def test_compute_gas_cost_in_usd(csv_processor):
     raw_transaction = RawTransaction(**SAMPLE_TRANSACTION)
     result = csv_processor.compute_gas_cost_in_usd(raw_transaction)
     assert result == 6  # Given the mock values: 2 (gas in eth) * 3000 (eth to usd mock value)
+
+def test_compute_gas_costs_in_usd_prices_a_block_at_once(csv_processor):
+    gas = [(2000000, 1000000000), (295582, 23759870228), (30000000, 10**12)]
+    transactions = [
+        RawTransaction(**dict(SAMPLE_TRANSACTION, receipts_gas_used=gas_used, receipts_effective_gas_price=gas_price))
+        for gas_used, gas_price in gas
+    ]
+
+    result = csv_processor.compute_gas_costs_in_usd(transactions)
+
+    # gas used * gas price in wei overflows int64 for the last transaction
+    assert result.tolist() == pytest.approx([gas_used * gas_price / 1e18 * 3000 for gas_used, gas_price in gas])
+    csv_processor.crypto_to_usd_instance.get_many.assert_called_once()
+
+def test_compute_gas_costs_in_usd_missing_price(csv_processor):
+    csv_processor.crypto_to_usd_instance.get_many.side_effect = lambda crypto, timestamps: [float('nan')] * len(timestamps)
+
+    with pytest.raises(ValueError, match="No ETH to USD price known"):
+        csv_processor.compute_gas_costs_in_usd([RawTransaction(**SAMPLE_TRANSACTION)])
+
+@pytest.mark.parametrize('content, rows', [
+    ('hash\n', 0),
+    ('hash\n0x01\n0x02\n', 2),
+    ('hash\n0x01\n0x02', 2),
+])
+def test_count_rows(csv_processor, tmp_path, content, rows):
+    path = tmp_path / 'transactions.csv'
+    path.write_text(content)
+    assert csv_processor.count_rows(str(path)) == rows
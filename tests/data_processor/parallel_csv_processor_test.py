@@ -0,0 +1,117 @@
+import csv
+import os
+import pytest
+from unittest.mock import Mock
+
+from data_processor import ParallelCsvProcessor
+from data_processor import parallel_csv_processor
+from data_processor.parallel_csv_processor import split_file, parse_chunks
+from tests.data_processor.csv_processor_test import SAMPLE_ROW
+
+CSV_ROW = dict(SAMPLE_ROW, block_timestamp='2023-08-01 07:04:59.000000 UTC', max_fee_per_gas='', max_priority_fee_per_gas='',
+               receipts_contract_address='', receipts_root='')
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / 'transactions.csv'
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(CSV_ROW))
+        writer.writeheader()
+        for i in range(50):
+            writer.writerow(dict(CSV_ROW, hash=f'hash_{i}'))
+        writer.writerow(dict(CSV_ROW, hash='invalid', nonce='not a number'))
+    return str(path)
+
+@pytest.fixture
+def mock_crypto_to_usd_instance():
+    instance = Mock()
+    instance.get_many.side_effect = lambda crypto, timestamps: [3000] * len(timestamps)
+    return instance
+
+def test_split_file_covers_every_line_once(csv_file):
+    fieldnames, chunks = split_file(csv_file, chunk_size=100)
+
+    assert fieldnames == list(CSV_ROW)
+    assert len(chunks) > 1
+
+    with open(csv_file, 'rb') as csvfile:
+        content = csvfile.read()
+    lines = b''.join(content[start:end] for start, end in chunks).splitlines()
+    assert lines == content.splitlines()[1:]
+
+@pytest.mark.parametrize('fast_decode', [False, True])
+def test_parallel_processor_writes_all_valid_rows(csv_file, mock_crypto_to_usd_instance, fast_decode):
+    repository = Mock()
+    processor = ParallelCsvProcessor(mock_crypto_to_usd_instance, repository, workers=3, chunk_size=500, batch_size=7,
+                                     fast_decode=fast_decode)
+
+    assert processor.process(csv_file) == 50
+
+    written = [transaction.hash for c in repository.create_many.call_args_list for transaction in c.args[0]]
+    assert sorted(written) == sorted(f'hash_{i}' for i in range(50))
+    assert all(len(c.args[0]) <= 7 for c in repository.create_many.call_args_list)
+
+@pytest.mark.parametrize('fast_decode', [False, True])
+def test_parallel_processor_skips_known_hashes(csv_file, mock_crypto_to_usd_instance, fast_decode):
+    repository = Mock()
+    repository.get_all_hashes.return_value = {f'hash_{i}' for i in range(40)}
+    processor = ParallelCsvProcessor(mock_crypto_to_usd_instance, repository, workers=2, chunk_size=500, skip_known_hashes=True,
+                                     fast_decode=fast_decode)
+
+    assert processor.process(csv_file) == 10
+    assert processor.rows_skipped == 40
+
+def test_parallel_processor_surfaces_writer_errors(csv_file, mock_crypto_to_usd_instance):
+    repository = Mock()
+    repository.create_many.side_effect = RuntimeError("database is locked")
+    processor = ParallelCsvProcessor(mock_crypto_to_usd_instance, repository, workers=2, chunk_size=500)
+
+    with pytest.raises(RuntimeError, match="database is locked"):
+        processor.process(csv_file)
+
+def test_parallel_processor_fails_when_a_worker_dies(csv_file, mock_crypto_to_usd_instance, monkeypatch):
+    # Simulate a worker killed by the OS, which never reports back
+    monkeypatch.setattr(parallel_csv_processor, 'parse_chunks', lambda *args: os._exit(1))
+    processor = ParallelCsvProcessor(mock_crypto_to_usd_instance, Mock(), workers=2, chunk_size=500)
+    processor.WORKER_POLL_INTERVAL = 0.1
+
+    with pytest.raises(RuntimeError, match="exited unexpectedly with exit code"):
+        processor.process(csv_file)
+
+def test_parallel_processor_fails_when_a_worker_exits_without_reporting(csv_file, mock_crypto_to_usd_instance, monkeypatch):
+    monkeypatch.setattr(parallel_csv_processor, 'parse_chunks', lambda *args: None)
+    processor = ParallelCsvProcessor(mock_crypto_to_usd_instance, Mock(), workers=2, chunk_size=500)
+    processor.WORKER_POLL_INTERVAL = 0.1
+
+    with pytest.raises(RuntimeError, match="exited without reporting"):
+        processor.process(csv_file)
+
+@pytest.mark.parametrize('fast_decode', [False, True])
+def test_parse_chunks_only_splits_rows_on_newlines(tmp_path, fast_decode):
+    path = tmp_path / 'transactions.csv'
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(CSV_ROW))
+        writer.writeheader()
+        writer.writerow(dict(CSV_ROW, hash='hash_0', receipts_root='root\x0bwith\u2028separators\x1c'))
+        writer.writerow(dict(CSV_ROW, hash='hash_1'))
+
+    fieldnames, chunks = split_file(str(path), chunk_size=1 << 20)
+    task_queue, result_queue = FakeQueue(chunks + [None]), FakeQueue()
+
+    parse_chunks(str(path), fieldnames, task_queue, result_queue, None, 100, fast_decode)
+
+    (rows_message, parsed), done_message = result_queue.items
+    assert [transaction.hash for transaction in parsed] == ['hash_0', 'hash_1']
+    assert done_message == ('done', (0, 0))
+
+
+class FakeQueue:
+    def __init__(self, items=None):
+        self.items = list(items or [])
+
+    def get(self):
+        return self.items.pop(0)
+
+    def put(self, item):
+        self.items.append(item)
@@ -0,0 +1,76 @@
+import pytest
+from pydantic import ValidationError
+
+from data_processor import RawTransaction, RowDecoder
+from data_processor.raw_transaction import ParsedTransaction
+from data_processor.row_decoder import CHECKED_INT_COLUMNS, OPTIONAL_INT_COLUMNS, UNCHECKED_COLUMNS
+from tests.data_processor.parallel_csv_processor_test import CSV_ROW
+
+FIELDNAMES = list(CSV_ROW)
+
+
+def as_row(values: dict) -> list:
+    return ['' if values[name] is None else str(values[name]) for name in FIELDNAMES]
+
+def raw_transaction_or_none(row: list):
+    try:
+        return RawTransaction(**dict(zip(FIELDNAMES, row)))
+    except ValidationError:
+        return None
+
+def test_every_column_of_raw_transaction_is_decoded_or_checked():
+    columns = set(ParsedTransaction._fields + CHECKED_INT_COLUMNS + OPTIONAL_INT_COLUMNS + UNCHECKED_COLUMNS)
+    assert columns == set(RawTransaction.model_fields)
+
+@pytest.mark.parametrize('column, value', [
+    ('hash', ''),
+    ('nonce', 'not a number'),
+    ('nonce', '1.0'),
+    ('value', ''),
+    ('value', '1e3'),
+    ('gas', ' 21000'),
+    ('block_number', '1.5'),
+    ('block_number', '-1'),
+    ('receipts_status', ''),
+    ('receipts_gas_used', '0x10'),
+    ('receipts_effective_gas_price', '1_000'),
+    ('max_fee_per_gas', ' 5'),
+    ('max_fee_per_gas', '5.0'),
+    ('max_priority_fee_per_gas', 'x'),
+    ('to_address', ''),
+    ('receipts_root', 'anything'),
+    ('block_timestamp', '2023-08-01 07:04:59.000000 UTC'),
+    ('block_timestamp', '2022-01-01T00:00:00Z'),
+    ('block_timestamp', '1690873499'),
+    ('block_timestamp', '2023-08-01 25:04:59.000000 UTC'),
+    ('block_timestamp', 'yesterday'),
+])
+def test_rows_are_rejected_exactly_when_raw_transaction_rejects_them(column, value):
+    row = as_row(dict(CSV_ROW, **{column: value}))
+    expected = raw_transaction_or_none(row)
+
+    transactions, rejected = RowDecoder(FIELDNAMES).decode([row])
+
+    if expected is None:
+        assert transactions == [] and [rejected_row for rejected_row, _ in rejected] == [row]
+        assert rejected[0][1].startswith(column)
+    else:
+        assert rejected == []
+        assert transactions == [ParsedTransaction.from_raw_transaction(expected)]
+
+def test_batches_keep_the_order_of_their_valid_rows():
+    # Columns in another order than RawTransaction, and an extra one
+    fieldnames = ['extra'] + FIELDNAMES[::-1]
+    rows = [['x'] + as_row(dict(CSV_ROW, hash=f'hash_{i}', block_number=i))[::-1] for i in range(6)]
+    rows[1][fieldnames.index('nonce')] = 'not a number'
+    rows[4] = rows[4][:5]
+
+    transactions, rejected = RowDecoder(fieldnames).decode(rows)
+
+    assert [(t.hash, t.block_number) for t in transactions] == [(f'hash_{i}', i) for i in (0, 2, 3, 5)]
+    assert [(row[fieldnames.index('hash')], reason.split(':')[0]) for row, reason in rejected[1:]] == [('hash_1', 'nonce')]
+    assert rejected[0] == (rows[4], '5 values for 21 columns')
+
+def test_a_header_without_every_column_is_refused():
+    with pytest.raises(ValueError, match="lacks the columns max_fee_per_gas"):
+        RowDecoder([name for name in FIELDNAMES if name != 'max_fee_per_gas'])
@@ -0,0 +1,68 @@
+import pytest
+
+from database import SqlRepository
+from database.in_memory_repository import InMemoryRepository
+
+from .test_aggregates import assert_consistent
+from .test_sql_repository import make_transaction
+
+
+def make_transfer(hash: str, sender: str, receiver: str, gas_used: int, gas_cost: float):
+    transaction = make_transaction(hash, gas_used=gas_used, gas_cost=gas_cost)
+    transaction.fromAddress = sender
+    transaction.toAddress = receiver
+    return transaction
+
+TRANSFERS = [
+    make_transfer('0x01', '0xa', '0xb', 100, 1.),
+    make_transfer('0x02', '0xa', '0xc', 200, 2.),
+    make_transfer('0x03', '0xb', '0xa', 400, 8.),
+    make_transfer('0x04', '0xc', '0xa', 50, 0.5),
+]
+
+@pytest.fixture(params=['sql', 'in_memory'])
+def repository(request):
+    if request.param == 'sql':
+        request.getfixturevalue('sqlite_engine')
+        repository = SqlRepository()
+    else:
+        repository = InMemoryRepository()
+    repository.create_many(TRANSFERS)
+    return repository
+
+def test_address_stats(repository):
+    assert repository.get_address_stats('0xa') == {
+        'address': '0xa', 'transactionsSent': 2, 'transactionsReceived': 2, 'gasUsed': 300, 'gasCostInDollars': 3.
+    }
+    assert repository.get_address_stats('0xd') is None
+
+@pytest.mark.parametrize('by, expected', [
+    ('gasCost', ['0xb', '0xa', '0xc']),
+    ('gasUsed', ['0xb', '0xa', '0xc']),
+    # Ties are ordered by address
+    ('transactions', ['0xa', '0xc', '0xb']),
+])
+def test_top_addresses(repository, by, expected):
+    assert [stats['address'] for stats in repository.get_top_addresses(by, 10)] == expected
+    assert [stats['address'] for stats in repository.get_top_addresses(by, 2)] == expected[:2]
+
+def test_top_addresses_rejects_unknown_rankings(repository):
+    with pytest.raises(ValueError):
+        repository.get_top_addresses('value', 10)
+
+def test_overwrite_moves_a_transaction_between_addresses(sqlite_engine):
+    repository = SqlRepository()
+    repository.create_many(TRANSFERS)
+
+    repository.create_many([make_transfer('0x04', '0xd', '0xa', 50, 0.5)], on_conflict='update')
+
+    # 0xc only received a transaction, it is no longer a sender
+    assert repository.get_address_stats('0xc')['transactionsSent'] == 0
+    assert repository.get_address_stats('0xd')['gasUsed'] == 50
+    assert [stats['address'] for stats in repository.get_top_addresses('gasCost', 10)] == ['0xb', '0xa', '0xd']
+    assert_consistent()
+
+    repository.create_many([make_transfer('0x02', '0xa', '0xb', 200, 2.)], on_conflict='update')
+    # Emptied rows are kept with zero totals
+    assert repository.get_address_stats('0xc') is None
+    assert_consistent()
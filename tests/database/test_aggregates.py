@@ -0,0 +1,86 @@
+import pytest
+from datetime import datetime
+
+from database import SqlRepository, TransactionStats, get_db_session
+from database import maintenance
+from database.aggregates import check_aggregates
+
+from .test_sql_repository import make_transaction
+
+
+def assert_consistent():
+    with get_db_session() as session:
+        consistent, stored, actual, mismatches = check_aggregates(session)
+    assert consistent, (stored, actual, mismatches)
+
+@pytest.mark.parametrize('on_conflict', [None, 'ignore', 'update'])
+def test_stats_follow_every_write(sqlite_engine, on_conflict):
+    repository = SqlRepository(batch_size=2)
+    repository.create(make_transaction('0x01', gas_used=100, gas_cost=1.))
+    repository.create(make_transaction('0x01', gas_used=100, gas_cost=1.))
+
+    repository.create_many([
+        make_transaction('0x01', gas_used=300, gas_cost=3.),
+        make_transaction('0x02', gas_used=200, gas_cost=2.),
+        make_transaction('0x03', gas_used=400, gas_cost=4.),
+        make_transaction('0x03', gas_used=500, gas_cost=5.),
+    ], on_conflict=on_conflict)
+
+    expected = {
+        None: (3, 100 + 200 + 400),
+        'ignore': (3, 100 + 200 + 400),
+        'update': (3, 300 + 200 + 500),
+    }[on_conflict]
+    stats = repository.get_stats()
+    assert (stats['totalTransactionsInDB'], stats['totalGasUsed']) == expected
+    assert_consistent()
+
+def test_get_stats_reads_the_aggregates_without_scanning(sqlite_engine):
+    repository = SqlRepository()
+    repository.create_many([make_transaction('0x01'), make_transaction('0x02')])
+
+    # A row written behind the repository's back is not counted until the aggregates are rebuilt
+    with get_db_session() as session:
+        session.add(make_transaction('0x03'))
+
+    assert repository.get_stats()['totalTransactionsInDB'] == 2
+    assert maintenance.check() is False
+
+    maintenance.rebuild()
+    assert repository.get_stats()['totalTransactionsInDB'] == 3
+    assert maintenance.check() is True
+
+def test_aggregates_are_built_for_databases_written_without_them(sqlite_engine):
+    with get_db_session() as session:
+        session.add(make_transaction('0x01', gas_used=100))
+        session.add(make_transaction('0x02', gas_used=200))
+
+    repository = SqlRepository()
+    assert repository.get_stats()['totalGasUsed'] == 300
+
+    with get_db_session() as session:
+        session.query(TransactionStats).delete()
+    # The first write builds them too, including its own rows
+    repository.create_many([make_transaction('0x03', gas_used=400)])
+    assert repository.get_stats()['totalGasUsed'] == 700
+    assert_consistent()
+
+def test_empty_database_stats(sqlite_engine):
+    assert SqlRepository().get_stats() == {'totalTransactionsInDB': 0, 'totalGasUsed': 0, 'totalGasCostInDollars': 0.}
+    assert_consistent()
+
+def test_overwrite_moves_a_transaction_between_rollups(sqlite_engine):
+    repository = SqlRepository()
+    moved = make_transaction('0x01', gas_used=100)
+    repository.create_many([moved])
+
+    moved = make_transaction('0x01', gas_used=150)
+    moved.executedAt = datetime(2023, 8, 2, 10, 30)
+    moved.blockNumber += 1
+    repository.create_many([moved], on_conflict='update')
+
+    assert repository.get_timeseries(datetime(2023, 8, 1), datetime(2023, 8, 3), 'hour') == [
+        {'bucketStart': datetime(2023, 8, 2, 10), 'transactionCount': 1, 'gasUsed': 150, 'gasCostInDollars': 1.5}
+    ]
+    assert [point['fromBlock'] for point in repository.get_block_stats(0, 10 ** 9, 1)] == [moved.blockNumber]
+    assert_consistent()
@@ -0,0 +1,34 @@
+import pytest
+
+from database.bloom_filter import BloomFilter
+
+
+def test_no_false_negatives_and_bounded_false_positives():
+    bloom_filter = BloomFilter(capacity=10000, false_positive_rate=0.01)
+    stored = [f'0x{i:064x}' for i in range(10000)]
+    bloom_filter.add_many(stored[:5000])
+    for hash in stored[5000:]:
+        bloom_filter.add(hash)
+
+    assert all(hash in bloom_filter for hash in stored)
+    false_positives = sum(f'0x{i:064x}' in bloom_filter for i in range(10000, 30000))
+    assert false_positives / 20000 < 0.02
+    assert bloom_filter.estimated_false_positive_rate() == pytest.approx(0.01, rel=0.1)
+
+def test_bulk_and_single_adds_set_the_same_bits():
+    bulk, single = BloomFilter(1000), BloomFilter(1000)
+    bulk.add_many(['a', 'b', 'c'])
+    for key in ['a', 'b', 'c']:
+        single.add(key)
+
+    assert bulk._bits == single._bits
+    assert bulk.count == single.count == 3
+
+def test_memory_follows_the_false_positive_rate():
+    assert BloomFilter(1000000, 0.01).memory_bytes == pytest.approx(1.2e6, rel=0.01)
+    assert BloomFilter(1000000, 0.001).memory_bytes == pytest.approx(1.8e6, rel=0.01)
+
+@pytest.mark.parametrize('capacity, false_positive_rate', [(0, 0.01), (10, 0), (10, 1)])
+def test_rejects_invalid_sizes(capacity, false_positive_rate):
+    with pytest.raises(ValueError):
+        BloomFilter(capacity, false_positive_rate)
@@ -0,0 +1,44 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from database import CachingRepository, SqlRepository
+
+from .test_sql_repository import make_transaction
+
+
+@pytest.fixture
+def repository(sqlite_engine):
+    repository = CachingRepository(SqlRepository(), max_entries=10)
+    repository.create_many([make_transaction('0x01', gas_used=100), make_transaction('0x02', gas_used=200)])
+    return repository
+
+def test_hot_lookups_are_served_from_memory(repository, monkeypatch):
+    assert repository.get_by_hash('0x01').gasUsed == 100
+
+    monkeypatch.setattr(repository.repository, 'get_by_hash', MagicMock(side_effect=AssertionError))
+    assert repository.get_by_hash('0x01').gasUsed == 100
+    assert repository.cache_stats()['hits'] == 1
+
+def test_missing_hashes_are_not_cached(repository):
+    assert repository.get_by_hash('0x03') is None
+    repository.create(make_transaction('0x03'))
+    assert repository.get_by_hash('0x03') is not None
+
+def test_writes_invalidate_cached_transactions(repository):
+    repository.get_by_hash('0x01')
+
+    repository.create_many([make_transaction('0x01', gas_used=300)], on_conflict='update')
+
+    assert repository.get_by_hash('0x01').gasUsed == 300
+
+def test_batch_lookups_share_the_cache(repository, monkeypatch):
+    repository.get_by_hash('0x01')
+    get_many_by_hash = MagicMock(wraps=repository.repository.get_many_by_hash)
+    monkeypatch.setattr(repository.repository, 'get_many_by_hash', get_many_by_hash)
+
+    found = repository.get_many_by_hash(['0x01', '0x02', '0x03'])
+
+    assert set(found) == {'0x01', '0x02'}
+    get_many_by_hash.assert_called_once_with(['0x02', '0x03'])
+    assert repository.get_by_hash('0x02').gasUsed == 200
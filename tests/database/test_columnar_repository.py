@@ -0,0 +1,212 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from database.columnar_repository import ColumnarRepository
+from database.in_memory_repository import InMemoryRepository
+from database.irepository import TransactionFilter
+from database.processed_transaction import ProcessedTransaction
+
+
+def make_hash(number: int) -> str:
+    return f"0x{number:064x}"
+
+def make_address(number: int) -> str:
+    return f"0x{number:040x}"
+
+def make_transactions(count: int, seed: int = 0):
+    generator = random.Random(seed)
+    start = datetime(2023, 8, 1)
+    return [
+        ProcessedTransaction(
+            hash=make_hash(generator.getrandbits(256)),
+            fromAddress=make_address(generator.randrange(20)),
+            # Contract creations have no receiver
+            toAddress=make_address(generator.randrange(20)) if generator.random() > 0.05 else "",
+            blockNumber=17818000 + generator.randrange(50),
+            executedAt=start + timedelta(seconds=generator.randrange(3 * 24 * 3600)),
+            gasUsed=generator.randrange(21000, 500000),
+            gasCostInDollars=round(generator.uniform(0.1, 50), 6),
+        )
+        for _ in range(count)
+    ]
+
+def as_tuple(transaction):
+    return (transaction.hash, transaction.fromAddress, transaction.toAddress, transaction.blockNumber,
+            transaction.executedAt, transaction.gasUsed, transaction.gasCostInDollars)
+
+def assert_same_aggregates(columnar, reference):
+    stats, expected = columnar.get_stats(), reference.get_stats()
+    assert stats["totalTransactionsInDB"] == expected["totalTransactionsInDB"]
+    assert stats["totalGasUsed"] == expected["totalGasUsed"]
+    assert stats["totalGasCostInDollars"] == pytest.approx(expected["totalGasCostInDollars"])
+
+    start, end = datetime(2023, 8, 1, 5, 30), datetime(2023, 8, 3, 12)
+    for bucket in ("hour", "day"):
+        timeseries, expected = columnar.get_timeseries(start, end, bucket), reference.get_timeseries(start, end, bucket)
+        assert [(row["bucketStart"], row["transactionCount"], row["gasUsed"]) for row in timeseries] == \
+               [(row["bucketStart"], row["transactionCount"], row["gasUsed"]) for row in expected]
+
+    blocks, expected = columnar.get_block_stats(17818003, 17818041, 10), reference.get_block_stats(17818003, 17818041, 10)
+    assert [(row["fromBlock"], row["toBlock"], row["transactionCount"], row["gasUsed"]) for row in blocks] == \
+           [(row["fromBlock"], row["toBlock"], row["transactionCount"], row["gasUsed"]) for row in expected]
+
+    for by in ("gasCost", "gasUsed", "transactions"):
+        top, expected = columnar.get_top_addresses(by, 5), reference.get_top_addresses(by, 5)
+        assert [(row["address"], row["transactionsSent"], row["transactionsReceived"]) for row in top] == \
+               [(row["address"], row["transactionsSent"], row["transactionsReceived"]) for row in expected]
+
+    for address in [make_address(number) for number in range(21)] + [""]:
+        stats, expected = columnar.get_address_stats(address), reference.get_address_stats(address)
+        assert (stats is None) == (expected is None)
+        if stats is not None:
+            assert stats["gasCostInDollars"] == pytest.approx(expected["gasCostInDollars"])
+            assert {**stats, "gasCostInDollars": 0} == {**expected, "gasCostInDollars": 0}
+
+def assert_same_listings(columnar, reference):
+    filters = [
+        TransactionFilter(),
+        TransactionFilter(from_address=make_address(3)),
+        TransactionFilter(to_address=make_address(4), from_block=17818010, to_block=17818030),
+        TransactionFilter(from_address=make_address(1), to_address=make_address(2)),
+        TransactionFilter(to_address=""),
+    ]
+    for filter in filters:
+        expected = [as_tuple(transaction) for transaction in reference.stream_transactions(filter)]
+        assert [as_tuple(row) for row in columnar.stream_transactions(filter, chunk_size=7)] == expected
+        if expected:
+            cursor = expected[len(expected) // 2][3], expected[len(expected) // 2][0]
+            assert [as_tuple(row) for row in columnar.get_transactions(filter, after=cursor, limit=10)] == \
+                   [as_tuple(transaction) for transaction in reference.get_transactions(filter, after=cursor, limit=10)]
+
+
+def test_matches_the_in_memory_repository():
+    transactions = make_transactions(500)
+    columnar, reference = ColumnarRepository(capacity=16), InMemoryRepository()
+    for start in range(0, len(transactions), 64):
+        columnar.create_many(transactions[start:start + 64])
+    reference.create_many(transactions)
+
+    assert len(columnar) == 500
+    assert columnar.get_all_hashes() == reference.get_all_hashes()
+    assert list(columnar.stream_hashes(chunk_size=30)) == [transaction.hash for transaction in transactions]
+    for transaction in transactions[::37]:
+        assert as_tuple(columnar.get_by_hash(transaction.hash)) == as_tuple(transaction)
+    assert_same_aggregates(columnar, reference)
+    assert_same_listings(columnar, reference)
+
+def test_get_many_by_hash():
+    transactions = make_transactions(100)
+    repository = ColumnarRepository()
+    repository.create_many(transactions)
+    hashes = [transaction.hash for transaction in transactions[:10]] + [make_hash(1), "0xnot-a-hash"]
+
+    found = repository.get_many_by_hash(hashes)
+
+    assert set(found) == set(hashes[:10])
+    assert as_tuple(found[transactions[3].hash]) == as_tuple(transactions[3])
+
+def test_unknown_and_malformed_hashes_are_not_found():
+    repository = ColumnarRepository()
+    repository.create_many(make_transactions(10))
+
+    assert repository.get_by_hash(make_hash(1)) is None
+    assert repository.get_by_hash("0x01") is None
+    assert repository.get_by_hash(make_hash(1).upper()) is None
+    assert repository.get_address_stats("0xfrom") is None
+    assert repository.get_transactions(TransactionFilter(from_address="0xfrom")) == []
+
+def test_create_many_rejects_malformed_hashes():
+    repository = ColumnarRepository()
+    transaction = make_transactions(1)[0]
+    transaction.hash = "0x01"
+
+    with pytest.raises(ValueError):
+        repository.create_many([transaction])
+    assert len(repository) == 0
+
+def test_create_many_conflict_modes(capsys):
+    first, second = make_transactions(2)
+    repository = ColumnarRepository()
+    updated = ProcessedTransaction(**{**first.to_dict(), "gasUsed": 1})
+
+    repository.create_many([first, updated, second])
+    assert repository.get_by_hash(first.hash).gasUsed == first.gasUsed
+    assert f"Duplicate transaction detected with hash {first.hash}" in capsys.readouterr().out
+
+    repository.create_many([updated], on_conflict="ignore")
+    assert repository.get_by_hash(first.hash).gasUsed == first.gasUsed
+    assert capsys.readouterr().out == ""
+
+    repository.create_many([updated], on_conflict="update")
+    assert repository.get_by_hash(first.hash).gasUsed == 1
+    assert len(repository) == 2
+    assert repository.get_stats()["totalGasUsed"] == 1 + second.gasUsed
+
+    with pytest.raises(ValueError):
+        repository.create_many([first], on_conflict="replace")
+
+def test_hashes_sharing_their_slot_are_all_found():
+    # Same words in a different order: the same key, so every hash but one is found by probing
+    words = [f"{number:016x}" for number in range(1, 5)]
+    transactions = make_transactions(4)
+    for transaction, shift in zip(transactions, range(4)):
+        transaction.hash = "0x" + "".join(words[shift:] + words[:shift])
+    repository = ColumnarRepository()
+    repository.create_many(transactions)
+
+    for transaction in transactions:
+        assert repository.get_by_hash(transaction.hash).hash == transaction.hash
+    assert set(repository.get_many_by_hash([transaction.hash for transaction in transactions])) == \
+           {transaction.hash for transaction in transactions}
+
+def test_save_and_load(tmp_path):
+    transactions = make_transactions(300)
+    saved = ColumnarRepository()
+    saved.create_many(transactions[:200])
+    path = tmp_path / "transactions.snapshot"
+    saved.save(str(path))
+
+    loaded = ColumnarRepository()
+    loaded.load(str(path))
+    reference = InMemoryRepository()
+    reference.create_many(transactions[:200])
+    assert len(loaded) == 200
+    assert as_tuple(loaded.get_by_hash(transactions[5].hash)) == as_tuple(transactions[5])
+    assert_same_aggregates(loaded, reference)
+    assert_same_listings(loaded, reference)
+
+    # Writes after the load stay in memory
+    updated = ProcessedTransaction(**{**transactions[0].to_dict(), "gasUsed": 1})
+    loaded.create_many([updated], on_conflict="update")
+    loaded.create_many(transactions[200:])
+    reference.create_many([updated], on_conflict="update")
+    reference.create_many(transactions[200:])
+    assert_same_aggregates(loaded, reference)
+    assert_same_listings(loaded, reference)
+
+    reloaded = ColumnarRepository()
+    reloaded.load(str(path))
+    assert len(reloaded) == 200
+    assert reloaded.get_by_hash(transactions[0].hash).gasUsed == transactions[0].gasUsed
+
+def test_save_and_load_empty_repository(tmp_path):
+    path = tmp_path / "empty.snapshot"
+    ColumnarRepository().save(str(path))
+
+    repository = ColumnarRepository()
+    repository.load(str(path))
+    assert repository.get_stats() == {"totalTransactionsInDB": 0, "totalGasUsed": 0, "totalGasCostInDollars": 0.}
+    assert repository.get_by_hash(make_hash(1)) is None
+    assert repository.get_top_addresses("gasCost", 3) == []
+
+    repository.create_many(make_transactions(3))
+    assert len(repository) == 3
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "transactions.pkl"
+    path.write_bytes(b"not a snapshot")
+
+    with pytest.raises(ValueError):
+        ColumnarRepository().load(str(path))
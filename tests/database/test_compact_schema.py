@@ -0,0 +1,128 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import StatementError
+
+from database import ProcessedTransaction, SqlRepository, TransactionFilter, maintenance
+from database.database import make_engine
+
+from tests.conftest import bind_database
+
+
+SENDER = f"0x{'ab' * 20}"
+RECEIVER = f"0x{'cd' * 20}"
+
+def make_transaction(number: int, block: int = 17818542, to_address: str = RECEIVER,
+                     gas_used: int = 21000) -> ProcessedTransaction:
+    return ProcessedTransaction(
+        hash=f"0x{number:064x}",
+        fromAddress=SENDER,
+        toAddress=to_address,
+        blockNumber=block,
+        executedAt=datetime(2023, 8, 1, 7, 4, 59),
+        gasUsed=gas_used,
+        gasCostInDollars=1.5,
+    )
+
+def stored_types(engine):
+    with engine.connect() as connection:
+        return connection.execute(text(
+            'SELECT typeof(hash), length(hash), typeof(fromAddress), length(fromAddress) FROM processed_transaction'
+        )).first()
+
+def read_everything(repository: SqlRepository):
+    listing = [tuple(row) for row in repository.stream_transactions(TransactionFilter())]
+    return (listing, repository.get_stats(), repository.get_address_stats(SENDER), repository.get_address_stats(RECEIVER),
+            repository.get_top_addresses("transactions", 5))
+
+
+def test_hashes_and_addresses_are_stored_as_bytes(compact_sqlite_engine):
+    repository = SqlRepository()
+    repository.create_many([make_transaction(1), make_transaction(2, to_address="")])
+
+    assert tuple(stored_types(compact_sqlite_engine)) == ("blob", 32, "blob", 20)
+    transaction = repository.get_by_hash(f"0x{1:064x}")
+    assert (transaction.hash, transaction.fromAddress, transaction.toAddress) == (f"0x{1:064x}", SENDER, RECEIVER)
+    assert repository.get_by_hash(f"0x{2:064x}").toAddress == ""
+    assert repository.get_all_hashes() == {f"0x{1:064x}", f"0x{2:064x}"}
+    assert repository.get_address_stats(RECEIVER)["transactionsReceived"] == 1
+    assert repository.get_top_addresses("gasUsed", 1)[0]["address"] == SENDER
+
+def test_malformed_values_are_not_found(compact_sqlite_engine):
+    repository = SqlRepository()
+    repository.create(make_transaction(0xabc))
+
+    assert repository.get_by_hash("0x0abc") is None
+    assert repository.get_by_hash(f"0x{0xabc:064X}") is None
+    assert list(repository.get_many_by_hash([f"0x{0xabc:064x}", "0x0abc"])) == [f"0x{0xabc:064x}"]
+    assert repository.get_address_stats("0xfrom") is None
+    assert repository.get_transactions(TransactionFilter(from_address="0xfrom")) == []
+
+def test_malformed_values_are_not_written(compact_sqlite_engine):
+    repository = SqlRepository()
+    transaction = make_transaction(1)
+    transaction.hash = "0x01"
+
+    with pytest.raises(StatementError):
+        repository.create_many([transaction])
+    assert repository.get_stats()["totalTransactionsInDB"] == 0
+
+def test_listing_keeps_its_order(compact_sqlite_engine):
+    repository = SqlRepository()
+    # Hashes whose bytes and hex strings would sort differently if compared as signed bytes
+    numbers = [0x7f << 248, 0x80 << 248, 0xff << 248, 1]
+    repository.create_many([make_transaction(number, block=1 + index % 2) for index, number in enumerate(numbers)])
+
+    expected = sorted((1 + index % 2, f"0x{number:064x}") for index, number in enumerate(numbers))
+    first_page = repository.get_transactions(TransactionFilter(), limit=2)
+    assert [(row.blockNumber, row.hash) for row in first_page] == expected[:2]
+    after = (first_page[-1].blockNumber, first_page[-1].hash)
+    assert [(row.blockNumber, row.hash) for row in repository.get_transactions(TransactionFilter(), after)] == expected[2:]
+
+def test_compact_converts_an_existing_database(tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'ratedapi.db'}"
+    engine, restore = bind_database(url, monkeypatch)
+    ProcessedTransaction.metadata.create_all(bind=engine)
+    repository = SqlRepository()
+    repository.create_many([make_transaction(number, block=number % 3, to_address=RECEIVER if number % 4 else "")
+                            for number in range(1, 50)])
+    before = read_everything(repository)
+    assert stored_types(engine)[0] == "text"
+    restore()
+
+    assert maintenance.compact(url) is True
+
+    # The schema is read from the database
+    engine, restore = bind_database(url, monkeypatch)
+    try:
+        assert tuple(stored_types(engine)) == ("blob", 32, "blob", 20)
+        assert read_everything(repository) == before
+        assert maintenance.check() is True
+        repository.create(make_transaction(100))
+        assert repository.get_by_hash(f"0x{100:064x}").fromAddress == SENDER
+    finally:
+        restore()
+    assert maintenance.compact(url) is True
+
+def test_compact_leaves_the_database_unchanged_on_malformed_values(tmp_path, monkeypatch, capsys):
+    url = f"sqlite:///{tmp_path / 'ratedapi.db'}"
+    engine, restore = bind_database(url, monkeypatch)
+    ProcessedTransaction.metadata.create_all(bind=engine)
+    malformed = make_transaction(2)
+    malformed.fromAddress = "0xfrom"
+    SqlRepository().create_many([make_transaction(1), malformed])
+    restore()
+
+    assert maintenance.compact(url) is False
+    assert "left unchanged" in capsys.readouterr().out
+
+    engine = make_engine(url)
+    try:
+        assert stored_types(engine)[0] == "text"
+        with engine.connect() as connection:
+            assert connection.execute(text("SELECT count(*) FROM processed_transaction")).scalar() == 2
+            tables = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars().all()
+        assert not [table for table in tables if table.endswith("_hex")]
+    finally:
+        engine.dispose()
@@ -0,0 +1,32 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from database import ProcessedTransaction, SqlRepository, get_db_session, get_read_session
+
+from .test_sql_repository import make_transaction
+
+
+def test_sqlite_database_uses_write_ahead_logging(sqlite_engine):
+    with sqlite_engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == 'wal'
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+
+def test_read_sessions_cannot_write(sqlite_engine):
+    with get_read_session() as session:
+        with pytest.raises(OperationalError, match='readonly'):
+            session.execute(ProcessedTransaction.__table__.insert(), [make_transaction('0x01').to_dict()])
+
+def test_reads_see_the_last_commit_while_a_write_is_open(sqlite_engine):
+    repository = SqlRepository()
+    repository.create(make_transaction('0x01'))
+
+    with get_db_session() as session:
+        session.execute(ProcessedTransaction.__table__.insert(), [make_transaction('0x02').to_dict()])
+        session.flush()
+        # The writer holds the database lock until it commits
+        assert repository.get_by_hash('0x01') is not None
+        assert repository.get_by_hash('0x02') is None
+        assert repository.get_stats()['totalTransactionsInDB'] == 1
+
+    assert repository.get_by_hash('0x02') is not None
@@ -0,0 +1,28 @@
+from database.in_memory_repository import InMemoryRepository
+from tests.database.test_sql_repository import make_transaction
+
+
+def test_create_many_keeps_stored_rows_on_duplicates(capsys):
+    repository = InMemoryRepository()
+    repository.create_many([make_transaction('0x01', gas_used=100), make_transaction('0x01', gas_used=200), make_transaction('0x02')])
+
+    assert repository.get_by_hash('0x01').gasUsed == 100
+    assert repository.get_stats()['totalTransactionsInDB'] == 2
+    assert "Duplicate transaction detected with hash 0x01" in capsys.readouterr().out
+
+def test_create_many_on_conflict_modes():
+    repository = InMemoryRepository()
+    repository.create(make_transaction('0x01', gas_used=100))
+
+    repository.create_many([make_transaction('0x01', gas_used=200), make_transaction('0x02')], on_conflict='ignore')
+    assert repository.get_by_hash('0x01').gasUsed == 100
+
+    repository.create_many([make_transaction('0x01', gas_used=300)], on_conflict='update')
+    assert repository.get_by_hash('0x01').gasUsed == 300
+
+def test_get_all_hashes():
+    repository = InMemoryRepository()
+    assert repository.get_all_hashes() == set()
+
+    repository.create_many([make_transaction('0x01'), make_transaction('0x02')])
+    assert repository.get_all_hashes() == {'0x01', '0x02'}
@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from database import SqlIngestStore, IngestRun, get_db_session, INGEST_RUNNING, INGEST_DONE, INGEST_FAILED
+
+
+def test_no_run(sqlite_engine):
+    assert SqlIngestStore().latest() is None
+
+def test_progress_of_a_running_ingest(sqlite_engine):
+    store = SqlIngestStore()
+    run_id = store.start('transactions.csv', rows_total=1000)
+    store.update(run_id, rows_written=200, rows_skipped=50)
+    with get_db_session() as session:
+        # 10 seconds in
+        run = session.get(IngestRun, run_id)
+        run.updatedAt = run.startedAt + timedelta(seconds=10)
+
+    status = store.latest()
+    assert (status['status'], status['rowsDone'], status['rowsPerSecond'], status['etaSeconds']) == (INGEST_RUNNING, 250, 25., 30.)
+
+def test_finished_runs(sqlite_engine):
+    store = SqlIngestStore()
+    store.finish(store.start('first.csv', rows_total=10), rows_written=10, rows_skipped=0)
+    assert (store.latest()['status'], store.latest()['etaSeconds']) == (INGEST_DONE, None)
+
+    store.finish(store.start('second.csv', rows_total=10), rows_written=3, rows_skipped=0, error="ValueError('boom')")
+    status = store.latest()
+    assert (status['filePath'], status['status'], status['error']) == ('second.csv', INGEST_FAILED, "ValueError('boom')")
+    assert status['finishedAt'] is not None
+
+def test_fail_unfinished(sqlite_engine):
+    store = SqlIngestStore()
+    store.finish(store.start('first.csv', rows_total=10), rows_written=10, rows_skipped=0)
+    store.start('second.csv', rows_total=10)
+
+    assert store.fail_unfinished('Interrupted') == 1
+    assert (store.latest()['status'], store.latest()['error']) == (INGEST_FAILED, 'Interrupted')
+
+def test_rows_counted_after_the_start(sqlite_engine):
+    store = SqlIngestStore()
+    run_id = store.start('transactions.csv')
+    assert (store.latest()['rowsTotal'], store.latest()['etaSeconds']) == (None, None)
+
+    store.update(run_id, rows_written=0, rows_skipped=0, rows_total=10)
+    assert store.latest()['rowsTotal'] == 10
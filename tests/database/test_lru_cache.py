@@ -0,0 +1,60 @@
+import pytest
+
+from database.lru_cache import LruCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+def test_evicts_least_recently_used_entries():
+    cache = LruCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats() == {'entries': 2, 'bytes': 0, 'hits': 3, 'misses': 1, 'evictions': 1, 'expirations': 0}
+
+def test_bounded_by_bytes():
+    cache = LruCache(max_bytes=10, sizeof=lambda key, value: len(value))
+    cache.put('a', 'xxxx')
+    cache.put('b', 'xxxx')
+    cache.put('c', 'xxxx')
+
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 8
+    # Entries larger than the whole cache are not stored
+    assert cache.put('d', 'x' * 11) is False
+    assert len(cache) == 2
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LruCache(max_entries=10, ttl=5, clock=clock)
+    cache.put('a', 1)
+
+    clock.now = 4.9
+    assert cache.get('a') == 1
+    clock.now = 5
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+def test_invalidation_drops_values_read_before_it():
+    cache = LruCache(max_entries=10)
+    cache.put('a', 1)
+    generation = cache.generation
+
+    cache.invalidate('a')
+
+    assert cache.get('a') is None
+    assert cache.put('a', 1, generation) is False
+    assert cache.put('a', 2, cache.generation) is True
+
+@pytest.mark.parametrize('options', [{}, {'max_entries': 0}, {'max_entries': 1, 'ttl': 0}])
+def test_rejects_invalid_bounds(options):
+    with pytest.raises(ValueError):
+        LruCache(**options)
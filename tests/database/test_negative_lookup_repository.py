@@ -0,0 +1,63 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from database import NegativeLookupRepository, SqlRepository, get_db_session
+
+from .test_sql_repository import make_transaction
+
+
+@pytest.fixture
+def repository(sqlite_engine):
+    SqlRepository().create_many([make_transaction('0x01'), make_transaction('0x02')])
+    return NegativeLookupRepository(SqlRepository(), min_capacity=1000)
+
+def test_unknown_hashes_do_not_reach_the_database(repository, monkeypatch):
+    assert repository.get_by_hash('0x01') is not None
+
+    monkeypatch.setattr(repository.repository, 'get_by_hash', MagicMock(side_effect=AssertionError))
+    monkeypatch.setattr(repository.repository, 'get_many_by_hash', MagicMock(side_effect=AssertionError))
+    assert repository.get_by_hash('0x99') is None
+    assert repository.get_many_by_hash(['0x98', '0x99']) == {}
+
+    stats = repository.filter_stats()
+    assert (stats['lookups'], stats['filtered_lookups'], stats['count']) == (4, 3, 2)
+
+def test_written_hashes_are_found(repository):
+    repository.load()
+    repository.create(make_transaction('0x03'))
+    repository.create_many([make_transaction('0x04')])
+
+    assert set(repository.get_many_by_hash(['0x03', '0x04', '0x05'])) == {'0x03', '0x04'}
+
+def test_writes_before_the_first_load_are_kept(repository):
+    repository.create_many([make_transaction('0x03')])
+    assert repository.get_by_hash('0x03') is not None
+
+def test_rows_written_elsewhere_need_a_reload(repository):
+    repository.load()
+    with get_db_session() as session:
+        session.add(make_transaction('0x03'))
+
+    assert repository.get_by_hash('0x03') is None
+    repository.load()
+    assert repository.get_by_hash('0x03') is not None
+
+def test_suspended_lookups_see_rows_written_elsewhere(repository):
+    repository.load()
+    repository.suspend()
+    with get_db_session() as session:
+        session.add(make_transaction('0x03'))
+
+    assert repository.get_by_hash('0x03') is not None
+    assert set(repository.get_many_by_hash(['0x03', '0x04'])) == {'0x03'}
+    repository.load()
+    assert not repository.suspended
+    assert repository.get_by_hash('0x03') is not None
+
+def test_filter_grows_past_its_capacity(repository):
+    repository.load()
+    repository.create_many([make_transaction(f'0x{i:04x}') for i in range(3, 1200)])
+
+    assert repository.filter_stats()['capacity'] == 2 * 1199
+    assert repository.get_by_hash('0x04af') is not None
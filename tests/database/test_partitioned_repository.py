@@ -0,0 +1,140 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from database import maintenance
+from database.in_memory_repository import InMemoryRepository
+from database.irepository import TransactionFilter
+from database.partitioned_repository import PartitionedRepository, partition_file
+from database.processed_transaction import ProcessedTransaction
+
+from tests.database.test_columnar_repository import (
+    make_hash, make_address, make_transactions, as_tuple, assert_same_aggregates, assert_same_listings
+)
+
+# Blocks 17818000 to 17818049 of make_transactions span 8 partitions, and the ranges of get_block_stats span two of them
+PARTITION_SIZE = 7
+
+
+@pytest.fixture
+def repository(tmp_path):
+    repository = PartitionedRepository(str(tmp_path / "partitions"), partition_size=PARTITION_SIZE, batch_size=50)
+    yield repository
+    repository.close()
+
+def make_transaction(number: int, block: int, sender: int = 1, gas_used: int = 21000,
+                     gas_cost: float = 1.5) -> ProcessedTransaction:
+    return ProcessedTransaction(hash=make_hash(number), fromAddress=make_address(sender), toAddress=make_address(99),
+                                blockNumber=block, executedAt=datetime(2023, 8, 1, 7, 4, 59), gasUsed=gas_used,
+                                gasCostInDollars=gas_cost)
+
+
+def test_same_results_as_a_single_repository(repository):
+    transactions = make_transactions(400)
+    reference = InMemoryRepository()
+    reference.create_many(transactions)
+    repository.create_many(make_transactions(400))
+
+    assert repository.partitions() == sorted({block // PARTITION_SIZE * PARTITION_SIZE
+                                              for block in range(17818000, 17818050)})
+    assert_same_aggregates(repository, reference)
+    assert_same_listings(repository, reference)
+
+def test_lookups_are_routed_to_the_partition_of_the_hash(repository):
+    transactions = make_transactions(100)
+    repository.create_many(transactions)
+
+    for transaction in transactions[:10]:
+        assert as_tuple(repository.get_by_hash(transaction.hash)) == as_tuple(transaction)
+    assert repository.get_by_hash(make_hash(1)) is None
+    hashes = [transaction.hash for transaction in transactions[10:20]] + [make_hash(1)]
+    found = repository.get_many_by_hash(hashes)
+    assert {hash: as_tuple(row) for hash, row in found.items()} == {
+        transaction.hash: as_tuple(transaction) for transaction in transactions[10:20]
+    }
+    assert repository.get_all_hashes() == set(repository.stream_hashes(chunk_size=7)) == \
+           {transaction.hash for transaction in transactions}
+
+def test_duplicates_are_found_in_every_partition(repository, capsys):
+    repository.create_many([make_transaction(1, block=3), make_transaction(2, block=10)])
+
+    repository.create_many([make_transaction(1, block=20, gas_used=1), make_transaction(3, block=20),
+                            make_transaction(3, block=20)])
+    assert "Duplicate transaction detected with hash " + make_hash(1) in capsys.readouterr().out
+    assert repository.get_by_hash(make_hash(1)).blockNumber == 3
+    assert repository.get_stats()["totalTransactionsInDB"] == 3
+
+    repository.create_many([make_transaction(2, block=3, gas_used=1)], on_conflict="ignore")
+    assert repository.get_by_hash(make_hash(2)).blockNumber == 10
+    assert capsys.readouterr().out == ""
+
+def test_updates_move_transactions_between_partitions(repository):
+    repository.create_many([make_transaction(1, block=3), make_transaction(2, block=10)])
+
+    repository.create_many([make_transaction(1, block=30, gas_used=5), make_transaction(2, block=11, gas_used=7)],
+                           on_conflict="update")
+
+    assert (repository.get_by_hash(make_hash(1)).blockNumber, repository.get_by_hash(make_hash(1)).gasUsed) == (30, 5)
+    assert [(row.hash, row.blockNumber) for row in repository.stream_transactions(TransactionFilter())] == \
+           [(make_hash(2), 11), (make_hash(1), 30)]
+    assert repository.get_stats() == {"totalTransactionsInDB": 2, "totalGasUsed": 12, "totalGasCostInDollars": 3.}
+    assert repository.get_block_stats(0, 6, 7) == []
+    assert repository.get_address_stats(make_address(1))["transactionsSent"] == 2
+
+def test_top_addresses_are_exact_across_partitions(repository):
+    # Sender 9 is never in the top 2 of a partition, but has the highest total
+    transactions = []
+    for partition in range(4):
+        block = partition * PARTITION_SIZE
+        transactions += [
+            make_transaction(partition * 10 + 1, block, sender=partition * 2 + 10, gas_used=100),
+            make_transaction(partition * 10 + 2, block, sender=partition * 2 + 11, gas_used=90),
+            make_transaction(partition * 10 + 3, block, sender=9, gas_used=80),
+        ]
+    repository.create_many(transactions)
+
+    top = repository.get_top_addresses("gasUsed", 2)
+    assert [(row["address"], row["gasUsed"], row["transactionsSent"]) for row in top] == \
+           [(make_address(9), 320, 4), (make_address(16), 100, 1)]
+    assert repository.get_top_addresses("transactions", 0) == []
+    with pytest.raises(ValueError):
+        repository.get_top_addresses("size", 1)
+
+def test_archived_partitions_leave_the_repository(repository, tmp_path):
+    repository.create_many([make_transaction(1, block=3), make_transaction(2, block=10)])
+
+    moved = repository.archive(0, str(tmp_path / "archive"))
+
+    assert moved == str(tmp_path / "archive" / partition_file(0)) and os.path.exists(moved)
+    assert repository.partitions() == [7]
+    assert repository.get_by_hash(make_hash(1)) is None
+    assert repository.get_stats()["totalTransactionsInDB"] == 1
+    repository.create(make_transaction(1, block=4))
+    assert repository.get_by_hash(make_hash(1)).blockNumber == 4
+    with pytest.raises(ValueError):
+        repository.archive(70, str(tmp_path / "archive"))
+
+def test_old_partitions_can_use_the_compact_schema(repository):
+    transactions = make_transactions(100)
+    repository.create_many(transactions)
+    expected = [as_tuple(row) for row in repository.stream_transactions(TransactionFilter())]
+    stats = repository.get_stats()
+    oldest = repository.partitions()[0]
+    repository.close()
+
+    assert maintenance.compact(f"sqlite:///{os.path.join(repository.directory, partition_file(oldest))}") is True
+
+    reopened = PartitionedRepository(repository.directory, partition_size=PARTITION_SIZE)
+    try:
+        assert [as_tuple(row) for row in reopened.stream_transactions(TransactionFilter())] == expected
+        assert reopened.get_stats() == pytest.approx(stats)
+        assert as_tuple(reopened.get_by_hash(transactions[0].hash)) == as_tuple(transactions[0])
+    finally:
+        reopened.close()
+
+def test_partition_size_is_checked_against_the_stored_partitions(repository):
+    repository.create(make_transaction(1, block=7))
+
+    with pytest.raises(ValueError):
+        PartitionedRepository(repository.directory, partition_size=5)
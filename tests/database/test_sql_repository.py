@@ -0,0 +1,104 @@
+import pytest
+from sqlalchemy import false
+from datetime import datetime
+
+from database import ProcessedTransaction, SqlRepository, sql_repository
+
+
+def make_transaction(hash: str, gas_used: int = 21000, gas_cost: float = 1.5) -> ProcessedTransaction:
+    return ProcessedTransaction(
+        hash=hash,
+        fromAddress='0xfrom',
+        toAddress='0xto',
+        blockNumber=17818542,
+        executedAt=datetime(2023, 8, 1, 7, 4, 59),
+        gasUsed=gas_used,
+        gasCostInDollars=gas_cost,
+    )
+
+def test_create_and_get_by_hash(sqlite_engine):
+    repository = SqlRepository()
+    repository.create(make_transaction('0x01'))
+
+    transaction = repository.get_by_hash('0x01')
+    assert transaction.gasUsed == 21000
+    assert repository.get_by_hash('0x02') is None
+
+def test_create_many_writes_all_batches(sqlite_engine):
+    repository = SqlRepository(batch_size=2)
+    repository.create_many([make_transaction(f'0x{i:02x}') for i in range(5)])
+
+    stats = repository.get_stats()
+    assert stats['totalTransactionsInDB'] == 5
+    assert stats['totalGasUsed'] == 5 * 21000
+
+def test_create_many_keeps_valid_rows_of_a_batch_with_duplicates(sqlite_engine, capsys):
+    repository = SqlRepository(batch_size=10)
+    repository.create(make_transaction('0x01'))
+
+    repository.create_many([make_transaction('0x01'), make_transaction('0x02')])
+
+    assert repository.get_stats()['totalTransactionsInDB'] == 2
+    assert "Duplicate transaction detected with hash 0x01" in capsys.readouterr().out
+
+def test_invalid_batch_size():
+    with pytest.raises(ValueError, match="batch_size must be a positive integer"):
+        SqlRepository(batch_size=0)
+
+    repository = SqlRepository()
+    with pytest.raises(ValueError, match="batch_size must be a positive integer"):
+        repository.batch_size = 0
+
+def test_create_many_on_conflict_ignore_keeps_stored_rows(sqlite_engine, capsys):
+    repository = SqlRepository()
+    repository.create(make_transaction('0x01', gas_used=100))
+
+    repository.create_many([make_transaction('0x01', gas_used=200), make_transaction('0x02')], on_conflict='ignore')
+
+    assert repository.get_by_hash('0x01').gasUsed == 100
+    assert repository.get_all_hashes() == {'0x01', '0x02'}
+    assert "Duplicate transaction" not in capsys.readouterr().out
+
+def test_create_many_on_conflict_update_overwrites_stored_rows(sqlite_engine):
+    repository = SqlRepository()
+    repository.create(make_transaction('0x01', gas_used=100))
+
+    repository.create_many([make_transaction('0x01', gas_used=200)], on_conflict='update')
+
+    assert repository.get_by_hash('0x01').gasUsed == 200
+    assert repository.get_stats()['totalTransactionsInDB'] == 1
+
+def test_create_many_invalid_on_conflict(sqlite_engine):
+    with pytest.raises(ValueError, match="Unsupported on_conflict mode"):
+        SqlRepository().create_many([make_transaction('0x01')], on_conflict='replace')
+
+def test_create_many_skips_duplicates_within_a_batch(sqlite_engine, capsys):
+    repository = SqlRepository()
+    repository.create_many([make_transaction('0x01', gas_used=100), make_transaction('0x01', gas_used=200), make_transaction('0x02')])
+
+    assert repository.get_by_hash('0x01').gasUsed == 100
+    assert repository.get_stats()['totalTransactionsInDB'] == 2
+    assert "Duplicate transaction detected with hash 0x01" in capsys.readouterr().out
+
+def test_create_many_handles_rows_stored_concurrently(sqlite_engine, monkeypatch, capsys):
+    repository = SqlRepository()
+    repository.create(make_transaction('0x01', gas_used=100))
+
+    # Simulate another writer storing 0x01 between the duplicate lookup and the insert
+    real_select = sql_repository.select
+    monkeypatch.setattr(sql_repository, "select", lambda *columns: real_select(*columns).where(false()))
+
+    repository.create_many([make_transaction('0x01', gas_used=200), make_transaction('0x02')])
+
+    assert repository.get_by_hash('0x01').gasUsed == 100
+    assert repository.get_stats()['totalTransactionsInDB'] == 2
+    assert "Duplicate transaction detected with hash 0x01" in capsys.readouterr().out
+
+def test_get_many_by_hash_spans_in_clause_chunks(sqlite_engine, monkeypatch):
+    monkeypatch.setattr(SqlRepository, 'IN_CLAUSE_SIZE', 2)
+    repository = SqlRepository()
+    repository.create_many([make_transaction(f'0x{i:02x}', gas_used=i) for i in range(5)])
+
+    found = repository.get_many_by_hash(['0x04', '0x00', '0x99', '0x02', '0x04', '0x03'])
+
+    assert {hash: row.gasUsed for hash, row in found.items()} == {'0x04': 4, '0x00': 0, '0x02': 2, '0x03': 3}
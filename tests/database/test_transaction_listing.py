@@ -0,0 +1,72 @@
+import pytest
+from sqlalchemy import text
+
+from database import SqlRepository, TransactionFilter
+from database.in_memory_repository import InMemoryRepository
+
+from .test_address_stats import make_transfer
+
+
+def make_block_transfer(hash: str, block_number: int, sender: str = '0xa', receiver: str = '0xb'):
+    transaction = make_transfer(hash, sender, receiver, 21000, 1.)
+    transaction.blockNumber = block_number
+    return transaction
+
+TRANSACTIONS = [
+    make_block_transfer('0x05', 2),
+    make_block_transfer('0x01', 1),
+    make_block_transfer('0x03', 2, sender='0xc'),
+    make_block_transfer('0x02', 3, receiver='0xc'),
+    make_block_transfer('0x04', 1, sender='0xc', receiver='0xa'),
+]
+
+@pytest.fixture(params=['sql', 'in_memory'])
+def repository(request):
+    if request.param == 'sql':
+        request.getfixturevalue('sqlite_engine')
+        repository = SqlRepository()
+    else:
+        repository = InMemoryRepository()
+    repository.create_many(TRANSACTIONS)
+    return repository
+
+def keys(transactions):
+    return [(transaction.blockNumber, transaction.hash) for transaction in transactions]
+
+def test_pages_follow_block_and_hash_order(repository):
+    first = repository.get_transactions(TransactionFilter(), limit=2)
+    assert keys(first) == [(1, '0x01'), (1, '0x04')]
+
+    second = repository.get_transactions(TransactionFilter(), after=keys(first)[-1], limit=2)
+    assert keys(second) == [(2, '0x03'), (2, '0x05')]
+
+    assert keys(repository.get_transactions(TransactionFilter(), after=keys(second)[-1], limit=2)) == [(3, '0x02')]
+
+@pytest.mark.parametrize('filters, expected', [
+    (TransactionFilter(from_address='0xc'), [(1, '0x04'), (2, '0x03')]),
+    (TransactionFilter(to_address='0xc'), [(3, '0x02')]),
+    (TransactionFilter(from_address='0xa', to_address='0xb'), [(1, '0x01'), (2, '0x05')]),
+    (TransactionFilter(from_block=2, to_block=2), [(2, '0x03'), (2, '0x05')]),
+])
+def test_filters(repository, filters, expected):
+    assert keys(repository.get_transactions(filters)) == expected
+
+def test_stream_resumes_after_the_cursor(repository):
+    assert keys(repository.stream_transactions(TransactionFilter(), after=(1, '0x04'), chunk_size=2)) == [
+        (2, '0x03'), (2, '0x05'), (3, '0x02')
+    ]
+
+@pytest.mark.parametrize('filters', [
+    TransactionFilter(),
+    TransactionFilter(from_address='0xa', from_block=2),
+    TransactionFilter(to_address='0xb', to_block=2),
+])
+def test_pages_seek_in_an_index(sqlite_engine, filters):
+    query = SqlRepository._transactions_query(filters, after=(1, '0x01')).limit(10)
+    compiled = query.compile(sqlite_engine, compile_kwargs={'literal_binds': True})
+    with sqlite_engine.connect() as connection:
+        plan = ' '.join(row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {compiled}')))
+
+    # No full scan, and no sort of the matching rows before the page is cut
+    assert 'SEARCH processed_transaction USING INDEX' in plan
+    assert 'TEMP B-TREE' not in plan
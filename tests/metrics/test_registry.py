@@ -0,0 +1,75 @@
+import json
+import os
+
+import pytest
+
+from metrics import Counter, Histogram, CallbackMetric, Registry, COUNTER
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+def test_counters_and_histograms_are_rendered_in_the_text_format(registry):
+    requests = Counter("requests_total", "Requests by status", ["status"], registry=registry)
+    latency = Histogram("latency_seconds", "Latency", buckets=[0.1, 1], registry=registry)
+    requests.labels(200).inc()
+    requests.labels(200).inc(2)
+    requests.labels('say "hi"\n').inc()
+    for seconds in (0.05, 0.1, 0.5, 3):
+        latency.observe(seconds)
+
+    assert registry.collect() == "\n".join([
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        'latency_seconds_sum 3.65',
+        'latency_seconds_count 4',
+        '# HELP requests_total Requests by status',
+        '# TYPE requests_total counter',
+        'requests_total{status="200"} 3',
+        'requests_total{status="say \\"hi\\"\\n"} 1',
+    ]) + "\n"
+
+def test_labels_are_checked_and_children_reused(registry):
+    requests = Counter("requests_total", "Requests", ["method", "status"], registry=registry)
+
+    assert requests.labels("GET", 200) is requests.labels("GET", "200")
+    with pytest.raises(ValueError):
+        requests.labels("GET")
+    with pytest.raises(ValueError):
+        Counter("requests_total", "Again", registry=registry)
+    with pytest.raises(ValueError):
+        Histogram("latency_seconds", "Latency", buckets=[1, 0.1], registry=registry)
+
+def test_callback_metrics_are_read_when_collected(registry):
+    stats = {"hits": 1}
+    CallbackMetric("cache_requests_total", "Cache lookups", lambda: {("hit",): stats["hits"]}, ["result"],
+                   kind=COUNTER, registry=registry)
+    stats["hits"] = 5
+
+    assert 'cache_requests_total{result="hit"} 5' in registry.collect()
+
+def test_shared_snapshots_are_added_to_the_metrics_of_the_process(registry, tmp_path):
+    requests = Counter("requests_total", "Requests", ["status"], registry=registry)
+    latency = Histogram("latency_seconds", "Latency", buckets=[0.1], registry=registry)
+    requests.labels(200).inc()
+    latency.observe(0.01)
+    # Another process, with a metric this one does not have
+    other = Registry()
+    Counter("requests_total", "Requests", ["status"], registry=other).labels(200).inc(2)
+    Histogram("latency_seconds", "Latency", buckets=[0.1], registry=other).observe(1)
+    Counter("rows_total", "Rows", registry=other).inc(7)
+    with open(tmp_path / "1.json", "w") as file:
+        json.dump(other.snapshot(), file)
+    # The snapshot of this process is not added to its live metrics
+    registry.share(str(tmp_path), interval=3600)
+    registry.write_snapshot()
+    assert os.path.exists(tmp_path / f"{os.getpid()}.json")
+
+    text = registry.collect(str(tmp_path))
+
+    assert 'requests_total{status="200"} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text and 'latency_seconds_count 2' in text
+    assert 'rows_total 7' in text
@@ -0,0 +1,122 @@
+import csv
+import threading
+import pytest
+from unittest.mock import Mock
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from data_processor import CsvProcessor
+from database import (
+    SqlRepository, SqlIngestStore, CachingRepository, NegativeLookupRepository, get_db_session, INGEST_DONE, INGEST_FAILED
+)
+from server import ingest
+from server.ingest import IngestWatcher, ingest_file
+from server.routes import get_ingest_router
+from tests.data_processor.csv_processor_test import SAMPLE_TRANSACTION
+from tests.database.test_sql_repository import make_transaction
+
+
+def write_csv(path, hashes):
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(SAMPLE_TRANSACTION))
+        writer.writeheader()
+        for hash in hashes:
+            writer.writerow({**SAMPLE_TRANSACTION, 'hash': hash})
+    return str(path)
+
+@pytest.fixture
+def mock_crypto_to_usd_instance():
+    instance = Mock()
+    instance.get_many.side_effect = lambda crypto, timestamps: [3000] * len(timestamps)
+    return instance
+
+@pytest.fixture
+def csv_processor(mock_crypto_to_usd_instance):
+    return CsvProcessor(mock_crypto_to_usd_instance, SqlRepository(), batch_size=2)
+
+def test_ingest_records_its_progress(sqlite_engine, csv_processor, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, 'PROGRESS_INTERVAL', 0)
+    updates = []
+    store = SqlIngestStore()
+    update = store.update
+    def recording_update(run_id, rows_written, rows_skipped, rows_total=None):
+        updates.append((rows_written, rows_total))
+        update(run_id, rows_written, rows_skipped, rows_total)
+    monkeypatch.setattr(store, 'update', recording_update)
+
+    assert ingest_file(csv_processor, write_csv(tmp_path / 'transactions.csv', ['0x01', '0x02', '0x03']), store) == 3
+
+    assert updates == [(0, 3), (2, None), (3, None)]
+    status = store.latest()
+    assert (status['status'], status['rowsTotal'], status['rowsWritten']) == (INGEST_DONE, 3, 3)
+
+def test_failed_ingest_is_recorded(sqlite_engine, csv_processor, tmp_path, mock_crypto_to_usd_instance):
+    mock_crypto_to_usd_instance.get_many.side_effect = RuntimeError('CoinGecko is down')
+    store = SqlIngestStore()
+
+    with pytest.raises(RuntimeError):
+        ingest_file(csv_processor, write_csv(tmp_path / 'transactions.csv', ['0x01']), store)
+
+    assert (store.latest()['status'], store.latest()['error']) == (INGEST_FAILED, "RuntimeError('CoinGecko is down')")
+
+@pytest.fixture
+def lookups(sqlite_engine):
+    negative_lookups = NegativeLookupRepository(SqlRepository(), min_capacity=1000)
+    return negative_lookups, CachingRepository(negative_lookups)
+
+def test_watcher_suspends_the_filter_while_an_ingest_runs(lookups):
+    negative_lookups, repository = lookups
+    store = SqlIngestStore()
+    watcher = IngestWatcher(store, negative_lookups, repository)
+    watcher.poll()
+    assert watcher.ready and not negative_lookups.suspended
+
+    run_id = store.start('transactions.csv', rows_total=1)
+    watcher.poll()
+    assert negative_lookups.suspended
+    # Written by the ingest process
+    with get_db_session() as session:
+        session.add(make_transaction('0x01'))
+    assert repository.get_by_hash('0x01') is not None
+
+    store.finish(run_id, rows_written=1, rows_skipped=0)
+    watcher.poll()
+    assert not negative_lookups.suspended
+    assert repository.cache_stats()['entries'] == 0
+    assert repository.get_many_by_hash(['0x01', '0x02']).keys() == {'0x01'}
+
+def test_lookups_bypass_the_filter_until_the_watcher_loads_it(lookups, monkeypatch):
+    negative_lookups, repository = lookups
+    loading, loaded = threading.Event(), threading.Event()
+    load = negative_lookups.load
+    def slow_load():
+        loading.set()
+        loaded.wait()
+        load()
+    monkeypatch.setattr(negative_lookups, 'load', slow_load)
+
+    watcher = IngestWatcher(SqlIngestStore(), negative_lookups, repository, poll_interval=60)
+    watcher.start()
+    loading.wait()
+    assert negative_lookups.suspended and not watcher.ready
+
+    loaded.set()
+    watcher.stop()
+    watcher.join()
+    assert watcher.ready and not negative_lookups.suspended
+
+def test_ingest_status_and_readiness_routes(sqlite_engine):
+    store = SqlIngestStore()
+    ready = [False]
+    app = FastAPI()
+    app.include_router(get_ingest_router(store, lambda: ready[0]))
+    client = TestClient(app)
+
+    assert client.get('/ingest/status').status_code == 404
+    assert (client.get('/ready').status_code, client.get('/ready').json()) == (503, {'ready': False})
+
+    store.update(store.start('transactions.csv', rows_total=10), rows_written=4, rows_skipped=1)
+    ready[0] = True
+    status = client.get('/ingest/status').json()
+    assert (status['status'], status['rowsTotal'], status['rowsDone']) == ('running', 10, 5)
+    assert (client.get('/ready').status_code, client.get('/ready').json()) == (200, {'ready': True})
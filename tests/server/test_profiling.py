@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from database import SqlRepository
+from server.middleware import ProfilingMiddleware
+from server.profiling import SamplingProfiler
+from server.routes import get_api_router
+from tests.database.test_sql_repository import make_transaction
+
+
+def spin_until(stopped: threading.Event):
+    while not stopped.is_set():
+        sum(range(1000))
+
+def test_sampling_profiler_reports_and_collapses_the_stacks_of_every_thread(tmp_path):
+    stopped = threading.Event()
+    worker = threading.Thread(target=spin_until, args=(stopped,), name="worker")
+    with SamplingProfiler(interval=0.001) as profiler:
+        worker.start()
+        time.sleep(0.1)
+        stopped.set()
+        worker.join()
+
+    assert profiler.samples > 0
+    assert any(stack[0] == "worker" and stack[-1].startswith("spin_until (test_profiling.py:") for stack in profiler.stacks)
+    report = profiler.report()
+    assert "cumulative s" in report and "spin_until (test_profiling.py:" in report
+    for line in profiler.collapsed().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert ";" in stack and int(count) > 0
+
+    report_path, collapsed_path = profiler.write(str(tmp_path), "ingest")
+    assert os.path.basename(report_path) == "ingest.txt" and os.path.exists(report_path)
+    assert os.path.basename(collapsed_path) == "ingest.collapsed" and os.path.exists(collapsed_path)
+
+    with pytest.raises(ValueError):
+        SamplingProfiler(interval=0)
+
+@pytest.fixture
+def profiles(tmp_path):
+    return tmp_path / "profiles"
+
+@pytest.fixture
+def profiled_app(sqlite_engine, profiles):
+    repository = SqlRepository()
+    repository.create_many([make_transaction('0x01'), make_transaction('0x02')])
+    def make(**options):
+        app = FastAPI()
+        app.include_router(get_api_router(repository))
+        app.add_middleware(ProfilingMiddleware, directory=str(profiles), **options)
+        return TestClient(app)
+    return make
+
+def test_requests_with_the_token_are_profiled(profiled_app, profiles):
+    client = profiled_app(token="secret")
+
+    assert 'x-profile' not in client.get('/stats').headers
+    assert 'x-profile' not in client.get('/stats', headers={'X-Profile': 'guess'}).headers
+    by_header = client.get('/stats', headers={'X-Profile': 'secret'})
+    by_query = client.get('/stats', params={'profile': 'secret', 'page': 1})
+
+    assert by_header.json()['totalTransactionsInDB'] == 2
+    for response in (by_header, by_query):
+        name = response.headers['x-profile']
+        with open(profiles / f"{name}.txt") as file:
+            report = file.read()
+        assert report.startswith("GET /stats")
+        # Sorted by cumulative time, with the repository call traced on the executor
+        assert "cumulative" in report and "get_stats" in report
+        assert "secret" not in report
+        assert os.path.exists(profiles / f"{name}.pstats")
+    assert len(list(profiles.iterdir())) == 4
+
+def test_requests_are_sampled_at_the_sample_rate(profiled_app, profiles):
+    draws = iter([0.5, 0.05])
+    client = profiled_app(sample_rate=0.1, random=lambda: next(draws))
+
+    assert 'x-profile' not in client.get('/stats').headers
+    assert 'x-profile' in client.get('/stats').headers
+    # Without a token, the requests cannot ask for a profile
+    assert 'x-profile' not in profiled_app().get('/stats', headers={'X-Profile': ''}).headers
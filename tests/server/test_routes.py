@@ -0,0 +1,173 @@
+import json
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from database import SqlRepository, InstrumentedRepository
+from metrics import REGISTRY
+from server.middleware import MetricsMiddleware
+from server.request_models import MAX_BATCH_HASHES
+from server.routes import get_api_router, get_metrics_router
+from tests.database.test_sql_repository import make_transaction
+
+
+def make_timed_transaction(hash: str, executed_at: datetime, block_number: int, gas_used: int, gas_cost: float):
+    transaction = make_transaction(hash, gas_used=gas_used, gas_cost=gas_cost)
+    transaction.executedAt = executed_at
+    transaction.blockNumber = block_number
+    return transaction
+
+@pytest.fixture
+def repository(sqlite_engine):
+    repository = SqlRepository()
+    repository.create_many([
+        make_timed_transaction('0x01', datetime(2023, 8, 1, 7, 4), 100, 10, 1.),
+        make_timed_transaction('0x02', datetime(2023, 8, 1, 7, 59), 101, 20, 2.),
+        make_timed_transaction('0x03', datetime(2023, 8, 1, 9, 0), 105, 30, 3.),
+        make_timed_transaction('0x04', datetime(2023, 8, 2, 0, 30), 110, 40, 4.),
+    ])
+    return repository
+
+@pytest.fixture
+def client(repository):
+    app = FastAPI()
+    app.include_router(get_api_router(repository))
+    return TestClient(app)
+
+def test_stats(client):
+    assert client.get('/stats').json() == {'totalTransactionsInDB': 4, 'totalGasUsed': 100, 'totalGasCostInDollars': 10.}
+
+def test_repository_calls_run_on_the_executor(repository, monkeypatch):
+    threads = []
+    get_stats = repository.get_stats
+    def recording_get_stats():
+        threads.append(threading.current_thread().name)
+        return get_stats()
+    monkeypatch.setattr(repository, 'get_stats', recording_get_stats)
+    app = FastAPI()
+    app.include_router(get_api_router(repository, ThreadPoolExecutor(max_workers=1, thread_name_prefix='test-db')))
+
+    assert TestClient(app).get('/stats').status_code == 200
+    assert threads == ['test-db_0']
+
+def test_hourly_timeseries(client):
+    response = client.get('/stats/timeseries', params={'from': '2023-08-01T07:30:00Z', 'to': '2023-08-01T23:00:00', 'bucket': 'hour'})
+
+    assert response.status_code == 200
+    assert response.json() == {'bucket': 'hour', 'points': [
+        {'bucketStart': '2023-08-01T07:00:00', 'transactionCount': 2, 'gasUsed': 30, 'gasCostInDollars': 3.},
+        {'bucketStart': '2023-08-01T09:00:00', 'transactionCount': 1, 'gasUsed': 30, 'gasCostInDollars': 3.},
+    ]}
+
+def test_daily_timeseries(client):
+    response = client.get('/stats/timeseries', params={'from': '2023-08-01T00:00:00', 'to': '2023-08-31T00:00:00', 'bucket': 'day'})
+
+    assert [(point['bucketStart'], point['gasUsed']) for point in response.json()['points']] == [
+        ('2023-08-01T00:00:00', 60), ('2023-08-02T00:00:00', 40)
+    ]
+
+@pytest.mark.parametrize('params', [
+    {'from': '2023-08-01T00:00:00', 'to': '2023-08-02T00:00:00', 'bucket': 'week'},
+    {'from': '2023-08-02T00:00:00', 'to': '2023-08-01T00:00:00'},
+    {'from': '2000-01-01T00:00:00', 'to': '2023-08-01T00:00:00', 'bucket': 'hour'},
+])
+def test_timeseries_rejects_invalid_ranges(client, params):
+    assert client.get('/stats/timeseries', params=params).status_code == 400
+
+def test_block_stats(client):
+    response = client.get('/stats/blocks', params={'from_block': 101, 'to_block': 200, 'size': 5})
+
+    assert response.json() == {'size': 5, 'points': [
+        {'fromBlock': 101, 'toBlock': 104, 'transactionCount': 1, 'gasUsed': 20, 'gasCostInDollars': 2.},
+        {'fromBlock': 105, 'toBlock': 109, 'transactionCount': 1, 'gasUsed': 30, 'gasCostInDollars': 3.},
+        {'fromBlock': 110, 'toBlock': 114, 'transactionCount': 1, 'gasUsed': 40, 'gasCostInDollars': 4.},
+    ]}
+
+def test_block_stats_rejects_invalid_ranges(client):
+    assert client.get('/stats/blocks', params={'from_block': 10, 'to_block': 1}).status_code == 400
+    assert client.get('/stats/blocks', params={'from_block': 1, 'to_block': 10, 'size': 0}).status_code == 422
+
+def test_address_stats(client):
+    response = client.get('/addresses/0xFROM/stats')
+
+    assert response.status_code == 200
+    assert response.json() == {
+        'address': '0xfrom', 'transactionsSent': 4, 'transactionsReceived': 0, 'gasUsed': 100, 'gasCostInDollars': 10.
+    }
+    assert client.get('/addresses/0xunknown/stats').status_code == 404
+
+def test_top_addresses(client):
+    response = client.get('/addresses/top', params={'by': 'transactions', 'limit': 5})
+
+    assert response.json() == {'by': 'transactions', 'addresses': [
+        {'address': '0xfrom', 'transactionsSent': 4, 'transactionsReceived': 0, 'gasUsed': 100, 'gasCostInDollars': 10.}
+    ]}
+    assert client.get('/addresses/top', params={'by': 'value'}).status_code == 400
+    assert client.get('/addresses/top', params={'limit': 0}).status_code == 422
+
+def test_transaction_pages(client):
+    first = client.get('/transactions', params={'limit': 3}).json()
+    assert [transaction['hash'] for transaction in first['transactions']] == ['0x01', '0x02', '0x03']
+
+    second = client.get('/transactions', params={'limit': 3, 'after': first['next']}).json()
+    assert [transaction['hash'] for transaction in second['transactions']] == ['0x04']
+    assert second['next'] is None
+
+def test_transaction_filters(client):
+    response = client.get('/transactions', params={'fromAddress': '0xFROM', 'fromBlock': 101, 'toBlock': 105})
+    assert [transaction['hash'] for transaction in response.json()['transactions']] == ['0x02', '0x03']
+
+    assert client.get('/transactions', params={'toAddress': '0xfrom'}).json() == {'transactions': [], 'next': None}
+
+def test_transaction_stream(client):
+    first = client.get('/transactions', params={'limit': 1}).json()
+    response = client.get('/transactions', params={'stream': True, 'after': first['next']})
+
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line['hash'] for line in lines] == ['0x02', '0x03', '0x04']
+    assert lines[0] == client.get('/transactions/0x02').json()
+
+@pytest.mark.parametrize('params', [
+    {'after': 'not a cursor'},
+    {'after': 'MTA='},
+    {'fromBlock': 10, 'toBlock': 1},
+])
+def test_transaction_listing_rejects_invalid_parameters(client, params):
+    assert client.get('/transactions', params=params).status_code == 400
+
+def test_transaction_batch(client):
+    response = client.post('/transactions/batch', json={'hashes': ['0x03', '0x99', '0x01', '0x03']})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [transaction['hash'] for transaction in body['transactions']] == ['0x03', '0x01']
+    assert body['transactions'][0] == client.get('/transactions/0x03').json()
+    assert body['missing'] == ['0x99']
+
+def test_transaction_batch_rejects_too_many_hashes(client):
+    response = client.post('/transactions/batch', json={'hashes': ['0x01'] * (MAX_BATCH_HASHES + 1)})
+    assert response.status_code == 422
+
+def test_metrics_record_the_route_templates_and_repository_calls(repository):
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(get_api_router(InstrumentedRepository(repository, "test")))
+    app.include_router(get_metrics_router(REGISTRY))
+    client = TestClient(app)
+
+    assert client.get('/transactions/0x01').status_code == 200
+    assert client.get('/transactions/0xff').status_code == 404
+    assert client.get('/unknown/path').status_code == 404
+    response = client.get('/metrics')
+
+    assert response.status_code == 200 and response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    assert 'ratedapi_http_request_duration_seconds_count{method="GET",route="/transactions/{hash}",status="200"}' \
+           in response.text
+    assert 'ratedapi_http_request_duration_seconds_count{method="GET",route="/transactions/{hash}",status="404"}' \
+           in response.text
+    assert 'ratedapi_http_request_duration_seconds_count{method="GET",route="unmatched",status="404"}' in response.text
+    assert 'ratedapi_repository_call_duration_seconds_count{repository="test",method="get_by_hash"} 2' in response.text
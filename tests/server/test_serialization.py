@@ -0,0 +1,52 @@
+import gc
+import json
+from datetime import datetime
+
+import pytest
+
+from database import ProcessedTransaction
+from server import serialization
+from server.response_models import ProcessedTransactionResponse, StatsResponse
+from server.serialization import TransactionEncoder, stats_json
+
+
+TRANSACTIONS = [
+    ProcessedTransaction(hash='0x01', fromAddress='0xa', toAddress='0xb', blockNumber=17818542,
+                         executedAt=datetime(2023, 8, 1, 7, 4, 59), gasUsed=21000, gasCostInDollars=12.87499),
+    ProcessedTransaction(hash='0x"é', fromAddress='', toAddress='0xb\n', blockNumber=0,
+                         executedAt=datetime(2023, 8, 1, 7, 4, 59, 120), gasUsed=0, gasCostInDollars=1e-9),
+    ProcessedTransaction(hash='0x03', fromAddress='0xa', toAddress='0xb', blockNumber=1,
+                         executedAt=datetime(2023, 8, 1), gasUsed=10 ** 12, gasCostInDollars=123456.789),
+]
+
+@pytest.fixture(params=['orjson', 'json'])
+def encoder_backend(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(serialization, 'orjson', None)
+    elif serialization.orjson is None:
+        pytest.skip('orjson is not installed')
+
+@pytest.mark.parametrize('transaction', TRANSACTIONS)
+def test_transactions_encode_as_the_response_model(encoder_backend, transaction):
+    expected = ProcessedTransactionResponse(**{column: getattr(transaction, column) for column in (
+        'hash', 'fromAddress', 'toAddress', 'blockNumber', 'executedAt', 'gasUsed', 'gasCostInDollars'
+    )}).model_dump_json()
+
+    assert TransactionEncoder().encode(transaction) == expected.encode()
+
+def test_stats_encode_as_the_response_model(encoder_backend):
+    stats = {'totalTransactionsInDB': 3, 'totalGasUsed': 42, 'totalGasCostInDollars': 10.005}
+    assert json.loads(stats_json(stats)) == json.loads(StatsResponse(**stats).model_dump_json())
+
+def test_encoded_bytes_live_as_long_as_the_transaction():
+    encoder = TransactionEncoder()
+    transaction = ProcessedTransaction(**{column: getattr(TRANSACTIONS[0], column) for column in (
+        'hash', 'fromAddress', 'toAddress', 'blockNumber', 'executedAt', 'gasUsed', 'gasCostInDollars'
+    )})
+
+    assert encoder.encode(transaction) is encoder.encode(transaction)
+    assert (encoder.hits, encoder.misses) == (1, 1)
+
+    del transaction
+    gc.collect()
+    assert len(encoder._encoded) == 0